@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends, Request, Body, File, UploadFile, Form
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 import asyncio
 import json
 import traceback
@@ -10,6 +10,7 @@ import jwt
 from pydantic import BaseModel
 import tempfile
 import os
+import shutil
 
 from agentpress.thread_manager import ThreadManager
 from services.supabase import DBConnection
@@ -18,9 +19,15 @@ from .run import run_agent
 from utils.auth_utils import get_current_user_id_from_jwt, get_user_id_from_stream_auth, verify_thread_access
 from utils.logger import logger
 from services.billing import check_billing_status, can_use_model
+from services.usage import register_inflight_run
 from utils.config import config
-from sandbox.sandbox import create_sandbox, get_or_start_sandbox
+from utils.sse import encode_frame, as_frame, decode_frame, get_terminal_status
+from utils.startup import startup
+from sandbox.sandbox import get_or_start_sandbox
+from .provisioning import ProjectProvisioner, stage_uploads, start_provisioning, sweep_interrupted_runs
 from services.llm import make_llm_api_call
+from services.llm_cache import LLMCachePolicy
+from services.artifact_store import ArtifactNotFoundError, get_artifact_store
 from run_agent_background import execute_run_agent_task, _cleanup_redis_response_list, update_agent_run_status
 from utils.constants import MODEL_NAME_ALIASES
 from agentpress.tool_orchestrator import ToolOrchestrator # Added import
@@ -51,6 +58,7 @@ def should_use_planner(prompt: str, enable_thinking: Optional[bool] = False) ->
     return False
 db = None
 instance_id = None # Global instance ID for this backend instance
+provisioning_sweeper: Optional[asyncio.Task] = None
 agent_tool_orchestrator: Optional[ToolOrchestrator] = None # New module-level global
 task_planner: Optional[TaskPlanner] = None  # Updated type hint
 task_state_manager: Optional[TaskStateManager] = None # Updated type hint
@@ -58,6 +66,9 @@ task_state_manager: Optional[TaskStateManager] = None # Updated type hint
 # TTL for Redis response lists (24 hours)
 REDIS_RESPONSE_LIST_TTL = 3600 * 24
 
+# Identical first prompts get the same generated project name
+PROJECT_NAME_CACHE_POLICY = LLMCachePolicy(namespace="project_name", ttl=7 * 24 * 3600)
+
 
 class AgentStartRequest(BaseModel):
     model_name: Optional[str] = None  # Will be set from config.MODEL_TO_USE in the endpoint
@@ -68,7 +79,10 @@ class AgentStartRequest(BaseModel):
 
 class InitiateAgentResponse(BaseModel):
     thread_id: str
+    project_id: Optional[str] = None
     agent_run_id: Optional[str] = None
+    # "provisioning": the sandbox is being created; progress is streamed on the agent run
+    status: Optional[str] = None
 
 def initialize(
     _db: DBConnection,
@@ -95,10 +109,19 @@ def initialize(
 
     # Note: Redis will be initialized in the lifespan function in api.py
 
+async def start_background_jobs():
+    """Start background work that needs Redis: failing runs whose provisioning was interrupted."""
+    global provisioning_sweeper
+    client = await db.client
+    provisioning_sweeper = asyncio.create_task(sweep_interrupted_runs(client))
+
 async def cleanup():
     """Clean up resources and stop running agents on shutdown."""
     logger.info("Starting cleanup of agent API resources")
 
+    if provisioning_sweeper:
+        provisioning_sweeper.cancel()
+
     # Use the instance_id to find and clean up this instance's keys
     try:
         if instance_id: # Ensure instance_id is set
@@ -134,7 +157,7 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
     all_responses = []
     try:
         all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
+        all_responses = [decode_frame(r) for r in all_responses_json]
         logger.info(f"Fetched {len(all_responses)} responses from Redis for DB update on stop/fail: {agent_run_id}")
     except Exception as e:
         logger.error(f"Failed to fetch responses from Redis for {agent_run_id} during stop/fail: {e}")
@@ -397,7 +420,9 @@ async def start_agent(
         is_planning_request = should_use_planner(prompt_text, body.enable_thinking)
         logger.info(f"Request type determination for thread {thread_id}: Is planning request? {is_planning_request}")
 
-        # Planner Availability Check
+        # Planner Availability Check (the planner needs plugin tools, which load in the background at startup)
+        if is_planning_request and not await startup.wait_for("tool_plugins"):
+            logger.warning(f"Tool plugins not loaded yet for thread {thread_id}; planning with the tools available.")
         if is_planning_request and (not task_planner or not task_state_manager):
             logger.error(f"Task planner or task state manager not initialized for thread {thread_id}. Cannot proceed with planning.")
             is_planning_request = False # Fallback
@@ -451,6 +476,7 @@ async def start_agent(
         }).execute()
         agent_run_id = agent_run_insert.data[0]['id']
         logger.info(f"Created new agent run (non-plan) for thread {thread_id}: {agent_run_id}")
+        await register_inflight_run(account_id, agent_run_id)
 
         instance_key_normal = f"active_run:{instance_id}:{agent_run_id}"
         try:
@@ -515,6 +541,28 @@ async def get_agent_run(agent_run_id: str, user_id: str = Depends(get_current_us
         "error": agent_run_data['error']
     }
 
+@router.get("/thread/{thread_id}/artifacts/{digest}")
+async def get_thread_artifact(thread_id: str, digest: str, user_id: str = Depends(get_current_user_id_from_jwt)):
+    """Full content of a tool output that was offloaded to the artifact store."""
+    client = await db.client
+    await verify_thread_access(client, thread_id, user_id)
+    store = get_artifact_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="Artifact store is disabled")
+    # Artifacts are shared by content; only serve those referenced from this thread
+    referenced = await client.table('messages').select('message_id').eq('thread_id', thread_id).contains('metadata', {'artifacts': [digest]}).limit(1).execute()
+    if not referenced.data:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    try:
+        data = await store.get(digest)
+    except ArtifactNotFoundError:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    return Response(
+        content=data,
+        media_type="text/plain; charset=utf-8",
+        headers={"ETag": f'"{digest}"', "Cache-Control": "private, max-age=31536000, immutable"},
+    )
+
 @router.get("/agent-run/{agent_run_id}/stream")
 async def stream_agent_run(
     agent_run_id: str,
@@ -543,14 +591,13 @@ async def stream_agent_run(
 
         try:
             # 1. Fetch and yield initial responses from Redis list
+            # Entries are pre-rendered SSE frames and are forwarded without re-encoding
             initial_responses_json = await redis.lrange(response_list_key, 0, -1)
-            initial_responses = []
             if initial_responses_json:
-                initial_responses = [json.loads(r) for r in initial_responses_json]
-                logger.debug(f"Sending {len(initial_responses)} initial responses for {agent_run_id}")
-                for response in initial_responses:
-                    yield f"data: {json.dumps(response)}\n\n"
-                last_processed_index = len(initial_responses) - 1
+                logger.debug(f"Sending {len(initial_responses_json)} initial responses for {agent_run_id}")
+                for entry in initial_responses_json:
+                    yield as_frame(entry)
+                last_processed_index = len(initial_responses_json) - 1
             initial_yield_complete = True
 
             # 2. Check run status *after* yielding initial data
@@ -559,7 +606,7 @@ async def stream_agent_run(
 
             if current_status != 'running':
                 logger.info(f"Agent run {agent_run_id} is not running (status: {current_status}). Ending stream.")
-                yield f"data: {json.dumps({'type': 'status', 'status': 'completed'})}\n\n"
+                yield encode_frame({'type': 'status', 'status': 'completed'})
                 return
 
             # 3. Set up Pub/Sub listeners for new responses and control signals
@@ -632,14 +679,15 @@ async def stream_agent_run(
                         new_responses_json = await redis.lrange(response_list_key, new_start_index, -1)
 
                         if new_responses_json:
-                            new_responses = [json.loads(r) for r in new_responses_json]
-                            num_new = len(new_responses)
+                            num_new = len(new_responses_json)
                             # logger.debug(f"Received {num_new} new responses for {agent_run_id} (index {new_start_index} onwards)")
-                            for response in new_responses:
-                                yield f"data: {json.dumps(response)}\n\n"
+                            for entry in new_responses_json:
+                                frame = as_frame(entry)
+                                yield frame
                                 # Check if this response signals completion
-                                if response.get('type') == 'status' and response.get('status') in ['completed', 'failed', 'stopped']:
-                                    logger.info(f"Detected run completion via status message in stream: {response.get('status')}")
+                                terminal_status = get_terminal_status(frame)
+                                if terminal_status:
+                                    logger.info(f"Detected run completion via status message in stream: {terminal_status}")
                                     terminate_stream = True
                                     break # Stop processing further new responses
                             last_processed_index += num_new
@@ -648,13 +696,13 @@ async def stream_agent_run(
                     elif queue_item["type"] == "control":
                         control_signal = queue_item["data"]
                         terminate_stream = True # Stop the stream on any control signal
-                        yield f"data: {json.dumps({'type': 'status', 'status': control_signal})}\n\n"
+                        yield encode_frame({'type': 'status', 'status': control_signal})
                         break
 
                     elif queue_item["type"] == "error":
                         logger.error(f"Listener error for {agent_run_id}: {queue_item['data']}")
                         terminate_stream = True
-                        yield f"data: {json.dumps({'type': 'status', 'status': 'error'})}\n\n"
+                        yield encode_frame({'type': 'status', 'status': 'error'})
                         break
 
                 except asyncio.CancelledError:
@@ -664,14 +712,14 @@ async def stream_agent_run(
                 except Exception as loop_err:
                     logger.error(f"Error in stream generator main loop for {agent_run_id}: {loop_err}", exc_info=True)
                     terminate_stream = True
-                    yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Stream failed: {loop_err}'})}\n\n"
+                    yield encode_frame({'type': 'status', 'status': 'error', 'message': f'Stream failed: {loop_err}'})
                     break
 
         except Exception as e:
             logger.error(f"Error setting up stream for agent run {agent_run_id}: {e}", exc_info=True)
             # Only yield error if initial yield didn't happen
             if not initial_yield_complete:
-                 yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Failed to start stream: {e}'})}\n\n"
+                 yield encode_frame({'type': 'status', 'status': 'error', 'message': f'Failed to start stream: {e}'})
         finally:
             terminate_stream = True
             # Graceful shutdown order: unsubscribe → close → cancel
@@ -751,7 +799,7 @@ async def generate_and_update_project_name(project_id: str, prompt: str):
         messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_message}]
 
         logger.debug(f"Calling LLM ({project_naming_model}) for project {project_id} naming.")
-        response = await make_llm_api_call(messages=messages, model_name=project_naming_model, max_tokens=20, temperature=0.7)
+        response = await make_llm_api_call(messages=messages, model_name=project_naming_model, max_tokens=20, temperature=0.7, cache=PROJECT_NAME_CACHE_POLICY)
         
         generated_name = None
         if response and response.get('choices') and response['choices'][0].get('message'):
@@ -906,6 +954,7 @@ async def initiate_agent_with_files(
     if not can_run:
         raise HTTPException(status_code=402, detail={"message": message, "subscription": subscription})
 
+    staging_dir = None
     try:
         # 1. Create Project
         placeholder_name = f"{prompt[:30]}..." if len(prompt) > 30 else prompt
@@ -927,160 +976,11 @@ async def initiate_agent_with_files(
         # Trigger Background Naming Task
         asyncio.create_task(generate_and_update_project_name(project_id=project_id, prompt=prompt))
 
-        # 3. Create Sandbox
-        sandbox_pass = str(uuid.uuid4())
-        sandbox_obj = create_sandbox(sandbox_pass, project_id) # Renamed to sandbox_obj
-
-        is_daytona_sandbox = not isinstance(sandbox_obj, dict)
-        sandbox_id = None
-        vnc_url = "N/A"
-        website_url = "N/A"
-        token = None
+        # 3. Stage attached files locally; they are pushed once the sandbox exists
+        staging_dir, staged_uploads = await stage_uploads(files, config.PROVISIONING_STAGING_DIR)
 
-        if is_daytona_sandbox:
-            sandbox_id = sandbox_obj.id
-            logger.info(f"Created new Daytona sandbox {sandbox_id} for project {project_id}")
-            try:
-                vnc_link = sandbox_obj.get_preview_link(6080)
-                website_link = sandbox_obj.get_preview_link(8080)
-                vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link).split("url='")[1].split("'")[0]
-                website_url = website_link.url if hasattr(website_link, 'url') else str(website_link).split("url='")[1].split("'")[0]
-                if hasattr(vnc_link, 'token'):
-                    token = vnc_link.token
-                elif "token='" in str(vnc_link):
-                    token = str(vnc_link).split("token='")[1].split("'")[0]
-            except Exception as e_preview:
-                logger.error(f"Error getting preview links for Daytona sandbox {sandbox_id}: {str(e_preview)}", exc_info=True)
-                # vnc_url and website_url will remain "N/A"
-        else: # Local sandbox (dict)
-            sandbox_id = sandbox_obj.get('id')
-            logger.info(f"Created new Local sandbox {sandbox_id} for project {project_id}")
-            container = sandbox_obj.get('container')
-            if container:
-                try:
-                    container.reload() # Ensure ports are up-to-date
-                    ports = container.ports
-                    # Example: {'5900/tcp': [{'HostIp': '0.0.0.0', 'HostPort': '32789'}], ...}
-                    vnc_host_port_list = ports.get('5900/tcp')
-                    if vnc_host_port_list and vnc_host_port_list[0] and vnc_host_port_list[0].get('HostPort'):
-                        vnc_host_port = vnc_host_port_list[0]['HostPort']
-                        vnc_url = f"localhost:{vnc_host_port}" # Assuming running on localhost
-                        logger.info(f"Local sandbox VNC URL determined: {vnc_url}")
-                    else:
-                        logger.warning(f"Could not determine VNC host port for local sandbox {sandbox_id}. Ports: {ports}")
-                    # For local sandbox, website_url might not be directly equivalent to Daytona's 8080 preview.
-                    # We'll set it to N/A or a placeholder.
-                    website_url = "N/A (local sandbox, direct website preview not applicable)"
-                    logger.info(f"Local sandbox website_url set to: {website_url}")
-                    token = None # No token concept for local_sandbox in this way
-                except Exception as e_local_ports:
-                    logger.error(f"Error getting port info for local sandbox {sandbox_id}: {str(e_local_ports)}", exc_info=True)
-            else:
-                logger.warning(f"Local sandbox object for {sandbox_id} does not contain a 'container' key.")
-
-        if not sandbox_id:
-             logger.error(f"Failed to obtain sandbox_id for project {project_id}")
-             raise Exception("Sandbox ID could not be determined.")
-
-        # Update project with sandbox info
-        update_result = await client.table('projects').update({
-            'sandbox': {
-                'id': sandbox_id, 'pass': sandbox_pass, 'vnc_preview': vnc_url,
-                'sandbox_url': website_url, 'token': token,
-                'is_local': not is_daytona_sandbox # Add flag to indicate local
-            }
-        }).eq('project_id', project_id).execute()
-
-        if not update_result.data:
-            logger.error(f"Failed to update project {project_id} with new sandbox {sandbox_id}")
-            raise Exception("Database update failed for project sandbox info")
-
-        # 4. Upload Files to Sandbox (if any)
-        message_content = prompt
-        if files:
-            successful_uploads = []
-            failed_uploads = []
-            for file in files:
-                if file.filename:
-                    upload_successful = False # Reset for each file
-                    try:
-                        safe_filename = file.filename.replace('/', '_').replace('\\', '_')
-                        target_path = f"/workspace/{safe_filename}"
-
-                        if is_daytona_sandbox:
-                            logger.info(f"Attempting to upload {safe_filename} to {target_path} in Daytona sandbox {sandbox_id}")
-                            content = await file.read()
-                            try:
-                                if hasattr(sandbox_obj, 'fs') and hasattr(sandbox_obj.fs, 'upload_file'):
-                                    import inspect
-                                    if inspect.iscoroutinefunction(sandbox_obj.fs.upload_file):
-                                        await sandbox_obj.fs.upload_file(target_path, content)
-                                    else:
-                                        sandbox_obj.fs.upload_file(target_path, content)
-                                    logger.debug(f"Called sandbox_obj.fs.upload_file for {target_path}")
-                                    upload_successful = True
-                                else:
-                                    logger.error(f"Daytona sandbox object for {sandbox_id} does not have 'fs.upload_file' method.")
-                                    # raise NotImplementedError("Suitable upload method not found on Daytona sandbox object.")
-                            except Exception as upload_error:
-                                logger.error(f"Error during Daytona sandbox upload call for {safe_filename}: {str(upload_error)}", exc_info=True)
-                        else: # Local sandbox
-                            logger.warning(f"Local sandbox file upload for {safe_filename} via this path is not fully implemented. Skipping file.")
-                            upload_successful = False # Explicitly false, though it's default
-
-                        if upload_successful and is_daytona_sandbox: # Verification only for Daytona for now
-                            try:
-                                await asyncio.sleep(0.2) # Give a moment for fs to sync
-                                parent_dir = os.path.dirname(target_path)
-                                files_in_dir = sandbox_obj.fs.list_files(parent_dir)
-                                file_names_in_dir = [f.name for f in files_in_dir]
-                                if safe_filename in file_names_in_dir:
-                                    successful_uploads.append(target_path)
-                                    logger.info(f"Successfully uploaded and verified file {safe_filename} to Daytona sandbox path {target_path}")
-                                else:
-                                    logger.error(f"Verification failed for {safe_filename} in Daytona sandbox: File not found in {parent_dir} after upload attempt.")
-                                    failed_uploads.append(safe_filename)
-                            except Exception as verify_error:
-                                logger.error(f"Error verifying file {safe_filename} after Daytona upload: {str(verify_error)}", exc_info=True)
-                                failed_uploads.append(safe_filename)
-                        elif upload_successful: # Should not happen for local if logic is correct
-                             successful_uploads.append(target_path) # Should ideally be verified too
-                        else: # upload_successful is False
-                            if not is_daytona_sandbox: # Already logged for local
-                                pass
-                            else: # Failed for Daytona
-                                failed_uploads.append(safe_filename)
-                    except Exception as file_error:
-                        logger.error(f"Error processing file {file.filename}: {str(file_error)}", exc_info=True)
-                        failed_uploads.append(file.filename)
-                    finally:
-                        await file.close()
-
-            if successful_uploads:
-                message_content += "\n\n" if message_content else ""
-                for file_path in successful_uploads: message_content += f"[Uploaded File: {file_path}]\n"
-            if failed_uploads:
-                message_content += "\n\nThe following files failed to upload:\n"
-                for failed_file in failed_uploads: message_content += f"- {failed_file}\n"
-
-        # 5. Add initial user message to thread
-        message_id = str(uuid.uuid4())
-        message_payload = {"role": "user", "content": message_content}
-        await client.table('messages').insert({
-            "message_id": message_id, "thread_id": thread_id, "type": "user",
-            "is_llm_message": True, "content": json.dumps(message_payload),
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }).execute()
-
-        # is_planning_request flag is kept for logging or metadata if needed.
-        # However, the execution path is now unified as run_agent handles planning internally.
-        # The original block for `if is_planning_request:` which directly called
-        # `task_planner.plan_task` and `plan_executor.execute_plan` is removed.
-
-        # This block will execute. The 'if not is_planning_request:' condition that previously
-        # wrapped this block (or was the alternative to a planning block) is removed,
-        # making this the default and only execution path branching from here for starting the agent.
-        logger.info("Proceeding with normal agent execution.")
+        # 4. Create the agent run now so the client can stream provisioning progress.
+        # The execution path is unified: run_agent handles planning internally.
         agent_run_table_insert = await client.table('agent_runs').insert({
             "thread_id": thread_id, "status": "running",
             "started_at": datetime.now(timezone.utc).isoformat(),
@@ -1088,6 +988,7 @@ async def initiate_agent_with_files(
         }).execute()
         agent_run_id = agent_run_table_insert.data[0]['id']
         logger.info(f"Created new agent run (non-plan): {agent_run_id}")
+        await register_inflight_run(account_id, agent_run_id)
 
         # Register run in Redis
         instance_key_normal = f"active_run:{instance_id}:{agent_run_id}"
@@ -1096,23 +997,33 @@ async def initiate_agent_with_files(
         except Exception as e:
             logger.warning(f"Failed to register agent run in Redis ({instance_key_normal}): {str(e)}")
 
-        execute_run_agent_task.send(
-            thread_id=thread_id,
-            project_id=project_id,
-            stream=stream,
-            initial_prompt_text=message_content, # Added: This is the prompt including file references
-            model_name=model_name,
-            enable_thinking=enable_thinking,
-            reasoning_effort=reasoning_effort,
-            enable_context_manager=enable_context_manager
-            # native_max_auto_continues and max_iterations will use defaults
-            # agent_run_id and instance_id are not direct params for the new actor
-        )
-        # The return here might need adjustment. The original run_agent_background was for background processing.
-        # execute_run_agent_task with store_results=True implies results are fetched differently.
-        return {"thread_id": thread_id, "agent_run_id": agent_run_id, "status": "submitted_to_worker"} # Status changed
+        def start_agent(message_content: str):
+            execute_run_agent_task.send(
+                thread_id=thread_id,
+                project_id=project_id,
+                stream=stream,
+                initial_prompt_text=message_content, # The prompt including file references
+                model_name=model_name,
+                enable_thinking=enable_thinking,
+                reasoning_effort=reasoning_effort,
+                enable_context_manager=enable_context_manager
+                # native_max_auto_continues and max_iterations will use defaults
+                # agent_run_id and instance_id are not direct params for the new actor
+            )
+
+        # 5. Create the sandbox, upload files and start the agent in the background
+        start_provisioning(ProjectProvisioner(
+            client, agent_run_id=agent_run_id, project_id=project_id, thread_id=thread_id,
+            prompt=prompt, start_agent=start_agent,
+            staged_uploads=staged_uploads, staging_dir=staging_dir,
+        ))
+        staging_dir = None # Owned by the provisioner from here on
+        return {"thread_id": thread_id, "project_id": project_id, "agent_run_id": agent_run_id, "status": "provisioning"}
 
     except Exception as e:
         logger.error(f"Error in agent initiation: {str(e)}\n{traceback.format_exc()}")
         # TODO: Clean up created project/thread if initiation fails mid-way
         raise HTTPException(status_code=500, detail=f"Failed to initiate agent session: {str(e)}")
+    finally:
+        if staging_dir:
+            shutil.rmtree(staging_dir, ignore_errors=True)
@@ -1,4 +1,8 @@
 import datetime
+import functools
+
+# Filled in per UTC day by get_gemini_system_prompt, so the prompt is byte-stable (and prompt-cacheable) within a day
+UTC_DATE_PLACEHOLDER = "__UTC_DATE__"
 
 SYSTEM_PROMPT = f"""
 You are Suna.so, an autonomous AI Agent created by the Kortix team.
@@ -25,8 +29,7 @@ You are a full-spectrum autonomous agent capable of executing complex tasks acro
 - All file operations (create, read, write, delete) expect paths relative to "/workspace"
 ## 2.2 SYSTEM INFORMATION
 - BASE ENVIRONMENT: Python 3.11 with Debian Linux (slim)
-- UTC DATE: {datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d')}
-- UTC TIME: {datetime.datetime.now(datetime.timezone.utc).strftime('%H:%M:%S')}
+- UTC DATE: {UTC_DATE_PLACEHOLDER}
 - CURRENT YEAR: 2025
 - TIME CONTEXT: When searching for latest news or time-sensitive information, ALWAYS use these current date/time values as reference points. Never use outdated information or assume different dates.
 - INSTALLED TOOLS:
@@ -470,8 +473,7 @@ If an `execute_python_code` call results in an error:
 
 - TIME CONTEXT FOR RESEARCH:
   * CURRENT YEAR: 2025
-  * CURRENT UTC DATE: {datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d')}
-  * CURRENT UTC TIME: {datetime.datetime.now(datetime.timezone.utc).strftime('%H:%M:%S')}
+  * CURRENT UTC DATE: {UTC_DATE_PLACEHOLDER}
   * CRITICAL: When searching for latest news or time-sensitive information, ALWAYS use these current date/time values as reference points. Never use outdated information or assume different dates.
 
 # 5. WORKFLOW MANAGEMENT
@@ -1625,8 +1627,13 @@ zip -r japan_trip_package.zip Japan_Itinerary.md travel_handbook/
 """
 
 
+@functools.lru_cache(maxsize=2)
+def _render_gemini_system_prompt(utc_date: str) -> str:
+  return (SYSTEM_PROMPT + EXAMPLE).replace(UTC_DATE_PLACEHOLDER, utc_date)
+
+
 def get_gemini_system_prompt():
-  return SYSTEM_PROMPT + EXAMPLE
+  return _render_gemini_system_prompt(datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d'))
   
 
 # if __name__ == "__main__":
@@ -0,0 +1,488 @@
+"""
+Background provisioning of a new project's sandbox for ``/agent/initiate``.
+
+Creating a sandbox (container start, supervisord and visualization setup) takes
+tens of seconds, so the endpoint no longer waits for it. It creates the project,
+thread and agent run, stages the attached files to local temporary storage,
+and hands off to a ``ProjectProvisioner`` running as a background task:
+
+    queued -> creating_sandbox -> uploading_files -> starting_agent -> ready
+                     \\                  \\                 \\
+                      `------------------`-----------------`--> failed | stopped
+
+Every transition is pushed to the agent run's response stream as a
+``{"type": "status", "status": "provisioning", "stage": ...}`` frame, so a
+client watching ``/agent-run/{id}/stream`` sees progress before the agent's
+own output. Staged files are pushed to the sandbox concurrently once it is
+ready (see sandbox/uploads.py), each reporting its own progress frame.
+The initial user message is then added and the agent run is started.
+A failure ends the stream with a ``failed`` status and marks the run failed.
+
+``stop_agent_run`` works during provisioning too: the provisioner listens on
+the run's control channel and abandons provisioning on ``STOP``, and checks
+the run is still ``running`` right before starting the agent. A sandbox that
+is being created when STOP arrives is still recorded on the project, so it is
+not orphaned. While it works
+it keeps a heartbeat key alive; ``sweep_interrupted_runs`` fails runs whose
+provisioner disappeared with its process (restart, crash).
+"""
+
+import asyncio
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+
+from sandbox.uploads import UPLOADED, SandboxUploader, UploadProgress, item_from_file
+from services import redis
+from services.usage import record_run_usage
+from utils.logger import logger
+from utils.sse import encode_frame
+
+QUEUED = "queued"
+CREATING_SANDBOX = "creating_sandbox"
+UPLOADING_FILES = "uploading_files"
+STARTING_AGENT = "starting_agent"
+READY = "ready"
+FAILED = "failed"
+STOPPED = "stopped"
+
+TRANSITIONS = {
+    QUEUED: (CREATING_SANDBOX, FAILED, STOPPED),
+    CREATING_SANDBOX: (UPLOADING_FILES, FAILED, STOPPED),
+    UPLOADING_FILES: (STARTING_AGENT, FAILED, STOPPED),
+    STARTING_AGENT: (READY, FAILED, STOPPED),
+    READY: (),
+    FAILED: (),
+    STOPPED: (),
+}
+
+# Hash of agent run id -> project id for every run being provisioned, across instances
+PROVISIONING_RUNS_KEY = "provisioning_runs"
+# A provisioner refreshes its heartbeat this often; a run whose heartbeat expired was interrupted
+HEARTBEAT_INTERVAL = 15
+HEARTBEAT_TTL = 60
+SWEEP_INTERVAL = 60
+
+WORKSPACE_DIR = "/workspace"
+_STAGING_CHUNK_SIZE = 1024 * 1024
+
+# Keeps running provisioning tasks referenced until they finish
+_background_tasks = set()
+
+
+@dataclass
+class StagedUpload:
+    """An uploaded file spooled to local disk until the sandbox is ready."""
+    filename: str
+    path: str
+    size: int
+
+    @property
+    def target_path(self) -> str:
+        return f"{WORKSPACE_DIR}/{self.filename}"
+
+
+def safe_filename(filename: str) -> str:
+    return filename.replace('/', '_').replace('\\', '_')
+
+
+def _copy_to_disk(source, path: str) -> int:
+    source.seek(0)
+    with open(path, "wb") as destination:
+        shutil.copyfileobj(source, destination, _STAGING_CHUNK_SIZE)
+        return destination.tell()
+
+
+async def stage_uploads(files: List[UploadFile], staging_root: Optional[str] = None) -> Tuple[Optional[str], List[StagedUpload]]:
+    """Spool request files to a temporary directory so the request can return before the sandbox exists.
+
+    Returns:
+        (staging directory or None when there is nothing to stage, staged files)
+    """
+    named_files = [file for file in files if file.filename]
+    if not named_files:
+        return None, []
+    if staging_root:
+        os.makedirs(staging_root, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix="initiate-", dir=staging_root)
+    staged = []
+    try:
+        for index, file in enumerate(named_files):
+            filename = safe_filename(file.filename)
+            # Prefix with the index so files with the same sanitized name don't overwrite each other
+            path = os.path.join(staging_dir, f"{index}-{filename}")
+            size = await asyncio.to_thread(_copy_to_disk, file.file, path)
+            staged.append(StagedUpload(filename=filename, path=path, size=size))
+            await file.close()
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    return staging_dir, staged
+
+
+def describe_sandbox(sandbox_obj: Any) -> Dict[str, Any]:
+    """Sandbox id, preview URLs and token for the project's ``sandbox`` column (blocking; run in a thread)."""
+    info: Dict[str, Any] = {"id": None, "vnc_preview": "N/A", "sandbox_url": "N/A", "token": None, "is_local": isinstance(sandbox_obj, dict)}
+
+    if not info["is_local"]:
+        info["id"] = sandbox_obj.id
+        try:
+            vnc_link = sandbox_obj.get_preview_link(6080)
+            website_link = sandbox_obj.get_preview_link(8080)
+            info["vnc_preview"] = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link).split("url='")[1].split("'")[0]
+            info["sandbox_url"] = website_link.url if hasattr(website_link, 'url') else str(website_link).split("url='")[1].split("'")[0]
+            if hasattr(vnc_link, 'token'):
+                info["token"] = vnc_link.token
+            elif "token='" in str(vnc_link):
+                info["token"] = str(vnc_link).split("token='")[1].split("'")[0]
+        except Exception as e:
+            logger.error(f"Error getting preview links for Daytona sandbox {info['id']}: {str(e)}", exc_info=True)
+        return info
+
+    info["id"] = sandbox_obj.get('id')
+    # For local sandboxes there is no equivalent of Daytona's 8080 website preview
+    info["sandbox_url"] = "N/A (local sandbox, direct website preview not applicable)"
+    container = sandbox_obj.get('container')
+    if not container:
+        logger.warning(f"Local sandbox object for {info['id']} does not contain a 'container' key.")
+        return info
+    try:
+        container.reload()  # Ensure ports are up-to-date
+        # Example: {'5900/tcp': [{'HostIp': '0.0.0.0', 'HostPort': '32789'}], ...}
+        vnc_ports = container.ports.get('5900/tcp')
+        if vnc_ports and vnc_ports[0] and vnc_ports[0].get('HostPort'):
+            info["vnc_preview"] = f"localhost:{vnc_ports[0]['HostPort']}"
+        else:
+            logger.warning(f"Could not determine VNC host port for local sandbox {info['id']}. Ports: {container.ports}")
+    except Exception as e:
+        logger.error(f"Error getting port info for local sandbox {info['id']}: {str(e)}", exc_info=True)
+    return info
+
+
+class ProvisioningError(Exception):
+    """Provisioning could not bring the project to a runnable state."""
+
+
+class ProvisioningStopped(Exception):
+    """The agent run was stopped while its project was being provisioned."""
+
+
+def _heartbeat_key(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:provisioning"
+
+
+async def mark_run_failed(client, agent_run_id: str, message: str) -> bool:
+    """Mark a still running agent run failed and settle its usage. Returns whether the run was updated."""
+    try:
+        result = await client.table('agent_runs').update({
+            "status": "failed", "error": message,
+            "completed_at": datetime.now(timezone.utc).isoformat()
+        }).eq("id", agent_run_id).eq("status", "running").execute()
+    except Exception as e:
+        logger.error(f"Failed to mark agent run {agent_run_id} as failed: {str(e)}")
+        return False
+    if not result.data:
+        return False
+    # Settle the run so it stops counting as in-flight usage for the account
+    try:
+        await record_run_usage(client, agent_run_id)
+    except Exception as e:
+        logger.error(f"Failed to record usage for agent run {agent_run_id}: {str(e)}")
+    return True
+
+
+class ProjectProvisioner:
+    """Creates a project's sandbox, uploads staged files and starts the agent run."""
+
+    def __init__(
+        self,
+        client,
+        agent_run_id: str,
+        project_id: str,
+        thread_id: str,
+        prompt: str,
+        start_agent: Callable[[str], Any],
+        staged_uploads: Optional[List[StagedUpload]] = None,
+        staging_dir: Optional[str] = None,
+        create_sandbox: Optional[Callable[[str, str], Any]] = None,
+        upload_concurrency: Optional[int] = None,
+    ):
+        """
+        Args:
+            client: Supabase client
+            agent_run_id: Run whose stream receives progress events and which starts on readiness
+            project_id: Project to attach the sandbox to
+            thread_id: Thread that receives the initial user message
+            prompt: User prompt; references to uploaded files are appended to it
+            start_agent: Called with the final prompt once the sandbox is ready (sync or async)
+            staged_uploads: Files spooled by ``stage_uploads``
+            staging_dir: Directory removed once provisioning ends
+            create_sandbox: Sandbox factory ``(password, project_id)``; defaults to sandbox.sandbox.create_sandbox
+            upload_concurrency: Files uploaded to the sandbox at once (default SANDBOX_UPLOAD_CONCURRENCY)
+        """
+        self.client = client
+        self.agent_run_id = agent_run_id
+        self.project_id = project_id
+        self.thread_id = thread_id
+        self.prompt = prompt
+        self.start_agent = start_agent
+        self.staged_uploads = staged_uploads or []
+        self.staging_dir = staging_dir
+        if create_sandbox is None:
+            from sandbox.sandbox import create_sandbox
+        self.create_sandbox = create_sandbox
+        self.upload_concurrency = upload_concurrency
+        self.stage = QUEUED
+        self.sandbox_obj: Any = None
+        self._stop_requested = False
+
+    async def _publish(self, response: Dict[str, Any]) -> None:
+        try:
+            await redis.rpush(f"agent_run:{self.agent_run_id}:responses", encode_frame(response))
+            await redis.publish(f"agent_run:{self.agent_run_id}:new_response", "new")
+        except Exception as e:
+            logger.warning("Failed to publish provisioning event for agent run %s: %s", self.agent_run_id, e)
+
+    async def _transition(self, stage: str, **details: Any) -> None:
+        if stage not in TRANSITIONS[self.stage]:
+            raise ProvisioningError(f"Invalid provisioning transition {self.stage} -> {stage}")
+        self.stage = stage
+        logger.info("Provisioning project %s (agent run %s): %s", self.project_id, self.agent_run_id, stage)
+        if stage != FAILED:
+            await self._publish({"type": "status", "status": "provisioning", "stage": stage, "project_id": self.project_id, **details})
+
+    async def run(self) -> bool:
+        """Provision the project and start the agent. Returns True once the run was started."""
+        watcher = asyncio.create_task(self._watch_control(asyncio.current_task()))
+        try:
+            await self._transition(CREATING_SANDBOX)
+            await self._create_sandbox()
+
+            await self._transition(UPLOADING_FILES, files=len(self.staged_uploads))
+            uploaded, failed = await self._upload_files()
+
+            await self._transition(STARTING_AGENT, uploaded=len(uploaded), failed=len(failed))
+            message_content = await self._add_user_message(uploaded, failed)
+            await self._check_still_running()
+            watcher.cancel()
+            result = self.start_agent(message_content)
+            if inspect.isawaitable(result):
+                await result
+
+            await self._transition(READY)
+            return True
+        except asyncio.CancelledError:
+            if not self._stop_requested:
+                raise
+            # The cancellation came from our own STOP listener; finish normally
+            asyncio.current_task().uncancel()
+            self._stopped()
+            return False
+        except ProvisioningStopped:
+            self._stopped()
+            return False
+        except Exception as e:
+            await self._fail(e)
+            return False
+        finally:
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
+            await self._forget()
+            if self.staging_dir:
+                shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    async def _watch_control(self, provisioning: "asyncio.Task[bool]") -> None:
+        """Keep the heartbeat alive and cancel ``provisioning`` when the run receives STOP."""
+        pubsub = None
+        try:
+            try:
+                # Heartbeat first, so a sweep never sees the registered run without one
+                await redis.set(_heartbeat_key(self.agent_run_id), self.stage, ex=HEARTBEAT_TTL)
+                await redis.hset(PROVISIONING_RUNS_KEY, self.agent_run_id, self.project_id)
+                pubsub = await redis.create_pubsub()
+                await pubsub.subscribe(f"agent_run:{self.agent_run_id}:control")
+            except Exception as e:
+                logger.warning("Provisioning for agent run %s cannot receive control signals: %s", self.agent_run_id, e)
+            beat_at = time.monotonic()
+            while True:
+                if time.monotonic() - beat_at >= HEARTBEAT_INTERVAL:
+                    try:
+                        await redis.set(_heartbeat_key(self.agent_run_id), self.stage, ex=HEARTBEAT_TTL)
+                        beat_at = time.monotonic()
+                    except Exception as e:
+                        logger.warning("Failed to refresh provisioning heartbeat for agent run %s: %s", self.agent_run_id, e)
+                if pubsub is None:
+                    await asyncio.sleep(1)
+                    continue
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.5)
+                if message and message.get("type") == "message":
+                    data = message.get("data")
+                    if isinstance(data, bytes): data = data.decode('utf-8')
+                    if data == "STOP":
+                        logger.info(f"Received STOP signal while provisioning agent run {self.agent_run_id}")
+                        self._stop_requested = True
+                        provisioning.cancel()
+                        return
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning("Provisioning control listener for agent run %s failed: %s", self.agent_run_id, e)
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.unsubscribe()
+                    await pubsub.close()
+                except Exception as e:
+                    logger.warning("Error closing provisioning pubsub for agent run %s: %s", self.agent_run_id, e)
+
+    async def _check_still_running(self) -> None:
+        """Catch a stop that happened before the control channel was subscribed."""
+        result = await self.client.table('agent_runs').select('status').eq("id", self.agent_run_id).execute()
+        if not result.data or result.data[0].get('status') != "running":
+            raise ProvisioningStopped(f"Agent run {self.agent_run_id} is no longer running")
+
+    def _stopped(self) -> None:
+        # stop_agent_run already updated the run and its stream; the agent is simply never started
+        logger.info("Provisioning of project %s stopped at stage %s (agent run %s)", self.project_id, self.stage, self.agent_run_id)
+        self.stage = STOPPED
+
+    async def _forget(self) -> None:
+        try:
+            await redis.hdel(PROVISIONING_RUNS_KEY, self.agent_run_id)
+            await redis.delete(_heartbeat_key(self.agent_run_id))
+        except Exception as e:
+            logger.warning("Failed to clear provisioning state of agent run %s: %s", self.agent_run_id, e)
+
+    async def _create_sandbox(self) -> None:
+        """Create the sandbox and record it on the project, even if provisioning is stopped meanwhile."""
+        # A STOP cannot interrupt the creation thread; finishing the step records the sandbox on the
+        # project, where the usual sandbox lifecycle finds it, instead of leaving it orphaned
+        creation = asyncio.ensure_future(self._create_and_record_sandbox())
+        try:
+            await asyncio.shield(creation)
+        except asyncio.CancelledError:
+            await asyncio.gather(creation, return_exceptions=True)
+            raise
+
+    async def _create_and_record_sandbox(self) -> None:
+        sandbox_pass = str(uuid.uuid4())
+        # Sandbox creation and the preview lookups are blocking SDK/Docker calls
+        self.sandbox_obj = await asyncio.to_thread(self.create_sandbox, sandbox_pass, self.project_id)
+        sandbox_info = await asyncio.to_thread(describe_sandbox, self.sandbox_obj)
+        if not sandbox_info["id"]:
+            raise ProvisioningError("Sandbox ID could not be determined.")
+        logger.info(f"Created new {'local' if sandbox_info['is_local'] else 'Daytona'} sandbox {sandbox_info['id']} for project {self.project_id}")
+
+        update_result = await self.client.table('projects').update({
+            'sandbox': {**sandbox_info, 'pass': sandbox_pass}
+        }).eq('project_id', self.project_id).execute()
+        if not update_result.data:
+            raise ProvisioningError("Database update failed for project sandbox info")
+
+    async def _upload_files(self) -> Tuple[List[str], List[str]]:
+        """Push staged files to the sandbox concurrently and verify them with one directory listing."""
+        if not self.staged_uploads:
+            return [], []
+        if isinstance(self.sandbox_obj, dict):
+            logger.warning("Local sandbox file upload via /agent/initiate is not implemented. Skipping %d files.", len(self.staged_uploads))
+            return [], []
+
+        async def report(progress: UploadProgress) -> None:
+            await self._publish({
+                "type": "status", "status": "provisioning", "stage": UPLOADING_FILES,
+                "project_id": self.project_id, "file": progress.to_dict(),
+            })
+
+        sources = [open(staged.path, "rb") for staged in self.staged_uploads]
+        try:
+            items = [item_from_file(source, staged.target_path) for source, staged in zip(sources, self.staged_uploads)]
+            outcomes = await SandboxUploader(self.sandbox_obj, concurrency=self.upload_concurrency).upload(items, on_progress=report)
+        finally:
+            for source in sources:
+                source.close()
+        results = [outcome.status == UPLOADED for outcome in outcomes]
+
+        try:
+            listed = {f.name for f in await asyncio.to_thread(self.sandbox_obj.fs.list_files, WORKSPACE_DIR)}
+        except Exception as e:
+            logger.error(f"Error verifying uploaded files for project {self.project_id}: {str(e)}", exc_info=True)
+            listed = set()
+
+        uploaded, failed = [], []
+        for staged, ok in zip(self.staged_uploads, results):
+            if ok and staged.filename in listed:
+                uploaded.append(staged.target_path)
+            else:
+                failed.append(staged.filename)
+        logger.info("Uploaded %d/%d files to sandbox for project %s", len(uploaded), len(self.staged_uploads), self.project_id)
+        return uploaded, failed
+
+    async def _add_user_message(self, uploaded: List[str], failed: List[str]) -> str:
+        message_content = self.prompt
+        if uploaded:
+            message_content += "\n\n" if message_content else ""
+            for file_path in uploaded: message_content += f"[Uploaded File: {file_path}]\n"
+        if failed:
+            message_content += "\n\nThe following files failed to upload:\n"
+            for failed_file in failed: message_content += f"- {failed_file}\n"
+
+        await self.client.table('messages').insert({
+            "message_id": str(uuid.uuid4()), "thread_id": self.thread_id, "type": "user",
+            "is_llm_message": True, "content": json.dumps({"role": "user", "content": message_content}),
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }).execute()
+        return message_content
+
+    async def _fail(self, error: Exception) -> None:
+        failed_stage = self.stage
+        logger.error(f"Provisioning failed for project {self.project_id} at stage {failed_stage}: {str(error)}", exc_info=True)
+        self.stage = FAILED
+        message = f"Failed to initiate agent session: {str(error)}"
+        await self._publish({"type": "status", "status": "failed", "stage": failed_stage, "message": message})
+        await mark_run_failed(self.client, self.agent_run_id, message)
+
+
+def start_provisioning(provisioner: ProjectProvisioner) -> "asyncio.Task[bool]":
+    """Run a provisioner in the background, keeping a reference until it finishes."""
+    task = asyncio.create_task(provisioner.run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def fail_interrupted_runs(client) -> List[str]:
+    """Fail runs whose provisioner stopped heartbeating, e.g. because its process restarted."""
+    interrupted = []
+    for agent_run_id in await redis.hgetall(PROVISIONING_RUNS_KEY):
+        if await redis.get(_heartbeat_key(agent_run_id)) is not None:
+            continue
+        message = "Failed to initiate agent session: provisioning was interrupted by a server restart"
+        if await mark_run_failed(client, agent_run_id, message):
+            logger.warning(f"Marked agent run {agent_run_id} failed: its provisioning was interrupted")
+            try:
+                await redis.rpush(f"agent_run:{agent_run_id}:responses", encode_frame({"type": "status", "status": "failed", "message": message}))
+                await redis.publish(f"agent_run:{agent_run_id}:new_response", "new")
+            except Exception as e:
+                logger.warning("Failed to publish failure of interrupted agent run %s: %s", agent_run_id, e)
+            interrupted.append(agent_run_id)
+        await redis.hdel(PROVISIONING_RUNS_KEY, agent_run_id)
+    return interrupted
+
+
+async def sweep_interrupted_runs(client, interval: float = SWEEP_INTERVAL) -> None:
+    """Run ``fail_interrupted_runs`` every ``interval`` seconds until cancelled."""
+    while True:
+        try:
+            await fail_interrupted_runs(client)
+        except Exception as e:
+            logger.warning("Sweeping interrupted provisioning runs failed: %s", e)
+        await asyncio.sleep(interval)
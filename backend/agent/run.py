@@ -3,7 +3,7 @@ import json
 import re
 import time
 from uuid import uuid4
-from typing import Optional, Any, Dict, AsyncGenerator # Added AsyncGenerator
+from typing import Optional, Any, Dict, AsyncGenerator, TYPE_CHECKING # Added AsyncGenerator
 
 # from agent.tools.message_tool import MessageTool
 from .tools.message_tool import MessageTool
@@ -23,13 +23,14 @@ from .tools.data_providers_tool import DataProvidersTool
 from .tools.visualization_tool import DataVisualizationTool # Import DataVisualizationTool
 from .prompt import get_system_prompt
 from utils.logger import logger
+from utils.tracing import span
 from utils.auth_utils import get_account_id_from_thread
 from services.billing import check_billing_status
 from .tools.sb_vision_tool import SandboxVisionTool
 from services.langfuse import langfuse
-from langfuse.client import StatefulTraceClient
-from services.langfuse import langfuse
-from .gemini_prompt import get_gemini_system_prompt
+
+if TYPE_CHECKING:
+    from langfuse.client import StatefulTraceClient
 
 # Imports for TaskPlanner
 from agentpress.plan_executor import PlanExecutor
@@ -119,7 +120,7 @@ async def run_agent(
     enable_thinking: Optional[bool] = False,
     reasoning_effort: Optional[str] = 'low',
     enable_context_manager: bool = True,
-    trace: Optional[StatefulTraceClient] = None
+    trace: Optional["StatefulTraceClient"] = None
 ) -> Optional[AsyncGenerator[Dict[str, Any], None]]:
 
     final_main_task_id: Optional[str] = None
@@ -163,7 +164,7 @@ async def run_agent(
         thread_manager.add_tool(expose_tool)
         message_tool = MessageTool()
         thread_manager.add_tool(message_tool)
-        web_search_tool = SandboxWebSearchTool(project_id=project_id, thread_manager=thread_manager)
+        web_search_tool = SandboxWebSearchTool(project_id=project_id, thread_id=thread_id, thread_manager=thread_manager)
         thread_manager.add_tool(web_search_tool)
         vision_tool = SandboxVisionTool(project_id=project_id, thread_id=thread_id, thread_manager=thread_manager)
         thread_manager.add_tool(vision_tool)
@@ -212,10 +213,11 @@ async def run_agent(
         )
 
         logger.info(f"Initiating planning with TaskPlanner for prompt: '{initial_prompt_text[:100]}...'")
-        planned_main_task = await task_planner.plan_task(
-            task_description=initial_prompt_text,
-            context={"original_thread_id": thread_id, "project_id": project_id}
-        )
+        with span("planning"):
+            planned_main_task = await task_planner.plan_task(
+                task_description=initial_prompt_text,
+                context={"original_thread_id": thread_id, "project_id": project_id}
+            )
 
         if not planned_main_task or planned_main_task.status == "planning_failed":
             error_msg = "Planning failed."
@@ -245,7 +247,8 @@ async def run_agent(
             main_task_id=final_main_task_id
         )
 
-        await plan_executor.execute_plan_for_task(final_main_task_id)
+        with span("plan_execution"):
+            await plan_executor.execute_plan_for_task(final_main_task_id)
 
         logger.info(f"Plan execution process completed for task {final_main_task_id}")
 
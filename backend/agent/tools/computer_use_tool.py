@@ -1,14 +1,18 @@
-import os
 import time
 import base64
 import aiohttp
 import asyncio
 import logging
-from typing import Optional, Dict
-import os
+from typing import Optional, Dict, TYPE_CHECKING
 
 from agentpress.tool import Tool, ToolResult, openapi_schema, xml_schema
-from sandbox.tool_base import SandboxToolsBase, Sandbox
+from agent.tools.screen_channel import ScreenshotChannel
+from sandbox.tool_base import SandboxToolsBase
+from utils.config import config
+from utils.tracing import record_phase
+
+if TYPE_CHECKING:
+    from daytona_sdk import Sandbox
 
 KEYBOARD_KEYS = [
     'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm',
@@ -24,17 +28,33 @@ KEYBOARD_KEYS = [
 
 class ComputerUseTool(SandboxToolsBase):
     """Computer automation tool for controlling the sandbox browser and GUI."""
+
+    SCHEDULER_CLASS = "browser" # Drives the same browser/GUI as SandboxBrowserTool
+    # Screen pixels per screenshot pixel of the last screenshot sent to the model
+    screen_scale = 1.0
     
-    def __init__(self, sandbox: Sandbox):
+    def __init__(self, sandbox: "Sandbox"):
         """Initialize automation tool with sandbox connection."""
         super().__init__(sandbox)
         self.session = None
-        self.mouse_x = 0  # Track current mouse position
+        self.mouse_x = 0  # Track current mouse position, in screen pixels
         self.mouse_y = 0
         # Get automation service URL using port 8000
         self.api_base_url = self.sandbox.get_preview_link(8000)
         logging.info(f"Initialized Computer Use Tool with API URL: {self.api_base_url}")
+        self.screen = ScreenshotChannel(
+            self._fetch_screenshot,
+            history=config.COMPUTER_USE_SCREENSHOT_HISTORY,
+            model_max_width=config.COMPUTER_USE_SCREENSHOT_MAX_WIDTH,
+        )
     
+    def _to_screen(self, value: float) -> int:
+        """Screen pixels for a coordinate on the screenshots sent to the model."""
+        return int(round(float(value) * self.screen_scale))
+
+    def _to_model(self, value: int) -> int:
+        return int(round(value / self.screen_scale))
+
     async def _get_session(self) -> aiohttp.ClientSession:
         """Get or create aiohttp session for API requests."""
         if self.session is None or self.session.closed:
@@ -43,6 +63,7 @@ class ComputerUseTool(SandboxToolsBase):
     
     async def _api_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict:
         """Send request to automation service API."""
+        started = time.perf_counter()
         try:
             session = await self._get_session()
             url = f"{self.api_base_url}/api{endpoint}"
@@ -56,12 +77,28 @@ class ComputerUseTool(SandboxToolsBase):
                 async with session.post(url, json=data) as response:
                     result = await response.json()
             
-            logging.debug(f"API response: {result}")
+            # Responses can carry whole screenshots; log their shape, not their content
+            logging.debug(f"API response: {endpoint} keys={list(result) if isinstance(result, dict) else type(result).__name__}")
             return result
             
         except Exception as e:
             logging.error(f"API request failed: {str(e)}")
             return {"success": False, "error": str(e)}
+        finally:
+            record_phase("computer_use_action", time.perf_counter() - started, endpoint)
+
+    async def _fetch_screenshot(self) -> bytes:
+        """Raw PNG bytes of the screen; falls back to the base64 JSON response of older services."""
+        session = await self._get_session()
+        url = f"{self.api_base_url}/api/automation/screenshot"
+        async with session.post(url, headers={"Accept": "image/png"}) as response:
+            response.raise_for_status()
+            if response.content_type.startswith("image/"):
+                return await response.read()
+            result = await response.json()
+        if "image" not in result:
+            raise ValueError(result.get("error", "Screenshot response has no image"))
+        return base64.b64decode(result["image"])
     
     async def cleanup(self):
         """Clean up resources."""
@@ -79,11 +116,11 @@ class ComputerUseTool(SandboxToolsBase):
                 "properties": {
                     "x": {
                         "type": "number",
-                        "description": "X coordinate"
+                        "description": "X coordinate, in pixels of the screenshot"
                     },
                     "y": {
                         "type": "number",
-                        "description": "Y coordinate"
+                        "description": "Y coordinate, in pixels of the screenshot"
                     }
                 },
                 "required": ["x", "y"]
@@ -104,8 +141,7 @@ class ComputerUseTool(SandboxToolsBase):
     async def move_to(self, x: float, y: float) -> ToolResult:
         """Move cursor to specified position."""
         try:
-            x_int = int(round(float(x)))
-            y_int = int(round(float(y)))
+            x_int, y_int = self._to_screen(x), self._to_screen(y)
             
             result = await self._api_request("POST", "/automation/mouse/move", {
                 "x": x_int,
@@ -115,7 +151,7 @@ class ComputerUseTool(SandboxToolsBase):
             if result.get("success", False):
                 self.mouse_x = x_int
                 self.mouse_y = y_int
-                return ToolResult(success=True, output=f"Moved to ({x_int}, {y_int})")
+                return ToolResult(success=True, output=f"Moved to ({x}, {y})")
             else:
                 return ToolResult(success=False, output=f"Failed to move: {result.get('error', 'Unknown error')}")
                 
@@ -138,11 +174,11 @@ class ComputerUseTool(SandboxToolsBase):
                     },
                     "x": {
                         "type": "number",
-                        "description": "Optional X coordinate"
+                        "description": "Optional X coordinate, in pixels of the screenshot"
                     },
                     "y": {
                         "type": "number",
-                        "description": "Optional Y coordinate"
+                        "description": "Optional Y coordinate, in pixels of the screenshot"
                     },
                     "num_clicks": {
                         "type": "integer",
@@ -171,11 +207,9 @@ class ComputerUseTool(SandboxToolsBase):
                    button: str = "left", num_clicks: int = 1) -> ToolResult:
         """Click at current or specified position."""
         try:
-            x_val = x if x is not None else self.mouse_x
-            y_val = y if y is not None else self.mouse_y
-            
-            x_int = int(round(float(x_val)))
-            y_int = int(round(float(y_val)))
+            x_int = self._to_screen(x) if x is not None else self.mouse_x
+            y_int = self._to_screen(y) if y is not None else self.mouse_y
+            x_val, y_val = self._to_model(x_int), self._to_model(y_int)
             num_clicks = int(num_clicks)
             
             result = await self._api_request("POST", "/automation/mouse/click", {
@@ -189,7 +223,7 @@ class ComputerUseTool(SandboxToolsBase):
                 self.mouse_x = x_int
                 self.mouse_y = y_int
                 return ToolResult(success=True, 
-                                output=f"{num_clicks} {button} click(s) performed at ({x_int}, {y_int})")
+                                output=f"{num_clicks} {button} click(s) performed at ({x_val}, {y_val})")
             else:
                 return ToolResult(success=False, output=f"Failed to click: {result.get('error', 'Unknown error')}")
         except Exception as e:
@@ -405,11 +439,9 @@ class ComputerUseTool(SandboxToolsBase):
     async def mouse_down(self, button: str = "left", x: Optional[float] = None, y: Optional[float] = None) -> ToolResult:
         """Press a mouse button at current or specified position."""
         try:
-            x_val = x if x is not None else self.mouse_x
-            y_val = y if y is not None else self.mouse_y
-            
-            x_int = int(round(float(x_val)))
-            y_int = int(round(float(y_val)))
+            x_int = self._to_screen(x) if x is not None else self.mouse_x
+            y_int = self._to_screen(y) if y is not None else self.mouse_y
+            x_val, y_val = self._to_model(x_int), self._to_model(y_int)
             
             result = await self._api_request("POST", "/automation/mouse/down", {
                 "x": x_int,
@@ -420,7 +452,7 @@ class ComputerUseTool(SandboxToolsBase):
             if result.get("success", False):
                 self.mouse_x = x_int
                 self.mouse_y = y_int
-                return ToolResult(success=True, output=f"{button} button pressed at ({x_int}, {y_int})")
+                return ToolResult(success=True, output=f"{button} button pressed at ({x_val}, {y_val})")
             else:
                 return ToolResult(success=False, output=f"Failed to press button: {result.get('error', 'Unknown error')}")
         except Exception as e:
@@ -457,11 +489,9 @@ class ComputerUseTool(SandboxToolsBase):
     async def mouse_up(self, button: str = "left", x: Optional[float] = None, y: Optional[float] = None) -> ToolResult:
         """Release a mouse button at current or specified position."""
         try:
-            x_val = x if x is not None else self.mouse_x
-            y_val = y if y is not None else self.mouse_y
-            
-            x_int = int(round(float(x_val)))
-            y_int = int(round(float(y_val)))
+            x_int = self._to_screen(x) if x is not None else self.mouse_x
+            y_int = self._to_screen(y) if y is not None else self.mouse_y
+            x_val, y_val = self._to_model(x_int), self._to_model(y_int)
             
             result = await self._api_request("POST", "/automation/mouse/up", {
                 "x": x_int,
@@ -472,7 +502,7 @@ class ComputerUseTool(SandboxToolsBase):
             if result.get("success", False):
                 self.mouse_x = x_int
                 self.mouse_y = y_int
-                return ToolResult(success=True, output=f"{button} button released at ({x_int}, {y_int})")
+                return ToolResult(success=True, output=f"{button} button released at ({x_val}, {y_val})")
             else:
                 return ToolResult(success=False, output=f"Failed to release button: {result.get('error', 'Unknown error')}")
         except Exception as e:
@@ -488,11 +518,11 @@ class ComputerUseTool(SandboxToolsBase):
                 "properties": {
                     "x": {
                         "type": "number",
-                        "description": "Target X coordinate"
+                        "description": "Target X coordinate, in pixels of the screenshot"
                     },
                     "y": {
                         "type": "number",
-                        "description": "Target Y coordinate"
+                        "description": "Target Y coordinate, in pixels of the screenshot"
                     }
                 },
                 "required": ["x", "y"]
@@ -513,10 +543,8 @@ class ComputerUseTool(SandboxToolsBase):
     async def drag_to(self, x: float, y: float) -> ToolResult:
         """Click and drag from current position to target position."""
         try:
-            target_x = int(round(float(x)))
-            target_y = int(round(float(y)))
-            start_x = self.mouse_x
-            start_y = self.mouse_y
+            target_x, target_y = self._to_screen(x), self._to_screen(y)
+            start_x, start_y = self._to_model(self.mouse_x), self._to_model(self.mouse_y)
             
             result = await self._api_request("POST", "/automation/mouse/drag", {
                 "x": target_x,
@@ -529,49 +557,53 @@ class ComputerUseTool(SandboxToolsBase):
                 self.mouse_x = target_x
                 self.mouse_y = target_y
                 return ToolResult(success=True, 
-                                output=f"Dragged from ({start_x}, {start_y}) to ({target_x}, {target_y})")
+                                output=f"Dragged from ({start_x}, {start_y}) to ({x}, {y})")
             else:
                 return ToolResult(success=False, output=f"Failed to drag: {result.get('error', 'Unknown error')}")
         except Exception as e:
             return ToolResult(success=False, output=f"Failed to drag: {str(e)}")
 
-    async def get_screenshot_base64(self) -> Optional[dict]:
-        """Capture screen and return as base64 encoded image."""
+    async def get_screenshot_base64(self, changes_only: bool = False) -> Optional[dict]:
+        """Capture the screen and return it base64 encoded for the model.
+
+        Frames are kept in the channel's in-memory ring buffer, not written to disk. With
+        ``changes_only``, an unchanged screen returns no image and a mostly unchanged one
+        returns just the changed region (``region`` gives its box).
+
+        Images are downscaled to at most COMPUTER_USE_SCREENSHOT_MAX_WIDTH. ``width``,
+        ``height``, ``region`` and ``dirty_box`` are in pixels of that downscaled screen,
+        which is also the space the mouse tools take coordinates in; ``scale`` is the
+        number of screen pixels per screenshot pixel.
+        """
         try:
-            result = await self._api_request("POST", "/automation/screenshot")
-            
-            if "image" in result:
-                base64_str = result["image"]
-                timestamp = time.strftime("%Y%m%d_%H%M%S")
-                
-                # Save screenshot to file
-                screenshots_dir = "screenshots"
-                if not os.path.exists(screenshots_dir):
-                    os.makedirs(screenshots_dir)
-                
-                timestamped_filename = os.path.join(screenshots_dir, f"screenshot_{timestamp}.png")
-                latest_filename = "latest_screenshot.png"
-                
-                # Decode base64 string and save to file
-                img_data = base64.b64decode(base64_str)
-                with open(timestamped_filename, 'wb') as f:
-                    f.write(img_data)
-                
-                # Save a copy as the latest screenshot
-                with open(latest_filename, 'wb') as f:
-                    f.write(img_data)
-                
-                return {
-                    "content_type": "image/png",
-                    "base64": base64_str,
-                    "timestamp": timestamp,
-                    "filename": timestamped_filename
-                }
-            else:
-                return None
-                
+            frame = await self.screen.capture()
+            self.screen_scale = scale = self.screen.scale_for(frame)
+
+            def to_model(box):
+                return None if box is None else tuple(int(round(value / scale)) for value in box)
+
+            info = {
+                "content_type": "image/png",
+                "timestamp": time.strftime("%Y%m%d_%H%M%S", time.localtime(frame.captured_at)),
+                "seq": frame.seq,
+                "width": int(round(frame.width / scale)),
+                "height": int(round(frame.height / scale)),
+                "scale": round(scale, 4),
+                "changed": frame.changed,
+                "changed_ratio": round(frame.changed_ratio, 3),
+                "dirty_box": to_model(frame.dirty_box),
+            }
+            region = None
+            if changes_only and frame.seq > 1:
+                if not frame.changed:
+                    return {**info, "unchanged": True}
+                if frame.changed_ratio < 0.5:
+                    region = frame.dirty_box
+            image = await self.screen.render_for_model(frame, region)
+            return {**info, "region": to_model(region), "base64": base64.b64encode(image).decode("ascii")}
+
         except Exception as e:
-            print(f"[Screenshot] Error during screenshot process: {str(e)}")
+            logging.error(f"[Screenshot] Error during screenshot process: {str(e)}")
             return None
 
     @openapi_schema({
@@ -0,0 +1,256 @@
+"""
+Image preprocessing for the vision tool.
+
+``see_image`` turns workspace images into something cheap to send to the
+model. Decoding a 10MB PNG and resizing it takes hundreds of milliseconds of
+CPU, so the work runs in a process pool (``ImagePipeline``) instead of on the
+event loop:
+
+- JPEGs are decoded in draft mode, at the smallest DCT scale (1/2, 1/4, 1/8)
+  that still covers the target size
+- downscaling applies ``Image.reduce`` for the integer part of the factor,
+  then a LANCZOS resize for the remainder
+- output fits an ``ImageBudget`` of estimated tokens (width * height / 750)
+  and encoded bytes. PNG is kept for transparent images and lossless sources
+  (screenshots, diagrams) while it fits; otherwise JPEG quality steps down,
+  then the image shrinks, until it fits
+- results are cached by (content hash, budget), so looking at the same image
+  again costs nothing
+
+``SANDBOX_RESIZE_SCRIPT`` does a first, near-lossless downscale inside the
+sandbox, so large files are not transferred at full size.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from utils.tracing import record_phase
+
+# Pixels per token in the model's image token estimate
+TOKEN_PIXELS = 750
+JPEG_QUALITIES = (85, 75, 65, 50, 40)
+LOSSLESS_FORMATS = ("PNG", "GIF", "BMP", "TIFF")
+MIN_SIDE = 64
+
+# Run in the sandbox as: python3 -c SCRIPT <src> <dst> <max_width> <max_height> <max_pixels>
+# Prints the source's SHA-256 and, if it had to be downscaled, writes a near-lossless copy to <dst>
+SANDBOX_RESIZE_SCRIPT = """
+import hashlib, json, sys
+from PIL import Image
+src, dst = sys.argv[1], sys.argv[2]
+max_width, max_height, max_pixels = (int(arg) for arg in sys.argv[3:6])
+with open(src, 'rb') as f:
+    digest = hashlib.sha256(f.read()).hexdigest()
+img = Image.open(src)
+result = {'sha256': digest, 'width': img.width, 'height': img.height, 'path': None}
+scale = min(1.0, max_width / img.width, max_height / img.height, (max_pixels / (img.width * img.height)) ** 0.5)
+if scale < 1:
+    size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+    source_format = img.format
+    if source_format == 'JPEG':
+        img.draft(img.mode, size)
+    img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+    img = img.resize(size, Image.LANCZOS, reducing_gap=2.0)
+    if source_format == 'JPEG':
+        img.save(dst, format='JPEG', quality=95)
+    else:
+        img.save(dst, format='PNG', compress_level=1)
+    result.update(path=dst, width=img.width, height=img.height)
+print(json.dumps(result))
+"""
+
+
+# Leading bytes of the formats the model accepts
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+def sniff_mime_type(data: bytes) -> Optional[str]:
+    """MIME type of ``data`` from its signature, or None if it is not PNG, JPEG, GIF or WEBP."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    return None
+
+
+def estimate_tokens(width: int, height: int) -> int:
+    return math.ceil(width * height / TOKEN_PIXELS)
+
+
+@dataclass(frozen=True)
+class ImageBudget:
+    """Limits for an image sent to the model."""
+
+    max_width: int = 1920
+    max_height: int = 1080
+    max_tokens: int = 1600
+    max_bytes: int = 1024 * 1024
+
+    def fit(self, width: int, height: int) -> Tuple[int, int]:
+        """Largest size with the aspect ratio of ``width`` x ``height`` within the budget."""
+        scale = min(1.0, self.max_width / width, self.max_height / height)
+        if self.max_tokens:
+            scale = min(scale, math.sqrt(self.max_tokens * TOKEN_PIXELS / (width * height)))
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    # JPEG quality used; None for images sent as PNG or unchanged
+    quality: Optional[int] = None
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.width, self.height)
+
+
+def shrink(image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """``image`` resized to ``size``, reducing by the integer part of the factor first."""
+    if image.size == size:
+        return image
+    factor = min(image.width // size[0], image.height // size[1])
+    if factor >= 2:
+        image = image.reduce(factor)
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    return image
+
+
+def _normalize_mode(image: Image.Image) -> Image.Image:
+    """``image`` as L, RGB or (only if some pixel is transparent) RGBA."""
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        if image.getchannel("A").getextrema()[0] == 255:
+            image = image.convert("RGB")
+    elif image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    return image
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    if image.mode != "RGBA":
+        return image
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def _encode(image: Image.Image, format: str, quality: Optional[int] = None) -> bytes:
+    buffer = BytesIO()
+    if format == "PNG":
+        image.save(buffer, format="PNG", compress_level=6)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def prepare_image(data: bytes, budget: ImageBudget) -> PreparedImage:
+    """Decode, downscale and re-encode ``data`` to fit ``budget`` (CPU-bound; run in a worker)."""
+    image = Image.open(BytesIO(data))
+    source_format = image.format
+    original = image.size
+    target = budget.fit(*original)
+    if target == original and len(data) <= budget.max_bytes and source_format in ("JPEG", "PNG"):
+        return PreparedImage(data, f"image/{source_format.lower()}", *original, *original)
+
+    if source_format == "JPEG":
+        image.draft(image.mode, target)
+    image = _normalize_mode(image)
+    lossless = image.mode == "RGBA" or source_format in LOSSLESS_FORMATS
+    while True:
+        image = shrink(image, target)
+        if lossless:
+            png = _encode(image, "PNG")
+            if len(png) <= budget.max_bytes:
+                return PreparedImage(png, "image/png", *image.size, *original)
+        flat = _flatten(image)
+        for quality in JPEG_QUALITIES:
+            jpeg = _encode(flat, "JPEG", quality)
+            if len(jpeg) <= budget.max_bytes or (quality == JPEG_QUALITIES[-1] and min(image.size) <= MIN_SIDE):
+                return PreparedImage(jpeg, "image/jpeg", *image.size, *original, quality=quality)
+        # Even the lowest quality is over budget; keep shrinking
+        target = max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)
+
+
+class ImagePipeline:
+    """Runs ``prepare_image`` in a process pool and caches results by content hash and budget."""
+
+    def __init__(self, workers: int = 2, cache_max_bytes: int = 64 * 1024 * 1024):
+        self.workers = workers
+        self.cache_max_bytes = cache_max_bytes
+        self._cache: "OrderedDict[Tuple[str, ImageBudget], PreparedImage]" = OrderedDict()
+        self._cache_bytes = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned workers: forking a process with running threads and an event loop is unsafe
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def cached(self, digest: str, budget: ImageBudget) -> Optional[PreparedImage]:
+        prepared = self._cache.get((digest, budget))
+        if prepared is not None:
+            self._cache.move_to_end((digest, budget))
+        return prepared
+
+    def _remember(self, key: Tuple[str, ImageBudget], prepared: PreparedImage) -> None:
+        if key in self._cache or len(prepared.data) > self.cache_max_bytes:
+            return
+        self._cache[key] = prepared
+        self._cache_bytes += len(prepared.data)
+        while self._cache_bytes > self.cache_max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted.data)
+
+    async def prepare(self, data: bytes, budget: ImageBudget, digest: Optional[str] = None) -> Tuple[PreparedImage, bool]:
+        """``data`` prepared for ``budget``, and whether it came from the cache.
+
+        ``digest`` identifies the content when ``data`` is a copy already downscaled in the sandbox.
+        """
+        digest = digest or hashlib.sha256(data).hexdigest()
+        prepared = self.cached(digest, budget)
+        if prepared is not None:
+            return prepared, True
+
+        started = time.perf_counter()
+        if self.workers:
+            try:
+                prepared = await asyncio.get_running_loop().run_in_executor(self._get_executor(), prepare_image, data, budget)
+            except BrokenProcessPool:
+                logging.warning("[SeeImage] Image worker pool broke; processing in a thread")
+                self._executor = None
+        if prepared is None:
+            prepared = await asyncio.to_thread(prepare_image, data, budget)
+        record_phase("image_prepare", time.perf_counter() - started, prepared.mime_type)
+        self._remember((digest, budget), prepared)
+        return prepared, False
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -14,6 +14,8 @@ class MessageTool(Tool):
     attachments and user takeover suggestions.
     """
 
+    SCHEDULER_CLASS = "interactive" # User-visible, scheduled ahead of other tools
+
     def __init__(self):
         super().__init__()
 
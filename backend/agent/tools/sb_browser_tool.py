@@ -1,11 +1,19 @@
 import traceback
 import json
+import shlex
+import time
+from typing import Optional
+from urllib.parse import urlencode
 
 from agentpress.tool import openapi_schema, xml_schema # ToolResult removed
 from agentpress.thread_manager import ThreadManager
+from sandbox.browser_client import (
+    SESSION_HEADER, BrowserRouteCache, BrowserServiceError, action_timeout, get_browser_client,
+)
 from sandbox.tool_base import SandboxToolsBase
 from utils.logger import logger
 from utils.s3_upload_utils import upload_base64_image
+from utils.tracing import record_phase
 
 # Custom Exceptions
 class BrowserToolError(Exception):
@@ -14,10 +22,76 @@ class BrowserToolError(Exception):
 
 class SandboxBrowserTool(SandboxToolsBase):
     """Tool for executing tasks in a Daytona sandbox with browser-use capabilities."""
+
+    SCHEDULER_CLASS = "browser" # One browser per sandbox, so actions are serialized per sandbox
     
     def __init__(self, project_id: str, thread_id: str, thread_manager: ThreadManager):
         super().__init__(project_id, thread_manager) # Pass project_id to super
         self.thread_id = thread_id
+        self._browser_route = BrowserRouteCache()
+
+    async def _browser_request(self, endpoint: str, params: Optional[dict], method: str) -> dict:
+        """Call the browser service directly when possible, through sandbox exec otherwise."""
+        started = time.perf_counter()
+        route = await self._browser_route.get(self.sandbox)
+        via = "exec"
+        try:
+            if route is not None:
+                try:
+                    via = "http"
+                    # Each thread gets its own browser context in the sandbox
+                    return await get_browser_client().request(
+                        route, endpoint, params, method, headers={SESSION_HEADER: self.thread_id}
+                    )
+                except BrowserServiceError as e:
+                    if e.request_sent:
+                        raise BrowserToolError(f"Browser API request ({endpoint}) failed: {e}") from e
+                    # The action never reached the service, so running it through exec cannot repeat it
+                    logger.warning(f"Direct browser service route failed, using sandbox exec: {e}")
+                    self._browser_route.unavailable()
+                    via = "exec"
+            return await self._browser_request_via_exec(endpoint, params, method)
+        finally:
+            record_phase("browser_request", time.perf_counter() - started, f"{endpoint}:{via}")
+
+    async def _browser_request_via_exec(self, endpoint: str, params: Optional[dict], method: str) -> dict:
+        """Call the browser service with curl inside the sandbox."""
+        url = f"http://localhost:8003/api/automation/{endpoint}"
+        if method == "GET" and params:
+            url = f"{url}?{urlencode(params)}"
+        curl_cmd = (f"curl -s -X {method} {shlex.quote(url)} -H 'Content-Type: application/json' "
+                    f"-H {shlex.quote(f'{SESSION_HEADER}: {self.thread_id}')}")
+        if params and method != "GET":
+            curl_cmd += f" -d {shlex.quote(json.dumps(params))}"
+
+        logger.debug("\033[95mExecuting curl command:\033[0m")
+        logger.debug(f"{curl_cmd}")
+
+        sandbox_result = await self._execute_in_sandbox(
+            command=curl_cmd,
+            session_id=None, # Direct exec for curl
+            is_blocking=True,
+            timeout=int(action_timeout(endpoint, params)) + 30,
+            expected_content_type="json"
+        )
+
+        if sandbox_result["exit_code"] != 0:
+            error_detail = f"Browser API request ({endpoint}) via curl failed. Exit code: {sandbox_result['exit_code']}. Output: {sandbox_result.get('output', '')[:500]}"
+            logger.error(error_detail)
+            raise BrowserToolError(error_detail)
+
+        if sandbox_result.get("json_parse_error"):
+            parse_error = sandbox_result["json_parse_error"]
+            raw_output = sandbox_result.get("output", "")
+            logger.error(f"Failed to parse JSON response from browser API ({endpoint}): {parse_error}. Raw output: {raw_output[:200]}", exc_info=True)
+            raise BrowserToolError(f"Browser API ({endpoint}) returned non-JSON response: {raw_output[:200]}...") from json.JSONDecodeError(parse_error, raw_output, 0)
+
+        api_result = sandbox_result.get("parsed_json")
+        if api_result is None: # Should not happen if json_parse_error is not set and output was expected to be JSON
+            raw_output = sandbox_result.get("output", "")
+            logger.error(f"Browser API ({endpoint}) call succeeded but parsed_json is missing. Raw output: {raw_output[:200]}")
+            raise BrowserToolError(f"Browser API ({endpoint}) call succeeded but parsed_json is missing. Raw output: {raw_output[:200]}")
+        return api_result
 
     async def _execute_browser_action(self, endpoint: str, params: dict = None, method: str = "POST") -> dict:
         """Execute a browser automation action through the API.
@@ -40,46 +114,7 @@ class SandboxBrowserTool(SandboxToolsBase):
             # Ensure sandbox is initialized
             await self._ensure_sandbox()
             
-            # Build the curl command
-            url = f"http://localhost:8003/api/automation/{endpoint}"
-            
-            if method == "GET" and params:
-                query_params = "&".join([f"{k}={v}" for k, v in params.items()])
-                url = f"{url}?{query_params}"
-                curl_cmd = f"curl -s -X {method} '{url}' -H 'Content-Type: application/json'"
-            else:
-                curl_cmd = f"curl -s -X {method} '{url}' -H 'Content-Type: application/json'"
-                if params:
-                    json_data = json.dumps(params)
-                    curl_cmd += f" -d '{json_data}'"
-            
-            logger.debug("\033[95mExecuting curl command:\033[0m")
-            logger.debug(f"{curl_cmd}")
-            
-            sandbox_result = await self._execute_in_sandbox(
-                command=curl_cmd,
-                session_id=None, # Direct exec for curl
-                is_blocking=True,
-                timeout=60, # Increased timeout
-                expected_content_type="json"
-            )
-
-            if sandbox_result["exit_code"] != 0:
-                error_detail = f"Browser API request ({endpoint}) via curl failed. Exit code: {sandbox_result['exit_code']}. Output: {sandbox_result.get('output', '')[:500]}"
-                logger.error(error_detail)
-                raise BrowserToolError(error_detail)
-
-            if sandbox_result.get("json_parse_error"):
-                parse_error = sandbox_result["json_parse_error"]
-                raw_output = sandbox_result.get("output", "")
-                logger.error(f"Failed to parse JSON response from browser API ({endpoint}): {parse_error}. Raw output: {raw_output[:200]}", exc_info=True)
-                raise BrowserToolError(f"Browser API ({endpoint}) returned non-JSON response: {raw_output[:200]}...") from json.JSONDecodeError(parse_error, raw_output, 0)
-
-            api_result = sandbox_result.get("parsed_json")
-            if api_result is None: # Should not happen if json_parse_error is not set and output was expected to be JSON
-                raw_output = sandbox_result.get("output", "")
-                logger.error(f"Browser API ({endpoint}) call succeeded but parsed_json is missing. Raw output: {raw_output[:200]}")
-                raise BrowserToolError(f"Browser API ({endpoint}) call succeeded but parsed_json is missing. Raw output: {raw_output[:200]}")
+            api_result = await self._browser_request(endpoint, params, method)
 
             # Ensure default keys exist, similar to original logic
             if "content" not in api_result:
@@ -128,6 +163,10 @@ class SandboxBrowserTool(SandboxToolsBase):
                 tool_output_data["image_url"] = api_result["image_url"]
             if api_result.get("image_upload_error"):
                 tool_output_data["image_upload_error"] = api_result["image_upload_error"]
+            if "steps" in api_result:
+                tool_output_data["steps"] = api_result["steps"]
+                tool_output_data["completed_steps"] = api_result.get("completed_steps", 0)
+                tool_output_data["failed_step"] = api_result.get("failed_step")
 
             return tool_output_data
 
@@ -531,64 +570,45 @@ class SandboxBrowserTool(SandboxToolsBase):
         logger.debug(f"\033[95mClosing tab: {page_id}\033[0m")
         return await self._execute_browser_action("close_tab", {"page_id": page_id})
 
-    # @openapi_schema({
-    #     "type": "function",
-    #     "function": {
-    #         "name": "browser_extract_content",
-    #         "description": "Extract content from the current page based on the provided goal",
-    #         "parameters": {
-    #             "type": "object",
-    #             "properties": {
-    #                 "goal": {
-    #                     "type": "string",
-    #                     "description": "The extraction goal (e.g., 'extract all links', 'find product information')"
-    #                 }
-    #             },
-    #             "required": ["goal"]
-    #         }
-    #     }
-    # })
-    # @xml_schema(
-    #     tag_name="browser-extract-content",
-    #     mappings=[
-    #         {"param_name": "goal", "node_type": "content", "path": "."}
-    #     ],
-    #     example='''
-    #     <browser-extract-content>
-    #     Extract all links on the page
-    #     </browser-extract-content>
-    #     '''
-    # )
-    # async def browser_extract_content(self, goal: str) -> ToolResult:
-    #     """Extract content from the current page based on the provided goal
-        
-    #     Args:
-    #         goal (str): The extraction goal
-            
-    #     Returns:
-    #         dict: Result of the execution
-    #     """
-    #     logger.debug(f"\033[95mExtracting content with goal: {goal}\033[0m")
-    #     result = await self._execute_browser_action("extract_content", {"goal": goal})
+    @openapi_schema({
+        "type": "function",
+        "function": {
+            "name": "browser_extract_content",
+            "description": "Get the current page's main content as cleaned markdown (navigation, ads, scripts and hidden elements removed). Cheaper than scrolling through screenshots to read a long page; unchanged page content is served from a cache.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "goal": {
+                        "type": "string",
+                        "description": "What you are looking for on the page (e.g., 'product prices', 'installation steps')"
+                    }
+                },
+                "required": ["goal"]
+            }
+        }
+    })
+    @xml_schema(
+        tag_name="browser-extract-content",
+        mappings=[
+            {"param_name": "goal", "node_type": "content", "path": "."}
+        ],
+        example='''
+        <browser-extract-content>
+        Installation steps
+        </browser-extract-content>
+        '''
+    )
+    async def browser_extract_content(self, goal: str) -> dict:
+        """Extract the current page's content as markdown
         
-    #     # Format content for better readability
-    #     if result.get("success"):
-    #         logger.debug(f"\033[92mContent extraction successful\033[0m")
-    #         content = result.data.get("content", "")
-    #         url = result.data.get("url", "")
-    #         title = result.data.get("title", "")
+        Args:
+            goal (str): What the content is needed for
             
-    #         if content:
-    #             content_preview = content[:200] + "..." if len(content) > 200 else content
-    #             logger.debug(f"\033[95mExtracted content from {title} ({url}):\033[0m")
-    #             logger.debug(f"\033[96m{content_preview}\033[0m")
-    #             logger.debug(f"\033[95mTotal content length: {len(content)} characters\033[0m")
-    #         else:
-    #             logger.debug(f"\033[93mNo content extracted from {url}\033[0m")
-    #     else:
-    #         logger.debug(f"\033[91mFailed to extract content: {result.data.get('error', 'Unknown error')}\033[0m")
-        
-    #     return result
+        Returns:
+            dict: Result of the execution, with the markdown under api_response.content
+        """
+        logger.debug(f"\033[95mExtracting content with goal: {goal}\033[0m")
+        return await self._execute_browser_action("extract_content", {"goal": goal})
 
     @openapi_schema({
         "type": "function",
@@ -932,4 +952,67 @@ class SandboxBrowserTool(SandboxToolsBase):
             dict: Result of the execution
         """
         logger.debug(f"\033[95mClicking at coordinates: ({x}, {y})\033[0m")
-        return await self._execute_browser_action("click_coordinates", {"x": x, "y": y})
\ No newline at end of file
+        return await self._execute_browser_action("click_coordinates", {"x": x, "y": y})
+
+    @openapi_schema({
+        "type": "function",
+        "function": {
+            "name": "browser_run_actions",
+            "description": "Run a sequence of browser actions in one request and get the browser state once, after the last action or at the first failed one. Use this for multi-step interactions such as filling a form and submitting it. Each step names an action (navigate_to, go_back, wait, click_element, click_coordinates, input_text, send_keys, switch_tab, open_tab, close_tab, scroll_down, scroll_up, scroll_to_text, select_dropdown_option, drag_drop) with the same parameters as the matching browser tool, and can set 'expect' conditions (url_contains, title_contains, text_visible, selector_visible, load_state, timeout_ms) that must be met before the next step runs.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "actions": {
+                        "type": "array",
+                        "description": "Ordered steps, e.g. [{\"action\": \"input_text\", \"params\": {\"index\": 3, \"text\": \"hello\"}}, {\"action\": \"send_keys\", \"params\": {\"keys\": \"Enter\"}, \"expect\": {\"load_state\": \"load\"}}]",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "action": {"type": "string"},
+                                "params": {"type": "object"},
+                                "expect": {"type": "object"}
+                            },
+                            "required": ["action"]
+                        }
+                    }
+                },
+                "required": ["actions"]
+            }
+        }
+    })
+    @xml_schema(
+        tag_name="browser-run-actions",
+        mappings=[
+            {"param_name": "actions", "node_type": "content", "path": "."}
+        ],
+        example='''
+        <browser-run-actions>
+        [{"action": "input_text", "params": {"index": 3, "text": "jane@example.com"}},
+         {"action": "input_text", "params": {"index": 4, "text": "secret"}},
+         {"action": "send_keys", "params": {"keys": "Enter"}, "expect": {"url_contains": "/dashboard"}}]
+        </browser-run-actions>
+        '''
+    )
+    async def browser_run_actions(self, actions) -> dict:
+        """Run several browser actions in one round trip
+        
+        Args:
+            actions (list | str): Steps as a list of {"action", "params", "expect"} objects (or its JSON)
+            
+        Returns:
+            dict: Result of the execution, with per-step results and the final browser state
+        """
+        if isinstance(actions, str):
+            try:
+                actions = json.loads(actions)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"actions must be a JSON list of steps: {e}")
+        if not isinstance(actions, list) or not actions:
+            raise ValueError("actions must be a non-empty list of steps.")
+        steps = []
+        for step in actions:
+            if not isinstance(step, dict) or not isinstance(step.get("action"), str):
+                raise ValueError(f"Each step needs an 'action' name: {step!r}")
+            steps.append({key: step[key] for key in ("action", "params", "expect") if step.get(key) is not None})
+        logger.debug(f"\033[95mRunning {len(steps)} browser actions: {[step['action'] for step in steps]}\033[0m")
+        return await self._execute_browser_action("batch", {"steps": steps})
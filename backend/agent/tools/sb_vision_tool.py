@@ -1,13 +1,18 @@
 import os
+import asyncio
 import base64
 import mimetypes
+import shlex
+import uuid
 from typing import Optional, Tuple
-from io import BytesIO
-from PIL import Image
 
 from agentpress.tool import openapi_schema, xml_schema # ToolResult removed
+from agent.tools.image_pipeline import (
+    SANDBOX_RESIZE_SCRIPT, TOKEN_PIXELS, ImageBudget, ImagePipeline, prepare_image, sniff_mime_type,
+)
 from sandbox.tool_base import SandboxToolsBase
 from agentpress.thread_manager import ThreadManager
+from utils.config import config
 # import json # Not used directly in this file after refactor
 import logging # Added for logging
 
@@ -22,11 +27,28 @@ mimetypes.add_type("image/gif", ".gif")
 MAX_IMAGE_SIZE = 10 * 1024 * 1024
 MAX_COMPRESSED_SIZE = 5 * 1024 * 1024
 
-# Compression settings
+# Compression settings (token and byte budgets come from config.VISION_IMAGE_*)
 DEFAULT_MAX_WIDTH = 1920 # Pixels
 DEFAULT_MAX_HEIGHT = 1080 # Pixels
-DEFAULT_JPEG_QUALITY = 85 # 0-100
-DEFAULT_PNG_COMPRESS_LEVEL = 6 # 0-9
+
+_image_pipeline: Optional[ImagePipeline] = None
+
+
+def get_image_pipeline() -> ImagePipeline:
+    """Process pool and result cache shared by every vision tool in this process."""
+    global _image_pipeline
+    if _image_pipeline is None:
+        _image_pipeline = ImagePipeline(workers=config.VISION_IMAGE_WORKERS, cache_max_bytes=config.VISION_IMAGE_CACHE_BYTES)
+    return _image_pipeline
+
+
+def image_budget() -> ImageBudget:
+    return ImageBudget(
+        max_width=DEFAULT_MAX_WIDTH,
+        max_height=DEFAULT_MAX_HEIGHT,
+        max_tokens=config.VISION_IMAGE_MAX_TOKENS,
+        max_bytes=config.VISION_IMAGE_MAX_BYTES,
+    )
 
 # Custom Exceptions
 class VisionToolError(Exception):
@@ -43,7 +65,9 @@ class SandboxVisionTool(SandboxToolsBase):
         self.thread_manager = thread_manager
 
     def compress_image(self, image_bytes: bytes, mime_type: str, file_path: str) -> Tuple[bytes, str]:
-        """Compress an image to reduce its size while maintaining reasonable quality.
+        """Compress an image to fit the configured token and byte budget (synchronous).
+        
+        ``see_image`` runs the same processing in a worker process; see agent/tools/image_pipeline.py.
         
         Args:
             image_bytes: Original image bytes
@@ -54,68 +78,34 @@ class SandboxVisionTool(SandboxToolsBase):
             Tuple of (compressed_bytes, new_mime_type)
         """
         try:
-            # Open image from bytes
-            img = Image.open(BytesIO(image_bytes))
-            
-            # Convert RGBA to RGB if necessary (for JPEG)
-            if img.mode in ('RGBA', 'LA', 'P') and mime_type != 'image/png': # Keep PNGs as RGBA if they are
-                # Create a white background
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                # If mode is 'P' (Palette), convert to RGBA first to ensure alpha channel is handled if present
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-
-                # Paste using alpha channel as mask if available
-                if img.mode == 'RGBA':
-                    background.paste(img, mask=img.split()[-1])
-                else: # For 'LA' or other modes that might not have alpha in the same way after conversion
-                    background.paste(img)
-                img = background
-            
-            # Calculate new dimensions while maintaining aspect ratio
-            original_width, original_height = img.size
-            resized_width, resized_height = original_width, original_height
-
-            if original_width > DEFAULT_MAX_WIDTH or original_height > DEFAULT_MAX_HEIGHT:
-                ratio = min(DEFAULT_MAX_WIDTH / original_width, DEFAULT_MAX_HEIGHT / original_height)
-                resized_width = int(original_width * ratio)
-                resized_height = int(original_height * ratio)
-                img = img.resize((resized_width, resized_height), Image.Resampling.LANCZOS)
-                logging.info(f"[SeeImage] Resized image from {original_width}x{original_height} to {resized_width}x{resized_height} for '{file_path}'")
-            
-            output_buffer = BytesIO()
-            output_mime = mime_type # Default to original, change if format changes
-            
-            if mime_type == 'image/gif':
-                img.save(output_buffer, format='GIF', optimize=True) # optimize for GIFs
-            elif mime_type == 'image/png':
-                img.save(output_buffer, format='PNG', optimize=True, compress_level=DEFAULT_PNG_COMPRESS_LEVEL)
-            elif mime_type in ('image/jpeg', 'image/jpg'):
-                img.save(output_buffer, format='JPEG', quality=DEFAULT_JPEG_QUALITY, optimize=True)
-            else: # For WEBP or other types, try to save as JPEG as a common compressed format
-                logging.info(f"[SeeImage] Converting '{file_path}' from {mime_type} to JPEG for compression.")
-                # Ensure image is in RGB mode for JPEG saving if it's not already handled
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                img.save(output_buffer, format='JPEG', quality=DEFAULT_JPEG_QUALITY, optimize=True)
-                output_mime = 'image/jpeg' # Mime type changed
-            
-            compressed_bytes = output_buffer.getvalue()
-            
-            original_size_kb = len(image_bytes) / 1024
-            compressed_size_kb = len(compressed_bytes) / 1024
-            if original_size_kb > 0: # Avoid division by zero for empty files
-                compression_ratio = (1 - compressed_size_kb / original_size_kb) * 100
-                logging.info(f"[SeeImage] Compressed '{file_path}': {original_size_kb:.1f}KB -> {compressed_size_kb:.1f}KB ({compression_ratio:.1f}% reduction). New MIME: {output_mime}")
-            else:
-                logging.info(f"[SeeImage] Processed '{file_path}': {original_size_kb:.1f}KB -> {compressed_size_kb:.1f}KB. New MIME: {output_mime}")
-
-            return compressed_bytes, output_mime
-            
+            prepared = prepare_image(image_bytes, image_budget())
+            logging.info(f"[SeeImage] Compressed '{file_path}': {len(image_bytes) / 1024:.1f}KB -> {len(prepared.data) / 1024:.1f}KB, "
+                         f"{prepared.original_width}x{prepared.original_height} -> {prepared.width}x{prepared.height}. New MIME: {prepared.mime_type}")
+            return prepared.data, prepared.mime_type
         except Exception as e:
             logging.error(f"[SeeImage] Failed to compress image '{file_path}': {str(e)}", exc_info=True)
             return image_bytes, mime_type # Return original if compression fails
 
+    async def _resize_in_sandbox(self, full_path: str, budget: ImageBudget) -> Optional[dict]:
+        """Hash the image and, if it exceeds the budget's size, downscale a copy inside the sandbox.
+
+        Returns the script's output (``sha256``, and ``path`` of the copy or None), or None on failure.
+        """
+        copy_path = f"/tmp/see_image_{uuid.uuid4().hex}"
+        command = " ".join([
+            "python3", "-c", shlex.quote(SANDBOX_RESIZE_SCRIPT), shlex.quote(full_path), copy_path,
+            str(budget.max_width), str(budget.max_height), str(budget.max_tokens * TOKEN_PIXELS if budget.max_tokens else 10 ** 12),
+        ])
+        try:
+            result = await self._execute_in_sandbox(command, timeout=60, expected_content_type="json")
+        except Exception as e:
+            logging.warning(f"[SeeImage] In-sandbox resize of '{full_path}' failed: {e}")
+            return None
+        if result.get("exit_code") != 0 or not isinstance(result.get("parsed_json"), dict):
+            logging.warning(f"[SeeImage] In-sandbox resize of '{full_path}' failed: {str(result.get('output', ''))[:200]}")
+            return None
+        return result["parsed_json"]
+
     @openapi_schema({
         "type": "function",
         "function": {
@@ -167,11 +157,6 @@ class SandboxVisionTool(SandboxToolsBase):
             if file_info.size > MAX_IMAGE_SIZE:
                 raise ValueError(f"Image file '{cleaned_path}' is too large ({file_info.size / (1024*1024):.2f}MB). Max original size: {MAX_IMAGE_SIZE / (1024*1024)}MB.")
 
-            try:
-                image_bytes = self.sandbox.fs.download_file(full_path) # Assuming this is synchronous or handled by Daytona SDK
-            except Exception as e_download:
-                raise VisionToolError(f"Could not read image file '{cleaned_path}': {str(e_download)}") from e_download
-
             mime_type, _ = mimetypes.guess_type(full_path)
             if not mime_type or not mime_type.startswith('image/'):
                 ext = os.path.splitext(cleaned_path)[1].lower()
@@ -180,7 +165,46 @@ class SandboxVisionTool(SandboxToolsBase):
                 if not mime_type:
                     raise ValueError(f"Unsupported or unknown image format for file: '{cleaned_path}'. Supported: JPG, PNG, GIF, WEBP.")
 
-            compressed_bytes, compressed_mime_type = self.compress_image(image_bytes, mime_type, cleaned_path)
+            # Large images are hashed and downscaled in the sandbox, so a cached result skips the download
+            # and a miss transfers the smaller copy
+            budget = image_budget()
+            pipeline = get_image_pipeline()
+            digest, download_path = None, full_path
+            if config.VISION_SANDBOX_RESIZE_MIN_BYTES and file_info.size >= config.VISION_SANDBOX_RESIZE_MIN_BYTES:
+                resized = await self._resize_in_sandbox(full_path, budget)
+                if resized:
+                    digest = resized.get("sha256")
+                    download_path = resized.get("path") or full_path
+
+            prepared = pipeline.cached(digest, budget) if digest else None
+            cached = prepared is not None
+            if prepared is None:
+                try:
+                    image_bytes = await asyncio.to_thread(self.sandbox.fs.download_file, download_path)
+                except Exception as e_download:
+                    raise VisionToolError(f"Could not read image file '{cleaned_path}': {str(e_download)}") from e_download
+                finally:
+                    if download_path != full_path:
+                        try:
+                            await asyncio.to_thread(self.sandbox.fs.delete_file, download_path)
+                        except Exception as e_cleanup:
+                            logging.warning(f"[SeeImage] Could not remove resized copy '{download_path}': {e_cleanup}")
+                try:
+                    prepared, cached = await pipeline.prepare(image_bytes, budget, digest)
+                except Exception as e_prepare:
+                    logging.error(f"[SeeImage] Failed to compress image '{cleaned_path}': {str(e_prepare)}", exc_info=True)
+
+            if prepared is not None:
+                compressed_bytes, compressed_mime_type = prepared.data, prepared.mime_type
+                logging.info(f"[SeeImage] Prepared '{cleaned_path}'{' (cached)' if cached else ''}: "
+                             f"{prepared.original_width}x{prepared.original_height} -> {prepared.width}x{prepared.height}, "
+                             f"{len(compressed_bytes) / 1024:.1f}KB {compressed_mime_type}")
+            else:
+                # Send the downloaded bytes if compression fails, labelled by their content: a copy resized in
+                # the sandbox is not in the original file's format
+                compressed_bytes, compressed_mime_type = image_bytes, sniff_mime_type(image_bytes)
+                if compressed_mime_type is None:
+                    raise VisionToolError(f"Could not process image '{cleaned_path}': unrecognized image data.")
             
             if len(compressed_bytes) > MAX_COMPRESSED_SIZE:
                 raise ValueError(f"Image '{cleaned_path}' is too large after compression ({len(compressed_bytes)/(1024*1024):.2f}MB). Max compressed: {MAX_COMPRESSED_SIZE/(1024*1024)}MB.")
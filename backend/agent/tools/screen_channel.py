@@ -0,0 +1,191 @@
+"""
+Screenshot channel for computer-use tools.
+
+Computer-use loops take a screenshot after nearly every action, often several
+per second. The channel keeps that cheap:
+
+- frames arrive as raw PNG bytes when the automation service supports it
+  (base64 JSON is still accepted)
+- each frame is diffed against the previous one in square tiles, so callers
+  know whether anything changed and where (``dirty_box``), and can send only
+  the changed region, or nothing at all
+- frames for the model can be downscaled to ``model_max_width``. Crops are
+  rendered at the same scale as the full frame, so the model works in one
+  coordinate space; ``scale_for`` gives the screen pixels per image pixel
+- the last ``history`` frames are kept in an in-memory ring buffer instead of
+  being written to disk
+
+Decoding, diffing and encoding run in a worker thread, off the event loop.
+Fetch and processing times are recorded with ``record_phase``.
+"""
+
+import asyncio
+import io
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageChops
+
+from utils.tracing import record_phase
+
+Box = Tuple[int, int, int, int]
+
+
+@dataclass
+class ScreenFrame:
+    """One captured screen with its diff against the previous frame."""
+
+    seq: int
+    png: bytes
+    width: int
+    height: int
+    captured_at: float
+    # Tiles whose pixels differ from the previous frame (every tile for the first frame)
+    dirty_tiles: int
+    total_tiles: int
+    # Bounding box of the dirty tiles, as (left, top, right, bottom); None when nothing changed
+    dirty_box: Optional[Box]
+    fetch_seconds: float
+    process_seconds: float
+
+    @property
+    def changed(self) -> bool:
+        return self.dirty_tiles > 0
+
+    @property
+    def changed_ratio(self) -> float:
+        return self.dirty_tiles / self.total_tiles if self.total_tiles else 0.0
+
+
+def dirty_tiles(previous: Optional[Image.Image], current: Image.Image, tile_size: int) -> Tuple[List[Box], int]:
+    """Tiles of ``current`` that differ from ``previous``, and the total number of tiles."""
+    width, height = current.size
+    columns = -(-width // tile_size)
+    rows = -(-height // tile_size)
+    all_tiles = [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in range(0, height, tile_size) for x in range(0, width, tile_size)
+    ]
+    if previous is None or previous.size != current.size:
+        return all_tiles, columns * rows
+    difference = ImageChops.difference(previous, current)
+    changed = difference.getbbox()
+    if changed is None:
+        return [], columns * rows
+    # Only tiles overlapping the overall changed area need a closer look
+    left, top, right, bottom = changed
+    tiles = [
+        tile for tile in all_tiles
+        if tile[0] < right and tile[2] > left and tile[1] < bottom and tile[3] > top
+        and difference.crop(tile).getbbox() is not None
+    ]
+    return tiles, columns * rows
+
+
+def bounding_box(tiles: List[Box]) -> Optional[Box]:
+    if not tiles:
+        return None
+    return min(t[0] for t in tiles), min(t[1] for t in tiles), max(t[2] for t in tiles), max(t[3] for t in tiles)
+
+
+def downscale(image: Image.Image, max_width: Optional[int]) -> Image.Image:
+    """``image`` scaled to at most ``max_width`` pixels wide, using ``reduce`` for integer factors."""
+    if not max_width or image.width <= max_width:
+        return image
+    factor = image.width // max_width
+    if factor >= 2 and image.width / factor <= max_width * 1.25:
+        image = image.reduce(factor)
+    if image.width > max_width:
+        image = image.resize((max_width, round(image.height * max_width / image.width)), Image.BILINEAR)
+    return image
+
+
+def encode_png(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+class ScreenshotChannel:
+    """Fetches, diffs and buffers screen frames."""
+
+    def __init__(
+        self,
+        fetch: Callable[[], Awaitable[bytes]],
+        tile_size: int = 64,
+        history: int = 8,
+        model_max_width: Optional[int] = 1280,
+    ):
+        self._fetch = fetch
+        self.tile_size = tile_size
+        self.model_max_width = model_max_width
+        self.frames: Deque[ScreenFrame] = deque(maxlen=history)
+        self._previous: Optional[Image.Image] = None
+        self._seq = 0
+        self._lock = asyncio.Lock()
+
+    def latest(self) -> Optional[ScreenFrame]:
+        return self.frames[-1] if self.frames else None
+
+    def _process(self, png: bytes) -> Tuple[Image.Image, List[Box], int]:
+        image = Image.open(io.BytesIO(png)).convert("RGB")
+        tiles, total = dirty_tiles(self._previous, image, self.tile_size)
+        return image, tiles, total
+
+    async def capture(self) -> ScreenFrame:
+        """Fetch a frame and diff it against the previous one."""
+        async with self._lock:
+            started = time.perf_counter()
+            png = await self._fetch()
+            fetched = time.perf_counter()
+            image, tiles, total = await asyncio.to_thread(self._process, png)
+            processed = time.perf_counter()
+            record_phase("screenshot_fetch", fetched - started)
+            record_phase("screenshot_diff", processed - fetched)
+
+            self._previous = image
+            self._seq += 1
+            frame = ScreenFrame(
+                seq=self._seq, png=png, width=image.width, height=image.height, captured_at=time.time(),
+                dirty_tiles=len(tiles), total_tiles=total, dirty_box=bounding_box(tiles),
+                fetch_seconds=fetched - started, process_seconds=processed - fetched,
+            )
+            self.frames.append(frame)
+            return frame
+
+    def scale_for(self, frame: ScreenFrame) -> float:
+        """Screen pixels per pixel of the images rendered for the model from ``frame``."""
+        if not self.model_max_width or frame.width <= self.model_max_width:
+            return 1.0
+        return frame.width / self.model_max_width
+
+    def _render(self, frame: ScreenFrame, box: Optional[Box]) -> bytes:
+        scale = self.scale_for(frame)
+        if box is None and scale == 1.0:
+            return frame.png
+        image = Image.open(io.BytesIO(frame.png))
+        if box is not None:
+            image = image.crop(box)
+        if scale != 1.0:
+            image = downscale(image, max(1, round(image.width / scale)))
+        return encode_png(image)
+
+    async def render_for_model(self, frame: ScreenFrame, region: Optional[Box] = None) -> bytes:
+        """PNG of the frame (or of ``region`` of it), downscaled by ``scale_for(frame)``."""
+        return await asyncio.to_thread(self._render, frame, region)
+
+    def stats(self) -> Dict[str, float]:
+        """Timings and sizes over the buffered frames."""
+        frames = list(self.frames)
+        if not frames:
+            return {"frames": 0}
+        return {
+            "frames": len(frames),
+            "last_seq": frames[-1].seq,
+            "avg_fetch_ms": round(sum(f.fetch_seconds for f in frames) / len(frames) * 1000, 2),
+            "avg_process_ms": round(sum(f.process_seconds for f in frames) / len(frames) * 1000, 2),
+            "avg_png_bytes": sum(len(f.png) for f in frames) // len(frames),
+            "avg_changed_ratio": round(sum(f.changed_ratio for f in frames) / len(frames), 3),
+        }
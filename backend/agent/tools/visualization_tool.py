@@ -2,9 +2,11 @@ from agentpress.tool import openapi_schema # ToolResult removed
 from sandbox.tool_base import SandboxToolsBase
 from agentpress.thread_manager import ThreadManager
 from uuid import uuid4
-from sandbox.sandbox import SessionExecuteRequest
+from utils.lazy_imports import lazy_import
 import logging # Added for logging
 
+daytona_sdk = lazy_import("daytona_sdk")
+
 # Custom Exceptions
 class VisualizationToolError(Exception):
     """Base exception for visualization tool errors."""
@@ -83,7 +85,7 @@ class DataVisualizationTool(SandboxToolsBase):
             await self._ensure_sandbox()
             self.sandbox.process.create_session(session_id)
             
-            mkdir_req = SessionExecuteRequest(command=f"mkdir -p {self.visualizations_path}", var_async=False, cwd=self.workspace_path)
+            mkdir_req = daytona_sdk.SessionExecuteRequest(command=f"mkdir -p {self.visualizations_path}", var_async=False, cwd=self.workspace_path)
             await self.sandbox.process.execute_session_command(session_id=session_id, req=mkdir_req)
             
             # Ensure string representations in the script are properly quoted for Python syntax
@@ -117,10 +119,10 @@ print(f"Bar chart saved to {{output_image_path}}")
 '''
             
             escaped_script_content = script_content.replace("'", "'\\''") # Basic shell escape
-            write_script_req = SessionExecuteRequest(command=f"cat > {script_path} << 'EOL'\n{escaped_script_content}\nEOL", var_async=False, cwd=self.workspace_path)
+            write_script_req = daytona_sdk.SessionExecuteRequest(command=f"cat > {script_path} << 'EOL'\n{escaped_script_content}\nEOL", var_async=False, cwd=self.workspace_path)
             await self.sandbox.process.execute_session_command(session_id=session_id, req=write_script_req)
             
-            exec_req = SessionExecuteRequest(command=f"python {script_path}", var_async=False, cwd=self.workspace_path)
+            exec_req = daytona_sdk.SessionExecuteRequest(command=f"python {script_path}", var_async=False, cwd=self.workspace_path)
             response = await self.sandbox.process.execute_session_command(session_id=session_id, req=exec_req, timeout=120) # Increased timeout
             
             logs_result = await self.sandbox.process.get_session_command_logs(session_id=session_id, command_id=response.cmd_id)
@@ -153,7 +155,7 @@ print(f"Bar chart saved to {{output_image_path}}")
                 if self.sandbox and self.sandbox.process:
                     # Clean up the script file first, then the session
                     if script_path: # Check if script_path was defined
-                        cleanup_req = SessionExecuteRequest(command=f"rm -f {script_path}", var_async=False, cwd=self.workspace_path)
+                        cleanup_req = daytona_sdk.SessionExecuteRequest(command=f"rm -f {script_path}", var_async=False, cwd=self.workspace_path)
                         # Use a new session or an existing utility session for cleanup if the original session might be compromised
                         # For simplicity, using the same session if it's still expected to be valid.
                         try:
@@ -200,7 +202,7 @@ print(f"Bar chart saved to {{output_image_path}}")
 
             self.sandbox.process.create_session(session_id)
             
-            check_req = SessionExecuteRequest(
+            check_req = daytona_sdk.SessionExecuteRequest(
                 command=f"test -f \"{cleaned_image_path}\" && echo 'exists' || echo 'not_exists'", # Quote path
                 var_async=False,
                 cwd=self.workspace_path 
@@ -271,7 +273,7 @@ print(f"Bar chart saved to {{output_image_path}}")
 
             # Quote path for shell command
             read_image_cmd = f"cat \"{cleaned_image_path}\" | base64 --wrap=0"
-            exec_read_req = SessionExecuteRequest(command=read_image_cmd, var_async=False, cwd=self.workspace_path)
+            exec_read_req = daytona_sdk.SessionExecuteRequest(command=read_image_cmd, var_async=False, cwd=self.workspace_path)
             response_read = await self.sandbox.process.execute_session_command(session_id=session_id, req=exec_read_req, timeout=60)
 
             base64_image_data_result = await self.sandbox.process.get_session_command_logs(session_id=session_id, command_id=response_read.cmd_id)
@@ -295,7 +297,7 @@ print(f"Bar chart saved to {{output_image_path}}")
             escaped_html_to_write = html_content_to_write.replace("'", "'\\''")
             # Ensure visualizations_path exists before writing
             write_html_cmd = f"mkdir -p \"{self.visualizations_path}\" && cat > \"{html_full_path}\" << 'EOL'\n{escaped_html_to_write}\nEOL"
-            write_html_req = SessionExecuteRequest(command=write_html_cmd, var_async=False, cwd=self.workspace_path)
+            write_html_req = daytona_sdk.SessionExecuteRequest(command=write_html_cmd, var_async=False, cwd=self.workspace_path)
             response_write = await self.sandbox.process.execute_session_command(session_id=session_id, req=write_html_req)
 
             if response_write.exit_code != 0:
@@ -6,6 +6,7 @@ from dotenv import load_dotenv
 # For now, keep openapi_schema and xml_schema if they are used by the class decorators.
 from agentpress.tool import openapi_schema, xml_schema
 from utils.config import config
+from sandbox.browser_client import SESSION_HEADER, BrowserRouteCache, BrowserServiceError, get_browser_client
 from sandbox.tool_base import SandboxToolsBase
 from agentpress.thread_manager import ThreadManager
 import json
@@ -13,6 +14,7 @@ import os
 import datetime
 import asyncio
 import logging
+from typing import Optional
 
 # Custom Exceptions
 class WebSearchToolError(Exception):
@@ -33,8 +35,12 @@ class ScrapingError(WebSearchToolError):
 class SandboxWebSearchTool(SandboxToolsBase):
     """Tool for performing web searches using Tavily API and web scraping using Firecrawl."""
 
-    def __init__(self, project_id: str, thread_manager: ThreadManager):
+    SCHEDULER_CLASS = "scrape" # Rate-limited external APIs, bounded across all runs
+
+    def __init__(self, project_id: str, thread_id: str, thread_manager: ThreadManager):
         super().__init__(project_id, thread_manager)
+        # Names the thread's browser session, whose loaded pages scrapes can reuse
+        self.thread_id = thread_id
         # Load environment variables
         load_dotenv()
         # Use API keys from config
@@ -49,6 +55,8 @@ class SandboxWebSearchTool(SandboxToolsBase):
 
         # Tavily asynchronous search client
         self.tavily_client = AsyncTavilyClient(api_key=self.tavily_api_key)
+        # Direct route to the sandbox browser service, looked up on first scrape
+        self._browser_route = BrowserRouteCache()
 
     @openapi_schema({
         "type": "function",
@@ -333,6 +341,68 @@ class SandboxWebSearchTool(SandboxToolsBase):
             logging.error(f"Error in scrape_webpage: {error_message}", exc_info=True)
             raise WebSearchToolError(f"An unexpected error occurred during webpage scraping: {error_message[:200]}") from e
     
+    async def _browser_page_content(self, url: str) -> Optional[dict]:
+        """Markdown of ``url`` from the thread's browser session if it has the page loaded, else None."""
+        route = await self._browser_route.get(self.sandbox)
+        if route is None:
+            return None
+        try:
+            result = await get_browser_client().request(
+                route, "page_content", {"url": url}, headers={SESSION_HEADER: self.thread_id}
+            )
+        except BrowserServiceError as e:
+            logging.info(f"Browser page content unavailable for {url}: {e}")
+            if not e.request_sent:
+                self._browser_route.unavailable()
+            return None
+        return result if result.get("found") and result.get("markdown") else None
+
+    async def _firecrawl_scrape(self, url: str) -> dict:
+        """Scrape ``url`` with Firecrawl, retrying timeouts with exponential backoff."""
+        # ---------- Firecrawl scrape endpoint ----------
+        logging.info(f"Sending request to Firecrawl for URL: {url}")
+        async with httpx.AsyncClient() as client:
+            headers = {
+                "Authorization": f"Bearer {self.firecrawl_api_key}",
+                "Content-Type": "application/json",
+            }
+            payload = {
+                "url": url,
+                "formats": ["markdown"]
+            }
+            
+            # Use longer timeout and retry logic for more reliability
+            max_retries = 3
+            timeout_seconds = 120
+            retry_count = 0
+            
+            while retry_count < max_retries:
+                try:
+                    logging.info(f"Sending request to Firecrawl (attempt {retry_count + 1}/{max_retries})")
+                    response = await client.post(
+                        f"{self.firecrawl_url}/v1/scrape",
+                        json=payload,
+                        headers=headers,
+                        timeout=timeout_seconds,
+                    )
+                    response.raise_for_status()
+                    data = response.json()
+                    logging.info(f"Successfully received response from Firecrawl for {url}")
+                    break
+                except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.ReadError) as timeout_err:
+                    retry_count += 1
+                    logging.warning(f"Request timed out (attempt {retry_count}/{max_retries}): {str(timeout_err)}")
+                    if retry_count >= max_retries:
+                        raise Exception(f"Request timed out after {max_retries} attempts with {timeout_seconds}s timeout")
+                    # Exponential backoff
+                    logging.info(f"Waiting {2 ** retry_count}s before retry")
+                    await asyncio.sleep(2 ** retry_count)
+                except Exception as e:
+                    # Don't retry on non-timeout errors
+                    logging.error(f"Error during scraping: {str(e)}")
+                    raise e
+        return data
+
     async def _scrape_single_url(self, url: str) -> dict:
         """
         Helper function to scrape a single URL and return the result information.
@@ -340,48 +410,18 @@ class SandboxWebSearchTool(SandboxToolsBase):
         logging.info(f"Scraping single URL: {url}")
         
         try:
-            # ---------- Firecrawl scrape endpoint ----------
-            logging.info(f"Sending request to Firecrawl for URL: {url}")
-            async with httpx.AsyncClient() as client:
-                headers = {
-                    "Authorization": f"Bearer {self.firecrawl_api_key}",
-                    "Content-Type": "application/json",
-                }
-                payload = {
-                    "url": url,
-                    "formats": ["markdown"]
-                }
-                
-                # Use longer timeout and retry logic for more reliability
-                max_retries = 3
-                timeout_seconds = 120
-                retry_count = 0
-                
-                while retry_count < max_retries:
-                    try:
-                        logging.info(f"Sending request to Firecrawl (attempt {retry_count + 1}/{max_retries})")
-                        response = await client.post(
-                            f"{self.firecrawl_url}/v1/scrape",
-                            json=payload,
-                            headers=headers,
-                            timeout=timeout_seconds,
-                        )
-                        response.raise_for_status()
-                        data = response.json()
-                        logging.info(f"Successfully received response from Firecrawl for {url}")
-                        break
-                    except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.ReadError) as timeout_err:
-                        retry_count += 1
-                        logging.warning(f"Request timed out (attempt {retry_count}/{max_retries}): {str(timeout_err)}")
-                        if retry_count >= max_retries:
-                            raise Exception(f"Request timed out after {max_retries} attempts with {timeout_seconds}s timeout")
-                        # Exponential backoff
-                        logging.info(f"Waiting {2 ** retry_count}s before retry")
-                        await asyncio.sleep(2 ** retry_count)
-                    except Exception as e:
-                        # Don't retry on non-timeout errors
-                        logging.error(f"Error during scraping: {str(e)}")
-                        raise e
+            # Pages the sandbox browser already has loaded are extracted there instead of fetched again
+            browser_page = await self._browser_page_content(url)
+            if browser_page is not None:
+                logging.info(f"Using browser extraction of {url} ({browser_page.get('source')})")
+                data = {"data": {"markdown": browser_page.get("markdown", ""), "metadata": {
+                    "title": browser_page.get("title", ""),
+                    "sourceURL": browser_page.get("url", url),
+                    "source": "browser",
+                    "dom_hash": browser_page.get("dom_hash"),
+                }}}
+            else:
+                data = await self._firecrawl_scrape(url)
 
             # Format the response
             title = data.get("data", {}).get("metadata", {}).get("title", "")
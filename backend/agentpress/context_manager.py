@@ -3,210 +3,395 @@ Context Management for AgentPress Threads.
 
 This module handles token counting and thread summarization to prevent
 reaching the context window limitations of LLM models.
+
+Long threads are summarized in the background once they pass a soft watermark.
+Older messages are rendered as a transcript, split into bounded chunks that are
+summarized independently (map) and merged with the previous summary (reduce).
+Each pass is stored as a summary segment bounded by the messages it covers, and
+get_llm_formatted_messages splices the latest segment in place of them.
 """
 
+import asyncio
 import json
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
-from litellm import token_counter, completion_cost
+from utils.lazy_imports import lazy_import
 from services.supabase import DBConnection
 from services.llm import make_llm_api_call
+from services.llm_cache import LLMCachePolicy
 from utils.logger import logger
 
+litellm = lazy_import("litellm")
+
 # Constants for token management
 DEFAULT_TOKEN_THRESHOLD = 120000  # 80k tokens threshold for summarization
 SUMMARY_TARGET_TOKENS = 10000    # Target ~10k tokens for the summary message
 RESERVE_TOKENS = 5000            # Reserve tokens for new messages
 
+# Rolling summarization
+ROLLING_SUMMARY_WATERMARK = 0.6        # Fraction of the threshold that starts a background summary
+KEEP_RECENT_TOKENS = 20000             # Most recent history is always left verbatim
+SUMMARY_CHUNK_TOKENS = 16000           # Transcript tokens per map call
+CHUNK_SUMMARY_TOKENS = 2000            # Target size of each chunk summary
+MAX_CONCURRENT_CHUNK_SUMMARIES = 4
+MAX_RENDERED_MESSAGE_CHARS = 24000     # Oversized messages are truncated in the transcript
+MIN_MESSAGES_TO_SUMMARIZE = 3
+
+# Summaries are deterministic (temperature 0); re-summarizing the same history reuses the result
+SUMMARY_CACHE_POLICY = LLMCachePolicy(namespace="context_summary", ttl=24 * 3600)
+
+SUMMARY_INSTRUCTIONS = """You are a specialized summarization assistant. Your task is to create a concise but comprehensive summary of the conversation history.
+
+The summary should:
+1. Preserve all key information including decisions, conclusions, and important context
+2. Include any tools that were used and their results
+3. Maintain chronological order of events
+4. Be presented as a narrated list of key points with section headers
+5. Include only factual information from the conversation (no new information)
+6. Be concise but detailed enough that the conversation can continue with this summary as context
+
+VERY IMPORTANT: This summary will replace older parts of the conversation in the LLM's context window, so ensure it contains ALL key information and LATEST STATE OF THE CONVERSATION - SO WE WILL KNOW HOW TO PICK UP WHERE WE LEFT OFF.
+"""
+
+REDUCE_INSTRUCTIONS = """You are a specialized summarization assistant. You are given consecutive summaries of parts of one conversation, oldest first.
+
+Merge them into a single summary that:
+1. Preserves all key information including decisions, conclusions, tool results and open tasks
+2. Maintains chronological order of events
+3. Resolves information that later parts update or contradict in favor of the later parts
+4. Is presented as a narrated list of key points with section headers
+
+VERY IMPORTANT: This summary will replace older parts of the conversation in the LLM's context window, so ensure it contains ALL key information and LATEST STATE OF THE CONVERSATION - SO WE WILL KNOW HOW TO PICK UP WHERE WE LEFT OFF.
+"""
+
+# Background rolling summaries in flight, per thread (at most one per thread per process)
+_rolling_summary_tasks: Dict[str, asyncio.Task] = {}
+
+
+def format_message_for_summary(message: Dict[str, Any]) -> str:
+    """Render a thread message as a readable transcript entry."""
+    if not isinstance(message, dict):
+        return str(message)
+
+    role = message.get('role', 'unknown')
+    content = message.get('content')
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if isinstance(part, dict) and part.get('type') == 'text':
+                parts.append(str(part.get('text', '')))
+            elif isinstance(part, dict):
+                parts.append(f"[{part.get('type', 'attachment')}]")
+            else:
+                parts.append(str(part))
+        text = "\n".join(parts)
+    elif isinstance(content, str):
+        text = content
+    elif content is None:
+        text = ""
+    else:
+        text = json.dumps(content, ensure_ascii=False, default=str)
+
+    for tool_call in message.get('tool_calls') or []:
+        function = tool_call.get('function', {}) if isinstance(tool_call, dict) else {}
+        arguments = function.get('arguments', '')
+        if not isinstance(arguments, str):
+            arguments = json.dumps(arguments, ensure_ascii=False, default=str)
+        text += f"\n[tool call] {function.get('name', 'unknown')}({arguments})"
+
+    if len(text) > MAX_RENDERED_MESSAGE_CHARS:
+        half = MAX_RENDERED_MESSAGE_CHARS // 2
+        text = f"{text[:half]}\n[... {len(text) - 2 * half} characters omitted ...]\n{text[-half:]}"
+    return f"[{role}] {text}"
+
+
+def count_text_tokens(text: str) -> int:
+    """Count tokens of transcript text."""
+    return litellm.token_counter(model="gpt-4", text=text)
+
+
+def split_into_chunks(entries: List[str], max_tokens: int) -> List[List[str]]:
+    """Group consecutive entries into chunks of at most max_tokens (an oversized entry forms its own chunk)."""
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    current_tokens = 0
+    for entry in entries:
+        tokens = count_text_tokens(entry)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(entry)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def parse_message_row(row: Dict[str, Any]) -> Any:
+    """Parse a messages row into the message object sent to the LLM."""
+    content = row['content']
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except json.JSONDecodeError:
+            pass  # Keep as string if not valid JSON
+
+    # Ensure we have the proper format for the LLM
+    if not (isinstance(content, dict) and 'role' in content) and 'type' in row:
+        # Convert message type to role if needed
+        role = row['type']
+        if role in ('assistant', 'user', 'system', 'tool'):
+            content = {'role': role, 'content': content}
+    return content
+
+
+def get_summary_text(summary_message: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Text of a stored summary message."""
+    if not summary_message:
+        return None
+    content = summary_message.get('content') if isinstance(summary_message, dict) else summary_message
+    return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False, default=str)
+
+
 class ContextManager:
     """Manages thread context including token counting and summarization."""
-    
+
     def __init__(self, token_threshold: int = DEFAULT_TOKEN_THRESHOLD):
         """Initialize the ContextManager.
-        
+
         Args:
             token_threshold: Token count threshold to trigger summarization
         """
         self.db = DBConnection()
         self.token_threshold = token_threshold
-    
+
+    @property
+    def rolling_summary_watermark(self) -> int:
+        """Token count at which a background rolling summary is started."""
+        return int(self.token_threshold * ROLLING_SUMMARY_WATERMARK)
+
     async def get_thread_token_count(self, thread_id: str) -> int:
         """Get the current token count for a thread using LiteLLM.
-        
+
         Args:
             thread_id: ID of the thread to analyze
-            
+
         Returns:
             The total token count for relevant messages in the thread
         """
         logger.debug(f"Getting token count for thread {thread_id}")
-        
+
         try:
             # Get messages for the thread
             messages = await self.get_messages_for_summarization(thread_id)
-            
+
             if not messages:
                 logger.debug(f"No messages found for thread {thread_id}")
                 return 0
-            
+
             # Use litellm's token_counter for accurate model-specific counting
             # This is much more accurate than the SQL-based estimation
-            token_count = token_counter(model="gpt-4", messages=messages)
-            
+            token_count = litellm.token_counter(model="gpt-4", messages=messages)
+
             logger.info(f"Thread {thread_id} has {token_count} tokens (calculated with litellm)")
             return token_count
-                
+
         except Exception as e:
             logger.error(f"Error getting token count: {str(e)}")
             return 0
-    
+
+    async def get_summary_state(self, thread_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Get the summary currently standing in for older messages and the time it covers up to.
+
+        This is the latest summary message or rolling summary segment, whichever
+        covers more of the thread.
+
+        Args:
+            thread_id: ID of the thread
+
+        Returns:
+            (summary message or None, coverage boundary timestamp or None)
+        """
+        client = await self.db.client
+
+        summary_result = await client.table('messages').select('content, created_at') \
+            .eq('thread_id', thread_id) \
+            .eq('type', 'summary') \
+            .eq('is_llm_message', True) \
+            .order('created_at', desc=True) \
+            .limit(1) \
+            .execute()
+        segment_result = await client.table('thread_summary_segments').select('content, end_created_at') \
+            .eq('thread_id', thread_id) \
+            .order('end_created_at', desc=True) \
+            .limit(1) \
+            .execute()
+
+        summary = summary_result.data[0] if summary_result.data else None
+        segment = segment_result.data[0] if segment_result.data else None
+
+        if segment and (not summary or segment['end_created_at'] > summary['created_at']):
+            return parse_message_row(segment), segment['end_created_at']
+        if summary:
+            return parse_message_row(summary), summary['created_at']
+        return None, None
+
+    async def get_unsummarized_rows(self, thread_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str], List[Dict[str, Any]]]:
+        """Get the current summary and the raw message rows it does not cover yet.
+
+        Args:
+            thread_id: ID of the thread
+
+        Returns:
+            (summary message or None, coverage boundary or None, message rows in order)
+        """
+        client = await self.db.client
+        summary, boundary = await self.get_summary_state(thread_id)
+
+        query = client.table('messages').select('message_id, type, content, created_at') \
+            .eq('thread_id', thread_id) \
+            .eq('is_llm_message', True)
+        if boundary:
+            logger.debug(f"Thread {thread_id} is summarized up to {boundary}")
+            query = query.gt('created_at', boundary)
+        messages_result = await query.order('created_at').execute()
+
+        # Skip existing summary messages - we don't want to summarize summaries
+        rows = [row for row in messages_result.data or [] if row.get('type') != 'summary']
+        return summary, boundary, rows
+
     async def get_messages_for_summarization(self, thread_id: str) -> List[Dict[str, Any]]:
         """Get all LLM messages from the thread that need to be summarized.
-        
-        This gets messages after the most recent summary or all messages if
-        no summary exists. Unlike get_llm_messages, this includes ALL messages 
-        since the last summary, even if we're generating a new summary.
-        
+
+        This gets messages after the most recent summary (or rolling summary
+        segment) or all messages if no summary exists. Unlike get_llm_messages,
+        this includes ALL messages since the last summary, even if we're
+        generating a new summary.
+
         Args:
             thread_id: ID of the thread to get messages from
-            
+
         Returns:
             List of message objects to summarize
         """
         logger.debug(f"Getting messages for summarization for thread {thread_id}")
-        client = await self.db.client
-        
+
         try:
-            # Find the most recent summary message
-            summary_result = await client.table('messages').select('created_at') \
-                .eq('thread_id', thread_id) \
-                .eq('type', 'summary') \
-                .eq('is_llm_message', True) \
-                .order('created_at', desc=True) \
-                .limit(1) \
-                .execute()
-            
-            # Get messages after the most recent summary or all messages if no summary
-            if summary_result.data and len(summary_result.data) > 0:
-                last_summary_time = summary_result.data[0]['created_at']
-                logger.debug(f"Found last summary at {last_summary_time}")
-                
-                # Get all messages after the summary, but NOT including the summary itself
-                messages_result = await client.table('messages').select('*') \
-                    .eq('thread_id', thread_id) \
-                    .eq('is_llm_message', True) \
-                    .gt('created_at', last_summary_time) \
-                    .order('created_at') \
-                    .execute()
-            else:
-                logger.debug("No previous summary found, getting all messages")
-                # Get all messages
-                messages_result = await client.table('messages').select('*') \
-                    .eq('thread_id', thread_id) \
-                    .eq('is_llm_message', True) \
-                    .order('created_at') \
-                    .execute()
-            
-            # Parse the message content if needed
-            messages = []
-            for msg in messages_result.data:
-                # Skip existing summary messages - we don't want to summarize summaries
-                if msg.get('type') == 'summary':
-                    logger.debug(f"Skipping summary message from {msg.get('created_at')}")
-                    continue
-                    
-                # Parse content if it's a string
-                content = msg['content']
-                if isinstance(content, str):
-                    try:
-                        content = json.loads(content)
-                    except json.JSONDecodeError:
-                        pass  # Keep as string if not valid JSON
-                
-                # Ensure we have the proper format for the LLM
-                if 'role' not in content and 'type' in msg:
-                    # Convert message type to role if needed
-                    role = msg['type']
-                    if role == 'assistant' or role == 'user' or role == 'system' or role == 'tool':
-                        content = {'role': role, 'content': content}
-                
-                messages.append(content)
-            
+            _, _, rows = await self.get_unsummarized_rows(thread_id)
+            messages = [parse_message_row(row) for row in rows]
+
             logger.info(f"Got {len(messages)} messages to summarize for thread {thread_id}")
             return messages
-            
+
         except Exception as e:
             logger.error(f"Error getting messages for summarization: {str(e)}", exc_info=True)
             return []
-    
+
+    async def _summarize(self, instructions: str, body: str, model: str, max_tokens: int) -> Optional[str]:
+        """Run one summarization call and return the summary text."""
+        system_message = {
+            "role": "system",
+            "content": f"""{instructions}
+
+THE CONVERSATION HISTORY TO SUMMARIZE IS AS FOLLOWS:
+===============================================================
+==================== CONVERSATION HISTORY ====================
+{body}
+==================== END OF CONVERSATION HISTORY ====================
+===============================================================
+"""
+        }
+        response = await make_llm_api_call(
+            model_name=model,
+            messages=[system_message, {"role": "user", "content": "PLEASE PROVIDE THE SUMMARY NOW."}],
+            temperature=0,
+            max_tokens=max_tokens,
+            stream=False,
+            cache=SUMMARY_CACHE_POLICY
+        )
+        if response and hasattr(response, 'choices') and response.choices:
+            return response.choices[0].message.content
+        return None
+
+    async def _reduce_summaries(self, summaries: List[str], model: str) -> Optional[str]:
+        """Merge consecutive summaries into one, in rounds when they do not fit a single call."""
+        while len(summaries) > 1:
+            groups = split_into_chunks(summaries, SUMMARY_CHUNK_TOKENS)
+            if len(groups) == len(summaries):
+                # Every summary fills a call on its own; merge pairwise so each round still shrinks
+                groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+
+            async def merge(group: List[str]) -> Optional[str]:
+                if len(group) == 1:
+                    return group[0]
+                body = "\n\n".join(f"---- PART {i + 1} ----\n{summary}" for i, summary in enumerate(group))
+                return await self._summarize(REDUCE_INSTRUCTIONS, body, model, SUMMARY_TARGET_TOKENS)
+
+            merged = await asyncio.gather(*[merge(group) for group in groups])
+            if any(summary is None for summary in merged):
+                return None
+            summaries = list(merged)
+        return summaries[0] if summaries else None
+
     async def create_summary(
-        self, 
-        thread_id: str, 
-        messages: List[Dict[str, Any]], 
-        model: str = "gpt-4o-mini"
+        self,
+        thread_id: str,
+        messages: List[Dict[str, Any]],
+        model: str = "gpt-4o-mini",
+        previous_summary: Optional[str] = None
     ) -> Optional[Dict[str, Any]]:
         """Generate a summary of conversation messages.
-        
+
+        The messages are rendered as a transcript and split into chunks of at most
+        SUMMARY_CHUNK_TOKENS that are summarized concurrently, then merged with
+        the previous summary (if any), so no single call exceeds the summarizer's
+        context regardless of the thread length.
+
         Args:
             thread_id: ID of the thread to summarize
             messages: Messages to summarize
             model: LLM model to use for summarization
-            
+            previous_summary: Summary of the history before these messages, folded into the result
+
         Returns:
             Summary message object or None if summarization failed
         """
         if not messages:
             logger.warning("No messages to summarize")
             return None
-        
+
         logger.info(f"Creating summary for thread {thread_id} with {len(messages)} messages")
-        
-        # Create system message with summarization instructions
-        system_message = {
-            "role": "system",
-            "content": f"""You are a specialized summarization assistant. Your task is to create a concise but comprehensive summary of the conversation history.
 
-The summary should:
-1. Preserve all key information including decisions, conclusions, and important context
-2. Include any tools that were used and their results
-3. Maintain chronological order of events
-4. Be presented as a narrated list of key points with section headers
-5. Include only factual information from the conversation (no new information)
-6. Be concise but detailed enough that the conversation can continue with this summary as context
+        try:
+            chunks = split_into_chunks([format_message_for_summary(message) for message in messages], SUMMARY_CHUNK_TOKENS)
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHUNK_SUMMARIES)
 
-VERY IMPORTANT: This summary will replace older parts of the conversation in the LLM's context window, so ensure it contains ALL key information and LATEST STATE OF THE CONVERSATION - SO WE WILL KNOW HOW TO PICK UP WHERE WE LEFT OFF.
+            async def summarize_chunk(index: int, chunk: List[str]) -> Optional[str]:
+                async with semaphore:
+                    logger.debug(f"Summarizing chunk {index + 1}/{len(chunks)} of thread {thread_id}")
+                    # A lone chunk with no earlier summary is already the final summary
+                    max_tokens = SUMMARY_TARGET_TOKENS if len(chunks) == 1 and not previous_summary else CHUNK_SUMMARY_TOKENS
+                    return await self._summarize(SUMMARY_INSTRUCTIONS, "\n\n".join(chunk), model, max_tokens)
 
+            chunk_summaries = await asyncio.gather(*[summarize_chunk(i, chunk) for i, chunk in enumerate(chunks)])
+            if any(summary is None for summary in chunk_summaries):
+                logger.error("Failed to generate summary: Invalid response")
+                return None
+
+            partials = ([previous_summary] if previous_summary else []) + list(chunk_summaries)
+            summary_content = await self._reduce_summaries(partials, model)
+
+            if summary_content:
+                logger.info(f"Summarized {len(messages)} messages of thread {thread_id} in {len(chunks)} chunk(s)")
 
-THE CONVERSATION HISTORY TO SUMMARIZE IS AS FOLLOWS:
-===============================================================
-==================== CONVERSATION HISTORY ====================
-{messages}
-==================== END OF CONVERSATION HISTORY ====================
-===============================================================
-"""
-        }
-        
-        try:
-            # Call LLM to generate summary
-            response = await make_llm_api_call(
-                model_name=model,
-                messages=[system_message, {"role": "user", "content": "PLEASE PROVIDE THE SUMMARY NOW."}],
-                temperature=0,
-                max_tokens=SUMMARY_TARGET_TOKENS,
-                stream=False
-            )
-            
-            if response and hasattr(response, 'choices') and response.choices:
-                summary_content = response.choices[0].message.content
-                
                 # Track token usage
                 try:
-                    token_count = token_counter(model=model, messages=[{"role": "user", "content": summary_content}])
-                    cost = completion_cost(model=model, prompt="", completion=summary_content)
+                    token_count = litellm.token_counter(model=model, messages=[{"role": "user", "content": summary_content}])
+                    cost = litellm.completion_cost(model=model, prompt="", completion=summary_content)
                     logger.info(f"Summary generated with {token_count} tokens at cost ${cost:.6f}")
                 except Exception as e:
                     logger.error(f"Error calculating token usage: {str(e)}")
-                
+
                 # Format the summary message with clear beginning and end markers
                 formatted_summary = f"""
 ======== CONVERSATION HISTORY SUMMARY ========
@@ -217,66 +402,165 @@ THE CONVERSATION HISTORY TO SUMMARIZE IS AS FOLLOWS:
 
 The above is a summary of the conversation history. The conversation continues below.
 """
-                
+
                 # Format the summary message
                 summary_message = {
                     "role": "user",
                     "content": formatted_summary
                 }
-                
+
                 return summary_message
             else:
                 logger.error("Failed to generate summary: Invalid response")
                 return None
-                
+
         except Exception as e:
             logger.error(f"Error creating summary: {str(e)}", exc_info=True)
             return None
-        
+
+    @staticmethod
+    def select_rolling_range(rows: List[Dict[str, Any]], keep_recent_tokens: int) -> int:
+        """Number of leading rows to fold into the rolling summary.
+
+        The most recent keep_recent_tokens of history stay verbatim, and the kept
+        tail never starts with a tool result separated from its tool call.
+        """
+        kept_tokens = 0
+        split = len(rows)
+        while split > 0:
+            tokens = count_text_tokens(format_message_for_summary(parse_message_row(rows[split - 1])))
+            if kept_tokens + tokens > keep_recent_tokens:
+                break
+            kept_tokens += tokens
+            split -= 1
+
+        while split < len(rows):
+            message = parse_message_row(rows[split])
+            if not (isinstance(message, dict) and message.get('role') == 'tool'):
+                break
+            split += 1
+        return split
+
+    async def update_rolling_summary(self, thread_id: str, model: str = "gpt-4o-mini") -> Optional[Dict[str, Any]]:
+        """Fold older unsummarized messages into a new rolling summary segment.
+
+        Args:
+            thread_id: ID of the thread to summarize
+            model: LLM model to use for summarization
+
+        Returns:
+            The stored segment, or None if there was nothing to summarize or it failed
+        """
+        summary, boundary, rows = await self.get_unsummarized_rows(thread_id)
+        split = self.select_rolling_range(rows, KEEP_RECENT_TOKENS)
+        if split < MIN_MESSAGES_TO_SUMMARIZE:
+            logger.debug(f"Thread {thread_id} has too few older messages ({split}) for a rolling summary")
+            return None
+
+        covered = rows[:split]
+        summary_message = await self.create_summary(
+            thread_id,
+            [parse_message_row(row) for row in covered],
+            model,
+            previous_summary=get_summary_text(summary)
+        )
+        if not summary_message:
+            logger.error(f"Failed to create rolling summary for thread {thread_id}")
+            return None
+
+        segment = {
+            'thread_id': thread_id,
+            'covers_after': boundary,
+            'start_message_id': covered[0]['message_id'],
+            'end_message_id': covered[-1]['message_id'],
+            'start_created_at': covered[0]['created_at'],
+            'end_created_at': covered[-1]['created_at'],
+            'message_count': len(covered),
+            'content': summary_message,
+            'token_count': count_text_tokens(summary_message['content']),
+        }
+        client = await self.db.client
+        try:
+            await client.table('thread_summary_segments').insert(segment).execute()
+        except Exception as e:
+            # Another worker summarized from the same boundary first
+            logger.warning(f"Discarding rolling summary for thread {thread_id}: {str(e)}")
+            return None
+
+        logger.info(f"Stored rolling summary for thread {thread_id} covering {len(covered)} messages up to {segment['end_created_at']}")
+        return segment
+
+    async def _run_rolling_summary(self, thread_id: str, model: str) -> None:
+        try:
+            await self.update_rolling_summary(thread_id, model)
+        except Exception as e:
+            logger.error(f"Error in rolling summary for thread {thread_id}: {str(e)}", exc_info=True)
+
+    def schedule_rolling_summary(self, thread_id: str, model: str = "gpt-4o-mini") -> bool:
+        """Start a background rolling summary for the thread unless one is already running.
+
+        Returns:
+            True if a new summary task was started
+        """
+        task = _rolling_summary_tasks.get(thread_id)
+        if task is not None and not task.done():
+            return False
+
+        task = asyncio.create_task(self._run_rolling_summary(thread_id, model))
+        _rolling_summary_tasks[thread_id] = task
+
+        def _forget(finished: asyncio.Task) -> None:
+            if _rolling_summary_tasks.get(thread_id) is finished:
+                del _rolling_summary_tasks[thread_id]
+
+        task.add_done_callback(_forget)
+        return True
+
     async def check_and_summarize_if_needed(
-        self, 
-        thread_id: str, 
-        add_message_callback, 
+        self,
+        thread_id: str,
+        add_message_callback,
         model: str = "gpt-4o-mini",
         force: bool = False
     ) -> bool:
         """Check if thread needs summarization and summarize if so.
-        
+
         Args:
             thread_id: ID of the thread to check
             add_message_callback: Callback to add the summary message to the thread
             model: LLM model to use for summarization
             force: Whether to force summarization regardless of token count
-            
+
         Returns:
             True if summarization was performed, False otherwise
         """
         try:
             # Get token count using LiteLLM (accurate model-specific counting)
             token_count = await self.get_thread_token_count(thread_id)
-            
+
             # If token count is below threshold and not forcing, no summarization needed
             if token_count < self.token_threshold and not force:
                 logger.debug(f"Thread {thread_id} has {token_count} tokens, below threshold {self.token_threshold}")
                 return False
-            
+
             # Log reason for summarization
             if force:
                 logger.info(f"Forced summarization of thread {thread_id} with {token_count} tokens")
             else:
                 logger.info(f"Thread {thread_id} exceeds token threshold ({token_count} >= {self.token_threshold}), summarizing...")
-            
-            # Get messages to summarize
-            messages = await self.get_messages_for_summarization(thread_id)
-            
+
+            # Get messages to summarize, and the summary they continue from
+            previous_summary, _, rows = await self.get_unsummarized_rows(thread_id)
+            messages = [parse_message_row(row) for row in rows]
+
             # If there are too few messages, don't summarize
-            if len(messages) < 3:
+            if len(messages) < MIN_MESSAGES_TO_SUMMARIZE:
                 logger.info(f"Thread {thread_id} has too few messages ({len(messages)}) to summarize")
                 return False
-            
+
             # Create summary
-            summary = await self.create_summary(thread_id, messages, model)
-            
+            summary = await self.create_summary(thread_id, messages, model, previous_summary=get_summary_text(previous_summary))
+
             if summary:
                 # Add summary message to thread
                 await add_message_callback(
@@ -286,13 +570,13 @@ The above is a summary of the conversation history. The conversation continues b
                     is_llm_message=True,
                     metadata={"token_count": token_count}
                 )
-                
+
                 logger.info(f"Successfully added summary to thread {thread_id}")
                 return True
             else:
                 logger.error(f"Failed to create summary for thread {thread_id}")
                 return False
-                
+
         except Exception as e:
             logger.error(f"Error in check_and_summarize_if_needed: {str(e)}", exc_info=True)
-            return False 
\ No newline at end of file
+            return False
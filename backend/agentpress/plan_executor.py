@@ -24,6 +24,7 @@ from .tool import ToolResult
 from .utils.json_helpers import format_for_yield
 from services.llm import make_llm_api_call
 from utils.logger import logger
+from utils.sse import encode_frame
 
 class PlanExecutor:
     """
@@ -79,7 +80,7 @@ class PlanExecutor:
             if 'thread_run_id' not in message_data['metadata']:
                  message_data['metadata']['thread_run_id'] = self.main_task_id
 
-            message_json = json.dumps(message_data)
+            message_json = encode_frame(message_data)
 
             # Create tasks for Redis operations to run them concurrently
             await asyncio.gather(
@@ -6,6 +6,7 @@ logger = logging.getLogger(__name__)
 
 class CompleteTool(Tool):
     PLUGIN_TOOL_ID = "SystemCompleteTask" # A distinct ID for this system tool
+    SCHEDULER_CLASS = "interactive" # User-visible, scheduled ahead of other tools
 
     @openapi_schema({
         "name": "task_complete",
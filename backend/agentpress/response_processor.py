@@ -13,20 +13,30 @@ import json
 import re
 import uuid
 import asyncio
+import time
 from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional, AsyncGenerator, Tuple, Union, Callable, Literal
+from typing import List, Dict, Any, Optional, AsyncGenerator, Tuple, Union, Callable, Literal, TYPE_CHECKING
 from dataclasses import dataclass
-from utils.logger import logger
+from utils.logger import logger, sampled
+from utils.tracing import record_phase
 from .tool import ToolResult
 from .tool_orchestrator import ToolOrchestrator
 from .plan_executor import PlanExecutor
-from litellm import completion_cost
-from langfuse.client import StatefulTraceClient
+from .tool_scheduler import get_tool_scheduler, tool_class_of, sandbox_of, current_run_id
+from utils.lazy_imports import lazy_import
 from services.langfuse import langfuse
+from services.prompt_cache import record_cache_usage
+from services.artifact_store import offload_tool_output
 from .utils.json_helpers import (
     ensure_dict, ensure_list, safe_json_parse, 
     to_json_string, format_for_yield
 )
+from .utils.json_scanner import IncrementalJSONScanner
+
+if TYPE_CHECKING:
+    from langfuse.client import StatefulTraceClient
+
+litellm = lazy_import("litellm")
 
 # Type alias for XML result adding strategy
 XmlAddingStrategy = Literal["user_message", "assistant_message", "inline_edit"]
@@ -87,7 +97,7 @@ class ProcessorConfig:
 class ResponseProcessor:
     """Processes LLM responses, extracting and executing tool calls."""
     
-    def __init__(self, tool_orchestrator: ToolOrchestrator, add_message_callback: Callable, plan_executor: PlanExecutor, trace: Optional[StatefulTraceClient] = None):
+    def __init__(self, tool_orchestrator: ToolOrchestrator, add_message_callback: Callable, plan_executor: PlanExecutor, trace: Optional["StatefulTraceClient"] = None):
         """Initialize the ResponseProcessor.
         
         Args:
@@ -105,6 +115,8 @@ class ResponseProcessor:
         
         self.is_plan = False
         self.plan_buffer: List[str] = []
+        # Tracks plan JSON completeness across chunks without re-parsing the buffer
+        self.plan_scanner = IncrementalJSONScanner(skip_prefix=True)
 
     def is_complete_json(self, json_str: str) -> bool:
         """
@@ -146,6 +158,8 @@ class ResponseProcessor:
         """
         accumulated_content = ""
         tool_calls_buffer = {}
+        tool_call_scanners: Dict[int, IncrementalJSONScanner] = {} # idx -> scanner over streamed arguments
+        executed_native_indices = set() # Native tool call indices already executed on stream
         current_xml_content = ""
         xml_chunks_buffer = []
         pending_tool_executions = []
@@ -180,11 +194,21 @@ class ResponseProcessor:
             # --- End Start Events ---
 
             __sequence = 0
+            stream_started = time.perf_counter()
+            first_chunk_received = False
 
             async for chunk in llm_response:
+                if not first_chunk_received:
+                    first_chunk_received = True
+                    record_phase("llm_ttft", time.perf_counter() - stream_started, llm_model)
+
+                # The final chunk carries usage (requested for prompt-caching models)
+                if getattr(chunk, 'usage', None) is not None:
+                    record_cache_usage(llm_model, chunk.usage)
+
                 if hasattr(chunk, 'choices') and chunk.choices and hasattr(chunk.choices[0], 'finish_reason') and chunk.choices[0].finish_reason:
                     finish_reason = chunk.choices[0].finish_reason
-                    logger.debug(f"Detected finish_reason: {finish_reason}")
+                    logger.debug("Detected finish_reason: %s", finish_reason)
 
                 if hasattr(chunk, 'choices') and chunk.choices:
                     delta = chunk.choices[0].delta if hasattr(chunk.choices[0], 'delta') else None
@@ -212,12 +236,11 @@ class ResponseProcessor:
                         if self.is_plan:
                             processed_as_plan_chunk = True
                             self.plan_buffer.append(chunk_content)
-                            full_json_str = "".join(self.plan_buffer)
 
-                            if self.is_complete_json(full_json_str):
+                            if self.plan_scanner.feed(chunk_content):
                                 logger.info("Complete plan JSON assembled from stream.")
                                 try:
-                                    plan_data = json.loads(full_json_str)
+                                    plan_data = self.plan_scanner.value()
                                     # Validate actual plan structure (e.g., presence of a specific key)
                                     if isinstance(plan_data, dict) and plan_data and (plan_marker.strip('":') in plan_data or "actions" in plan_data or "subtasks" in plan_data): # Example validation
                                         logger.info(f"Valid plan structure detected. Parsed plan data snippet: {str(plan_data)[:200]}...")
@@ -254,18 +277,23 @@ class ResponseProcessor:
                                         processed_as_plan_chunk = False # Fall through to regular processing for current chunk_content
 
                                     self.plan_buffer = []
+                                    self.plan_scanner = IncrementalJSONScanner(skip_prefix=True)
                                     self.is_plan = False
                                     if processed_as_plan_chunk: # If it was handled as a plan (executed or error during exec)
                                         continue # Skip regular processing for this chunk
                                 except json.JSONDecodeError:
-                                    logger.debug("Plan JSONDecodeError (plan buffer likely incomplete), waiting for more chunks...")
-                                    # processed_as_plan_chunk is True, original logic will be skipped. Loop continues.
+                                    # The brackets balanced but the content is not valid JSON; stop treating it as a plan
+                                    logger.warning(f"Plan JSON is balanced but invalid, dropping it: {self.plan_scanner.text[:200]}")
+                                    self.plan_buffer = []
+                                    self.plan_scanner = IncrementalJSONScanner(skip_prefix=True)
+                                    self.is_plan = False
                                 except Exception as e_plan_exec:
                                     logger.error(f"Error during plan processing or execution: {e_plan_exec}", exc_info=True)
                                     err_content = {"role": "system", "status_type": "error", "message": f"Error processing/executing plan: {str(e_plan_exec)}"}
                                     err_msg_obj = await self.add_message(thread_id=thread_id, type="status", content=err_content, is_llm_message=False, metadata={"thread_run_id": thread_run_id})
                                     if err_msg_obj: yield format_for_yield(err_msg_obj)
                                     self.plan_buffer = []
+                                    self.plan_scanner = IncrementalJSONScanner(skip_prefix=True)
                                     self.is_plan = False
                                     continue # Skip original logic for this chunk
                             # else: (JSON not complete yet)
@@ -350,7 +378,8 @@ class ResponseProcessor:
                                     # Ensure arguments is a string for logging, might already be if from to_json_string
                                     if not isinstance(arguments_json_string, str):
                                         arguments_json_string = to_json_string(arguments_json_string)
-                                    logger.debug(f"Native tool call detected: ID={tool_call_data_chunk['id']}, Function={tool_call_data_chunk['function']['name']}, Args={arguments_json_string}")
+                                    logger.debug("Native tool call detected: ID=%s, Function=%s, Args=%s", tool_call_data_chunk['id'],
+                                                 tool_call_data_chunk['function']['name'], arguments_json_string, extra=sampled())
 
                                 now_tool_chunk = datetime.now(timezone.utc).isoformat()
                                 yield {
@@ -367,6 +396,8 @@ class ResponseProcessor:
                                 # Initialize buffer for this index if it doesn't exist
                                 if idx not in tool_calls_buffer:
                                     tool_calls_buffer[idx] = {"id": None, "function": {"name": None, "arguments": ""}}
+                                    # Argument deltas are scanned incrementally instead of re-parsing the buffer
+                                    tool_call_scanners[idx] = IncrementalJSONScanner()
 
                                 # Update buffer with new data from the chunk
                                 if hasattr(tool_call_chunk, 'id') and tool_call_chunk.id:
@@ -375,24 +406,42 @@ class ResponseProcessor:
                                     tool_calls_buffer[idx]['function']['name'] = tool_call_chunk.function.name
                                 if hasattr(tool_call_chunk, 'function') and hasattr(tool_call_chunk.function, 'arguments') and tool_call_chunk.function.arguments:
                                     tool_calls_buffer[idx]['function']['arguments'] += tool_call_chunk.function.arguments
+                                    tool_call_scanners[idx].feed(tool_call_chunk.function.arguments)
 
-                                # ... (check complete logic remains same) ...
-                                has_complete_tool_call = False # Placeholder
-                                if (tool_calls_buffer.get(idx) and
+                                scanner = tool_call_scanners[idx]
+                                has_complete_tool_call = bool(
                                     tool_calls_buffer[idx]['id'] and
                                     tool_calls_buffer[idx]['function']['name'] and
-                                    tool_calls_buffer[idx]['function']['arguments']):
-                                    try:
-                                        safe_json_parse(tool_calls_buffer[idx]['function']['arguments'])
-                                        has_complete_tool_call = True
-                                    except json.JSONDecodeError: pass
-
+                                    scanner.complete
+                                )
+
+                                # Yield top-level arguments (e.g. file_path) as soon as they finish streaming,
+                                # so clients can stage the tool before a large body arrives (transient, not saved)
+                                staged_arguments = scanner.pop_new_values()
+                                if staged_arguments and not scanner.complete:
+                                    now_staged = datetime.now(timezone.utc).isoformat()
+                                    yield {
+                                        "message_id": None, "thread_id": thread_id, "type": "status", "is_llm_message": True,
+                                        "content": to_json_string({
+                                            "role": "assistant", "status_type": "tool_call_staged", "index": idx,
+                                            "tool_call_id": tool_calls_buffer[idx]['id'],
+                                            "function_name": tool_calls_buffer[idx]['function']['name'],
+                                            "arguments": staged_arguments
+                                        }),
+                                        "metadata": to_json_string({"thread_run_id": thread_run_id}),
+                                        "created_at": now_staged, "updated_at": now_staged
+                                    }
 
-                                if has_complete_tool_call and config.execute_tools and config.execute_on_stream:
+                                if has_complete_tool_call and idx not in executed_native_indices and config.execute_tools and config.execute_on_stream:
+                                    executed_native_indices.add(idx)
                                     current_tool = tool_calls_buffer[idx]
+                                    try:
+                                        arguments = scanner.value()
+                                    except json.JSONDecodeError:
+                                        arguments = safe_json_parse(current_tool['function']['arguments'])
                                     tool_call_data = {
                                         "function_name": current_tool['function']['name'],
-                                        "arguments": safe_json_parse(current_tool['function']['arguments']),
+                                        "arguments": arguments,
                                         "id": current_tool['id']
                                     }
                                     current_assistant_id = last_assistant_message_object['message_id'] if last_assistant_message_object else None
@@ -420,6 +469,7 @@ class ResponseProcessor:
                     break
 
             # print() # Add a final newline after the streaming loop finishes
+            record_phase("llm_stream", time.perf_counter() - stream_started, llm_model)
 
             # --- After Streaming Loop ---
 
@@ -672,7 +722,7 @@ class ResponseProcessor:
             if last_assistant_message_object: # Only calculate if assistant message was saved
                 try:
                     # Use accumulated_content for streaming cost calculation
-                    final_cost = completion_cost(
+                    final_cost = litellm.completion_cost(
                         model=llm_model,
                         messages=prompt_messages, # Use the prompt messages provided
                         completion=accumulated_content
@@ -854,7 +904,7 @@ class ResponseProcessor:
                     if final_cost is None: # Fall back to calculating cost if direct cost not available or zero
                         logger.info("Calculating cost using completion_cost function.")
                         # Note: litellm might need 'messages' kwarg depending on model/provider
-                        final_cost = completion_cost(
+                        final_cost = litellm.completion_cost(
                             completion_response=llm_response,
                             model=llm_model, # Explicitly pass the model name
                             # messages=prompt_messages # Pass prompt messages if needed by litellm for this model
@@ -1104,7 +1154,7 @@ class ResponseProcessor:
                         if not tag_stack:  # This is our matching end tag
                             chunk_end = next_end + len(end_pattern)
                             chunk = content[chunk_start:chunk_end]
-                            logger.debug(f"Extracted XML chunk: {chunk}") # Logging extracted chunk
+                            logger.debug("Extracted XML chunk: %s", chunk, extra=sampled()) # Logging extracted chunk
                             chunks.append(chunk)
                             pos = chunk_end
                             break
@@ -1238,8 +1288,8 @@ class ResponseProcessor:
                 "arguments": params              # The extracted parameters
             }
             
-            logger.info(f"Parsed XML tool call: Tag='{xml_tag_name}', ToolID='{target_tool_id}', Method='{target_method_name}', Args={params}")
-            logger.debug(f"XML parsing details: {parsing_details}")
+            logger.info("Parsed XML tool call: Tag='%s', ToolID='%s', Method='%s', Params=%s", xml_tag_name, target_tool_id, target_method_name, sorted(params))
+            logger.debug("XML parsing details: %s", parsing_details)
             # logger.debug(f"Created tool call for orchestrator: {tool_call}") # Redundant with above
             return tool_call, parsing_details # Return both dicts
             
@@ -1332,12 +1382,18 @@ class ResponseProcessor:
                 except json.JSONDecodeError: # If not JSON, wrap it as per previous logic
                     arguments = {"text": arguments}
             
-            # Call the orchestrator's execute_tool method
-            enhanced_result = await self.tool_orchestrator.execute_tool(
-                tool_id=tool_id_for_orchestrator,
-                method_name=method_name_for_orchestrator,
-                params=arguments
-            )
+            # Wait for a slot in the worker-wide scheduler, then call the orchestrator
+            tool_instance = getattr(self.tool_orchestrator, "tools", {}).get(tool_id_for_orchestrator)
+            async with get_tool_scheduler().slot(
+                tool_class=tool_class_of(tool_instance),
+                run_id=current_run_id() or f"processor:{id(self)}",
+                sandbox_id=sandbox_of(tool_instance),
+            ):
+                enhanced_result = await self.tool_orchestrator.execute_tool(
+                    tool_id=tool_id_for_orchestrator,
+                    method_name=method_name_for_orchestrator,
+                    params=arguments
+                )
             
             # logger.info(f"Tool execution via orchestrator complete: {tool_id_for_orchestrator}.{method_name_for_orchestrator} -> Status: {enhanced_result.status}") # Covered by "Adding tool result"
             span.end(status_message=f"tool_executed_via_orchestrator: {enhanced_result.status}", output=enhanced_result.result or enhanced_result.error)
@@ -1360,6 +1416,10 @@ class ResponseProcessor:
         execution_strategy: ToolExecutionStrategy = "sequential"
     ) -> List[Tuple[Dict[str, Any], ToolResult]]: # Changed return type
         """Execute tool calls with the specified strategy using ToolOrchestrator.
+
+        Strategies are submission policies on top of the worker-wide tool scheduler:
+        "sequential" submits one call at a time, "parallel" submits all of them and
+        the scheduler bounds how many actually run (see agentpress/tool_scheduler.py).
         
         Args:
             tool_calls: List of tool calls to execute
@@ -1388,12 +1448,12 @@ class ResponseProcessor:
         results = []
         for index, tool_call in enumerate(tool_calls):
             tool_repr = tool_call.get('function_name') or f"{tool_call.get('tool_id')}__{tool_call.get('method_name')}"
-            logger.debug(f"Executing tool {index+1}/{len(tool_calls)} (seq): {tool_repr}")
+            logger.debug("Executing tool %d/%d (seq): %s", index + 1, len(tool_calls), tool_repr)
             
             try:
                 result = await self._execute_tool(tool_call) # This now calls the orchestrator
                 results.append((tool_call, result))
-                logger.debug(f"Completed tool {tool_repr} with status: {result.status}")
+                logger.debug("Completed tool %s with status: %s", tool_repr, result.status)
             except Exception as e: # Should be caught by _execute_tool, but as a safeguard
                 logger.error(f"Outer error executing tool {tool_repr} (seq): {str(e)}")
                 error_result = ToolResult(
@@ -1460,16 +1520,21 @@ class ResponseProcessor:
                     content_to_store = json.dumps(content_to_store)
                 else:
                     content_to_store = str(content_to_store) # Ensure string
+                # Large outputs go to the artifact store; the message keeps a reference with a preview
+                content_to_store, artifact_digest = await offload_tool_output(content_to_store)
             else: # XML call
                 # _format_xml_tool_result expects the old ToolResult structure.
                 # We need to adapt or make it use ToolResult.
                 # For now, let's quickly adapt here.
                 temp_legacy_result_obj = {"success": result.status == "completed", "output": result.result or result.error}
+                output, artifact_digest = await offload_tool_output(str(temp_legacy_result_obj['output']))
                 # This is a simplification; ToolResult was a class. Let's assume _format_xml_tool_result just needs a string.
-                content_to_store = self._format_xml_tool_result(tool_call, str(temp_legacy_result_obj['output']))
+                content_to_store = self._format_xml_tool_result(tool_call, output)
+            if artifact_digest:
+                metadata["artifacts"] = [artifact_digest]
 
-            logger.info(f"Adding tool result to history: ToolName='{tool_name_for_logging}', Status='{result.status}', AssistantMessageID='{assistant_message_id}'")
-            logger.debug(f"Tool result content being added: {content_to_store}")
+            logger.info("Adding tool result to history: ToolName='%s', Status='%s', AssistantMessageID='%s'", tool_name_for_logging, result.status, assistant_message_id)
+            logger.debug("Tool result content being added: %s", content_to_store)
 
 
             if is_native_call:
@@ -8,8 +8,29 @@ from agentpress.task_state_manager import TaskStateManager
 from agentpress.tool_orchestrator import ToolOrchestrator
 from agentpress.api_models_tasks import TaskState # For type hinting
 from services.llm import make_llm_api_call # Assuming this is the correct way to call LLM
+from services.llm_cache import LLMCachePolicy
 from utils.logger import logger
 
+
+def _is_valid_plan_response(response: Any) -> bool:
+    """Only cache planner responses that contain a parseable plan."""
+    try:
+        content = response.choices[0].message.content.strip()
+        if content.startswith("```"):
+            content = content.split("\n", 1)[1].rsplit("```", 1)[0]
+        return isinstance(json.loads(content).get("plan"), list)
+    except (AttributeError, IndexError, TypeError, ValueError):
+        return False
+
+
+# Planner prompts are frequently repeated verbatim or with small wording changes
+PLANNER_CACHE_POLICY = LLMCachePolicy(
+    namespace="task_planner",
+    ttl=6 * 3600,
+    semantic=True,
+    validator=_is_valid_plan_response,
+)
+
 class TaskPlanner:
     """
     Handles the decomposition of high-level tasks into smaller, manageable subtasks
@@ -100,11 +121,12 @@ class TaskPlanner:
             try:
                 llm_response_obj = await make_llm_api_call(
                     messages=current_prompt_messages,
-                    model="gpt-4o", # Or the model specified in the new system prompt if different
+                    model_name="gpt-4o", # Or the model specified in the new system prompt if different
                     temperature=0.1,
                     max_tokens=2048, # Adjust if necessary
                     stream=False,
-                    json_mode=True # Crucial for ensuring JSON output
+                    response_format={"type": "json_object"}, # Crucial for ensuring JSON output
+                    cache=PLANNER_CACHE_POLICY
                 )
 
                 # Standard response extraction
@@ -136,7 +158,7 @@ class TaskPlanner:
                 logger.debug(f"TASK_PLANNER: LLM plan response (Attempt {attempts + 1}):\n{llm_response_content}")
 
                 cleaned_response_content = llm_response_content.strip()
-                # No need to strip ```json anymore if json_mode=True works as expected,
+                # No need to strip ```json anymore if JSON mode works as expected,
                 # but keep it as a fallback if issues are seen.
                 if cleaned_response_content.startswith("```json"):
                     cleaned_response_content = cleaned_response_content[7:-3].strip()
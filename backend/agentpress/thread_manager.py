@@ -11,7 +11,8 @@ This module provides comprehensive conversation management, including:
 """
 
 import json
-from typing import List, Dict, Any, Optional, Type, Union, AsyncGenerator, Literal
+import logging
+from typing import List, Dict, Any, Optional, Set, Type, Union, AsyncGenerator, Literal, TYPE_CHECKING
 from services.llm import make_llm_api_call
 from agentpress.tool import Tool
 from agentpress.tool_orchestrator import ToolOrchestrator # Changed import
@@ -25,10 +26,14 @@ from agentpress.task_state_manager import TaskStateManager
 from agentpress.task_storage_supabase import SupabaseTaskStorage
 from services.supabase import DBConnection
 from utils.logger import logger
-from langfuse.client import StatefulGenerationClient, StatefulTraceClient
+from utils.tracing import span
+from services.artifact_store import inline_artifacts
 from services.langfuse import langfuse
 import datetime
 
+if TYPE_CHECKING:
+    from langfuse.client import StatefulGenerationClient, StatefulTraceClient
+
 # Type alias for tool choice
 ToolChoice = Literal["auto", "required", "none"]
 
@@ -40,7 +45,7 @@ class ThreadManager:
     XML-based tool execution patterns.
     """
 
-    def __init__(self, tool_orchestrator: ToolOrchestrator, trace: Optional[StatefulTraceClient] = None):
+    def __init__(self, tool_orchestrator: ToolOrchestrator, trace: Optional["StatefulTraceClient"] = None):
         """Initialize ThreadManager.
 
         Args:
@@ -114,7 +119,8 @@ class ThreadManager:
 
         try:
             # Add returning='representation' to get the inserted row data including the id
-            result = await client.table('messages').insert(data_to_insert, returning='representation').execute()
+            with span("db_write", "messages"):
+                result = await client.table('messages').insert(data_to_insert, returning='representation').execute()
             logger.info(f"Successfully added message to thread {thread_id}")
 
             if result.data and len(result.data) > 0 and isinstance(result.data[0], dict) and 'message_id' in result.data[0]:
@@ -126,7 +132,7 @@ class ThreadManager:
             logger.error(f"Failed to add message to thread {thread_id}: {str(e)}", exc_info=True)
             raise
 
-    async def get_llm_messages(self, thread_id: str) -> List[Dict[str, Any]]:
+    async def get_llm_messages(self, thread_id: str, expand_artifacts: bool = False) -> List[Dict[str, Any]]:
         """Get all messages for a thread.
 
         This method uses the SQL function which handles context truncation
@@ -134,6 +140,8 @@ class ThreadManager:
 
         Args:
             thread_id: The ID of the thread to get messages for.
+            expand_artifacts: Replace artifact references (large tool outputs stored
+                outside the messages table) in tool results by their full content.
 
         Returns:
             List of message objects.
@@ -169,12 +177,43 @@ class ThreadManager:
                             if 'arguments' in tool_call['function'] and not isinstance(tool_call['function']['arguments'], str):
                                 tool_call['function']['arguments'] = json.dumps(tool_call['function']['arguments'])
 
+            if expand_artifacts and any('<artifact ' in json.dumps(message.get('content')) for message in messages):
+                tool_artifacts = await self._tool_result_artifacts(client, thread_id)
+                for message in messages:
+                    content = message.get('content')
+                    if isinstance(content, str):
+                        message['content'] = await inline_artifacts(content, tool_artifacts.get(content, ()))
+                    elif isinstance(content, list):
+                        for part in content:
+                            if isinstance(part, dict) and isinstance(part.get('text'), str):
+                                part['text'] = await inline_artifacts(part['text'], tool_artifacts.get(part['text'], ()))
+
             return messages
 
         except Exception as e:
             logger.error(f"Failed to get messages for thread {thread_id}: {str(e)}", exc_info=True)
             return []
 
+    async def _tool_result_artifacts(self, client, thread_id: str) -> Dict[str, Set[str]]:
+        """Content of the thread's tool result messages -> artifact digests recorded in their metadata.
+
+        Only these digests are expanded, and only in these messages: any other message
+        (e.g. user text quoting a reference) could otherwise pull an arbitrary artifact into the context.
+        """
+        result = await client.table('messages').select('content, metadata').eq('thread_id', thread_id).eq('type', 'tool').execute()
+        artifacts: Dict[str, Set[str]] = {}
+        for row in result.data or []:
+            metadata = row.get('metadata') or {}
+            if isinstance(metadata, str):
+                metadata = json.loads(metadata)
+            digests = metadata.get('artifacts')
+            content = row.get('content')
+            if isinstance(content, str):
+                content = json.loads(content)
+            if digests and isinstance(content, dict) and isinstance(content.get('content'), str):
+                artifacts.setdefault(content['content'], set()).update(digests)
+        return artifacts
+
     async def run_thread(
         self,
         thread_id: str,
@@ -192,7 +231,7 @@ class ThreadManager:
         enable_thinking: Optional[bool] = False,
         reasoning_effort: Optional[str] = 'low',
         enable_context_manager: bool = True,
-        generation: Optional[StatefulGenerationClient] = None,
+        generation: Optional["StatefulGenerationClient"] = None,
     ) -> Union[Dict[str, Any], AsyncGenerator]:
         """Run a conversation thread with LLM integration and tool execution.
 
@@ -284,6 +323,8 @@ class ThreadManager:
                     working_system_prompt['content'] += examples_content
                     logger.debug("Appended XML examples to string system prompt content.")
                 elif isinstance(system_content, list):
+                    # Copy the blocks so the caller's prompt (reused across runs) stays byte-stable
+                    working_system_prompt['content'] = [dict(item) if isinstance(item, dict) else item for item in system_content]
                     appended = False
                     for item in working_system_prompt['content']: # Modify the copy
                         if isinstance(item, dict) and item.get('type') == 'text' and 'text' in item:
@@ -306,8 +347,8 @@ class ThreadManager:
                 nonlocal processor_config
                 # Note: processor_config is now guaranteed to exist due to check above
 
-                # 1. Get messages from thread for LLM call
-                messages = await self.get_llm_messages(thread_id)
+                # 1. Get messages from thread for LLM call, with offloaded tool outputs in full
+                messages = await self.get_llm_messages(thread_id, expand_artifacts=True)
 
                 # 2. Check token count before proceeding
                 token_count = 0
@@ -328,12 +369,16 @@ class ThreadManager:
                         )
                         if summarized:
                             logger.info("Summarization complete, fetching updated messages with summary")
-                            messages = await self.get_llm_messages(thread_id)
+                            messages = await self.get_llm_messages(thread_id, expand_artifacts=True)
                             # Recount tokens after summarization, using the modified prompt
                             new_token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages)
                             logger.info(f"After summarization: token count reduced from {token_count} to {new_token_count}")
                         else:
                             logger.warning("Summarization failed or wasn't needed - proceeding with original messages")
+                    elif token_count >= self.context_manager.rolling_summary_watermark and enable_context_manager:
+                        # Fold older messages into a rolling summary in the background so this turn doesn't wait
+                        if self.context_manager.schedule_rolling_summary(thread_id, model=llm_model):
+                            logger.info(f"Thread token count ({token_count}) passed the rolling summary watermark, summarizing in the background")
                     elif not enable_context_manager:
                         logger.info("Automatic summarization disabled. Skipping token count check and summarization.")
 
@@ -375,9 +420,13 @@ class ThreadManager:
                     logger.debug(f"Retrieved {len(openapi_tool_schemas) if openapi_tool_schemas else 0} OpenAPI tool schemas for LLM.")
 
                 # 5. Make LLM API call
-                logger.debug(f"Final messages for LLM call (Thread {thread_id}):") # Changed prepared_messages to final_messages_for_llm
+                # Building the per-message previews is costly on long threads; only do it when DEBUG is on
+                preview_messages = logger.isEnabledFor(logging.DEBUG)
+                logger.debug("Final messages for LLM call (Thread %s):", thread_id) # Changed prepared_messages to final_messages_for_llm
                 for i, msg in enumerate(final_messages_for_llm): # Changed prepared_messages to final_messages_for_llm
                     if isinstance(msg, dict):
+                        if not preview_messages:
+                            continue
                         role = msg.get('role')
                         content = msg.get('content')
                         content_type = type(content).__name__
@@ -418,17 +467,18 @@ class ThreadManager:
                               "tools": openapi_tool_schemas,
                             }
                         )
-                    llm_response = await make_llm_api_call(
-                        final_messages_for_llm, # Changed prepared_messages to final_messages_for_llm
-                        llm_model,
-                        temperature=llm_temperature,
-                        max_tokens=llm_max_tokens,
-                        tools=openapi_tool_schemas,
-                        tool_choice=tool_choice if processor_config.native_tool_calling else None,
-                        stream=stream,
-                        enable_thinking=enable_thinking,
-                        reasoning_effort=reasoning_effort
-                    )
+                    with span("llm_request", llm_model):
+                        llm_response = await make_llm_api_call(
+                            final_messages_for_llm, # Changed prepared_messages to final_messages_for_llm
+                            llm_model,
+                            temperature=llm_temperature,
+                            max_tokens=llm_max_tokens,
+                            tools=openapi_tool_schemas,
+                            tool_choice=tool_choice if processor_config.native_tool_calling else None,
+                            stream=stream,
+                            enable_thinking=enable_thinking,
+                            reasoning_effort=reasoning_effort
+                        )
                     logger.debug("Successfully received raw LLM API response stream/object")
 
                 except Exception as e:
@@ -7,6 +7,8 @@ import inspect # Added
 from typing import Dict, Any, Optional, List, Type # Added List, Type
 from .tool import Tool, ToolResult, openapi_schema # Added openapi_schema for dummy tool
 from utils.logger import logger # Changed import
+from utils.tracing import span
+from services.prompt_cache import canonical_tools
 
 # Define a default plugin directory at the module level or pass to orchestrator
 DEFAULT_PLUGINS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "plugins"))
@@ -20,6 +22,9 @@ class ToolOrchestrator:
         self.tools: Dict[str, Tool] = {}
         self.tool_execution_tasks: Dict[str, asyncio.Task] = {}
         self.plugin_sources: Dict[str, str] = {} # tool_id -> path of plugin file
+        # Memoized LLM-facing schemas; byte-stable across calls so provider prompt caches keep hitting
+        self._llm_schemas: Optional[List[Dict[str, Any]]] = None
+        self._xml_schemas: Optional[str] = None
         logger.info("ToolOrchestrator initialized.")
 
     def get_tool_names(self) -> List[str]:
@@ -45,6 +50,7 @@ class ToolOrchestrator:
         self.tools[tool_id] = tool_instance
         if plugin_path:
             self.plugin_sources[tool_id] = plugin_path
+        self._invalidate_schemas()
         # Removed the original generic log as it's now covered by the conditional logging above.
 
     def unload_tool(self, tool_id: str):
@@ -53,10 +59,15 @@ class ToolOrchestrator:
             del self.tools[tool_id]
             if tool_id in self.plugin_sources:
                 del self.plugin_sources[tool_id]
+            self._invalidate_schemas()
             logger.info(f"Tool '{tool_id}' unloaded successfully.")
         else:
             logger.warning(f"Tool with ID '{tool_id}' not found, cannot unload.")
 
+    def _invalidate_schemas(self):
+        self._llm_schemas = None
+        self._xml_schemas = None
+
     def load_tools_from_directory(self, directory_path: str = DEFAULT_PLUGINS_DIR):
         """
         Scans a directory for Python files, imports them, finds Tool subclasses,
@@ -168,8 +179,8 @@ class ToolOrchestrator:
         Returns:
             A ToolResult object representing the outcome of the execution.
         """
-        logger.info(f"ToolOrchestrator: Executing tool_id='{tool_id}', method_name='{method_name}'")
-        logger.debug(f"ToolOrchestrator: Received params: {params}")
+        logger.info("ToolOrchestrator: Executing tool_id='%s', method_name='%s'", tool_id, method_name)
+        logger.debug("ToolOrchestrator: Received params: %s", params)
         execution_id = str(uuid.uuid4())
         start_time = time.time()
 
@@ -207,7 +218,7 @@ class ToolOrchestrator:
         enhanced_result.update_progress(0.1, status="running")
 
         try:
-            logger.info(f"Executing method '{method_name}' on tool '{tool_id}' with params: {params}")
+            logger.info("Executing method '%s' on tool '%s' with params: %s", method_name, tool_id, sorted(params))
             # This is where the actual tool method is called.
             # Tool methods themselves are not async, so we run them in the default executor.
             # The `success_response` or `fail_response` from the tool method will create a ToolResult.
@@ -219,7 +230,8 @@ class ToolOrchestrator:
             # The method_to_call is an async method of the tool.
             # It should return raw data or raise an exception.
             # actual_result_data = await loop.run_in_executor(None, lambda: method_to_call(**params)) # This was incorrect for async tool methods
-            actual_result_data = await method_to_call(**params)
+            with span("tool", tool_id):
+                actual_result_data = await method_to_call(**params)
 
             # The `method_to_call` should now return a ToolResult.
             # We need to ensure the tool_id and execution_id are correctly passed into it.
@@ -256,7 +268,7 @@ class ToolOrchestrator:
             # to construct the `ToolResult`.
 
             # actual_result_data = await loop.run_in_executor(None, lambda: method_to_call(**params)) # This was moved up
-            logger.debug(f"ToolOrchestrator: Raw result from {tool_id}.{method_name}: {actual_result_data}")
+            logger.debug("ToolOrchestrator: Raw result from %s.%s: %s", tool_id, method_name, actual_result_data)
 
             # Now, use the tool's success_response to build the ToolResult
             final_enhanced_result = tool_instance.success_response(
@@ -270,7 +282,7 @@ class ToolOrchestrator:
             return final_enhanced_result
 
         except Exception as e:
-            logger.debug(f"ToolOrchestrator: Error from {tool_id}.{method_name}: {e}")
+            logger.debug("ToolOrchestrator: Error from %s.%s: %s", tool_id, method_name, e)
             logger.error(f"Error executing tool '{tool_id}' method '{method_name}': {e}", exc_info=True)
             # Use the tool's fail_response
             final_enhanced_result = tool_instance.fail_response(
@@ -379,7 +391,13 @@ class ToolOrchestrator:
         """
         Returns a list of schemas formatted for an LLM, typically OpenAPI.
         This will replace get_openapi_schemas() for LLM consumption.
+
+        The list is canonical (sorted by name, sorted keys) and memoized until a tool
+        is registered or unloaded.
         """
+        if self._llm_schemas is not None:
+            return list(self._llm_schemas)
+
         llm_schemas = []
         for tool_id, tool_instance in self.tools.items():
             tool_method_schemas = tool_instance.get_schemas() # Dict[str, List[ToolSchema]]
@@ -413,15 +431,20 @@ class ToolOrchestrator:
 
         logger.debug(f"ToolOrchestrator: Providing {len(llm_schemas)} OpenAPI schemas for LLM.")
         # logger.debug(f"Prepared {len(llm_schemas)} schemas for LLM consumption.") # Replaced by above
-        return llm_schemas
+        self._llm_schemas = canonical_tools(llm_schemas)
+        return list(self._llm_schemas)
 
     def get_xml_schemas_for_llm(self) -> str:
         """
         Returns a string containing XML schema examples, formatted for an LLM.
         This will replace get_xml_examples() for LLM consumption.
+        Tools are listed in sorted order and the string is memoized, so it is byte-stable.
         """
+        if self._xml_schemas is not None:
+            return self._xml_schemas
+
         xml_schema_parts = []
-        for tool_id, tool_instance in self.tools.items():
+        for tool_id, tool_instance in sorted(self.tools.items()):
             tool_method_schemas = tool_instance.get_schemas() # Dict[str, List[ToolSchema]]
             for method_name, schema_list in tool_method_schemas.items():
                 for schema_obj in schema_list:
@@ -436,12 +459,14 @@ class ToolOrchestrator:
                         )
 
         if not xml_schema_parts:
+            self._xml_schemas = ""
             return ""
 
-        return (
+        self._xml_schemas = (
             "You can use the following XML tools. Wrap the XML in <tool_code>...</tool_code> tags.\n\n"
             + "\n\n---\n\n".join(xml_schema_parts)
         )
+        return self._xml_schemas
         logger.debug(f"ToolOrchestrator: Providing XML schema string of length {len(xml_schema_parts_joined)} for LLM.") # Corrected variable name
         return xml_schema_parts_joined
 
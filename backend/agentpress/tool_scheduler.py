@@ -0,0 +1,214 @@
+"""
+Worker-wide scheduling of tool executions.
+
+Every tool call in a worker process goes through one ``ToolScheduler``, which
+bounds concurrency across all agent runs sharing the event loop:
+
+- a global cap (TOOL_MAX_CONCURRENCY) on tools running at once;
+- per tool class limits: ``browser`` tools share the sandbox's single browser
+  (TOOL_BROWSER_CONCURRENCY_PER_SANDBOX per sandbox), ``scrape`` tools call
+  rate-limited external APIs (TOOL_SCRAPE_CONCURRENCY for the whole worker);
+- ``interactive`` tools (ask, complete, ...) are user-visible, so they jump the
+  queue ahead of everything else;
+- among equal priorities, runs get slots by start-time fair queuing, so a run
+  that submits twenty scrapes at once does not starve another run's single call.
+
+A tool's class comes from its ``SCHEDULER_CLASS`` attribute (``default`` when
+unset). The processor's ``sequential``/``parallel`` execution strategies are
+policies on top of this: sequential submits one call at a time, parallel
+submits them all and lets the scheduler bound them.
+
+Time spent waiting for a slot is recorded as the ``tool_queue`` phase (see
+utils/tracing.py), so it shows in the Prometheus histogram and run timings.
+"""
+
+import asyncio
+import itertools
+import time
+import weakref
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from utils.config import config
+from utils.logger import logger
+from utils.tracing import current_run, record_phase
+
+DEFAULT_CLASS = "default"
+INTERACTIVE_CLASS = "interactive"
+
+
+@dataclass(frozen=True)
+class ToolClassLimit:
+    """Concurrency limit for a tool class; ``per_sandbox`` applies it to each sandbox separately."""
+    limit: Optional[int] = None
+    per_sandbox: bool = False
+    priority: int = 1  # Lower runs first
+
+
+@dataclass
+class _Waiter:
+    key: Tuple[int, float, int]
+    tool_class: str
+    limit_key: Tuple[str, Optional[str]]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class ToolScheduler:
+    """Grants tool execution slots under global and per-class limits."""
+
+    def __init__(self, max_concurrency: int = 32, class_limits: Optional[Dict[str, ToolClassLimit]] = None):
+        self.max_concurrency = max_concurrency
+        self.class_limits: Dict[str, ToolClassLimit] = dict(class_limits or {})
+        self.active = 0
+        self._active_by_key: Dict[Tuple[str, Optional[str]], int] = {}
+        self._waiters: List[_Waiter] = []
+        self._sequence = itertools.count()
+        # Start-time fair queuing: virtual time advances with each granted slot,
+        # and a run's next call starts after the tag of its previous one
+        self._virtual_time = 0.0
+        self._run_finish_tags: Dict[str, float] = {}
+
+    def _limit_for(self, tool_class: str) -> ToolClassLimit:
+        return self.class_limits.get(tool_class, ToolClassLimit())
+
+    def _has_capacity(self, waiter: _Waiter) -> bool:
+        if self.active >= self.max_concurrency:
+            return False
+        limit = self._limit_for(waiter.tool_class).limit
+        return limit is None or self._active_by_key.get(waiter.limit_key, 0) < limit
+
+    def _dispatch(self) -> None:
+        """Grant slots to queued calls in (priority, fair-queuing tag) order while capacity allows."""
+        if not self._waiters:
+            return
+        self._waiters.sort(key=lambda waiter: waiter.key)
+        remaining = []
+        for waiter in self._waiters:
+            if waiter.future.done():
+                continue  # Cancelled while queued
+            if self._has_capacity(waiter):
+                self._grant(waiter.limit_key)
+                self._virtual_time = max(self._virtual_time, waiter.key[1])
+                waiter.future.set_result(None)
+            else:
+                remaining.append(waiter)
+        self._waiters = remaining
+        # Forget runs whose last tag is behind virtual time; they start fresh anyway
+        self._run_finish_tags = {run: tag for run, tag in self._run_finish_tags.items() if tag > self._virtual_time}
+
+    def _grant(self, limit_key: Tuple[str, Optional[str]]) -> None:
+        self.active += 1
+        self._active_by_key[limit_key] = self._active_by_key.get(limit_key, 0) + 1
+
+    def _release(self, limit_key: Tuple[str, Optional[str]]) -> None:
+        self.active -= 1
+        remaining = self._active_by_key.get(limit_key, 1) - 1
+        if remaining:
+            self._active_by_key[limit_key] = remaining
+        else:
+            self._active_by_key.pop(limit_key, None)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        tool_class: str = DEFAULT_CLASS,
+        run_id: Optional[str] = None,
+        sandbox_id: Optional[str] = None,
+        weight: float = 1.0,
+    ) -> AsyncIterator[None]:
+        """Wait for an execution slot for one tool call and hold it for the body.
+
+        Args:
+            tool_class: Scheduling class of the tool (see ``class_limits``)
+            run_id: Run the call belongs to, for fair queuing across runs
+            sandbox_id: Sandbox the tool acts on, for per-sandbox limits
+            weight: Share of the worker a run gets relative to other runs
+        """
+        limit = self._limit_for(tool_class)
+        limit_key = (tool_class, sandbox_id if limit.per_sandbox else None)
+        run_key = run_id or ""
+        start_tag = max(self._virtual_time, self._run_finish_tags.get(run_key, 0.0))
+        self._run_finish_tags[run_key] = start_tag + 1.0 / max(weight, 1e-6)
+
+        waiter = _Waiter(
+            key=(limit.priority, start_tag, next(self._sequence)),
+            tool_class=tool_class,
+            limit_key=limit_key,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._waiters.append(waiter)
+        self._dispatch()
+        if not waiter.future.done():
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # The slot was granted just as the caller was cancelled
+                    self._release(limit_key)
+                else:
+                    waiter.future.cancel()
+                    self._dispatch()
+                raise
+        waited = time.perf_counter() - waiter.enqueued_at
+        record_phase("tool_queue", waited, tool_class)
+        if waited > 1:
+            logger.debug("Tool of class %s waited %.2fs for a slot (%d active, %d queued)", tool_class, waited, self.active, len(self._waiters))
+        try:
+            yield
+        finally:
+            self._release(limit_key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Currently running and queued calls, by class."""
+        queued: Dict[str, int] = {}
+        for waiter in self._waiters:
+            if not waiter.future.done():
+                queued[waiter.tool_class] = queued.get(waiter.tool_class, 0) + 1
+        running: Dict[str, int] = {}
+        for (tool_class, _), count in self._active_by_key.items():
+            running[tool_class] = running.get(tool_class, 0) + count
+        return {"active": self.active, "running": running, "queued": queued}
+
+
+def default_class_limits() -> Dict[str, ToolClassLimit]:
+    return {
+        INTERACTIVE_CLASS: ToolClassLimit(priority=0),
+        "browser": ToolClassLimit(limit=config.TOOL_BROWSER_CONCURRENCY_PER_SANDBOX, per_sandbox=True),
+        "scrape": ToolClassLimit(limit=config.TOOL_SCRAPE_CONCURRENCY),
+    }
+
+
+def tool_class_of(tool_instance: Any) -> str:
+    """Scheduling class declared by a tool via ``SCHEDULER_CLASS``."""
+    tool_class = getattr(tool_instance, "SCHEDULER_CLASS", None)
+    return tool_class if isinstance(tool_class, str) else DEFAULT_CLASS
+
+
+def sandbox_of(tool_instance: Any) -> Optional[str]:
+    """Sandbox a tool acts on; sandbox tools are bound to one project's sandbox."""
+    project_id = getattr(tool_instance, "project_id", None)
+    return project_id if isinstance(project_id, str) else None
+
+
+def current_run_id() -> Optional[str]:
+    """Id of the agent run traced in the current context, if any."""
+    run = current_run()
+    return run.run_id if run else None
+
+
+# One scheduler per event loop: the worker runs every actor on a single loop,
+# and asyncio futures cannot be shared between loops (e.g. in tests)
+_schedulers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ToolScheduler]" = weakref.WeakKeyDictionary()
+
+
+def get_tool_scheduler() -> ToolScheduler:
+    """The scheduler shared by every run on the current event loop."""
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = ToolScheduler(config.TOOL_MAX_CONCURRENCY, default_class_limits())
+        _schedulers[loop] = scheduler
+    return scheduler
@@ -122,6 +122,10 @@ def safe_json_parse(value: Union[str, Dict, List, Any], default: Any = None) ->
     return value
 
 
+# First characters a JSON document can start with
+_JSON_START_CHARS = frozenset('{["-0123456789tfn')
+
+
 def to_json_string(value: Any) -> str:
     """
     Convert a value to a JSON string if needed.
@@ -136,6 +140,10 @@ def to_json_string(value: Any) -> str:
         JSON string representation
     """
     if isinstance(value, str):
+        # Plain text (the common case for streamed chunks) cannot be JSON; skip the validation parse
+        stripped = value.lstrip()
+        if not stripped or stripped[0] not in _JSON_START_CHARS:
+            return json.dumps(value)
         # If it's already a string, check if it's valid JSON
         try:
             json.loads(value)
@@ -0,0 +1,211 @@
+"""
+Incremental JSON scanner for streamed LLM output.
+
+Tool-call arguments and plans arrive as many small string deltas. Re-parsing the
+accumulated text after every delta is quadratic in its size, so instead the
+scanner keeps nesting depth and string/escape state across chunks and only looks
+at the new characters. It reports when the root value is complete (so it can be
+parsed once) and extracts top-level scalar members of the root object as soon as
+they finish streaming, e.g. ``file_path`` before a large ``file_contents`` body.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+# Inside a string only quotes and backslashes change the scanner state
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+# Top-level values longer than this are not extracted early (they are available once complete)
+MAX_PARTIAL_VALUE_CHARS = 4096
+
+# Member states while scanning the root object
+_EXPECT_KEY = "key"
+_EXPECT_COLON = "colon"
+_EXPECT_VALUE = "value"
+_IN_SCALAR = "scalar"
+_AFTER_VALUE = "after"
+
+
+class IncrementalJSONScanner:
+    """
+    Resumable scanner for a single streamed JSON object or array.
+
+    Usage:
+        scanner = IncrementalJSONScanner()
+        for delta in deltas:
+            if scanner.feed(delta):
+                arguments = scanner.value()
+    """
+
+    def __init__(self, skip_prefix: bool = False):
+        """
+        Args:
+            skip_prefix: Ignore any text before the first '{' or '[' (e.g. prose before a JSON plan).
+                Otherwise the first non-whitespace character must open the root value.
+        """
+        self.skip_prefix = skip_prefix
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.complete = False
+        self.error = False
+        self.partial_values: Dict[str, Any] = {}
+        self._root: Optional[str] = None
+        self._chunks: List[str] = []
+        self._value: Any = None
+        self._parsed = False
+        self._new_keys: List[str] = []
+        # Root object member tracking
+        self._member_state = _EXPECT_KEY
+        self._current_key: Optional[str] = None
+        self._capture: Optional[List[str]] = None
+        self._capture_start = 0
+        self._capture_len = 0
+
+    @property
+    def text(self) -> str:
+        """The JSON text scanned so far (without any skipped prefix or trailing text)."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> bool:
+        """Scan the next chunk. Returns True once the root value is complete."""
+        if self.complete or self.error or not chunk:
+            return self.complete
+
+        i = 0
+        n = len(chunk)
+        if not self.started:
+            if self.skip_prefix:
+                match = re.search(r"[{\[]", chunk)
+                if match is None:
+                    return False
+                i = match.start()
+            else:
+                while i < n and chunk[i].isspace():
+                    i += 1
+                if i == n:
+                    return False
+                if chunk[i] not in "{[":
+                    self.error = True
+                    return False
+        chunk = chunk[i:]
+        n = len(chunk)
+        i = 0
+
+        while i < n:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                    i += 1
+                    continue
+                match = _STRING_SPECIAL.search(chunk, i)
+                if match is None:
+                    break
+                i = match.start()
+                if chunk[i] == "\\":
+                    self.escape = True
+                    i += 1
+                    continue
+                self.in_string = False
+                if self._capture is not None:
+                    self._finish_capture(chunk, i + 1)
+                i += 1
+                continue
+
+            c = chunk[i]
+            if c == '"':
+                self.in_string = True
+                if self._tracks_members() and self._member_state in (_EXPECT_KEY, _EXPECT_VALUE):
+                    self._start_capture(i)
+            elif c in "{[":
+                if self.depth == 0:
+                    self.started = True
+                    self._root = c
+                elif self._tracks_members() and self._member_state == _EXPECT_VALUE:
+                    # Nested containers are only available once the whole value completes
+                    self._member_state = _AFTER_VALUE
+                self.depth += 1
+            elif c in "}]":
+                if self._tracks_members() and self._member_state == _IN_SCALAR:
+                    self._finish_capture(chunk, i)
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+                    self._chunks.append(chunk[:i + 1])
+                    return True
+            elif self._tracks_members():
+                if c == ",":
+                    if self._member_state == _IN_SCALAR:
+                        self._finish_capture(chunk, i)
+                    self._member_state = _EXPECT_KEY
+                elif c == ":" and self._member_state == _EXPECT_COLON:
+                    self._member_state = _EXPECT_VALUE
+                elif self._member_state == _EXPECT_VALUE and not c.isspace():
+                    self._member_state = _IN_SCALAR
+                    self._start_capture(i)
+            i += 1
+
+        self._chunks.append(chunk)
+        if self._capture is not None:
+            self._extend_capture(chunk[self._capture_start:])
+            self._capture_start = 0
+        return False
+
+    def value(self) -> Any:
+        """Parse the completed JSON value (parsed once and cached)."""
+        if not self.complete:
+            raise json.JSONDecodeError("Incomplete JSON value", self.text, len(self.text))
+        if not self._parsed:
+            self._value = json.loads(self.text)
+            self._parsed = True
+        return self._value
+
+    def pop_new_values(self) -> Dict[str, Any]:
+        """Top-level values that finished streaming since the last call."""
+        new_values = {key: self.partial_values[key] for key in self._new_keys}
+        self._new_keys = []
+        return new_values
+
+    def _tracks_members(self) -> bool:
+        return self.depth == 1 and self._root == "{"
+
+    def _start_capture(self, start: int) -> None:
+        self._capture = []
+        self._capture_start = start
+        self._capture_len = 0
+
+    def _extend_capture(self, text: str) -> None:
+        self._capture_len += len(text)
+        if self._capture_len > MAX_PARTIAL_VALUE_CHARS and self._member_state != _EXPECT_KEY:
+            # Too large to extract early; stop buffering a second copy of it
+            self._capture = None
+            if self._member_state != _IN_SCALAR:
+                self._member_state = _AFTER_VALUE
+            return
+        self._capture.append(text)
+
+    def _finish_capture(self, chunk: str, end: int) -> None:
+        if self._capture is None:
+            # Capture was abandoned because the value was too large
+            if self._member_state == _IN_SCALAR:
+                self._member_state = _AFTER_VALUE
+            return
+        raw = "".join(self._capture) + chunk[self._capture_start:end]
+        self._capture = None
+        try:
+            decoded = json.loads(raw)
+        except ValueError:
+            self._member_state = _AFTER_VALUE
+            return
+
+        if self._member_state == _EXPECT_KEY:
+            self._current_key = decoded
+            self._member_state = _EXPECT_COLON
+            return
+
+        self._member_state = _AFTER_VALUE
+        if self._current_key is not None and len(raw) <= MAX_PARTIAL_VALUE_CHARS:
+            self.partial_values[self._current_key] = decoded
+            self._new_keys.append(self._current_key)
@@ -1,6 +1,6 @@
 from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.routing import APIRouter
 import sentry
 from contextlib import asynccontextmanager
@@ -14,6 +14,9 @@ from utils.config import config, EnvMode
 import asyncio
 import json # Added import for json.dumps
 from utils.logger import logger, setup_logger as get_logger # Added get_logger
+from utils.sse import encode_frame
+from utils.startup import startup
+from utils.auth_utils import verify_metrics_token
 import uuid
 import time
 from collections import OrderedDict
@@ -70,11 +73,12 @@ async def lifespan(app: FastAPI):
         supabase_task_storage = SupabaseTaskStorage(db_connection=db_connection)
         
         tool_orchestrator = ToolOrchestrator()
-        # Assuming DEFAULT_PLUGINS_DIR is defined in ToolOrchestrator or passed here
-        tool_orchestrator.load_tools_from_directory()
+        # Plugin discovery imports every plugin module and loading tasks reads the whole table;
+        # both run in the background so the API starts serving right away (see /api/health/ready)
+        startup.defer("tool_plugins", asyncio.to_thread(tool_orchestrator.load_tools_from_directory))
 
         task_state_manager = TaskStateManager(storage=supabase_task_storage)
-        await task_state_manager.initialize() # Load existing tasks
+        startup.defer("tasks", task_state_manager.initialize()) # Load existing tasks
 
         task_planner = TaskPlanner(task_manager=task_state_manager, tool_orchestrator=tool_orchestrator)
 
@@ -98,9 +102,13 @@ async def lifespan(app: FastAPI):
             logger.info("Redis connection initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize Redis connection: {e}")
+
+        await agent_api.start_background_jobs()
         
         yield
         
+        await startup.shutdown()
+
         # Clean up agent resources
         logger.info("Cleaning up agent resources")
         await agent_api.cleanup()
@@ -126,17 +134,17 @@ app = FastAPI(lifespan=lifespan)
 
 # Dependency provider functions
 async def get_task_state_manager() -> TaskStateManager:
-    if not task_state_manager:
+    if not task_state_manager or not await startup.wait_for("tasks"):
         raise HTTPException(status_code=503, detail="TaskStateManager not initialized")
     return task_state_manager
 
 async def get_task_planner() -> TaskPlanner:
-    if not task_planner:
+    if not task_planner or not await startup.wait_for("tool_plugins"):
         raise HTTPException(status_code=503, detail="TaskPlanner not initialized")
     return task_planner
 
 async def get_tool_orchestrator() -> ToolOrchestrator:
-    if not tool_orchestrator:
+    if not tool_orchestrator or not await startup.wait_for("tool_plugins"):
         raise HTTPException(status_code=503, detail="ToolOrchestrator not initialized")
     return tool_orchestrator
 
@@ -176,7 +184,7 @@ async def plan_new_task(
 
             response_list_key = f"agent_run:{main_task.id}:responses"
             response_channel = f"agent_run:{main_task.id}:new_response"
-            message_json_str = json.dumps(message_data) # Renamed to avoid conflict
+            message_json_str = encode_frame(message_data) # Renamed to avoid conflict
 
             try:
                 # Import redis here if not globally available or prefer scoped import
@@ -393,15 +401,44 @@ app.include_router(log_router, prefix="") # Add the new router, prefix is alread
 
 
 @app.get("/api/health")
+@app.get("/api/health/live")
 async def health_check():
-    """Health check endpoint to verify API is working."""
-    logger.info("Health check endpoint called")
+    """Liveness probe: the process is up and serving. Does no I/O."""
+    logger.debug("Health check endpoint called")
     return {
         "status": "ok", 
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "instance_id": instance_id
     }
 
+@app.get("/api/health/ready")
+async def readiness_check():
+    """Readiness probe: 200 once the database is connected and deferred startup steps have finished."""
+    checks = {
+        "database": "ready" if db_connection and db_connection._initialized else "pending",
+        **{name: step["state"] for name, step in startup.status().items()},
+    }
+    ready = all(state == "ready" for state in checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "starting",
+            "checks": checks,
+            "steps": startup.status(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "instance_id": instance_id,
+        },
+    )
+
+@app.get("/metrics", dependencies=[Depends(verify_metrics_token)])
+async def metrics():
+    """Prometheus metrics of this API process (phase duration histograms from utils.tracing).
+
+    Requires ``Authorization: Bearer <METRICS_TOKEN>``; not served when the token is unset.
+    """
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
     import uvicorn
     
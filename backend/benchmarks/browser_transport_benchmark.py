@@ -0,0 +1,116 @@
+"""
+Benchmark per-action overhead of browser service calls: curl through exec vs the pooled HTTP client.
+
+Serves a stand-in for the sandbox browser service locally (its responses carry a
+screenshot and an element list of configurable size) and calls it:
+
+- exec: what ``_browser_request_via_exec`` runs, a ``curl`` process per action
+  whose stdout is parsed as JSON. Sandbox exec also adds an API round trip to the
+  sandbox provider that is not included here, so this is a lower bound.
+- http: ``BrowserServiceClient.request`` over one pooled keep-alive client
+
+Usage:
+    python -m benchmarks.browser_transport_benchmark --actions 200 --concurrency 4 --screenshot-kb 300
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import socket
+import statistics
+import threading
+import time
+from typing import Dict, List
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from sandbox.browser_client import BrowserRoute, BrowserServiceClient
+
+
+def make_app(screenshot_kb: int) -> Starlette:
+    body = json.dumps({
+        "success": True,
+        "message": "Clicked element with index 3",
+        "url": "https://example.com/form",
+        "title": "Example form",
+        "elements": "\n".join(f"[{i}]<button>Item {i}</button>" for i in range(200)),
+        "screenshot_base64": os.urandom(screenshot_kb * 768).hex()[: screenshot_kb * 1024],
+        "element_count": 200,
+    }).encode()
+
+    async def action(request):
+        await request.body()
+        return Response(body, media_type="application/json")
+
+    return Starlette(routes=[Route("/api/automation/{endpoint}", action, methods=["POST"])])
+
+
+def start_service(screenshot_kb: int) -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(make_app(screenshot_kb), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+async def via_exec(base_url: str, params: Dict) -> Dict:
+    command = (f"curl -s -X POST {shlex.quote(base_url + '/api/automation/click_element')} "
+               f"-H 'Content-Type: application/json' -d {shlex.quote(json.dumps(params))}")
+    process = await asyncio.create_subprocess_shell(command, stdout=asyncio.subprocess.PIPE)
+    stdout, _ = await process.communicate()
+    return json.loads(stdout)
+
+
+async def run(mode: str, base_url: str, actions: int, concurrency: int) -> Dict[str, float]:
+    client = BrowserServiceClient(max_connections=concurrency, max_response_bytes=64 * 1024 * 1024)
+    route = BrowserRoute(base_url)
+    latencies: List[float] = []
+    remaining = actions
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            params = {"index": 3}
+            started = time.perf_counter()
+            if mode == "exec":
+                result = await via_exec(base_url, params)
+            else:
+                result = await client.request(route, "click_element", params)
+            latencies.append(time.perf_counter() - started)
+            assert result["success"]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await client.aclose()
+    latencies.sort()
+    return {
+        "actions_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark browser service transports")
+    parser.add_argument("--actions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--screenshot-kb", type=int, default=300, help="Size of the screenshot field in responses")
+    args = parser.parse_args()
+
+    base_url = start_service(args.screenshot_kb)
+    results = {mode: asyncio.run(run(mode, base_url, args.actions, args.concurrency)) for mode in ("exec", "http")}
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+In-memory stand-in for Supabase's PostgREST API, for load tests.
+
+Implements the subset of PostgREST the backend uses through supabase-py:
+select (column lists, ``order``, ``limit``/``offset``, ``count=exact``),
+insert/upsert, update and delete with the usual filters (eq, neq, gt, gte, lt,
+lte, in, is, like, ilike), ``single()``/``maybe_single()`` object responses,
+schemas via the ``Accept-Profile``/``Content-Profile`` headers, and the RPC
+functions an agent run calls. Rows live in process memory; nothing is checked
+against the real schema, so it measures the backend, not Postgres.
+
+Usage:
+    python -m benchmarks.fake_supabase --port 8701
+"""
+
+import argparse
+import asyncio
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# Generated primary key column per table (default "id")
+PRIMARY_KEYS = {
+    "projects": "project_id",
+    "threads": "thread_id",
+    "messages": "message_id",
+}
+OBJECT_MEDIA_TYPE = "application/vnd.pgrst.object+json"
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+Row = Dict[str, Any]
+RpcHandler = Callable[["FakeSupabaseStore", Dict[str, Any]], Any]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _text(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    return str(value)
+
+
+def _like(value: Any, pattern: str, case_sensitive: bool) -> bool:
+    import fnmatch
+    value, pattern = _text(value), pattern.replace("%", "*")
+    if not case_sensitive:
+        value, pattern = value.lower(), pattern.lower()
+    return fnmatch.fnmatchcase(value, pattern)
+
+
+def _compare(value: Any, argument: str) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        left, right = float(value), float(argument)
+    except (TypeError, ValueError):
+        left, right = _text(value), argument
+    return (left > right) - (left < right)
+
+
+def matches(row: Row, column: str, expression: str) -> bool:
+    """Evaluate one PostgREST filter (e.g. ``eq.abc``, ``in.(a,b)``, ``not.is.null``) against a row."""
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    operator, _, argument = expression.partition(".")
+    value = row.get(column)
+    if operator == "eq":
+        result = _text(value) == argument
+    elif operator == "neq":
+        result = _text(value) != argument
+    elif operator in ("gt", "gte", "lt", "lte"):
+        order = _compare(value, argument)
+        result = order is not None and {"gt": order > 0, "gte": order >= 0, "lt": order < 0, "lte": order <= 0}[operator]
+    elif operator == "in":
+        options = [option.strip().strip('"') for option in argument.strip("()").split(",") if option]
+        result = _text(value) in options
+    elif operator == "is":
+        result = _text(value) == argument
+    elif operator in ("like", "ilike"):
+        result = _like(value, argument, operator == "like")
+    else:
+        raise ValueError(f"Unsupported filter operator: {operator}")
+    return not result if negate else result
+
+
+def _select_columns(select: Optional[str]) -> Optional[List[str]]:
+    """Plain columns of a select clause; ``*`` and embedded resources (``projects(name)``) select everything."""
+    if not select:
+        return None
+    columns, depth, current = [], 0, ""
+    for char in select:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            columns.append(current.strip())
+            current = ""
+            continue
+        current += char
+    columns.append(current.strip())
+    if any(column == "*" or "(" in column for column in columns):
+        return None
+    return [column.split(":")[-1] for column in columns if column]
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    return (value is None, _text(value) if not isinstance(value, (int, float)) else value)
+
+
+class FakeSupabaseStore:
+    """Tables (keyed by ``schema.table``) and RPC functions."""
+
+    def __init__(self):
+        self.tables: Dict[str, List[Row]] = {}
+        self.rpcs: Dict[str, RpcHandler] = dict(DEFAULT_RPCS)
+        self.requests = 0
+
+    def table(self, name: str, schema: str = "public") -> List[Row]:
+        return self.tables.setdefault(f"{schema}.{name}", [])
+
+    def insert(self, name: str, row: Row, schema: str = "public", upsert_on: Optional[List[str]] = None) -> Row:
+        rows = self.table(name, schema)
+        if upsert_on:
+            for existing in rows:
+                if all(_text(existing.get(column)) == _text(row.get(column)) for column in upsert_on):
+                    existing.update(row)
+                    existing["updated_at"] = _now()
+                    return existing
+        stored = dict(row)
+        primary_key = PRIMARY_KEYS.get(name, "id")
+        stored.setdefault(primary_key, str(uuid.uuid4()))
+        stored.setdefault("created_at", _now())
+        stored.setdefault("updated_at", stored["created_at"])
+        rows.append(stored)
+        return stored
+
+    def query(self, name: str, filters: List[Tuple[str, str]], schema: str = "public") -> List[Row]:
+        return [row for row in self.table(name, schema) if all(matches(row, column, expression) for column, expression in filters)]
+
+
+def _get_llm_formatted_messages(store: FakeSupabaseStore, params: Dict[str, Any]) -> List[Any]:
+    rows = store.query("messages", [("thread_id", f"eq.{params.get('p_thread_id')}"), ("is_llm_message", "eq.true")])
+    messages = []
+    for row in sorted(rows, key=lambda row: row["created_at"]):
+        content = row.get("content")
+        if isinstance(content, str):
+            try:
+                content = json.loads(content)
+            except json.JSONDecodeError:
+                content = {"role": row.get("type"), "content": content}
+        if isinstance(content, dict):
+            messages.append({**content, "message_id": row["message_id"]})
+    return messages
+
+
+DEFAULT_RPCS: Dict[str, RpcHandler] = {
+    "get_llm_formatted_messages": _get_llm_formatted_messages,
+    "record_agent_run_usage": lambda store, params: None,
+    "reconcile_account_usage": lambda store, params: None,
+}
+
+
+def create_app(store: FakeSupabaseStore) -> FastAPI:
+    app = FastAPI()
+
+    def parse(request: Request) -> Tuple[str, List[Tuple[str, str]], Dict[str, str]]:
+        schema = request.headers.get("accept-profile") or request.headers.get("content-profile") or "public"
+        filters = [(key, value) for key, value in request.query_params.multi_items() if key not in RESERVED_PARAMS]
+        return schema, filters, dict(request.query_params)
+
+    def respond(request: Request, rows: List[Row], params: Dict[str, str], status_code: int = 200, total: Optional[int] = None) -> Response:
+        prefer = request.headers.get("prefer", "")
+        if request.method != "GET" and "return=representation" not in prefer:
+            return Response(status_code=204 if status_code == 200 else status_code)
+        columns = _select_columns(params.get("select"))
+        if columns is not None:
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        headers = {}
+        if "count=exact" in prefer:
+            headers["content-range"] = f"0-{max(len(rows) - 1, 0)}/{total if total is not None else len(rows)}"
+        if OBJECT_MEDIA_TYPE in request.headers.get("accept", ""):
+            if len(rows) != 1:
+                return JSONResponse(status_code=406, headers=headers, content={
+                    "code": "PGRST116", "details": f"The result contains {len(rows)} rows",
+                    "hint": None, "message": "JSON object requested, multiple (or no) rows returned",
+                })
+            return JSONResponse(status_code=status_code, headers=headers, content=rows[0])
+        return JSONResponse(status_code=status_code, headers=headers, content=rows)
+
+    @app.post("/rest/v1/rpc/{function}")
+    async def rpc(function: str, request: Request):
+        store.requests += 1
+        handler = store.rpcs.get(function)
+        if handler is None:
+            return JSONResponse(status_code=404, content={
+                "code": "PGRST202", "details": None, "hint": None,
+                "message": f"Could not find the function public.{function}",
+            })
+        body = await request.body()
+        result = handler(store, json.loads(body) if body else {})
+        if asyncio.iscoroutine(result):
+            result = await result
+        return JSONResponse(content=result)
+
+    @app.get("/rest/v1/{table}")
+    async def select(table: str, request: Request):
+        store.requests += 1
+        schema, filters, params = parse(request)
+        try:
+            rows = store.query(table, filters, schema)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"code": "PGRST100", "message": str(e)})
+        for clause in reversed(params.get("order", "").split(",")):
+            if clause:
+                column, *modifiers = clause.split(".")
+                rows = sorted(rows, key=lambda row: _sort_key(row.get(column)), reverse="desc" in modifiers)
+        total = len(rows)
+        offset = int(params.get("offset", 0))
+        limit = params.get("limit")
+        rows = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+        return respond(request, rows, params, total=total)
+
+    @app.post("/rest/v1/{table}")
+    async def insert(table: str, request: Request):
+        store.requests += 1
+        schema, _, params = parse(request)
+        payload = await request.json()
+        upsert_on = None
+        if "resolution=merge-duplicates" in request.headers.get("prefer", ""):
+            upsert_on = params.get("on_conflict", PRIMARY_KEYS.get(table, "id")).split(",")
+        rows = [store.insert(table, row, schema, upsert_on) for row in (payload if isinstance(payload, list) else [payload])]
+        return respond(request, rows, params, status_code=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def update(table: str, request: Request):
+        store.requests += 1
+        schema, filters, params = parse(request)
+        changes = await request.json()
+        rows = store.query(table, filters, schema)
+        for row in rows:
+            row.update(changes)
+            row["updated_at"] = _now()
+        return respond(request, rows, params)
+
+    @app.delete("/rest/v1/{table}")
+    async def delete(table: str, request: Request):
+        store.requests += 1
+        schema, filters, params = parse(request)
+        rows = store.query(table, filters, schema)
+        remaining = store.table(table, schema)
+        remaining[:] = [row for row in remaining if not any(row is deleted for deleted in rows)]
+        return respond(request, rows, params)
+
+    return app
+
+
+class FakeSupabaseServer:
+    """Runs the fake PostgREST API in the current event loop."""
+
+    def __init__(self, store: Optional[FakeSupabaseStore] = None, host: str = "127.0.0.1", port: int = 0):
+        self.store = store or FakeSupabaseStore()
+        self.host = host
+        self.port = port
+        self._server: Optional[uvicorn.Server] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def url(self) -> str:
+        """Value for SUPABASE_URL (the client appends /rest/v1)."""
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "FakeSupabaseServer":
+        uv_config = uvicorn.Config(create_app(self.store), host=self.host, port=self.port, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(uv_config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+        if not self.port:
+            self.port = self._server.servers[0].sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.should_exit = True
+            await self._task
+
+    async def __aenter__(self) -> "FakeSupabaseServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an in-memory PostgREST stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8701)
+    args = parser.parse_args()
+    uvicorn.run(create_app(FakeSupabaseStore()), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark see_image preprocessing: the previous inline compression vs ImagePipeline.
+
+Generates a large photo-like JPEG and a large screenshot-like PNG, then for each mode
+processes ``--images`` of them concurrently while a ticker task measures event loop lag:
+
+- legacy: the previous ``compress_image`` (full decode, LANCZOS resize to 1920x1080,
+  re-encode) called inline in the async code, as ``see_image`` did
+- pipeline: ``ImagePipeline.prepare`` (draft decoding, reduce + resize, budgeted encoding)
+  in a process pool. The images are distinct, so nothing is served from the cache
+
+Usage:
+    python -m benchmarks.image_pipeline_benchmark --images 8 --workers 2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from io import BytesIO
+from typing import Dict, List
+
+from PIL import Image, ImageDraw
+
+from agent.tools.image_pipeline import ImageBudget, ImagePipeline
+
+
+def make_images(count: int) -> List[bytes]:
+    images = []
+    for i in range(count):
+        if i % 2 == 0:
+            small = Image.frombytes("RGB", (500, 375), os.urandom(500 * 375 * 3))
+            image, format = small.resize((4000, 3000), Image.BILINEAR), "JPEG"
+        else:
+            image, format = Image.new("RGB", (2880, 1800), "white"), "PNG"
+            draw = ImageDraw.Draw(image)
+            for y in range(0, 1800, 40):
+                draw.rectangle((40, y + 8, 1400 + i, y + 24), fill=(30, 30, 30))
+        buffer = BytesIO()
+        image.save(buffer, format=format, quality=92)
+        images.append(buffer.getvalue())
+    return images
+
+
+def legacy_compress(data: bytes) -> bytes:
+    image = Image.open(BytesIO(data))
+    is_png = image.format == "PNG"
+    if image.width > 1920 or image.height > 1080:
+        ratio = min(1920 / image.width, 1080 / image.height)
+        image = image.resize((int(image.width * ratio), int(image.height * ratio)), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    if is_png:
+        image.save(buffer, format="PNG", optimize=True, compress_level=6)
+    else:
+        image.save(buffer, format="JPEG", quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+async def run(mode: str, images: List[bytes], workers: int) -> Dict[str, float]:
+    pipeline = ImagePipeline(workers=workers)
+    if workers:
+        # Start the workers before timing
+        await pipeline.prepare(make_images(1)[0], ImageBudget(max_tokens=100))
+    lags: List[float] = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - started - 0.005)
+
+    async def process(data: bytes) -> int:
+        if mode == "legacy":
+            return len(legacy_compress(data))
+        prepared, _ = await pipeline.prepare(data, ImageBudget())
+        return len(prepared.data)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    sizes = await asyncio.gather(*(process(data) for data in images))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await tick
+    pipeline.shutdown()
+    return {
+        "total_ms": round(elapsed * 1000, 1),
+        "max_loop_lag_ms": round(max(lags, default=0) * 1000, 1),
+        "avg_output_kb": round(sum(sizes) / len(sizes) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark see_image preprocessing")
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    images = make_images(args.images)
+    results = {mode: asyncio.run(run(mode, images, args.workers)) for mode in ("legacy", "pipeline")}
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
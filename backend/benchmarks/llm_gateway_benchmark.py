@@ -0,0 +1,138 @@
+"""
+Benchmark the LLM gateway against local mock LLM servers.
+
+Two mock providers are started: a "primary" that injects 429s (with Retry-After)
+and tail latency, and a healthy "secondary". The same batch of concurrent
+requests is sent through:
+
+- legacy: the previous make_llm_api_call policy (2 attempts, fixed delay on 429, no failover)
+- gateway: retry-after-aware backoff with jitter on the primary only
+- gateway+failover: the above plus failover and hedging to the secondary
+
+Usage:
+    python -m benchmarks.llm_gateway_benchmark --requests 200 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import litellm
+
+from benchmarks.mock_llm_server import MockLLMBehavior, MockLLMServer
+from services.llm_gateway import LLMGateway, retryable_errors
+
+MESSAGES = [{"role": "user", "content": "Summarize the benchmark results."}]
+
+
+def make_completion_fn(api_bases: Dict[str, str]) -> Callable[..., Awaitable[Any]]:
+    """Route '<provider>/<model>' names to the matching mock server."""
+    async def completion(**params):
+        provider, model = params["model"].split("/", 1)
+        params = {**params, "model": f"openai/{model}", "api_base": api_bases[provider], "api_key": "mock", "max_retries": 0}
+        return await litellm.acompletion(**params)
+    return completion
+
+
+async def run_batch(call: Callable[[], Awaitable[Any]], total: int, concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call()
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    def pct(p: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3) if latencies else None
+
+    return {
+        "success_rate": round(len(latencies) / total, 3),
+        "failures": failures,
+        "p50_s": pct(0.50),
+        "p95_s": pct(0.95),
+        "p99_s": pct(0.99),
+        "mean_s": round(statistics.mean(latencies), 3) if latencies else None,
+        "wall_s": round(elapsed, 3),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LLM gateway against mock providers")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.3, help="429 ratio on the primary provider")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--latency-jitter", type=float, default=1.5, help="Tail latency on the primary provider")
+    parser.add_argument("--legacy-delay", type=float, default=5.0, help="Fixed 429 delay of the legacy policy (production used 30s)")
+    parser.add_argument("--hedge-delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    primary_behavior = MockLLMBehavior(
+        latency=args.latency, latency_jitter=args.latency_jitter,
+        rate_limit_ratio=args.rate_limit_ratio, retry_after=args.retry_after, seed=1,
+    )
+    secondary_behavior = MockLLMBehavior(latency=args.latency, seed=2)
+
+    async with MockLLMServer(primary_behavior) as primary, MockLLMServer(secondary_behavior) as secondary:
+        completion = make_completion_fn({"primary": primary.api_base, "secondary": secondary.api_base})
+        params = {"model": "primary/mock-model", "messages": MESSAGES}
+
+        async def legacy_call():
+            last_error = None
+            for _ in range(2):
+                try:
+                    return await completion(**params)
+                except litellm.exceptions.RateLimitError as e:
+                    last_error = e
+                    await asyncio.sleep(args.legacy_delay)
+                except retryable_errors() as e:
+                    last_error = e
+                    await asyncio.sleep(0.1)
+            raise last_error
+
+        limits = {"primary": {"requests_per_minute": 6000, "tokens_per_minute": 10_000_000},
+                  "secondary": {"requests_per_minute": 6000, "tokens_per_minute": 10_000_000}}
+
+        def build_params(model: str) -> Dict[str, Any]:
+            return {"model": model, "messages": MESSAGES}
+
+        retry_only = LLMGateway(completion_fn=completion, provider_limits=limits, fallback_models={},
+                                hedge_delay=None, provider_filter=lambda _: True)
+        failover = LLMGateway(completion_fn=completion, provider_limits=limits,
+                              fallback_models={"primary/mock-model": ["secondary/mock-model"]},
+                              hedge_delay=args.hedge_delay, provider_filter=lambda _: True)
+
+        results = {}
+        for name, call in (
+            ("legacy", legacy_call),
+            ("gateway", lambda: retry_only.call(build_params, "primary/mock-model")),
+            ("gateway+failover", lambda: failover.call(build_params, "primary/mock-model")),
+        ):
+            primary_behavior.requests = primary_behavior.rate_limited = 0
+            secondary_behavior.requests = 0
+            results[name] = await run_batch(call, args.requests, args.concurrency)
+            results[name]["primary_requests"] = primary_behavior.requests
+            results[name]["primary_429s"] = primary_behavior.rate_limited
+            results[name]["secondary_requests"] = secondary_behavior.requests
+
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
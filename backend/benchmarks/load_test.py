@@ -0,0 +1,450 @@
+"""
+End-to-end load test: the real API and agent worker against local stand-ins.
+
+Starts the mock LLM server (benchmarks/mock_llm_server.py) and the in-memory
+PostgREST stand-in (benchmarks/fake_supabase.py) on a background thread, uses
+a local Redis (``--redis-url``, or ``--spawn-redis`` to start a throwaway
+redis-server), and launches as subprocesses:
+
+- the API (``uvicorn api:app``), which clients stream runs from over SSE
+- a worker that executes the ``run_agent_background`` actor. Runs are handed
+  over through a Redis list instead of RabbitMQ, and runs share one event loop,
+  the same way dramatiq's AsyncIO middleware runs them.
+
+Each run gets its own project, thread and user message. It is enqueued, and
+then streamed from ``/api/agent-run/{id}/stream`` like the frontend does. The
+report records runs/sec, time to first chunk, chunk latency, run duration and
+CPU/memory per run for both processes. It is written as JSON, so results can
+be diffed between commits.
+
+Scenarios:
+- chat: each run is one streamed ThreadManager.run_thread turn, with native
+  tool calls and auto-continue, in place of run_agent.
+- agent: the full run_agent (planning, then plan execution).
+
+Usage:
+    python -m benchmarks.load_test --runs 200 --concurrency 20 --tokens-per-second 80 --spawn-redis
+    python -m benchmarks.load_test --scenario agent --tool-call-ratio 0.3 --error-ratio 0.05 --output before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+import jwt
+import redis.asyncio as redis_async
+
+from benchmarks.fake_supabase import FakeSupabaseServer
+from benchmarks.mock_llm_server import MockLLMBehavior, MockLLMServer
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+JWT_SECRET = "load-test-jwt-secret-0123456789abcdef"
+RUN_QUEUE = "load_test:runs"
+STOP_SENTINEL = "__stop__"
+MODEL = "openai/mock-model"
+TERMINAL_STATUSES = ("completed", "failed", "stopped", "error")
+SYSTEM_PROMPT = "You are a helpful assistant running under a load test."
+
+
+def make_token(claims: Dict[str, Any]) -> str:
+    return jwt.encode({"exp": int(time.time()) + 24 * 3600, **claims}, JWT_SECRET, algorithm="HS256")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p90/p99/max in milliseconds."""
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(values)
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+    return {"count": len(ordered), "p50": pct(0.50), "p90": pct(0.90), "p99": pct(0.99), "max": round(ordered[-1] * 1000, 2)}
+
+
+def process_usage(pid: int) -> Optional[Dict[str, float]]:
+    """CPU seconds and resident memory of a process, from /proc (None where unavailable)."""
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as status_file:
+            status = dict(line.split(":", 1) for line in status_file if ":" in line)
+    except OSError:
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    return {
+        "cpu_s": (int(fields[11]) + int(fields[12])) / ticks,
+        "rss_mb": int(status["VmRSS"].split()[0]) / 1024,
+        "peak_rss_mb": int(status["VmHWM"].split()[0]) / 1024,
+    }
+
+
+def usage_per_run(before: Optional[Dict[str, float]], after: Optional[Dict[str, float]], runs: int) -> Optional[Dict[str, float]]:
+    if not before or not after or not runs:
+        return None
+    return {
+        "cpu_ms_per_run": round((after["cpu_s"] - before["cpu_s"]) / runs * 1000, 2),
+        "rss_growth_kb_per_run": round((after["rss_mb"] - before["rss_mb"]) * 1024 / runs, 1),
+        "rss_mb": round(after["rss_mb"], 1),
+        "peak_rss_mb": round(after["peak_rss_mb"], 1),
+    }
+
+
+def git_commit() -> Optional[str]:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+class StandIns:
+    """Mock LLM and fake Supabase servers on their own thread, so they do not compete with the load clients."""
+
+    def __init__(self, behavior: MockLLMBehavior):
+        self.llm = MockLLMServer(behavior)
+        self.supabase = FakeSupabaseServer()
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="load-test-stand-ins", daemon=True)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self.llm.start())
+        self._loop.run_until_complete(self.supabase.start())
+        self._started.set()
+        self._loop.run_forever()
+
+    def start(self) -> "StandIns":
+        self._thread.start()
+        if not self._started.wait(30):
+            raise RuntimeError("Mock LLM / fake Supabase servers did not start")
+        return self
+
+    def stop(self) -> None:
+        async def shutdown():
+            await self.llm.stop()
+            await self.supabase.stop()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(30)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(10)
+
+
+def app_env(args, stand_ins: StandIns, redis_url: str) -> Dict[str, str]:
+    """Environment for the API and worker processes: every backend dependency points at a local stand-in."""
+    parsed = urlparse(redis_url)
+    env = dict(os.environ)
+    env.update({
+        "ENV_MODE": "local",
+        "LOG_LEVEL": args.log_level,
+        "SUPABASE_URL": stand_ins.supabase.url,
+        "SUPABASE_ANON_KEY": make_token({"role": "anon", "sub": "anon"}),
+        "SUPABASE_SERVICE_ROLE_KEY": make_token({"role": "service_role", "sub": "service_role"}),
+        "SUPABASE_JWT_SECRET": JWT_SECRET,
+        "REDIS_HOST": parsed.hostname or "localhost",
+        "REDIS_PORT": str(parsed.port or 6379),
+        "REDIS_PASSWORD": parsed.password or "",
+        "REDIS_SSL": "True" if parsed.scheme == "rediss" else "False",
+        "OPENAI_API_KEY": "mock",
+        "OPENAI_API_BASE": stand_ins.llm.api_base,
+        "LOAD_TEST_REDIS_URL": redis_url,
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def spawn(name: str, command: List[str], env: Dict[str, str], log_dir: str) -> subprocess.Popen:
+    log_file = open(os.path.join(log_dir, f"{name}.log"), "w")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def log_tail(log_dir: str, name: str, lines: int = 40) -> str:
+    try:
+        with open(os.path.join(log_dir, f"{name}.log")) as log_file:
+            return "".join(log_file.readlines()[-lines:])
+    except OSError:
+        return ""
+
+
+async def wait_ready(http: httpx.AsyncClient, api_url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API exited with code {process.returncode}")
+        try:
+            if (await http.get(f"{api_url}/api/health/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"API not ready after {timeout}s")
+
+
+async def seed_run(http: httpx.AsyncClient, supabase_url: str, account_id: str, prompt: str) -> Dict[str, str]:
+    """Create the project, thread, first user message and agent_runs row of one run."""
+    headers = {"Prefer": "return=representation"}
+
+    async def insert(table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        response = await http.post(f"{supabase_url}/rest/v1/{table}", json=row, headers=headers)
+        response.raise_for_status()
+        return response.json()[0]
+
+    project = await insert("projects", {"name": "load test", "account_id": account_id, "is_public": False, "sandbox": {}})
+    thread = await insert("threads", {"project_id": project["project_id"], "account_id": account_id})
+    await insert("messages", {
+        "thread_id": thread["thread_id"], "type": "user", "is_llm_message": True,
+        "content": json.dumps({"role": "user", "content": prompt}),
+    })
+    agent_run = await insert("agent_runs", {"thread_id": thread["thread_id"], "status": "running"})
+    return {"project_id": project["project_id"], "thread_id": thread["thread_id"], "agent_run_id": agent_run["id"]}
+
+
+async def drive_run(args, http: httpx.AsyncClient, queue: redis_async.Redis, api_url: str, supabase_url: str,
+                    account_id: str, token: str, index: int) -> Dict[str, Any]:
+    """Enqueue one run and stream it to the end; returns its timings as seen by the client."""
+    ids = await seed_run(http, supabase_url, account_id, f"Load test request #{index}: summarize the project status.")
+    started = time.perf_counter()
+    await queue.rpush(RUN_QUEUE, json.dumps({
+        "agent_run_id": ids["agent_run_id"], "thread_id": ids["thread_id"], "project_id": ids["project_id"],
+        "instance_id": "loadtest", "model_name": MODEL, "enable_thinking": False, "reasoning_effort": "low",
+        "stream": True, "enable_context_manager": False,
+    }))
+
+    result: Dict[str, Any] = {"status": None, "ttfc": None, "gaps": [], "frames": 0}
+    last_frame = None
+    try:
+        url = f"{api_url}/api/agent-run/{ids['agent_run_id']}/stream"
+        async with http.stream("GET", url, params={"token": token}, timeout=args.run_timeout) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                now = time.perf_counter()
+                frame = json.loads(line[6:])
+                result["frames"] += 1
+                if frame.get("type") == "assistant":
+                    if result["ttfc"] is None:
+                        result["ttfc"] = now - started
+                    elif last_frame is not None:
+                        result["gaps"].append(now - last_frame)
+                    last_frame = now
+                if frame.get("type") == "status" and frame.get("status") in TERMINAL_STATUSES:
+                    result["status"] = frame["status"]
+                    break
+    except (httpx.HTTPError, json.JSONDecodeError) as e:
+        result["status"] = f"client_error:{type(e).__name__}"
+    result["duration"] = time.perf_counter() - started
+    return result
+
+
+async def run_load(args, stand_ins: StandIns, redis_url: str, log_dir: str) -> Dict[str, Any]:
+    env = app_env(args, stand_ins, redis_url)
+    api_port = free_port()
+    api_url = f"http://127.0.0.1:{api_port}"
+    api = spawn("api", [sys.executable, "-m", "uvicorn", "api:app", "--port", str(api_port), "--log-level", "warning"], env, log_dir)
+    worker = spawn("worker", [sys.executable, "-m", "benchmarks.load_test", "worker",
+                              "--scenario", args.scenario, "--concurrency", str(args.worker_concurrency),
+                              "--max-auto-continues", str(args.max_auto_continues)], env, log_dir)
+    queue = redis_async.from_url(redis_url, decode_responses=True)
+    limits = httpx.Limits(max_connections=args.concurrency * 2 + 10)
+    try:
+        async with httpx.AsyncClient(timeout=30, limits=limits) as http:
+            await wait_ready(http, api_url, api, args.startup_timeout)
+            user_id = str(uuid.uuid4())
+            account_id = user_id  # Personal account: same id as the user
+            token = make_token({"sub": user_id, "role": "authenticated"})
+            await http.post(f"{stand_ins.supabase.url}/rest/v1/account_user", headers={"Content-Profile": "basejump"},
+                            json={"user_id": user_id, "account_id": account_id, "account_role": "owner"})
+
+            for i in range(args.warmup):
+                await drive_run(args, http, queue, api_url, stand_ins.supabase.url, account_id, token, -i - 1)
+
+            api_before, worker_before = process_usage(api.pid), process_usage(worker.pid)
+            llm_before = stand_ins.llm.behavior.counters()
+            supabase_before = stand_ins.supabase.store.requests
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def one(index: int) -> Dict[str, Any]:
+                async with semaphore:
+                    return await drive_run(args, http, queue, api_url, stand_ins.supabase.url, account_id, token, index)
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(one(i) for i in range(args.runs)))
+            wall = time.perf_counter() - started
+            api_after, worker_after = process_usage(api.pid), process_usage(worker.pid)
+    finally:
+        await queue.rpush(RUN_QUEUE, STOP_SENTINEL)
+        await queue.aclose()
+        for process in (worker, api):
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    statuses = Counter(result["status"] or "no_status" for result in results)
+    llm_after = stand_ins.llm.behavior.counters()
+    return {
+        "config": vars(args),
+        "commit": git_commit(),
+        "runs": {"total": args.runs, "statuses": dict(statuses)},
+        "throughput": {"wall_s": round(wall, 3), "runs_per_sec": round(statuses.get("completed", 0) / wall, 3)},
+        "time_to_first_chunk_ms": percentiles([result["ttfc"] for result in results if result["ttfc"] is not None]),
+        "chunk_latency_ms": percentiles([gap for result in results for gap in result["gaps"]]),
+        "run_duration_ms": percentiles([result["duration"] for result in results]),
+        "frames_per_run": round(statistics.mean(result["frames"] for result in results), 1) if results else 0,
+        "processes": {
+            "api": usage_per_run(api_before, api_after, args.runs),
+            "worker": usage_per_run(worker_before, worker_after, args.runs),
+        },
+        "mock_llm": {name: llm_after[name] - llm_before[name] for name in llm_after},
+        "supabase_requests_per_run": round((stand_ins.supabase.store.requests - supabase_before) / args.runs, 1) if args.runs else 0,
+    }
+
+
+async def chat_turn(thread_id: str, project_id: str, stream: bool, tool_orchestrator, task_state_manager,
+                    model_name: str, trace=None, max_auto_continues: int = 3, **kwargs):
+    """Stand-in for run_agent in the chat scenario: one streamed thread turn with native tool calls."""
+    from agentpress.response_processor import ProcessorConfig
+    from agentpress.thread_manager import ThreadManager
+
+    thread_manager = ThreadManager(tool_orchestrator=tool_orchestrator, trace=trace)
+    response = await thread_manager.run_thread(
+        thread_id=thread_id,
+        system_prompt={"role": "system", "content": SYSTEM_PROMPT},
+        stream=True,
+        llm_model=model_name,
+        processor_config=ProcessorConfig(xml_tool_calling=False, native_tool_calling=True, execute_on_stream=True),
+        native_max_auto_continues=max_auto_continues,
+        enable_context_manager=False,
+    )
+    if isinstance(response, dict):
+        yield response
+        return
+    async for chunk in response:
+        yield chunk
+
+
+async def worker_main(args) -> None:
+    """Worker process: executes the run_agent_background actor for every run pushed to the queue."""
+    import functools
+
+    import run_agent_background
+
+    if args.scenario == "chat":
+        run_agent_background.run_agent = functools.partial(chat_turn, max_auto_continues=args.max_auto_continues)
+    actor_fn = run_agent_background.run_agent_background.fn
+    run = getattr(actor_fn, "__wrapped__", actor_fn)  # the coroutine function behind dramatiq's async_to_sync
+
+    queue = redis_async.from_url(os.environ["LOAD_TEST_REDIS_URL"], decode_responses=True)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+
+    async def execute(payload: Dict[str, Any]) -> None:
+        try:
+            await run(**payload)
+        finally:
+            semaphore.release()
+
+    while True:
+        await semaphore.acquire()
+        item = await queue.blpop(RUN_QUEUE, timeout=0)
+        if item[1] == STOP_SENTINEL:
+            break
+        task = asyncio.create_task(execute(json.loads(item[1])))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    await queue.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API and agent worker against local stand-ins")
+    parser.add_argument("mode", nargs="?", choices=["load", "worker"], default="load", help=argparse.SUPPRESS)
+    parser.add_argument("--scenario", choices=["chat", "agent"], default="chat")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10, help="Runs in flight at once")
+    parser.add_argument("--worker-concurrency", type=int, default=50, help="Runs one worker executes at once")
+    parser.add_argument("--warmup", type=int, default=2, help="Runs excluded from the measurements")
+    parser.add_argument("--max-auto-continues", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock LLM latency before the first chunk (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--reply-words", type=int, default=120, help="Length of each mock reply")
+    parser.add_argument("--tool-call-ratio", type=float, default=0.0)
+    parser.add_argument("--tool-call-name", default="FileSystemHelper__list_files_in_directory")
+    parser.add_argument("--tool-call-arguments", default='{"directory_path": "/workspace"}')
+    parser.add_argument("--error-ratio", type=float, default=0.0, help="Share of LLM requests answered with 503")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Share of LLM requests answered with 429")
+    parser.add_argument("--stream-error-ratio", type=float, default=0.0, help="Share of LLM streams cut off midway")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--spawn-redis", action="store_true", help="Start a throwaway redis-server for the run")
+    parser.add_argument("--run-timeout", type=float, default=300)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--log-level", default="WARNING", help="LOG_LEVEL of the API and worker")
+    parser.add_argument("--output", default="load_test_report.json")
+    args = parser.parse_args()
+
+    if args.mode == "worker":
+        asyncio.run(worker_main(args))
+        return
+
+    behavior = MockLLMBehavior(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        reply=" ".join(f"token{i}" for i in range(args.reply_words)),
+        tool_call_ratio=args.tool_call_ratio,
+        tool_call_name=args.tool_call_name,
+        tool_call_arguments=args.tool_call_arguments,
+        error_ratio=args.error_ratio,
+        rate_limit_ratio=args.rate_limit_ratio,
+        stream_error_ratio=args.stream_error_ratio,
+        seed=args.seed,
+    )
+    log_dir = tempfile.mkdtemp(prefix="load_test_")
+    redis_server = None
+    redis_url = args.redis_url
+    if args.spawn_redis:
+        if not shutil.which("redis-server"):
+            parser.error("--spawn-redis needs redis-server on PATH")
+        redis_port = free_port()
+        redis_server = subprocess.Popen(["redis-server", "--port", str(redis_port), "--save", "", "--appendonly", "no"],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        redis_url = f"redis://127.0.0.1:{redis_port}/0"
+        time.sleep(0.3)
+
+    stand_ins = StandIns(behavior).start()
+    try:
+        report = asyncio.run(run_load(args, stand_ins, redis_url, log_dir))
+    except Exception as e:
+        print(f"Load test failed: {e}\n--- api.log ---\n{log_tail(log_dir, 'api')}\n--- worker.log ---\n{log_tail(log_dir, 'worker')}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        stand_ins.stop()
+        if redis_server:
+            redis_server.terminate()
+
+    report["logs"] = log_dir
+    with open(args.output, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
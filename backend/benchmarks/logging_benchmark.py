@@ -0,0 +1,135 @@
+"""
+Benchmark the event-loop cost of logging on the streaming hot path.
+
+Simulates ResponseProcessor handling streamed chunks on an asyncio loop, with
+the per-chunk debug logs it emits, under two setups:
+
+- legacy: DEBUG level, eager f-strings, synchronous file + console handlers
+- queued: production level, %-style/lazy arguments, sampled per-chunk records,
+  QueueHandler with a background writer thread
+
+Reports the time the event loop spends per chunk (loop wall time / chunks).
+
+Usage:
+    python -m benchmarks.logging_benchmark --chunks 20000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+from typing import Dict, List
+
+from utils.logger import AsyncLogHandler, JSONFormatter, ModuleLevelFilter, SamplingFilter, lazy, sampled
+
+CHUNK = {"role": "assistant", "content": "lorem ipsum dolor sit amet " * 3}
+PARAMS = {"file_path": "src/app.py", "file_contents": "print('hello')\n" * 40}
+
+
+def make_handlers(log_dir: str, name: str) -> List[logging.Handler]:
+    file_handler = RotatingFileHandler(os.path.join(log_dir, f"{name}.log"), maxBytes=50 * 1024 * 1024, backupCount=1)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    console_handler = logging.StreamHandler(open(os.devnull, "w"))
+    console_handler.setFormatter(JSONFormatter())
+    return [file_handler, console_handler]
+
+
+def make_logger(name: str) -> logging.Logger:
+    bench_logger = logging.getLogger(f"logging_benchmark.{name}")
+    bench_logger.propagate = False
+    bench_logger.handlers.clear()
+    return bench_logger
+
+
+async def legacy_stream(bench_logger: logging.Logger, chunks: int) -> None:
+    accumulated = ""
+    for i in range(chunks):
+        chunk = dict(CHUNK)
+        accumulated += chunk["content"]
+        bench_logger.debug(f"Processing chunk {i}: {chunk}")
+        bench_logger.debug(f"Accumulated content length: {len(accumulated)}")
+        if i % 20 == 0:
+            bench_logger.debug(f"Parsed XML tool call: Tag=create-file, Params={PARAMS}")
+            bench_logger.info(f"Executing tool create_file with params: {PARAMS}")
+        if i % 64 == 0:
+            await asyncio.sleep(0)
+
+
+async def queued_stream(bench_logger: logging.Logger, chunks: int) -> None:
+    accumulated = ""
+    for i in range(chunks):
+        chunk = dict(CHUNK)
+        accumulated += chunk["content"]
+        bench_logger.debug("Processing chunk %d: %s", i, chunk, extra=sampled())
+        bench_logger.debug("Accumulated content length: %s", lazy(lambda: len(accumulated)), extra=sampled())
+        if i % 20 == 0:
+            bench_logger.debug("Parsed XML tool call: Tag=create-file, Params=%s", PARAMS)
+            bench_logger.info("Executing tool create_file with params: %s", sorted(PARAMS))
+        if i % 64 == 0:
+            await asyncio.sleep(0)
+
+
+def run_legacy(log_dir: str, chunks: int) -> float:
+    bench_logger = make_logger("legacy")
+    bench_logger.setLevel(logging.DEBUG)
+    handlers = make_handlers(log_dir, "legacy")
+    for handler in handlers:
+        bench_logger.addHandler(handler)
+    start = time.perf_counter()
+    asyncio.run(legacy_stream(bench_logger, chunks))
+    elapsed = time.perf_counter() - start
+    for handler in handlers:
+        handler.close()
+    return elapsed
+
+
+def run_queued(log_dir: str, chunks: int, level: int) -> Dict[str, float]:
+    bench_logger = make_logger("queued")
+    bench_logger.setLevel(level)
+    queue_handler = AsyncLogHandler(queue.Queue(-1))
+    queue_handler.addFilter(ModuleLevelFilter())
+    queue_handler.addFilter(SamplingFilter())
+    bench_logger.addHandler(queue_handler)
+    handlers = make_handlers(log_dir, "queued")
+    listener = QueueListener(queue_handler.queue, *handlers)
+    listener.start()
+    start = time.perf_counter()
+    asyncio.run(queued_stream(bench_logger, chunks))
+    elapsed = time.perf_counter() - start
+    # Draining the queue happens off the loop; measured separately for reference
+    drain_start = time.perf_counter()
+    listener.stop()
+    drain = time.perf_counter() - drain_start
+    for handler in handlers:
+        handler.close()
+    return {"loop": elapsed, "drain": drain}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark logging overhead on the event loop")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as log_dir:
+        legacy = min(run_legacy(log_dir, args.chunks) for _ in range(args.repeat))
+        results["legacy_debug"] = {"loop_us_per_chunk": round(legacy / args.chunks * 1e6, 2)}
+        for label, level in (("queued_debug", logging.DEBUG), ("queued_info", logging.INFO)):
+            runs = [run_queued(log_dir, args.chunks, level) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run["loop"])
+            results[label] = {
+                "loop_us_per_chunk": round(best["loop"] / args.chunks * 1e6, 2),
+                "writer_drain_ms": round(best["drain"] * 1e3, 1),
+                "speedup": round(legacy / best["loop"], 2),
+            }
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Local OpenAI-compatible mock LLM server for benchmarks and load tests.
+
+Each server instance exposes ``/v1/chat/completions`` and can inject latency,
+rate-limit (429) responses with a ``Retry-After`` header, 503s and streams that
+break off midway. Both streaming (SSE) and non-streaming responses are
+supported, so it can stand in for any provider LiteLLM talks to through the
+``openai/`` route. Streams are paced at a configurable token rate and a share of
+responses can be native tool calls, with the arguments streamed in fragments
+the way providers do.
+
+Usage:
+    python -m benchmarks.mock_llm_server --port 8700 --rate-limit-ratio 0.2 --latency 0.5
+    python -m benchmarks.mock_llm_server --tokens-per-second 50 --tool-call-ratio 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class MockLLMBehavior:
+    """How the mock server responds. Can be changed while the server is running."""
+    latency: float = 0.05
+    latency_jitter: float = 0.0
+    rate_limit_ratio: float = 0.0
+    retry_after: float = 1.0
+    error_ratio: float = 0.0
+    reply: str = "This is a mock response."
+    stream_chunk_delay: float = 0.0
+    # Overrides stream_chunk_delay when set (one word per chunk)
+    tokens_per_second: float = 0.0
+    # Share of responses that are a native tool call instead of text
+    tool_call_ratio: float = 0.0
+    tool_call_name: str = "web_search"
+    tool_call_arguments: str = '{"query": "mock search", "num_results": 5}'
+    # Share of streams that are cut off after half of the chunks
+    stream_error_ratio: float = 0.0
+    # Counters
+    requests: int = 0
+    rate_limited: int = 0
+    errors: int = 0
+    stream_errors: int = 0
+    tool_calls: int = 0
+    completed: int = 0
+    seed: Optional[int] = None
+    _random: random.Random = field(default_factory=random.Random, repr=False)
+
+    def __post_init__(self):
+        if self.seed is not None:
+            self._random.seed(self.seed)
+
+    @property
+    def chunk_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second else self.stream_chunk_delay
+
+    def counters(self) -> dict:
+        return {
+            "requests": self.requests,
+            "completed": self.completed,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "stream_errors": self.stream_errors,
+            "tool_calls": self.tool_calls,
+        }
+
+
+def _completion_body(model: str, reply: str, prompt_tokens: int) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": reply},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(reply.split()),
+            "total_tokens": prompt_tokens + len(reply.split()),
+        },
+    }
+
+
+def _text_deltas(reply: str) -> list:
+    words = reply.split(" ")
+    return [{"role": "assistant", "content": word + (" " if i < len(words) - 1 else "")} for i, word in enumerate(words)]
+
+
+def _tool_call_deltas(name: str, arguments: str, fragment_size: int = 8) -> list:
+    call_id = f"call_{uuid.uuid4().hex[:24]}"
+    deltas = [{"role": "assistant", "tool_calls": [{
+        "index": 0, "id": call_id, "type": "function", "function": {"name": name, "arguments": ""},
+    }]}]
+    for start in range(0, len(arguments), fragment_size):
+        deltas.append({"tool_calls": [{"index": 0, "function": {"arguments": arguments[start:start + fragment_size]}}]})
+    return deltas
+
+
+async def _stream_body(model: str, deltas: list, finish_reason: str, chunk_delay: float, break_after: Optional[int] = None):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    for i, delta in enumerate(deltas):
+        if break_after is not None and i >= break_after:
+            # Dropping the connection mid-response, as an overloaded upstream would
+            raise ConnectionResetError("mock stream interrupted")
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        if chunk_delay:
+            await asyncio.sleep(chunk_delay)
+    final = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+    }
+    yield f"data: {json.dumps(final)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def create_app(behavior: MockLLMBehavior) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        behavior.requests += 1
+        rnd = behavior._random
+
+        if rnd.random() < behavior.rate_limit_ratio:
+            behavior.rate_limited += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": str(behavior.retry_after)},
+                content={"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+            )
+
+        latency = behavior.latency + rnd.uniform(0, behavior.latency_jitter)
+        if latency:
+            await asyncio.sleep(latency)
+
+        if rnd.random() < behavior.error_ratio:
+            behavior.errors += 1
+            return JSONResponse(status_code=503, content={"error": {"message": "Overloaded", "type": "overloaded_error"}})
+
+        behavior.completed += 1
+        model = body.get("model", "mock-model")
+        if body.get("stream"):
+            if body.get("tools") and rnd.random() < behavior.tool_call_ratio:
+                behavior.tool_calls += 1
+                deltas, finish_reason = _tool_call_deltas(behavior.tool_call_name, behavior.tool_call_arguments), "tool_calls"
+            else:
+                deltas, finish_reason = _text_deltas(behavior.reply), "stop"
+            break_after = None
+            if rnd.random() < behavior.stream_error_ratio:
+                behavior.stream_errors += 1
+                break_after = len(deltas) // 2
+            return StreamingResponse(
+                _stream_body(model, deltas, finish_reason, behavior.chunk_delay, break_after),
+                media_type="text/event-stream",
+            )
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        return JSONResponse(_completion_body(model, behavior.reply, prompt_tokens))
+
+    return app
+
+
+class MockLLMServer:
+    """Runs the mock server in the current event loop."""
+
+    def __init__(self, behavior: Optional[MockLLMBehavior] = None, host: str = "127.0.0.1", port: int = 0):
+        self.behavior = behavior or MockLLMBehavior()
+        self.host = host
+        self.port = port
+        self._server: Optional[uvicorn.Server] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def api_base(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> "MockLLMServer":
+        uv_config = uvicorn.Config(create_app(self.behavior), host=self.host, port=self.port, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(uv_config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+        if not self.port:
+            self.port = self._server.servers[0].sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.should_exit = True
+            await self._task
+
+    async def __aenter__(self) -> "MockLLMServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--latency", type=float, default=0.05, help="Base response latency in seconds")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Extra random latency in seconds")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After value sent with 429s")
+    parser.add_argument("--error-ratio", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Streaming pace (0 = as fast as possible)")
+    parser.add_argument("--tool-call-ratio", type=float, default=0.0, help="Fraction of streamed responses that are tool calls")
+    parser.add_argument("--stream-error-ratio", type=float, default=0.0, help="Fraction of streams cut off midway")
+    args = parser.parse_args()
+
+    behavior = MockLLMBehavior(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        rate_limit_ratio=args.rate_limit_ratio,
+        retry_after=args.retry_after,
+        error_ratio=args.error_ratio,
+        tokens_per_second=args.tokens_per_second,
+        tool_call_ratio=args.tool_call_ratio,
+        stream_error_ratio=args.stream_error_ratio,
+    )
+    uvicorn.run(create_app(behavior), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
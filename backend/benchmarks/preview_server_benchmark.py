@@ -0,0 +1,173 @@
+"""
+Benchmark the sandbox workspace preview server (sandbox/docker/server.py).
+
+Generates a typical agent-built site (HTML pages, a stylesheet, JS bundles,
+images and a video) and serves it with the server in two modes, each in its own
+uvicorn process:
+
+- legacy: ``PREVIEW_SERVER_DEV=1`` (StaticFiles plus the per-request workspace
+  check; run without the reloader, whose CPU cost is not measured here)
+- preview: the default preview mode (validators, compression, LRU, ranges)
+
+Concurrent clients repeatedly load a page and all of its assets, either cold
+(no validators) or revalidating (``If-None-Match``, as a browser does with
+``Cache-Control: no-cache``), and seek in the video with Range requests.
+
+Reports requests/sec, latency percentiles and bytes on the wire per mode and scenario.
+
+Usage:
+    python -m benchmarks.preview_server_benchmark --duration 10 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sandbox", "docker")
+PAGE_ASSETS = ["/styles.css", "/app.js", "/vendor.js"] + [f"/images/photo{i}.png" for i in range(8)]
+PAGES = ["/", "/about.html", "/pricing.html", "/blog/index.html", "/contact.html"]
+
+
+def make_site(root: str) -> None:
+    """Write a site shaped like what the agent typically generates."""
+    rng = random.Random(0)
+    words = ["hero", "feature", "pricing", "team", "contact", "lorem", "ipsum", "dolor", "amet", "section"]
+
+    def text(size: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(size // 6))
+
+    def page(title: str) -> str:
+        assets = "".join(f'<img src="{asset}">' for asset in PAGE_ASSETS if asset.endswith(".png"))
+        body = "".join(f"<section><h2>{title} {i}</h2><p>{text(600)}</p></section>" for i in range(10))
+        return (f'<!doctype html><html><head><title>{title}</title><link rel="stylesheet" href="/styles.css">'
+                f'<script src="/vendor.js"></script><script src="/app.js"></script></head><body>{body}{assets}</body></html>')
+
+    os.makedirs(os.path.join(root, "images"), exist_ok=True)
+    os.makedirs(os.path.join(root, "blog"), exist_ok=True)
+    for url in PAGES:
+        path = os.path.join(root, url.lstrip("/") or "index.html")
+        if path.endswith("/") or os.path.isdir(path):
+            path = os.path.join(path, "index.html")
+        with open(path, "w") as f:
+            f.write(page(url))
+    with open(os.path.join(root, "styles.css"), "w") as f:
+        f.write("".join(f".c{i} {{ margin: {i % 7}px; color: #{i % 4096:03x}; }}\n" for i in range(1500)))
+    with open(os.path.join(root, "app.js"), "w") as f:
+        f.write("".join(f"function handler{i}(e) {{ return document.querySelector('.c{i}'); }}\n" for i in range(4000)))
+    with open(os.path.join(root, "vendor.js"), "w") as f:
+        f.write("".join(f"var v{i} = {{ key: '{text(60)}', n: {i} }};\n" for i in range(9000)))
+    for i in range(8):
+        with open(os.path.join(root, "images", f"photo{i}.png"), "wb") as f:
+            f.write(rng.randbytes(rng.randint(20_000, 200_000)))
+    with open(os.path.join(root, "video.mp4"), "wb") as f:
+        f.write(rng.randbytes(8 * 1024 * 1024))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(site_dir: str, dev: bool) -> (subprocess.Popen, str):
+    port = free_port()
+    env = dict(os.environ, PREVIEW_WORKSPACE_DIR=site_dir, PREVIEW_SERVER_DEV="1" if dev else "0")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--app-dir", SERVER_DIR, "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url + "/", timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("preview server did not start")
+
+
+async def client_loop(client: httpx.AsyncClient, scenario: str, deadline: float, latencies: List[float], stats: Dict[str, int]) -> None:
+    etags: Dict[str, str] = {}
+    rng = random.Random()
+    while time.monotonic() < deadline:
+        if scenario == "range":
+            start = rng.randrange(0, 8 * 1024 * 1024 - 256 * 1024)
+            requests = [("/video.mp4", {"Range": f"bytes={start}-{start + 256 * 1024 - 1}"})]
+        else:
+            requests = [(url, {}) for url in [rng.choice(PAGES)] + PAGE_ASSETS]
+        for url, headers in requests:
+            headers = {"Accept-Encoding": "gzip, br", **headers}
+            if scenario == "revalidate" and url in etags:
+                headers["If-None-Match"] = etags[url]
+            started = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            stats["requests"] += 1
+            stats[f"status_{response.status_code}"] = stats.get(f"status_{response.status_code}", 0) + 1
+            stats["wire_bytes"] += len(response.content) if "content-encoding" not in response.headers \
+                else int(response.headers.get("content-length", 0))
+            if "etag" in response.headers:
+                etags[url] = response.headers["etag"]
+
+
+async def run_scenario(url: str, scenario: str, duration: float, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    stats = {"requests": 0, "wire_bytes": 0}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        # Warm up so compression and LRU caches are populated in both modes
+        await client_loop(client, scenario, time.monotonic() + 0.5, [], {"requests": 0, "wire_bytes": 0})
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(*(client_loop(client, scenario, deadline, latencies, stats) for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        "requests_per_sec": round(stats["requests"] / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "wire_mb_per_sec": round(stats["wire_bytes"] / elapsed / 1e6, 1),
+        **{key: value for key, value in stats.items() if key.startswith("status_")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sandbox preview server")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per mode and scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", nargs="+", default=["cold", "revalidate", "range"], choices=["cold", "revalidate", "range"])
+    parser.add_argument("--modes", nargs="+", default=["legacy", "preview"], choices=["legacy", "preview"])
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    with tempfile.TemporaryDirectory() as site_dir:
+        make_site(site_dir)
+        for mode in args.modes:
+            process, url = start_server(site_dir, dev=mode == "legacy")
+            try:
+                results[mode] = {
+                    scenario: asyncio.run(run_scenario(url, scenario, args.duration, args.concurrency))
+                    for scenario in args.scenarios
+                }
+            finally:
+                process.terminate()
+                process.wait()
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
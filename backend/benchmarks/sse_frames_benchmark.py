@@ -0,0 +1,109 @@
+"""
+Benchmark SSE frame throughput for streamed agent output.
+
+Compares the CPU cost of delivering agent responses to stream viewers:
+
+- legacy: producer json.dumps -> each viewer json.loads + json.dumps + f-string framing
+- framed: producer encodes one SSE frame with orjson -> viewers forward it untouched
+
+Runs in a single thread and reports delivered frames per CPU-second (frames/sec per core).
+
+Usage:
+    python -m benchmarks.sse_frames_benchmark --frames 20000 --viewers 1 5 20
+"""
+
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+from agentpress.utils.json_helpers import to_json_string
+from utils.sse import as_frame, encode_frame, get_terminal_status
+
+
+def make_responses(count: int, chunk_size: int) -> List[Dict[str, Any]]:
+    """Responses shaped like ResponseProcessor content chunks, with occasional tool status messages."""
+    thread_id = str(uuid.uuid4())
+    thread_run_id = str(uuid.uuid4())
+    text = ("lorem ipsum dolor sit amet " * (chunk_size // 27 + 1))[:chunk_size]
+    now = datetime.now(timezone.utc).isoformat()
+    responses = []
+    for i in range(count):
+        if i % 50 == 49:
+            content = {"role": "assistant", "status_type": "tool_completed", "function_name": "create_file", "tool_index": i}
+            response_type = "status"
+        else:
+            content = {"role": "assistant", "content": text}
+            response_type = "assistant"
+        responses.append({
+            "sequence": i, "message_id": None, "thread_id": thread_id, "type": response_type, "is_llm_message": True,
+            "content": to_json_string(content),
+            "metadata": to_json_string({"stream_status": "chunk", "thread_run_id": thread_run_id}),
+            "created_at": now, "updated_at": now,
+        })
+    responses.append({"type": "status", "status": "completed", "message": "Agent run completed successfully"})
+    return responses
+
+
+def legacy_pipeline(responses: List[Dict[str, Any]], viewers: int) -> int:
+    stored = [json.dumps(response) for response in responses]
+    delivered = 0
+    for _ in range(viewers):
+        for entry in stored:
+            response = json.loads(entry)
+            frame = f"data: {json.dumps(response)}\n\n"
+            delivered += 1
+            if response.get('type') == 'status' and response.get('status') in ['completed', 'failed', 'stopped']:
+                break
+        assert frame
+    return delivered
+
+
+def framed_pipeline(responses: List[Dict[str, Any]], viewers: int) -> int:
+    stored = [encode_frame(response) for response in responses]
+    delivered = 0
+    for _ in range(viewers):
+        for entry in stored:
+            frame = as_frame(entry)
+            delivered += 1
+            if get_terminal_status(frame):
+                break
+        assert frame
+    return delivered
+
+
+def measure(pipeline: Callable[[List[Dict[str, Any]], int], int], responses: List[Dict[str, Any]], viewers: int, repeat: int) -> float:
+    best = float("inf")
+    delivered = 0
+    for _ in range(repeat):
+        start = time.process_time()
+        delivered = pipeline(responses, viewers)
+        best = min(best, time.process_time() - start)
+    return delivered / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SSE frame encoding and fan-out")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=40, help="Characters of text per content chunk")
+    parser.add_argument("--viewers", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    responses = make_responses(args.frames, args.chunk_size)
+    results = {}
+    for viewers in args.viewers:
+        legacy = measure(legacy_pipeline, responses, viewers, args.repeat)
+        framed = measure(framed_pipeline, responses, viewers, args.repeat)
+        results[f"{viewers}_viewers"] = {
+            "legacy_frames_per_sec": round(legacy),
+            "framed_frames_per_sec": round(framed),
+            "speedup": round(framed / legacy, 2),
+        }
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Cold start regression check for the API (and worker) imports.
+
+Imports the target module in fresh interpreters with ``-X importtime`` and
+reports the median wall time plus the slowest top-level imports. Exits with a
+non-zero status when the median exceeds the budget, so it can gate CI:
+
+    python -m benchmarks.startup_benchmark --module api --budget-ms 1500
+
+The default budget is STARTUP_IMPORT_BUDGET_MS from the config. Heavy SDKs
+should stay out of import time (see utils/lazy_imports.py); the report lists
+which modules were responsible when the budget is blown.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from utils.config import config
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+# Modules that must not be loaded just by importing the API
+HEAVY_MODULES = ("litellm", "openai", "langfuse", "stripe", "daytona_sdk", "docker")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+# Lazily imported modules are registered too, but stay _LazyModule until first used
+loaded = [m for m in {heavy!r} if m in sys.modules and type(sys.modules[m]).__name__ == "module"]
+print("STARTUP_RESULT " + json.dumps({{"elapsed": elapsed, "loaded": loaded}}))
+"""
+
+
+def run_once(module: str) -> Tuple[float, List[str], Dict[str, int]]:
+    """Import ``module`` in a fresh interpreter; returns (seconds, eagerly loaded heavy modules, cumulative us per module)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        # Top-level imports and their direct children (nesting adds two spaces per level)
+        if match and len(match.group(3)) <= 3:
+            cumulative[match.group(4)] = int(match.group(2))
+    for line in result.stdout.splitlines():
+        if line.startswith("STARTUP_RESULT "):
+            probe = json.loads(line[len("STARTUP_RESULT "):])
+            return probe["elapsed"], probe["loaded"], cumulative
+    raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time against a budget")
+    parser.add_argument("--module", default="api")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=config.STARTUP_IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to report")
+    args = parser.parse_args()
+
+    timings = []
+    eager = set()
+    slowest: Dict[str, int] = {}
+    for _ in range(args.runs):
+        elapsed, loaded, cumulative = run_once(args.module)
+        timings.append(elapsed)
+        eager.update(loaded)
+        for name, us in cumulative.items():
+            slowest[name] = max(slowest.get(name, 0), us)
+
+    median_ms = statistics.median(timings) * 1000
+    report = {
+        "config": vars(args),
+        "median_ms": round(median_ms, 1),
+        "min_ms": round(min(timings) * 1000, 1),
+        "max_ms": round(max(timings) * 1000, 1),
+        "eagerly_loaded_heavy_modules": sorted(eager),
+        "slowest_imports_ms": {
+            name: round(us / 1000, 1)
+            for name, us in sorted(slowest.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        },
+        "within_budget": median_ms <= args.budget_ms,
+    }
+    print(json.dumps(report, indent=2))
+    if not report["within_budget"]:
+        print(f"Cold import of {args.module} took {median_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ import json
 import logging
 import traceback
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Dict, Optional
 
 # --- INICIO DEL BLOQUE DE DIAGNÓSTICO PYTHON (VERSIÓN MEJORADA) ---
 # Colocar esto al principio de backend/run_agent_background.py
@@ -69,6 +69,9 @@ import uuid
 from agentpress.thread_manager import ThreadManager
 from services.supabase import DBConnection
 from services import redis # This is the async redis used by the app
+from services.usage import record_run_usage
+from utils.sse import encode_frame, decode_frame
+from utils import tracing
 import redis as redis_sync # Synchronous redis for Dramatiq results backend
 from dramatiq.brokers.rabbitmq import RabbitmqBroker
 from dramatiq.middleware import Results
@@ -81,8 +84,6 @@ from agentpress.task_state_manager import TaskStateManager # Added import
 import os # Necesario para getenv
 # Imports for sandbox stopping
 from sandbox.sandbox import get_or_start_sandbox, daytona, use_daytona # Modified import
-from daytona_api_client.models.workspace_state import WorkspaceState
-from daytona_sdk import SessionExecuteRequest # Added for workspace cleanup
 
 # Setup for Dramatiq Results Backend
 # Assuming config has REDIS_HOST, REDIS_PORT, REDIS_PASSWORD, REDIS_SSL
@@ -289,6 +290,8 @@ async def run_agent_background(
         await pubsub.subscribe(instance_control_channel, global_control_channel)
         worker_logger.debug(f"Subscribed to control channels: {instance_control_channel}, {global_control_channel}")
         stop_checker = asyncio.create_task(check_for_stop_signal())
+        # Started after the stop checker so its polling is not counted in the run's timings
+        tracing.start_run(agent_run_id)
 
         # Ensure active run key exists and has TTL
         await redis.set(instance_active_key, "running", ex=redis.REDIS_KEY_TTL)
@@ -334,7 +337,7 @@ async def run_agent_background(
             # Push specific error to Redis for frontend
             error_response_init = {"type": "status", "status": "error", "message": init_error_message}
             try:
-                await redis.rpush(response_list_key, json.dumps(error_response_init))
+                await redis.rpush(response_list_key, encode_frame(error_response_init))
                 await redis.publish(response_channel, "new")
             except Exception as redis_err_init:
                  worker_logger.error(f"Failed to push agent initialization error to Redis for {agent_run_id}: {redis_err_init}")
@@ -350,7 +353,7 @@ async def run_agent_background(
                     # It's better to create a status message for Redis here if we want immediate feedback on stop
                     stop_message_obj = {"type": "status", "status": "stopped", "message": "Agent run stopped by signal."}
                     try:
-                        await redis.rpush(response_list_key, json.dumps(stop_message_obj))
+                        await redis.rpush(response_list_key, encode_frame(stop_message_obj))
                         await redis.publish(response_channel, "new")
                     except Exception as e_redis_stop:
                         worker_logger.warning(f"Failed to push stop signal message to Redis for {agent_run_id}: {e_redis_stop}")
@@ -359,8 +362,9 @@ async def run_agent_background(
 
                 try:
                     # Store response in Redis list and publish notification
-                    response_json = json.dumps(response) # response is already a dict from run_agent
-                    asyncio.create_task(redis.rpush(response_list_key, response_json))
+                    # Serialize once into the SSE frame that viewers forward as-is
+                    response_frame = encode_frame(response) # response is already a dict from run_agent
+                    asyncio.create_task(redis.rpush(response_list_key, response_frame))
                     asyncio.create_task(redis.publish(response_channel, "new"))
                     total_responses += 1
 
@@ -384,7 +388,7 @@ async def run_agent_background(
                     # Push specific error to Redis for frontend
                     error_response_loop = {"type": "status", "status": "error", "message": loop_error_message}
                     try:
-                        await redis.rpush(response_list_key, json.dumps(error_response_loop))
+                        await redis.rpush(response_list_key, encode_frame(error_response_loop))
                         await redis.publish(response_channel, "new")
                     except Exception as redis_err_loop:
                          worker_logger.error(f"Failed to push loop processing error to Redis for {agent_run_id}: {redis_err_loop}")
@@ -399,7 +403,7 @@ async def run_agent_background(
                  completion_message = {"type": "status", "status": "completed", "message": "Agent run completed successfully"}
                  trace.span(name="agent_run_completed").end(status_message="agent_run_completed")
                  try:
-                     await redis.rpush(response_list_key, json.dumps(completion_message))
+                     await redis.rpush(response_list_key, encode_frame(completion_message))
                      await redis.publish(response_channel, "new") # Notify about the completion message
                  except Exception as e_redis_complete:
                      worker_logger.error(f"Failed to push completion message to Redis for {agent_run_id}: {e_redis_complete}")
@@ -408,10 +412,10 @@ async def run_agent_background(
 
         # Fetch final responses from Redis for DB update (ensuring this is always done)
         all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
+        all_responses = [decode_frame(r) for r in all_responses_json]
 
         # Update DB status
-        await update_agent_run_status(client, agent_run_id, final_status, error=error_message, responses=all_responses)
+        await update_agent_run_status(client, agent_run_id, final_status, error=error_message, responses=all_responses, timings=tracing.finish_run())
 
         # Publish final control signal (END_STREAM or ERROR)
         control_signal = "END_STREAM" if final_status == "completed" else "ERROR" if final_status == "failed" else "STOP"
@@ -433,7 +437,7 @@ async def run_agent_background(
         # Push error message to Redis list
         error_response = {"type": "status", "status": "error", "message": error_message}
         try:
-            await redis.rpush(response_list_key, json.dumps(error_response))
+            await redis.rpush(response_list_key, encode_frame(error_response))
             await redis.publish(response_channel, "new")
         except Exception as redis_err:
              worker_logger.error(f"Failed to push error response to Redis for {agent_run_id}: {redis_err}")
@@ -442,13 +446,13 @@ async def run_agent_background(
         all_responses = []
         try:
              all_responses_json = await redis.lrange(response_list_key, 0, -1)
-             all_responses = [json.loads(r) for r in all_responses_json]
+             all_responses = [decode_frame(r) for r in all_responses_json]
         except Exception as fetch_err:
              worker_logger.error(f"Failed to fetch responses from Redis after error for {agent_run_id}: {fetch_err}")
              all_responses = [error_response] # Use the error message we tried to push
 
         # Update DB status
-        await update_agent_run_status(client, agent_run_id, "failed", error=f"{error_message}\n{traceback_str}", responses=all_responses)
+        await update_agent_run_status(client, agent_run_id, "failed", error=f"{error_message}\n{traceback_str}", responses=all_responses, timings=tracing.finish_run())
 
         # Publish ERROR signal
         try:
@@ -497,6 +501,9 @@ async def run_agent_background(
                 worker_logger.warning(f"No project data found for project_id {project_id} when attempting sandbox cleanup.")
 
             if sandbox_id_for_cleanup_and_stop:
+                # Daytona SDK types are imported on use; the SDK is slow to import
+                from daytona_api_client.models.workspace_state import WorkspaceState
+                from daytona_sdk import SessionExecuteRequest # Added for workspace cleanup
                 sandbox_instance = None # Define here to ensure it's in scope for stopping if cleanup fails partially
                 try:
                     worker_logger.info(f"Fetching sandbox instance for ID: {sandbox_id_for_cleanup_and_stop}")
@@ -791,7 +798,8 @@ async def update_agent_run_status(
     agent_run_id: str,
     status: str,
     error: Optional[str] = None,
-    responses: Optional[list[any]] = None # Expects parsed list of dicts
+    responses: Optional[list[any]] = None, # Expects parsed list of dicts
+    timings: Optional[Dict[str, Any]] = None # Phase timing summary from utils.tracing
 ) -> bool:
     """
     Centralized function to update agent run status.
@@ -810,6 +818,10 @@ async def update_agent_run_status(
             # Ensure responses are stored correctly as JSONB
             update_data["responses"] = responses
 
+        if timings:
+            update_data["timings"] = timings
+            worker_logger.info("Agent run %s timings: %s", agent_run_id, json.dumps(timings["phases"]))
+
         # Retry up to 3 times
         for retry in range(3):
             try:
@@ -818,6 +830,12 @@ async def update_agent_run_status(
                 if hasattr(update_result, 'data') and update_result.data:
                     worker_logger.info(f"Successfully updated agent run {agent_run_id} status to '{status}' (retry {retry})")
 
+                    # Add the finished run to the account's usage ledger
+                    try:
+                        await record_run_usage(client, agent_run_id)
+                    except Exception as usage_error:
+                        worker_logger.error(f"Failed to record usage for agent run {agent_run_id}: {str(usage_error)}")
+
                     # Verify the update
                     verify_result = await client.table('agent_runs').select('status', 'completed_at').eq("id", agent_run_id).execute()
                     if verify_result.data:
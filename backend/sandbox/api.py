@@ -1,12 +1,16 @@
+import asyncio
+import io
+import json
 import os
 import urllib.parse
-from typing import Optional
+from typing import List, Optional
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, APIRouter, Form, Depends, Request
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 
 from sandbox.sandbox import get_or_start_sandbox
+from sandbox.uploads import UPLOADED, SandboxUploader, item_from_file, spool_chunks
 from utils.logger import logger
 from utils.auth_utils import get_optional_user_id
 from services.supabase import DBConnection
@@ -162,11 +166,10 @@ async def create_file(
         # Get sandbox using the safer method
         sandbox = await get_sandbox_by_id_safely(client, sandbox_id)
         
-        # Read file content directly from the uploaded file
-        content = await file.read()
-        
-        # Create file using raw binary content
-        sandbox.fs.upload_file(path, content)
+        # Upload from the spooled request file, off the event loop
+        [result] = await SandboxUploader(sandbox).upload([item_from_file(file.file, path)], pack=False)
+        if result.status != UPLOADED:
+            raise Exception(result.error)
         logger.info(f"File created at {path} in sandbox {sandbox_id}")
         
         return {"status": "success", "created": True, "path": path}
@@ -174,6 +177,97 @@ async def create_file(
         logger.error(f"Error creating file in sandbox {sandbox_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.put("/sandboxes/{sandbox_id}/files/stream")
+async def stream_file(
+    sandbox_id: str,
+    path: str,
+    request: Request,
+    user_id: Optional[str] = Depends(get_optional_user_id)
+):
+    """Create a file in the sandbox from a raw request body, spooled in chunks (for large files)"""
+    path = normalize_path(path)
+    logger.info(f"Received streamed file upload request for sandbox {sandbox_id}, path: {path}, user_id: {user_id}")
+    client = await db.client
+    await verify_sandbox_access(client, sandbox_id, user_id)
+
+    try:
+        sandbox = await get_sandbox_by_id_safely(client, sandbox_id)
+        spool = await spool_chunks(request.stream())
+        try:
+            [result] = await SandboxUploader(sandbox).upload([item_from_file(spool, path)], pack=False)
+        finally:
+            spool.close()
+        if result.status != UPLOADED:
+            raise Exception(result.error)
+        logger.info(f"File created at {path} in sandbox {sandbox_id} ({result.size} bytes)")
+        return {"status": "success", "created": True, "path": path, "size": result.size}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating file in sandbox {sandbox_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/sandboxes/{sandbox_id}/files/batch")
+async def create_files(
+    sandbox_id: str,
+    files: List[UploadFile] = File(...),
+    directory: str = Form("/workspace"),
+    paths: Optional[List[str]] = Form(None),
+    pack: bool = Form(True),
+    stream_progress: bool = Form(False),
+    user_id: Optional[str] = Depends(get_optional_user_id)
+):
+    """Upload several files concurrently.
+
+    Files go to ``paths`` when given (one per file), otherwise to ``directory``
+    under their own names. Many small files are packed into one tar archive
+    unless ``pack`` is false. With ``stream_progress`` the response is NDJSON:
+    one line per finished file, then a summary line.
+    """
+    if paths is not None and len(paths) != len(files):
+        raise HTTPException(status_code=400, detail="paths must have one entry per file")
+    directory = normalize_path(directory).rstrip("/")
+    if paths is not None:
+        targets = [normalize_path(p) for p in paths]
+    else:
+        targets = [f"{directory}/{(f.filename or 'upload').replace('/', '_').replace(chr(92), '_')}" for f in files]
+
+    logger.info(f"Received batch upload of {len(files)} files for sandbox {sandbox_id}, user_id: {user_id}")
+    client = await db.client
+    await verify_sandbox_access(client, sandbox_id, user_id)
+    sandbox = await get_sandbox_by_id_safely(client, sandbox_id)
+    items = [item_from_file(f.file, target) for f, target in zip(files, targets)]
+    uploader = SandboxUploader(sandbox)
+
+    def summary(results):
+        uploaded = sum(result.status == UPLOADED for result in results)
+        return {"status": "success" if uploaded == len(results) else "partial", "uploaded": uploaded,
+                "failed": len(results) - uploaded, "files": [result.to_dict() for result in results]}
+
+    if not stream_progress:
+        return summary(await uploader.upload(items, pack=pack))
+
+    # FastAPI closes the form's files when the endpoint returns, before a streamed
+    # body is sent, so take ownership of the spooled files for the upload
+    for f in files:
+        f.file = io.BytesIO()
+
+    async def progress_lines():
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(uploader.upload(items, on_progress=queue.put_nowait, pack=pack))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (progress := await queue.get()) is not None:
+                yield json.dumps({"type": "progress", **progress.to_dict()}) + "\n"
+            yield json.dumps({"type": "summary", **summary(task.result())}) + "\n"
+        finally:
+            if not task.done():
+                task.cancel()
+            for item in items:
+                item.source.close()
+
+    return StreamingResponse(progress_lines(), media_type="application/x-ndjson")
+
 @router.get("/sandboxes/{sandbox_id}/files")
 async def list_files(
     sandbox_id: str, 
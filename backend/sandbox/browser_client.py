@@ -0,0 +1,195 @@
+"""
+Direct HTTP client for the browser automation service in sandboxes.
+
+The browser service (sandbox/docker/browser_api.py) listens on port 8003
+inside the sandbox. Calling it via ``curl`` through sandbox exec pays for an
+exec round trip and a process spawn on every action. It also returns
+multi-megabyte screenshots through exec output. Instead, tools call the
+service over the sandbox's preview link (Daytona) or a published container
+port (local sandboxes) with one pooled ``httpx.AsyncClient`` per event loop,
+so connections are kept alive across actions and runs. Bodies are streamed
+into a buffer, and each action type has its own read timeout.
+
+``resolve_browser_route`` returns None when there is no direct route, and
+callers fall back to exec. Tools keep their route in a ``BrowserRouteCache``,
+which looks it up on first use and again ``ROUTE_RETRY_INTERVAL`` seconds
+after it could not be resolved or reached. Requests name their browser session (an isolated
+browser context in the service) with the ``X-Browser-Session`` header.
+"""
+
+import asyncio
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import httpx
+import orjson
+
+from utils.config import config
+from utils.logger import logger
+
+BROWSER_API_PORT = 8003
+PREVIEW_TOKEN_HEADER = "X-Daytona-Preview-Token"
+SESSION_HEADER = "X-Browser-Session"
+
+# Read timeouts (seconds) for actions that wait on page loads; others use DEFAULT_ACTION_TIMEOUT
+ACTION_TIMEOUTS = {
+    "navigate_to": 60,
+    "search_google": 60,
+    "go_back": 45,
+    "open_tab": 60,
+    "save_pdf": 120,
+    "batch": 180,
+}
+DEFAULT_ACTION_TIMEOUT = 30
+# Seconds before looking up a route again after it failed or could not be resolved
+ROUTE_RETRY_INTERVAL = 30
+
+
+class BrowserServiceError(Exception):
+    """The browser service could not be reached or answered with an error."""
+
+    def __init__(self, message: str, request_sent: bool):
+        super().__init__(message)
+        # False when the request never reached the service, so running it another way is safe
+        self.request_sent = request_sent
+
+
+@dataclass
+class BrowserRoute:
+    """Base URL of a sandbox's browser service plus headers the route needs."""
+
+    base_url: str
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+def resolve_browser_route(sandbox: Any) -> Optional[BrowserRoute]:
+    """Direct route to the sandbox's browser service, or None (blocking; run in a thread)."""
+    try:
+        if isinstance(sandbox, dict):
+            # Local sandboxes only have a route if the container publishes the port
+            container = sandbox.get("container")
+            if container is None:
+                return None
+            container.reload()
+            bindings = (container.ports or {}).get(f"{BROWSER_API_PORT}/tcp")
+            if not bindings or not bindings[0].get("HostPort"):
+                return None
+            return BrowserRoute(f"http://127.0.0.1:{bindings[0]['HostPort']}")
+
+        link = sandbox.get_preview_link(BROWSER_API_PORT)
+        url = getattr(link, "url", None)
+        if not url:
+            return None
+        token = getattr(link, "token", None)
+        return BrowserRoute(url.rstrip("/"), {PREVIEW_TOKEN_HEADER: token} if token else {})
+    except Exception as e:
+        logger.warning(f"No direct route to the browser service: {e}")
+        return None
+
+
+class BrowserRouteCache:
+    """A tool's route to its sandbox's browser service, looked up again a while after it fails."""
+
+    def __init__(self, route: Optional[BrowserRoute] = None):
+        self.route = route
+        # When an unavailable route may be looked up again (time.monotonic())
+        self.retry_at = 0.0
+
+    async def get(self, sandbox: Any) -> Optional[BrowserRoute]:
+        """The route, or None while there is none (callers fall back to exec)."""
+        if self.route is None and config.BROWSER_API_DIRECT and time.monotonic() >= self.retry_at:
+            self.route = await asyncio.to_thread(resolve_browser_route, sandbox)
+            logger.debug(f"Browser service route: {self.route.base_url if self.route else 'exec'}")
+            if self.route is None:
+                self.unavailable()
+        return self.route
+
+    def unavailable(self) -> None:
+        """Stop using the route; it is looked up again after ``ROUTE_RETRY_INTERVAL``."""
+        self.route = None
+        self.retry_at = time.monotonic() + ROUTE_RETRY_INTERVAL
+
+
+def action_timeout(endpoint: str, params: Optional[Dict[str, Any]] = None) -> float:
+    timeout = ACTION_TIMEOUTS.get(endpoint, DEFAULT_ACTION_TIMEOUT)
+    if endpoint == "wait" and params:
+        timeout += float(params.get("seconds", 0) or 0)
+    return timeout
+
+
+class BrowserServiceClient:
+    """Pooled keep-alive HTTP client for browser service requests."""
+
+    def __init__(self, max_connections: int, max_response_bytes: int, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.max_response_bytes = max_response_bytes
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections, keepalive_expiry=60),
+            timeout=httpx.Timeout(DEFAULT_ACTION_TIMEOUT, connect=10),
+            transport=transport,
+        )
+
+    async def request(
+        self,
+        route: BrowserRoute,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        method: str = "POST",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        """Call ``/api/automation/<endpoint>`` and return the decoded JSON body.
+
+        Raises:
+            BrowserServiceError: On connection failures, error statuses, oversized or non-JSON bodies
+        """
+        url = f"{route.base_url}/api/automation/{endpoint}"
+        timeout = httpx.Timeout(action_timeout(endpoint, params), connect=10)
+        kwargs: Dict[str, Any] = {"params": params} if method == "GET" else {"json": params or {}}
+        if headers:
+            kwargs["headers"] = {**route.headers, **headers}
+        else:
+            kwargs["headers"] = route.headers
+        try:
+            async with self._http.stream(method, url, timeout=timeout, **kwargs) as response:
+                if response.status_code == 503:
+                    # The preview proxy could not reach the service. 502 and 504 may come after
+                    # the service started the action, so they count as sent
+                    raise BrowserServiceError(f"Browser service unavailable ({response.status_code})", request_sent=False)
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body += chunk
+                    if len(body) > self.max_response_bytes:
+                        raise BrowserServiceError(
+                            f"Browser service response exceeds {self.max_response_bytes} bytes", request_sent=True
+                        )
+                if response.status_code >= 400:
+                    raise BrowserServiceError(
+                        f"Browser service returned {response.status_code}: {bytes(body[:200]).decode('utf-8', 'replace')}",
+                        request_sent=True,
+                    )
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            raise BrowserServiceError(f"Could not connect to the browser service: {e}", request_sent=False) from e
+        except httpx.HTTPError as e:
+            raise BrowserServiceError(f"Browser service request failed: {e!r}", request_sent=True) from e
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError as e:
+            raise BrowserServiceError(f"Browser service returned non-JSON response: {bytes(body[:200])!r}", request_sent=True) from e
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+# One client per event loop: httpx connection pools are bound to the loop they were created on
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, BrowserServiceClient]" = weakref.WeakKeyDictionary()
+
+
+def get_browser_client() -> BrowserServiceClient:
+    """The client shared by every tool on the current event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = BrowserServiceClient(config.BROWSER_API_MAX_CONNECTIONS, config.BROWSER_API_MAX_RESPONSE_BYTES)
+        _clients[loop] = client
+    return client
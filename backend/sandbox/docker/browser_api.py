@@ -1,8 +1,10 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Body
+from fastapi import FastAPI, APIRouter, HTTPException, Body, Depends, Header
 from playwright.async_api import async_playwright, Browser, Page
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import asyncio
+import contextvars
+import time
 import json
 import logging
 import base64
@@ -16,6 +18,9 @@ import pytesseract
 from PIL import Image
 import io
 
+from browser_pool import BrowserContextPool, BrowserSession, DEFAULT_SESSION
+from page_extraction import PageExtractor, normalize_url
+
 #######################################################
 # Action model definitions
 #######################################################
@@ -59,6 +64,16 @@ class CloseTabAction(BaseModel):
 class NoParamsAction(BaseModel):
     pass
 
+class WaitAction(BaseModel):
+    seconds: int = 3
+
+class ScrollToTextAction(BaseModel):
+    text: str
+
+class SelectDropdownOptionAction(BaseModel):
+    index: int
+    option_text: str
+
 class DragDropAction(BaseModel):
     element_source: Optional[str] = None
     element_target: Optional[str] = None
@@ -75,6 +90,28 @@ class DoneAction(BaseModel):
     success: bool = True
     text: str = ""
 
+class StepExpectation(BaseModel):
+    """Conditions a batch step must reach (waiting up to timeout_ms) before the next step runs."""
+    url_contains: Optional[str] = None
+    title_contains: Optional[str] = None
+    text_visible: Optional[str] = None
+    selector_visible: Optional[str] = None
+    load_state: Optional[str] = None  # "load", "domcontentloaded" or "networkidle"
+    timeout_ms: int = 10000
+
+class BatchStep(BaseModel):
+    action: str  # Name of an automation endpoint, e.g. "input_text"
+    params: Dict[str, Any] = {}
+    expect: Optional[StepExpectation] = None
+
+class BatchAction(BaseModel):
+    steps: List[BatchStep]
+    include_screenshot: bool = True
+
+class PageContentAction(BaseModel):
+    url: str
+    max_age_seconds: int = 900  # Oldest cached extraction served for a URL no tab has open
+
 #######################################################
 # DOM Structure Models
 #######################################################
@@ -274,16 +311,39 @@ class BrowserActionResult(BaseModel):
     class Config:
         arbitrary_types_allowed = True
 
+class BatchStepResult(BaseModel):
+    index: int
+    action: str
+    success: bool
+    message: str = ""
+    error: str = ""
+    elapsed_ms: int = 0
+
+class BrowserBatchResult(BrowserActionResult):
+    steps: List[BatchStepResult] = []
+    completed_steps: int = 0
+    failed_step: Optional[int] = None
+
 #######################################################
 # Browser Automation Implementation 
 #######################################################
 
+# Set while a batch runs its steps: actions skip collecting browser state,
+# which is collected once for the whole batch instead
+_batch_in_progress: contextvars.ContextVar[bool] = contextvars.ContextVar("batch_in_progress", default=False)
+# Browser session (context and tabs) of the current request, bound by BrowserAutomation.bind_session
+_current_session: contextvars.ContextVar[Optional[BrowserSession]] = contextvars.ContextVar("browser_session", default=None)
+
 class BrowserAutomation:
     def __init__(self):
-        self.router = APIRouter()
+        # Every automation request runs in the browser session named by its X-Browser-Session header
+        self.router = APIRouter(dependencies=[Depends(self.bind_session)])
+        # Lookups that must not open a browser context for the session they name
+        self.lookup_router = APIRouter()
+        self.lookup_router.post("/automation/page_content")(self.page_content)
         self.browser: Browser = None
-        self.pages: List[Page] = []
-        self.current_page_index: int = 0
+        self.pool = BrowserContextPool.from_env()
+        self.extractor = PageExtractor.from_env()
         self.logger = logging.getLogger("browser_automation")
         self.include_attributes = ["id", "href", "src", "alt", "aria-label", "placeholder", "name", "role", "title", "value"]
         self.screenshot_dir = os.path.join(os.getcwd(), "screenshots")
@@ -326,6 +386,30 @@ class BrowserAutomation:
         # Drag and drop
         self.router.post("/automation/drag_drop")(self.drag_drop)
 
+        # Multi-step sequences in one request
+        self.router.post("/automation/batch")(self.batch)
+        # Actions allowed in a batch, with the model their params are validated with.
+        # Endpoints that take their params as separate body fields get them spread from the model.
+        spread = lambda handler: lambda params: handler(**params.model_dump())
+        self.batch_actions = {
+            "navigate_to": (self.navigate_to, GoToUrlAction),
+            "search_google": (self.search_google, SearchGoogleAction),
+            "go_back": (self.go_back, NoParamsAction),
+            "wait": (spread(self.wait), WaitAction),
+            "click_element": (self.click_element, ClickElementAction),
+            "click_coordinates": (self.click_coordinates, ClickCoordinatesAction),
+            "input_text": (self.input_text, InputTextAction),
+            "send_keys": (self.send_keys, SendKeysAction),
+            "switch_tab": (self.switch_tab, SwitchTabAction),
+            "open_tab": (self.open_tab, OpenTabAction),
+            "close_tab": (self.close_tab, CloseTabAction),
+            "scroll_down": (self.scroll_down, ScrollAction),
+            "scroll_up": (self.scroll_up, ScrollAction),
+            "scroll_to_text": (spread(self.scroll_to_text), ScrollToTextAction),
+            "select_dropdown_option": (spread(self.select_dropdown_option), SelectDropdownOptionAction),
+            "drag_drop": (self.drag_drop, DragDropAction),
+        }
+
     async def startup(self):
         """Initialize the browser instance on startup"""
         try:
@@ -359,21 +443,11 @@ class BrowserAutomation:
                     self.logger.error("Failed to launch browser on both attempts. Last error: %s", e)
                     raise RuntimeError(f"Failed to launch browser after multiple attempts. Last error: {e}")
 
-            try:
-                await self.get_current_page()
-                print("Found existing page, using it")
-                self.current_page_index = 0
-            except Exception as page_error:
-                print(f"Error finding existing page, creating new one. ( {page_error})")
-                page = await self.browser.new_page(viewport={'width': 1024, 'height': 768})
-                print("New page created successfully")
-                self.pages.append(page)
-                self.current_page_index = 0
-                # Navigate directly to google.com instead of about:blank
-                await page.goto("https://www.google.com", wait_until="domcontentloaded", timeout=30000)
-                print("Navigated to google.com")
-                
-                print("Browser initialization completed successfully")
+            # Sessions get their own contexts on demand; the default one is ready on a blank tab
+            self.pool.browser = self.browser
+            await self.pool.acquire(DEFAULT_SESSION)
+            self.pool.start_reaper()
+            print("Browser initialization completed successfully")
         except Exception as e:
             print(f"Browser startup error: {str(e)}")
             traceback.print_exc()
@@ -381,14 +455,50 @@ class BrowserAutomation:
             
     async def shutdown(self):
         """Clean up browser instance on shutdown"""
+        await self.pool.close_all()
         if self.browser:
             await self.browser.close()
+
+    async def bind_session(self, x_browser_session: Optional[str] = Header(None)):
+        """Request dependency: bind the request to its browser session and mark the session in use"""
+        session = await self.pool.acquire(x_browser_session or DEFAULT_SESSION)
+        _current_session.set(session)
+        session.active += 1
+        try:
+            yield session
+        finally:
+            session.active -= 1
+
+    @property
+    def session(self) -> BrowserSession:
+        """Browser session of the current request (the default session outside requests)"""
+        session = _current_session.get() or self.pool.sessions.get(DEFAULT_SESSION)
+        if session is None:
+            raise HTTPException(status_code=500, detail="No browser session available")
+        return session
+
+    @property
+    def pages(self) -> List[Page]:
+        return self.session.pages
+
+    @property
+    def current_page_index(self) -> int:
+        return self.session.current_page_index
+
+    @current_page_index.setter
+    def current_page_index(self, index: int) -> None:
+        self.session.current_page_index = index
     
     async def get_current_page(self) -> Page:
         """Get the current active page"""
-        if not self.pages:
-            raise HTTPException(status_code=500, detail="No browser pages available")
-        return self.pages[self.current_page_index]
+        session = self.session
+        if not session.pages:
+            # The last tab was closed; sessions always have one to act on
+            await self.pool.new_page(session)
+            session.current_page_index = 0
+        page = session.pages[session.current_page_index]
+        session.touch_page(page)
+        return page
     
     async def get_selector_map(self) -> Dict[int, DOMElementNode]:
         """Get a map of selectable elements on the page"""
@@ -694,6 +804,8 @@ class BrowserAutomation:
         """Helper method to get updated browser state after any action
         Returns a tuple of (dom_state, screenshot, elements, metadata)
         """
+        if _batch_in_progress.get():
+            return None, "", "", {}
         try:
             # Wait a moment for any potential async processes to settle
             await asyncio.sleep(0.5)
@@ -1275,8 +1387,8 @@ class BrowserAutomation:
         """Open a new tab with the specified URL"""
         try:
             print(f"Attempting to open new tab with URL: {action.url}")
-            # Create new page in same browser instance
-            new_page = await self.browser.new_page()
+            # Create new page in the session's context (the pool adds it to the session's tabs)
+            new_page = await self.pool.new_page(self.session)
             print(f"New page created successfully")
             
             # Navigate to the URL
@@ -1284,9 +1396,8 @@ class BrowserAutomation:
             await new_page.wait_for_load_state("networkidle", timeout=10000)
             print(f"Navigated to URL in new tab: {action.url}")
             
-            # Add to page list and make it current
-            self.pages.append(new_page)
-            self.current_page_index = len(self.pages) - 1
+            # Make it current
+            self.current_page_index = self.pages.index(new_page)
             print(f"New tab added as index {self.current_page_index}")
             
             # Get updated state after action
@@ -1371,40 +1482,25 @@ class BrowserAutomation:
     
     # Content Actions
     
-    async def extract_content(self, goal: str = Body(...)):
+    async def extract_content(self, goal: str = Body(..., embed=True)):
         """Extract content from the current page based on the provided goal"""
         try:
             page = await self.get_current_page()
-            content = await page.content()
-            
-            # In a full implementation, we would use an LLM to extract specific content
-            # based on the goal. For this example, we'll extract visible text.
-            extracted_text = await page.evaluate("""
-            Array.from(document.querySelectorAll('p, h1, h2, h3, h4, h5, h6, li, span, div'))
-                .filter(el => {
-                    const style = window.getComputedStyle(el);
-                    return style.display !== 'none' && 
-                           style.visibility !== 'hidden' && 
-                           style.opacity !== '0' &&
-                           el.innerText && 
-                           el.innerText.trim().length > 0;
-                })
-                .map(el => el.innerText.trim())
-                .join('\\n\\n');
-            """)
+            # Cleaned markdown of the page, converted once per DOM state (only changed blocks are re-converted)
+            extracted, cached = await self.extractor.extract(page, self.session.session_id)
             
             # Get updated state
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"extract_content({goal})")
             
             return self.build_action_result(
                 True,
-                f"Content extracted based on goal: {goal}",
+                f"Content extracted based on goal: {goal}" + (" (cached)" if cached else ""),
                 dom_state,
                 screenshot,
                 elements,
                 metadata,
                 error="",
-                content=extracted_text
+                content=extracted.markdown
             )
         except Exception as e:
             return self.build_action_result(
@@ -1418,6 +1514,36 @@ class BrowserAutomation:
                 content=None
             )
     
+    async def page_content(self, action: PageContentAction = Body(...), x_browser_session: Optional[str] = Header(None)):
+        """Markdown of a URL the caller's browser session has loaded: from one of its open tabs, else from its cache"""
+        url = normalize_url(action.url)
+        session_id = x_browser_session or DEFAULT_SESSION
+        session = self.pool.sessions.get(session_id)
+        try:
+            for page in list(session.pages) if session else []:
+                if normalize_url(page.url) == url:
+                    extracted, cached = await self.extractor.extract(page, session_id)
+                    return self.page_content_result(extracted, "cache" if cached else "page")
+        except Exception as e:
+            # The tab navigated or closed mid-extraction; the cache may still have the page
+            print(f"Error extracting open page {action.url}: {e}")
+        extracted = self.extractor.latest(url, session_id)
+        if extracted is None or extracted.age_seconds > action.max_age_seconds:
+            return {"success": True, "found": False, "url": action.url}
+        return self.page_content_result(extracted, "cache")
+
+    def page_content_result(self, extracted, source: str) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "found": True,
+            "source": source,
+            "url": extracted.url,
+            "title": extracted.title,
+            "markdown": extracted.markdown,
+            "dom_hash": extracted.dom_hash,
+            "age_seconds": round(extracted.age_seconds, 1),
+        }
+    
     async def save_pdf(self):
         """Save the current page as a PDF"""
         try:
@@ -1824,6 +1950,88 @@ class BrowserAutomation:
                 content=None
             )
 
+    # Batched Actions
+
+    async def check_expectation(self, expect: StepExpectation) -> str:
+        """Wait for every condition in ``expect``; returns an error message, or "" when all are met."""
+        page = await self.get_current_page()
+        timeout = expect.timeout_ms
+        try:
+            if expect.load_state:
+                await page.wait_for_load_state(expect.load_state, timeout=timeout)
+            if expect.url_contains:
+                await page.wait_for_url(lambda url: expect.url_contains in url, timeout=timeout)
+            if expect.selector_visible:
+                await page.wait_for_selector(expect.selector_visible, state="visible", timeout=timeout)
+            if expect.text_visible:
+                await page.get_by_text(expect.text_visible, exact=False).first.wait_for(state="visible", timeout=timeout)
+            if expect.title_contains:
+                deadline = time.monotonic() + timeout / 1000
+                while expect.title_contains not in await page.title():
+                    if time.monotonic() > deadline:
+                        return f"Title does not contain '{expect.title_contains}'"
+                    await asyncio.sleep(0.1)
+        except Exception as e:
+            return f"Expectation not met: {e}"
+        return ""
+
+    async def run_batch_step(self, step: BatchStep) -> BrowserActionResult:
+        if step.action not in self.batch_actions:
+            raise ValueError(f"Unsupported batch action '{step.action}'. Supported: {', '.join(self.batch_actions)}")
+        handler, model = self.batch_actions[step.action]
+        return await handler(model(**step.params))
+
+    async def batch(self, action: BatchAction = Body(...)):
+        """Run steps in order and return the browser state once, after the last step or the first failure"""
+        step_results: List[BatchStepResult] = []
+        failed_step = None
+        token = _batch_in_progress.set(True)
+        try:
+            for index, step in enumerate(action.steps):
+                started = time.perf_counter()
+                try:
+                    result = await self.run_batch_step(step)
+                    success, message, error = result.success, result.message, result.error
+                    if success and step.expect is not None:
+                        error = await self.check_expectation(step.expect)
+                        success = not error
+                except Exception as e:
+                    success, message, error = False, str(e), str(e)
+                step_results.append(BatchStepResult(
+                    index=index, action=step.action, success=success, message=message,
+                    error=error or ("" if success else message),
+                    elapsed_ms=int((time.perf_counter() - started) * 1000),
+                ))
+                if not success:
+                    failed_step = index
+                    break
+        finally:
+            _batch_in_progress.reset(token)
+
+        completed = len(step_results) - (1 if failed_step is not None else 0)
+        if failed_step is None:
+            message = f"Completed {completed} of {len(action.steps)} steps"
+        else:
+            message = f"Step {failed_step} ({action.steps[failed_step].action}) failed after {completed} completed steps: {step_results[-1].error}"
+
+        dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"batch({len(step_results)} steps)")
+        result = self.build_action_result(
+            failed_step is None,
+            message,
+            dom_state,
+            screenshot if action.include_screenshot else None,
+            elements,
+            metadata,
+            error="" if failed_step is None else step_results[-1].error,
+            content=None
+        )
+        return BrowserBatchResult(
+            **result.model_dump(),
+            steps=step_results,
+            completed_steps=completed,
+            failed_step=failed_step,
+        )
+
 # Create singleton instance
 automation_service = BrowserAutomation()
 
@@ -1834,8 +2042,16 @@ api_app = FastAPI()
 async def health_check():
     return {"status": "ok", "message": "API server is running"}
 
+@api_app.get("/api/automation/metrics")
+async def browser_metrics():
+    """Browser context, tab, memory and extraction cache counts"""
+    metrics = await automation_service.pool.metrics()
+    metrics["extraction"] = automation_service.extractor.stats()
+    return metrics
+
 # Include automation service router with /api prefix
 api_app.include_router(automation_service.router, prefix="/api")
+api_app.include_router(automation_service.lookup_router, prefix="/api")
 
 async def test_browser_api():
     """Test the browser automation API functionality"""
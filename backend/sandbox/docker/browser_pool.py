@@ -0,0 +1,315 @@
+"""
+Browser context pool for the browser automation service.
+
+Each session, named by the ``X-Browser-Session`` request header (the agent
+tools send their thread id), gets its own Playwright browser context. Cookies,
+storage and tabs are therefore isolated between runs that share a sandbox.
+Requests without the header share the ``default`` session.
+
+The pool also manages tab and context lifecycles:
+
+- tabs other than the current one are closed after ``idle_tab_seconds``
+  without use, and whole sessions after ``idle_context_seconds``
+- a context is recycled (closed and reopened on its current URL, keeping
+  cookies and localStorage) after
+  ``max_navigations`` main-frame navigations, or when its pages' JS heaps
+  exceed ``max_heap_mb``
+- when ``max_contexts`` sessions are open, the least recently used idle one
+  is closed to make room
+- requests for fonts, media and known ad/tracker hosts are aborted by
+  default (``RequestBlockingPolicy``), so pages load faster
+
+``metrics()`` reports context, page and memory counts for ``/api/automation/metrics``.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+logger = logging.getLogger("browser_pool")
+
+DEFAULT_SESSION = "default"
+
+AD_HOSTS = (
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com", "google-analytics.com",
+    "googletagmanager.com", "googletagservices.com", "adservice.google.", "amazon-adsystem.com",
+    "connect.facebook.net", "scorecardresearch.com", "taboola.com", "outbrain.com", "criteo.",
+    "adnxs.com", "hotjar.com", "quantserve.com", "moatads.com", "pubmatic.com", "rubiconproject.com",
+)
+
+PAGE_HEAP_SCRIPT = "() => (performance.memory ? performance.memory.usedJSHeapSize : 0)"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class RequestBlockingPolicy:
+    """Aborts requests by Playwright resource type and by ad/tracker host."""
+
+    def __init__(self, resource_types: Iterable[str] = ("font", "media"), block_ads: bool = True,
+                 ad_hosts: Iterable[str] = AD_HOSTS):
+        self.resource_types: FrozenSet[str] = frozenset(t.strip() for t in resource_types if t.strip())
+        self.ad_hosts = tuple(ad_hosts) if block_ads else ()
+        self.blocked = 0
+
+    @classmethod
+    def from_env(cls) -> "RequestBlockingPolicy":
+        return cls(
+            resource_types=os.environ.get("BROWSER_BLOCK_RESOURCES", "font,media").split(","),
+            block_ads=os.environ.get("BROWSER_BLOCK_ADS", "true").lower() in ("1", "true", "yes"),
+        )
+
+    @property
+    def active(self) -> bool:
+        return bool(self.resource_types or self.ad_hosts)
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.resource_types:
+            return True
+        if self.ad_hosts:
+            host = url.split("://", 1)[-1].split("/", 1)[0].lower()
+            return any(ad_host in host for ad_host in self.ad_hosts)
+        return False
+
+    async def handle(self, route) -> None:
+        request = route.request
+        if self.should_block(request.resource_type, request.url):
+            self.blocked += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+
+@dataclass
+class BrowserSession:
+    """One isolated browser context with its tabs."""
+
+    session_id: str
+    context: Any
+    pages: List[Any] = field(default_factory=list)
+    current_page_index: int = 0
+    navigations: int = 0
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    # Requests currently using the session; sessions in use are never reaped or recycled
+    active: int = 0
+    recycles: int = 0
+    page_last_used: Dict[int, float] = field(default_factory=dict)
+
+    def touch_page(self, page: Any) -> None:
+        now = time.monotonic()
+        self.last_used = now
+        self.page_last_used[id(page)] = now
+
+
+class BrowserContextPool:
+    """Creates, reaps and recycles per-session browser contexts on one browser."""
+
+    def __init__(
+        self,
+        viewport: Optional[Dict[str, int]] = None,
+        max_contexts: int = 8,
+        idle_tab_seconds: int = 600,
+        idle_context_seconds: int = 1800,
+        max_navigations: int = 200,
+        max_heap_mb: int = 512,
+        blocking_policy: Optional[RequestBlockingPolicy] = None,
+    ):
+        self.browser = None
+        self.viewport = viewport or {"width": 1024, "height": 768}
+        self.max_contexts = max_contexts
+        self.idle_tab_seconds = idle_tab_seconds
+        self.idle_context_seconds = idle_context_seconds
+        self.max_navigations = max_navigations
+        self.max_heap_mb = max_heap_mb
+        self.blocking_policy = blocking_policy or RequestBlockingPolicy()
+        self.sessions: Dict[str, BrowserSession] = {}
+        self.closed_tabs = 0
+        self.closed_sessions = 0
+        self._lock = asyncio.Lock()
+        self._reaper: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "BrowserContextPool":
+        return cls(
+            max_contexts=_env_int("BROWSER_MAX_CONTEXTS", 8),
+            idle_tab_seconds=_env_int("BROWSER_IDLE_TAB_SECONDS", 600),
+            idle_context_seconds=_env_int("BROWSER_IDLE_CONTEXT_SECONDS", 1800),
+            max_navigations=_env_int("BROWSER_RECYCLE_NAVIGATIONS", 200),
+            max_heap_mb=_env_int("BROWSER_RECYCLE_HEAP_MB", 512),
+            blocking_policy=RequestBlockingPolicy.from_env(),
+        )
+
+    # --- Sessions ---
+
+    async def acquire(self, session_id: str) -> BrowserSession:
+        """The session's state, creating its context (and first tab) if needed."""
+        async with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                await self._make_room()
+                session = await self._open_session(session_id)
+                self.sessions[session_id] = session
+            elif session.active == 0 and self.max_navigations and session.navigations >= self.max_navigations:
+                await self.recycle(session, reason=f"{session.navigations} navigations")
+        session.last_used = time.monotonic()
+        return session
+
+    async def _open_session(self, session_id: str) -> BrowserSession:
+        session = BrowserSession(session_id=session_id, context=None)
+        await self._start_context(session)
+        return session
+
+    async def _start_context(
+        self, session: BrowserSession, url: Optional[str] = None, storage_state: Optional[dict] = None
+    ) -> None:
+        """Give the session a new context with one tab, optionally opened on ``url`` with ``storage_state``."""
+        if self.browser is None:
+            raise RuntimeError("Browser is not running")
+        session.context = await self.browser.new_context(viewport=self.viewport, storage_state=storage_state)
+        if self.blocking_policy.active:
+            await session.context.route("**/*", self.blocking_policy.handle)
+        session.pages = []
+        session.page_last_used = {}
+        session.current_page_index = 0
+        page = await self.new_page(session)
+        if url and url != "about:blank":
+            try:
+                await page.goto(url, wait_until="domcontentloaded", timeout=30000)
+            except Exception as e:
+                logger.warning("Could not restore %s for session %s: %s", url, session.session_id, e)
+        session.navigations = 0
+
+    async def new_page(self, session: BrowserSession) -> Any:
+        """Open a tab in the session's context and track it."""
+        page = await session.context.new_page()
+
+        def on_navigation(frame) -> None:
+            if frame == page.main_frame:
+                session.navigations += 1
+        page.on("framenavigated", on_navigation)
+        session.pages.append(page)
+        session.touch_page(page)
+        return page
+
+    async def _make_room(self) -> None:
+        if len(self.sessions) < self.max_contexts:
+            return
+        idle = [s for s in self.sessions.values() if s.active == 0]
+        if not idle:
+            logger.warning("All %d browser contexts are in use; opening one more", len(self.sessions))
+            return
+        await self.close_session(min(idle, key=lambda s: s.last_used).session_id)
+
+    async def close_session(self, session_id: str) -> None:
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        self.closed_sessions += 1
+        try:
+            await session.context.close()
+        except Exception as e:
+            logger.warning("Error closing context for session %s: %s", session_id, e)
+
+    async def recycle(self, session: BrowserSession, reason: str) -> None:
+        """Replace the session's context with a fresh one on the same URL, keeping cookies and localStorage."""
+        current = session.pages[session.current_page_index] if session.pages else None
+        url = current.url if current is not None else None
+        logger.info("Recycling browser context for session %s (%s)", session.session_id, reason)
+        try:
+            storage_state = await session.context.storage_state()
+        except Exception as e:
+            logger.warning("Could not save storage state for session %s: %s", session.session_id, e)
+            storage_state = None
+        try:
+            await session.context.close()
+        except Exception as e:
+            logger.warning("Error closing context for session %s: %s", session.session_id, e)
+        await self._start_context(session, url, storage_state)
+        session.recycles += 1
+
+    # --- Lifecycle ---
+
+    async def page_heap_bytes(self, page: Any) -> int:
+        try:
+            return int(await page.evaluate(PAGE_HEAP_SCRIPT) or 0)
+        except Exception:
+            return 0
+
+    async def reap(self) -> None:
+        """Close idle tabs and sessions, and recycle sessions over the memory budget."""
+        now = time.monotonic()
+        async with self._lock:
+            for session in list(self.sessions.values()):
+                if session.active:
+                    continue
+                if now - session.last_used > self.idle_context_seconds:
+                    logger.info("Closing idle browser session %s", session.session_id)
+                    await self.close_session(session.session_id)
+                    continue
+                await self._reap_tabs(session, now)
+                if self.max_heap_mb:
+                    heap = sum([await self.page_heap_bytes(page) for page in session.pages])
+                    if heap > self.max_heap_mb * 1024 * 1024:
+                        await self.recycle(session, reason=f"{heap // (1024 * 1024)}MB JS heap")
+
+    async def _reap_tabs(self, session: BrowserSession, now: float) -> None:
+        current = session.pages[session.current_page_index] if session.pages else None
+        for page in list(session.pages):
+            if page is current or now - session.page_last_used.get(id(page), now) <= self.idle_tab_seconds:
+                continue
+            try:
+                await page.close()
+            except Exception as e:
+                logger.warning("Error closing idle tab in session %s: %s", session.session_id, e)
+            session.pages.remove(page)
+            session.page_last_used.pop(id(page), None)
+            self.closed_tabs += 1
+        if current is not None:
+            session.current_page_index = session.pages.index(current)
+
+    def start_reaper(self, interval: float = 30) -> None:
+        async def loop() -> None:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.reap()
+                except Exception as e:
+                    logger.error("Browser pool reaper failed: %s", e)
+        self._reaper = asyncio.create_task(loop())
+
+    async def close_all(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for session_id in list(self.sessions):
+            await self.close_session(session_id)
+
+    async def metrics(self) -> Dict[str, Any]:
+        sessions = {}
+        for session in list(self.sessions.values()):
+            heaps = [await self.page_heap_bytes(page) for page in session.pages]
+            sessions[session.session_id] = {
+                "pages": len(session.pages),
+                "navigations": session.navigations,
+                "recycles": session.recycles,
+                "active_requests": session.active,
+                "idle_seconds": round(time.monotonic() - session.last_used, 1),
+                "js_heap_mb": round(sum(heaps) / (1024 * 1024), 1),
+                "page_js_heap_mb": [round(h / (1024 * 1024), 1) for h in heaps],
+            }
+        return {
+            "contexts": len(self.sessions),
+            "pages": sum(len(s.pages) for s in self.sessions.values()),
+            "closed_tabs": self.closed_tabs,
+            "closed_sessions": self.closed_sessions,
+            "blocked_requests": self.blocking_policy.blocked,
+            "sessions": sessions,
+        }
@@ -0,0 +1,279 @@
+"""
+Cached page-to-markdown extraction for the browser automation service.
+
+Pages are converted to cleaned markdown inside the browser, one top-level
+block of the main content at a time. Scripts, styles, navigation, footers,
+asides, form controls and hidden elements are dropped. Each block is
+fingerprinted by a 64-bit hash of its HTML. The page's DOM hash is the hash of its
+block fingerprints.
+
+- Extractions are cached per (browser session, URL, DOM hash) in a
+  byte-bounded LRU, and each block's markdown is cached per (browser
+  session, fingerprint).
+- Re-extracting a page sends the fingerprints already cached for its URL to
+  the page script. The script converts only blocks that are new or changed,
+  so after an in-page interaction only the changed subtrees are converted and
+  transferred.
+- ``latest(url, session_id)`` serves a session's last extraction of a URL.
+  ``/automation/page_content`` uses it to give the scrape tool pages its
+  thread's browser session has already loaded; sessions never see each
+  other's pages.
+"""
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+from urllib.parse import urldefrag
+
+V = TypeVar("V")
+
+MAX_TRACKED_URLS = 1024
+
+EXTRACT_SCRIPT = r"""
+({ known }) => {
+    const knownHashes = new Set(known);
+    const SKIP = new Set(['SCRIPT', 'STYLE', 'NOSCRIPT', 'TEMPLATE', 'SVG', 'CANVAS', 'IFRAME', 'OBJECT', 'EMBED',
+        'VIDEO', 'AUDIO', 'NAV', 'FOOTER', 'ASIDE', 'BUTTON', 'SELECT', 'INPUT', 'TEXTAREA', 'DIALOG']);
+    const BLOCK = new Set(['P', 'DIV', 'SECTION', 'ARTICLE', 'MAIN', 'HEADER', 'FIGURE', 'FIGCAPTION', 'DL', 'DT',
+        'DD', 'DETAILS', 'SUMMARY', 'ADDRESS', 'FORM', 'FIELDSET', 'CENTER']);
+
+    // 64-bit hash from two 32-bit lanes (FNV-1a and a multiplicative lane), mixed at the end
+    const hash64 = (text) => {
+        let h1 = 0x811c9dc5, h2 = 0x41c6ce57;
+        for (let i = 0; i < text.length; i++) {
+            const c = text.charCodeAt(i);
+            h1 = Math.imul(h1 ^ c, 0x01000193);
+            h2 = Math.imul(h2 ^ c, 0x5f356495);
+        }
+        h1 = Math.imul(h1 ^ (h1 >>> 16), 0x85ebca6b) ^ Math.imul(h2 ^ (h2 >>> 13), 0xc2b2ae35);
+        h2 = Math.imul(h2 ^ (h2 >>> 16), 0x85ebca6b) ^ Math.imul(h1 ^ (h1 >>> 13), 0xc2b2ae35);
+        return (h1 >>> 0).toString(16).padStart(8, '0') + (h2 >>> 0).toString(16).padStart(8, '0');
+    };
+    const skipped = (el) => SKIP.has(el.tagName.toUpperCase()) || el.hidden || el.getAttribute('aria-hidden') === 'true';
+    const invisible = (el) => {
+        const style = window.getComputedStyle(el);
+        return style.display === 'none' || style.visibility === 'hidden';
+    };
+
+    const inline = (el) => children(el).replace(/\s+/g, ' ').trim();
+    const children = (el) => Array.from(el.childNodes).map(convert).join('');
+    const convert = (node) => {
+        if (node.nodeType === Node.TEXT_NODE) return node.textContent.replace(/\s+/g, ' ');
+        if (node.nodeType !== Node.ELEMENT_NODE || skipped(node)) return '';
+        const tag = node.tagName.toUpperCase();
+        if (BLOCK.has(tag) && invisible(node)) return '';
+        if (/^H[1-6]$/.test(tag)) {
+            const text = inline(node);
+            return text ? `\n\n${'#'.repeat(Number(tag[1]))} ${text}\n\n` : '';
+        }
+        switch (tag) {
+            case 'BR': return '\n';
+            case 'HR': return '\n\n---\n\n';
+            case 'A': {
+                const text = inline(node);
+                const href = node.getAttribute('href') && node.href;
+                return text && href && !href.startsWith('javascript:') ? `[${text}](${href})` : text;
+            }
+            case 'STRONG': case 'B': { const text = inline(node); return text ? `**${text}**` : ''; }
+            case 'EM': case 'I': { const text = inline(node); return text ? `*${text}*` : ''; }
+            case 'CODE': return `\`${node.textContent}\``;
+            case 'PRE': return `\n\n\`\`\`\n${node.textContent.replace(/\n+$/, '')}\n\`\`\`\n\n`;
+            case 'IMG': { const alt = (node.getAttribute('alt') || '').trim(); return alt ? `![${alt}](${node.src})` : ''; }
+            case 'BLOCKQUOTE':
+                return '\n\n' + children(node).trim().split('\n').map(line => `> ${line}`).join('\n') + '\n\n';
+            case 'UL': case 'OL': {
+                const items = Array.from(node.children).filter(li => li.tagName.toUpperCase() === 'LI' && !skipped(li));
+                const lines = items.map((li, i) => {
+                    const marker = tag === 'OL' ? `${i + 1}.` : '-';
+                    const body = children(li).trim().replace(/\n{2,}/g, '\n').replace(/\n/g, '\n   ');
+                    return body ? `${marker} ${body}` : '';
+                }).filter(Boolean);
+                return lines.length ? `\n\n${lines.join('\n')}\n\n` : '';
+            }
+            case 'TABLE': {
+                const rows = Array.from(node.rows).map(row =>
+                    '| ' + Array.from(row.cells).map(cell => inline(cell).replace(/\|/g, '\\|')).join(' | ') + ' |');
+                if (!rows.length) return '';
+                const columns = node.rows[0].cells.length;
+                rows.splice(1, 0, '|' + ' --- |'.repeat(columns));
+                return `\n\n${rows.join('\n')}\n\n`;
+            }
+        }
+        const text = children(node);
+        return BLOCK.has(tag) || tag === 'LI' ? `\n\n${text}\n\n` : text;
+    };
+    const tidy = (markdown) => markdown.split('\n').map(line => line.replace(/[ \t]+$/, '')).join('\n')
+        .replace(/\n{3,}/g, '\n\n').trim();
+
+    // Main content root; single-child wrappers are unwrapped so blocks stay small
+    let root = document.querySelector('main, [role="main"]') || document.body;
+    if (!root) return { url: location.href, title: document.title, blocks: [] };
+    while (root.children.length === 1 && !skipped(root.children[0]) && root.children[0].children.length) {
+        root = root.children[0];
+    }
+    const blocks = [];
+    let loose = '';
+    const flushLoose = () => {
+        const text = loose.replace(/\s+/g, ' ').trim();
+        if (text) {
+            const hash = hash64('#text' + text);
+            blocks.push(knownHashes.has(hash) ? { hash } : { hash, markdown: text });
+        }
+        loose = '';
+    };
+    for (const node of root.childNodes) {
+        if (node.nodeType === Node.TEXT_NODE) { loose += node.textContent; continue; }
+        if (node.nodeType !== Node.ELEMENT_NODE || skipped(node)) continue;
+        flushLoose();
+        const hash = hash64(node.outerHTML);
+        blocks.push(knownHashes.has(hash) ? { hash } : { hash, markdown: tidy(convert(node)) });
+    }
+    flushLoose();
+    return { url: location.href, title: document.title, blocks };
+}
+"""
+
+
+def normalize_url(url: str) -> str:
+    """``url`` without its fragment or a trailing slash."""
+    return urldefrag(url)[0].rstrip("/")
+
+
+class ByteLRU(Generic[V]):
+    """LRU of values bounded by their total size."""
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[V], int]):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._sizeof = sizeof
+        self._entries: "OrderedDict[Any, Tuple[V, int]]" = OrderedDict()
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Any) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Any, value: V) -> None:
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.size -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= evicted
+
+
+@dataclass
+class ExtractedPage:
+    """Markdown of a page at one DOM state."""
+
+    url: str
+    title: str
+    dom_hash: str
+    markdown: str
+    block_hashes: List[str]
+    extracted_at: float
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.extracted_at
+
+
+class PageExtractor:
+    """Extracts page markdown, reusing cached pages and blocks."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        # Half the budget for whole pages, half for blocks
+        self.pages: ByteLRU[ExtractedPage] = ByteLRU(max_bytes // 2, lambda page: len(page.markdown) + 64 * len(page.block_hashes))
+        self.blocks: ByteLRU[str] = ByteLRU(max_bytes // 2, len)
+        # (session, URL) -> DOM hash of its most recent extraction
+        self._latest: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.reused_blocks = 0
+        self.converted_blocks = 0
+
+    @classmethod
+    def from_env(cls) -> "PageExtractor":
+        try:
+            max_mb = int(os.environ.get("BROWSER_EXTRACT_CACHE_MB", 64))
+        except ValueError:
+            max_mb = 64
+        return cls(max_bytes=max_mb * 1024 * 1024)
+
+    def latest(self, url: str, session_id: str) -> Optional[ExtractedPage]:
+        """The session's most recent cached extraction of ``url``, if still cached."""
+        url = normalize_url(url)
+        dom_hash = self._latest.get((session_id, url))
+        return self.pages.get((session_id, url, dom_hash)) if dom_hash else None
+
+    async def extract(self, page: Any, session_id: str) -> Tuple[ExtractedPage, bool]:
+        """Markdown of the page's current DOM, and whether the whole page came from the session's cache."""
+        previous = self.latest(page.url, session_id)
+        known = [h for h in previous.block_hashes if (session_id, h) in self.blocks] if previous else []
+        while True:
+            result = await page.evaluate(EXTRACT_SCRIPT, {"known": known})
+            url = normalize_url(result["url"])
+            hashes = [block["hash"] for block in result["blocks"]]
+            dom_hash = hashlib.sha1("".join(hashes).encode()).hexdigest()[:16]
+            cached = self.pages.get((session_id, url, dom_hash))
+            if cached is not None:
+                self.hits += 1
+                self._remember(session_id, url, dom_hash)
+                return cached, True
+
+            parts = [block.get("markdown", self.blocks.get((session_id, block["hash"]))) for block in result["blocks"]]
+            if None not in parts or not known:
+                break
+            # Blocks were evicted while the script ran; convert the page in full
+            known = []
+
+        self.misses += 1
+        for block in result["blocks"]:
+            if "markdown" in block:
+                self.converted_blocks += 1
+                self.blocks.put((session_id, block["hash"]), block["markdown"])
+            else:
+                self.reused_blocks += 1
+        extracted = ExtractedPage(
+            url=url,
+            title=result.get("title", ""),
+            dom_hash=dom_hash,
+            markdown="\n\n".join(part for part in parts if part),
+            block_hashes=hashes,
+            extracted_at=time.time(),
+        )
+        self.pages.put((session_id, url, dom_hash), extracted)
+        self._remember(session_id, url, dom_hash)
+        return extracted, False
+
+    def _remember(self, session_id: str, url: str, dom_hash: str) -> None:
+        self._latest[(session_id, url)] = dom_hash
+        self._latest.move_to_end((session_id, url))
+        while len(self._latest) > MAX_TRACKED_URLS:
+            self._latest.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached_pages": len(self.pages),
+            "cached_blocks": len(self.blocks),
+            "cache_bytes": self.pages.size + self.blocks.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reused_blocks": self.reused_blocks,
+            "converted_blocks": self.converted_blocks,
+        }
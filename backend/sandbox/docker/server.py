@@ -1,11 +1,354 @@
+"""
+Static server for the sandbox workspace (website preview on port 8080).
+
+Agent-built sites in /workspace are previewed through this server. By default
+it runs in preview mode, tuned for serving:
+
+- no auto-reloader (it re-scanned the workspace for changes and burned CPU)
+- ETag / Last-Modified validators with 304 responses, and ``Cache-Control: no-cache``
+  so browsers revalidate cheaply and still see edits right away
+- gzip or brotli (when the ``brotli`` package is installed) for text assets;
+  compressed bodies are cached on disk, keyed by path, mtime and size, and get
+  their own ETags (``"...-gz"``, ``"...-br"``)
+- single byte ranges (206/416) for audio and video seeking
+- an in-memory LRU of hot small files and their compressed bodies
+
+Set ``PREVIEW_SERVER_DEV=1`` to get the previous behavior (StaticFiles with
+auto-reload) for working on this server itself.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import stat
+import tempfile
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, Optional, Set, Tuple
+
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.base import BaseHTTPMiddleware
 import uvicorn
-import os
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
 
 # Ensure we're serving from the /workspace directory
-workspace_dir = "/workspace"
+workspace_dir = os.environ.get("PREVIEW_WORKSPACE_DIR", "/workspace")
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/json", "application/xml",
+    "application/wasm", "image/svg+xml", "application/manifest+json",
+)
+MIN_COMPRESS_SIZE = 1024
+# ETag suffixes of compressed representations (a strong ETag names one exact body)
+ETAG_SUFFIXES = {"gzip": "-gz", "br": "-br"}
+CHUNK_SIZE = 64 * 1024
+
+
+class LRUCache:
+    """Byte-bounded LRU of response bodies."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[Tuple, bytes]" = OrderedDict()
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+        return body
+
+    def put(self, key: Tuple, body: bytes) -> None:
+        if len(body) > self.max_bytes or key in self._entries:
+            return
+        self._entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """First-to-last byte (inclusive) of a single ``bytes=`` range; None if absent or multi-range.
+
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[6:].strip().partition("-")
+    try:
+        if not start_text:  # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError(header)
+            return max(size - length, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None  # Malformed ranges are ignored, not errors
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, min(end, size - 1)
+
+
+class PreviewFiles:
+    """ASGI app serving a directory with validators, compression, ranges and an LRU."""
+
+    def __init__(
+        self,
+        directory: str,
+        html: bool = True,
+        cache_max_bytes: int = 32 * 1024 * 1024,
+        cache_max_file_bytes: int = 512 * 1024,
+        compressed_dir: Optional[str] = None,
+    ):
+        self.directory = os.path.realpath(directory)
+        self.html = html
+        self.cache = LRUCache(cache_max_bytes)
+        self.cache_max_file_bytes = cache_max_file_bytes
+        self.compressed_dir = compressed_dir or os.path.join(tempfile.gettempdir(), "preview-compressed")
+        os.makedirs(self.compressed_dir, exist_ok=True)
+        # Path digest -> names of its cached compressed bodies, so misses need no directory listing
+        self._compressed_index: Dict[str, Set[str]] = {}
+        for name in os.listdir(self.compressed_dir):
+            if not name.startswith("."):
+                self._compressed_index.setdefault(name.split("-", 1)[0], set()).add(name)
+        self._compressed_lock = threading.Lock()
+
+    # --- Path resolution ---
+
+    def _stat(self, path: str) -> Optional[os.stat_result]:
+        try:
+            return os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def resolve(self, url_path: str) -> Tuple[Optional[str], Optional[os.stat_result], int]:
+        """File to serve for a URL path: (path, stat, status).
+
+        Directories serve index.html, or 307 (no path) when the URL lacks the trailing slash
+        relative links need; misses serve 404.html.
+        """
+        relative = os.path.normpath(url_path.lstrip("/")) if url_path.strip("/") else ""
+        if relative.startswith(".."):
+            return None, None, 404
+        path = os.path.realpath(os.path.join(self.directory, relative))
+        if path != self.directory and not path.startswith(self.directory + os.sep):
+            return None, None, 404
+        st = self._stat(path)
+        if st is not None and stat.S_ISDIR(st.st_mode) and self.html:
+            if not url_path.endswith("/"):
+                return None, None, 307
+            path = os.path.join(path, "index.html")
+            st = self._stat(path)
+        if st is not None and stat.S_ISREG(st.st_mode):
+            return path, st, 200
+        if not os.path.isdir(self.directory):
+            # The agent may delete the workspace; recreate it only when a lookup misses
+            os.makedirs(self.directory, exist_ok=True)
+        if self.html:
+            not_found = os.path.join(self.directory, "404.html")
+            st = self._stat(not_found)
+            if st is not None and stat.S_ISREG(st.st_mode):
+                return not_found, st, 404
+        return None, None, 404
+
+    # --- Bodies ---
+
+    async def _body(self, path: str, st: os.stat_result) -> Optional[bytes]:
+        """Whole file from the LRU (small files only); None for files that should be streamed."""
+        if st.st_size > self.cache_max_file_bytes:
+            return None
+        key = (path, st.st_mtime_ns, st.st_size, "identity")
+        body = self.cache.get(key)
+        if body is None:
+            body = await asyncio.to_thread(_read, path)
+            self.cache.put(key, body)
+        return body
+
+    def _compress_blocking(self, path: str, st: os.stat_result, encoding: str) -> bytes:
+        digest = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        version = f"{digest}-{st.st_mtime_ns}-{st.st_size}."
+        cached_name = f"{version}{encoding}"
+        cached_path = os.path.join(self.compressed_dir, cached_name)
+        try:
+            return _read(cached_path)
+        except FileNotFoundError:
+            pass
+        data = _read(path)
+        compressed = brotli.compress(data, quality=5) if encoding == "br" else gzip.compress(data, compresslevel=6, mtime=0)
+        _write_atomic(cached_path, compressed)
+        with self._compressed_lock:
+            names = self._compressed_index.setdefault(digest, set())
+            # Drop bodies for older versions of this file
+            stale = {name for name in names if not name.startswith(version)}
+            names -= stale
+            names.add(cached_name)
+        for name in stale:
+            try:
+                os.unlink(os.path.join(self.compressed_dir, name))
+            except FileNotFoundError:
+                pass
+        return compressed
+
+    async def _compressed(self, path: str, st: os.stat_result, encoding: str) -> bytes:
+        key = (path, st.st_mtime_ns, st.st_size, encoding)
+        body = self.cache.get(key)
+        if body is None:
+            body = await asyncio.to_thread(self._compress_blocking, path, st, encoding)
+            if len(body) <= self.cache_max_file_bytes:
+                self.cache.put(key, body)
+        return body
+
+    @staticmethod
+    def choose_encoding(accept_encoding: str, content_type: str, size: int) -> Optional[str]:
+        if size < MIN_COMPRESS_SIZE or not content_type.startswith(COMPRESSIBLE_TYPES):
+            return None
+        offered = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+        if brotli is not None and "br" in offered:
+            return "br"
+        if "gzip" in offered:
+            return "gzip"
+        return None
+
+    # --- HTTP ---
+
+    @staticmethod
+    def etag_for(st: os.stat_result, encoding: Optional[str] = None) -> str:
+        """Strong ETag of the file's representation in ``encoding`` (None for the file as is)."""
+        return f'"{st.st_mtime_ns:x}-{st.st_size:x}{ETAG_SUFFIXES.get(encoding, "")}"'
+
+    @staticmethod
+    def not_modified(headers: Dict[str, str], etag: str, st: os.stat_result) -> bool:
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            return if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(st.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return
+        method = scope["method"]
+        if method not in ("GET", "HEAD"):
+            await self._send(send, 405, [(b"allow", b"GET, HEAD")], b"Method Not Allowed")
+            return
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        path, st, status = self.resolve(scope["path"])
+        if status == 307:
+            location = (scope.get("raw_path") or scope["path"].encode("utf-8")) + b"/"
+            if scope.get("query_string"):
+                location += b"?" + scope["query_string"]
+            await self._send(send, 307, [(b"location", location)], b"", method == "HEAD")
+            return
+        if path is None:
+            await self._send(send, 404, [(b"content-type", b"text/plain; charset=utf-8")], b"Not Found", method == "HEAD")
+            return
+
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        head_only = method == "HEAD"
+        identity_etag = self.etag_for(st)
+        # Ranges address the file as is; anything else may be sent compressed, under its own ETag
+        wants_range = status == 200 and "range" in headers and headers.get("if-range", identity_etag) in (
+            identity_etag, formatdate(st.st_mtime, usegmt=True)
+        )
+        encoding = None if wants_range else self.choose_encoding(headers.get("accept-encoding", ""), content_type, st.st_size)
+        etag = self.etag_for(st, encoding)
+        response_headers: List[Tuple[bytes, bytes]] = [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"etag", etag.encode("latin-1")),
+            (b"last-modified", formatdate(st.st_mtime, usegmt=True).encode("latin-1")),
+            (b"cache-control", b"no-cache"),
+            (b"accept-ranges", b"bytes"),
+            (b"vary", b"Accept-Encoding"),
+        ]
+
+        if status == 200 and self.not_modified(headers, etag, st):
+            await self._send(send, 304, response_headers, b"", True)
+            return
+
+        byte_range = None
+        if wants_range:
+            try:
+                byte_range = parse_range(headers["range"], st.st_size)
+            except ValueError:
+                await self._send(send, 416, response_headers + [(b"content-range", f"bytes */{st.st_size}".encode("latin-1"))], b"", head_only)
+                return
+
+        if byte_range is not None:
+            start, end = byte_range
+            response_headers.append((b"content-range", f"bytes {start}-{end}/{st.st_size}".encode("latin-1")))
+            await self._send_file(send, 206, response_headers, path, st, start, end - start + 1, head_only)
+            return
+
+        if encoding:
+            body = await self._compressed(path, st, encoding)
+            response_headers.append((b"content-encoding", encoding.encode("latin-1")))
+            await self._send(send, status, response_headers, body, head_only)
+            return
+        body = await self._body(path, st)
+        if body is not None:
+            await self._send(send, status, response_headers, body, head_only)
+        else:
+            await self._send_file(send, status, response_headers, path, st, 0, st.st_size, head_only)
+
+    @staticmethod
+    async def _send(send, status: int, headers: List[Tuple[bytes, bytes]], body: bytes, head_only: bool = False) -> None:
+        headers = headers + [(b"content-length", str(len(body)).encode("latin-1"))] if status != 304 else headers
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if head_only else body})
+
+    @staticmethod
+    async def _send_file(send, status: int, headers: List[Tuple[bytes, bytes]], path: str, st: os.stat_result,
+                         offset: int, length: int, head_only: bool) -> None:
+        await send({"type": "http.response.start", "status": status,
+                    "headers": headers + [(b"content-length", str(length).encode("latin-1"))]})
+        if head_only or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        f = await asyncio.to_thread(open, path, "rb")
+        try:
+            await asyncio.to_thread(f.seek, offset)
+            remaining = length
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:  # File shrank while streaming
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await asyncio.to_thread(f.close)
+
 
 class WorkspaceDirMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
@@ -15,15 +358,24 @@ class WorkspaceDirMiddleware(BaseHTTPMiddleware):
             os.makedirs(workspace_dir, exist_ok=True)
         return await call_next(request)
 
+
+DEV_MODE = os.environ.get("PREVIEW_SERVER_DEV", "").lower() in ("1", "true", "yes")
+
 app = FastAPI()
-app.add_middleware(WorkspaceDirMiddleware)
 
 # Initial directory creation
 os.makedirs(workspace_dir, exist_ok=True)
-app.mount('/', StaticFiles(directory=workspace_dir, html=True), name='site')
+if DEV_MODE:
+    app.add_middleware(WorkspaceDirMiddleware)
+    app.mount('/', StaticFiles(directory=workspace_dir, html=True), name='site')
+else:
+    app.mount('/', PreviewFiles(directory=workspace_dir, html=True), name='site')
 
 # This is needed for the import string approach with uvicorn
 if __name__ == '__main__':
-    print(f"Starting server with auto-reload, serving files from: {workspace_dir}")
-    # Don't use reload directly in the run call
-    uvicorn.run("server:app", host="0.0.0.0", port=8080, reload=True) 
\ No newline at end of file
+    if DEV_MODE:
+        print(f"Starting server with auto-reload, serving files from: {workspace_dir}")
+        uvicorn.run("server:app", host="0.0.0.0", port=8080, reload=True)
+    else:
+        print(f"Starting preview server, serving files from: {workspace_dir}")
+        uvicorn.run(app, host="0.0.0.0", port=8080, access_log=False)
@@ -1,8 +1,10 @@
-import docker
 import uuid
 import os
 from utils.logger import logger
 from utils.config import config
+from utils.lazy_imports import lazy_import, lazy_object
+
+docker = lazy_import("docker")
 
 class LocalSandbox:
     def __init__(self):
@@ -219,5 +221,5 @@ class LocalSandbox:
             'ports': container.ports
         }
 
-# Instancia global
-local_sandbox = LocalSandbox()
+# Instancia global (el cliente de Docker se crea en el primer uso)
+local_sandbox = lazy_object(LocalSandbox)
@@ -1,13 +1,32 @@
-from daytona_sdk import Daytona, DaytonaConfig, CreateSandboxParams, Sandbox, SessionExecuteRequest
-from daytona_api_client.models.workspace_state import WorkspaceState
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 from utils.logger import logger
 from utils.config import config
 from utils.config import Configuration
+from utils.lazy_imports import lazy_object
 from sandbox.local_sandbox import local_sandbox
 
+if TYPE_CHECKING:
+    from daytona_sdk import Sandbox
+
 load_dotenv()
 
+# Daytona SDK names re-exported by this module; the SDK is only imported when one is first used
+_DAYTONA_EXPORTS = {
+    "Daytona": "daytona_sdk",
+    "DaytonaConfig": "daytona_sdk",
+    "CreateSandboxParams": "daytona_sdk",
+    "Sandbox": "daytona_sdk",
+    "SessionExecuteRequest": "daytona_sdk",
+    "WorkspaceState": "daytona_api_client.models.workspace_state",
+}
+
+def __getattr__(name):
+    if name in _DAYTONA_EXPORTS:
+        import importlib
+        return getattr(importlib.import_module(_DAYTONA_EXPORTS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # Conditional Daytona Client Initialization
 daytona = None # Initialize module-level 'daytona' client as None
 
@@ -27,17 +46,23 @@ if use_daytona():
         )
         # 'daytona' remains None
     else:
-        try:
-            daytona_config = DaytonaConfig(
-                api_key=config.DAYTONA_API_KEY,
-                server_url=config.DAYTONA_SERVER_URL,
-                target=config.DAYTONA_TARGET
-            )
-            daytona = Daytona(daytona_config) # Assign to the module-level 'daytona'
-            logger.debug("Daytona client initialized")
-        except Exception as e:
-            logger.error(f"Failed to initialize Daytona client even though use_daytona() was true and target seemed valid: {e}")
-            # daytona remains None
+        def _create_daytona_client():
+            # The Daytona SDK is slow to import; it is loaded with the first sandbox operation
+            from daytona_sdk import Daytona, DaytonaConfig
+            try:
+                daytona_config = DaytonaConfig(
+                    api_key=config.DAYTONA_API_KEY,
+                    server_url=config.DAYTONA_SERVER_URL,
+                    target=config.DAYTONA_TARGET
+                )
+                client = Daytona(daytona_config)
+                logger.debug("Daytona client initialized")
+                return client
+            except Exception as e:
+                logger.error(f"Failed to initialize Daytona client even though use_daytona() was true and target seemed valid: {e}")
+                raise
+
+        daytona = lazy_object(_create_daytona_client) # Assign to the module-level 'daytona'
 else:
     logger.debug(
         "Daytona mode disabled (DAYTONA_API_KEY, DAYTONA_SERVER_URL, or DAYTONA_TARGET not set, empty, or invalid). "
@@ -51,6 +76,7 @@ async def get_or_start_sandbox(sandbox_id: str):
 
     if use_daytona():
         logger.info("Using Daytona for sandbox operations")
+        from daytona_api_client.models.workspace_state import WorkspaceState
         try:
             sandbox = daytona.get_current_sandbox(sandbox_id)
 
@@ -97,8 +123,9 @@ async def get_or_start_sandbox(sandbox_id: str):
             logger.error(f"Error with local sandbox operations for {sandbox_id}: {str(e)}")
             raise e
 
-def start_supervisord_session(sandbox: Sandbox):
+def start_supervisord_session(sandbox: "Sandbox"):
     """Start supervisord in a session."""
+    from daytona_sdk import SessionExecuteRequest
     session_id = "supervisord-session"
     try:
         logger.info(f"Creating session {session_id} for supervisord")
@@ -114,8 +141,9 @@ def start_supervisord_session(sandbox: Sandbox):
         logger.error(f"Error starting supervisord session: {str(e)}")
         raise e
 
-def setup_visualization_environment(sandbox: Sandbox):
+def setup_visualization_environment(sandbox: "Sandbox"):
     """Set up the visualization environment in the sandbox."""
+    from daytona_sdk import SessionExecuteRequest
     session_id = "viz_setup_session"
     try:
         logger.info(f"Setting up visualization environment for sandbox {sandbox.id}")
@@ -179,6 +207,7 @@ def create_sandbox(password: str, project_id: str = None):
             logger.debug(f"Using project_id as label for Daytona sandbox: {project_id}")
             labels = {'id': project_id}
 
+        from daytona_sdk import CreateSandboxParams
         params = CreateSandboxParams(
             image=Configuration.SANDBOX_IMAGE_NAME, # Assuming Configuration.SANDBOX_IMAGE_NAME is also relevant for Daytona
             public=True,
@@ -1,17 +1,20 @@
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
 from agentpress.thread_manager import ThreadManager
 from agentpress.tool import Tool
-from daytona_sdk import Sandbox
 from sandbox.sandbox import get_or_start_sandbox
 from utils.logger import logger
 from utils.files_utils import clean_path
+from utils.tracing import traced
 import json # Added for JSON parsing
 import asyncio # Added for asyncio.to_thread
 from typing import Dict, Any, Optional # Added for type hints
 # from daytona_api_client.models import SessionExecuteRequest # If using daytona_sdk directly for types - keep commented for now
 # from sandbox.sandbox import use_daytona # To check which sandbox type is active - keep commented for now
 
+if TYPE_CHECKING:
+    from daytona_sdk import Sandbox
+
 
 class SandboxToolsBase(Tool):
     """Base class for all sandbox tools that provides project-based sandbox access."""
@@ -28,7 +31,7 @@ class SandboxToolsBase(Tool):
         self._sandbox_id = None
         self._sandbox_pass = None
 
-    async def _ensure_sandbox(self) -> Sandbox:
+    async def _ensure_sandbox(self) -> "Sandbox":
         """Ensure we have a valid sandbox instance, retrieving it from the project if needed."""
         if self._sandbox is None:
             try:
@@ -74,7 +77,7 @@ class SandboxToolsBase(Tool):
         return self._sandbox
 
     @property
-    def sandbox(self) -> Sandbox:
+    def sandbox(self) -> "Sandbox":
         """Get the sandbox instance, ensuring it exists."""
         if self._sandbox is None:
             raise RuntimeError("Sandbox not initialized. Call _ensure_sandbox() first.")
@@ -93,6 +96,7 @@ class SandboxToolsBase(Tool):
         logger.debug(f"Cleaned path: {path} -> {cleaned_path}")
         return cleaned_path
 
+    @traced("sandbox_exec")
     async def _execute_in_sandbox(
         self,
         command: str,
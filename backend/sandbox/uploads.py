@@ -0,0 +1,237 @@
+"""
+Concurrent file uploads into a sandbox.
+
+Upload sources are file objects (``UploadFile.file``, which Starlette spools
+to disk above 1MB, or ``spool_chunks`` for raw request streams), so request
+bodies are never held whole in memory while they wait. A file's content is
+only read when its upload starts, in a worker thread, because the sandbox
+SDK's ``fs.upload_file`` is blocking and takes bytes.
+
+``SandboxUploader`` sends files in parallel, bounded by a semaphore
+(SANDBOX_UPLOAD_CONCURRENCY). When a batch has many small files, they are
+packed into a single tar archive: one upload plus one ``tar -x`` in the
+sandbox replaces a round trip per file. If packing fails, those files are
+uploaded one by one. Every file reports progress through an optional
+``on_progress`` callback.
+"""
+
+import asyncio
+import inspect
+import os
+import shlex
+import tarfile
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, BinaryIO, Callable, List, Optional
+
+from fastapi import HTTPException
+
+from utils.config import config
+from utils.logger import logger
+
+UPLOADED = "uploaded"
+FAILED = "failed"
+
+
+@dataclass
+class UploadItem:
+    """A file to write to ``target_path`` in the sandbox."""
+    target_path: str
+    source: BinaryIO
+    size: int
+
+
+@dataclass
+class UploadProgress:
+    """Outcome of one file's upload."""
+    path: str
+    size: int
+    status: str
+    packed: bool = False
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {"path": self.path, "size": self.size, "status": self.status, "packed": self.packed, "error": self.error}
+
+
+def _size_of(source: BinaryIO) -> int:
+    position = source.tell()
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(position)
+    return size
+
+
+def item_from_file(source: BinaryIO, target_path: str) -> UploadItem:
+    """Upload item for an already spooled file object (e.g. ``UploadFile.file``)."""
+    return UploadItem(target_path=target_path, source=source, size=_size_of(source))
+
+
+async def spool_chunks(
+    chunks: AsyncIterator[bytes], max_memory: Optional[int] = None, max_bytes: Optional[int] = None
+) -> BinaryIO:
+    """Copy a byte stream into a temporary file that stays in memory up to ``max_memory`` bytes.
+
+    Raises:
+        HTTPException: 413 once the stream exceeds ``max_bytes`` (default SANDBOX_UPLOAD_MAX_BYTES)
+    """
+    max_memory = max_memory or config.SANDBOX_UPLOAD_SPOOL_MAX_MEMORY
+    max_bytes = max_bytes or config.SANDBOX_UPLOAD_MAX_BYTES
+    spool = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    try:
+        async for chunk in chunks:
+            if spool.tell() + len(chunk) > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File size exceeds {max_bytes // (1024 * 1024)}MB limit")
+            # In-memory writes are cheap; once the spool is on disk, write from a thread
+            if spool.tell() + len(chunk) <= max_memory:
+                spool.write(chunk)
+            else:
+                await asyncio.to_thread(spool.write, chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def _read_all(source: BinaryIO) -> bytes:
+    source.seek(0)
+    return source.read()
+
+
+def _build_tar(items: List[UploadItem]) -> BinaryIO:
+    archive = tempfile.SpooledTemporaryFile(max_size=config.SANDBOX_UPLOAD_SPOOL_MAX_MEMORY)
+    now = time.time()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        for item in items:
+            info = tarfile.TarInfo(name=item.target_path.lstrip("/"))
+            info.size = item.size
+            info.mtime = now
+            info.mode = 0o644
+            item.source.seek(0)
+            tar.addfile(info, item.source)
+    archive.seek(0)
+    return archive
+
+
+class SandboxUploader:
+    """Uploads batches of files into one sandbox."""
+
+    def __init__(
+        self,
+        sandbox: Any,
+        concurrency: Optional[int] = None,
+        pack_min_files: Optional[int] = None,
+        pack_max_file_bytes: Optional[int] = None,
+    ):
+        """
+        Args:
+            sandbox: Sandbox exposing ``fs.upload_file`` (and ``process.exec`` for packed uploads)
+            concurrency: Uploads in flight at once
+            pack_min_files: Small files needed in a batch before they are packed into a tar (0 disables packing)
+            pack_max_file_bytes: Files up to this size are packing candidates
+        """
+        self.sandbox = sandbox
+        self.concurrency = concurrency or config.SANDBOX_UPLOAD_CONCURRENCY
+        self.pack_min_files = config.SANDBOX_UPLOAD_PACK_MIN_FILES if pack_min_files is None else pack_min_files
+        self.pack_max_file_bytes = pack_max_file_bytes or config.SANDBOX_UPLOAD_PACK_MAX_FILE_BYTES
+
+    async def _report(self, on_progress: Optional[Callable[[UploadProgress], Any]], progress: UploadProgress) -> None:
+        if on_progress is None:
+            return
+        try:
+            result = on_progress(progress)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.warning("Upload progress callback failed for %s: %s", progress.path, e)
+
+    def _upload_blocking(self, item: UploadItem) -> None:
+        self.sandbox.fs.upload_file(item.target_path, _read_all(item.source))
+
+    async def _upload_one(self, item: UploadItem, semaphore: asyncio.Semaphore, on_progress) -> UploadProgress:
+        async with semaphore:
+            try:
+                await asyncio.to_thread(self._upload_blocking, item)
+                progress = UploadProgress(item.target_path, item.size, UPLOADED)
+            except Exception as e:
+                logger.error(f"Error uploading {item.target_path} to sandbox: {str(e)}")
+                progress = UploadProgress(item.target_path, item.size, FAILED, error=str(e))
+        await self._report(on_progress, progress)
+        return progress
+
+    def _upload_packed_blocking(self, items: List[UploadItem]) -> None:
+        archive = _build_tar(items)
+        archive_path = f"/tmp/.upload-{uuid.uuid4().hex}.tar"
+        try:
+            self.sandbox.fs.upload_file(archive_path, _read_all(archive))
+        finally:
+            archive.close()
+        directories = sorted({os.path.dirname(item.target_path) for item in items})
+        quoted_archive = shlex.quote(archive_path)
+        command = (
+            f"mkdir -p {' '.join(shlex.quote(d) for d in directories)} && "
+            f"tar -xf {quoted_archive} -C / ; status=$? ; rm -f {quoted_archive} ; exit $status"
+        )
+        response = self.sandbox.process.exec(f"sh -c {shlex.quote(command)}", timeout=300)
+        exit_code = getattr(response, "exit_code", 0)
+        if exit_code:
+            raise RuntimeError(f"tar extraction exited with {exit_code}: {getattr(response, 'result', '')}")
+
+    async def _upload_packed(self, items: List[UploadItem], semaphore: asyncio.Semaphore, on_progress) -> List[UploadProgress]:
+        async with semaphore:
+            try:
+                await asyncio.to_thread(self._upload_packed_blocking, items)
+            except Exception as e:
+                logger.warning("Packed upload of %d files failed, uploading them individually: %s", len(items), e)
+                packed_ok = False
+            else:
+                packed_ok = True
+        if not packed_ok:
+            return list(await asyncio.gather(*(self._upload_one(item, semaphore, on_progress) for item in items)))
+        results = []
+        for item in items:
+            progress = UploadProgress(item.target_path, item.size, UPLOADED, packed=True)
+            await self._report(on_progress, progress)
+            results.append(progress)
+        return results
+
+    async def upload(
+        self,
+        items: List[UploadItem],
+        on_progress: Optional[Callable[[UploadProgress], Any]] = None,
+        pack: bool = True,
+    ) -> List[UploadProgress]:
+        """Upload ``items`` and return their results in the same order.
+
+        Args:
+            items: Files to upload
+            on_progress: Called (sync or async) as each file finishes
+            pack: Allow packing small files into one tar archive
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        small = [item for item in items if item.size <= self.pack_max_file_bytes]
+        packable = pack and self.pack_min_files > 0 and len(small) >= self.pack_min_files \
+            and hasattr(getattr(self.sandbox, "process", None), "exec")
+        packed_items = small if packable else []
+        packed_ids = {id(item) for item in packed_items}
+
+        jobs = [self._upload_one(item, semaphore, on_progress) for item in items if id(item) not in packed_ids]
+        if packed_items:
+            jobs.append(self._upload_packed(packed_items, semaphore, on_progress))
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*jobs)
+
+        by_path = {}
+        for outcome in outcomes:
+            for progress in (outcome if isinstance(outcome, list) else [outcome]):
+                by_path[progress.path] = progress
+        results = [by_path[item.target_path] for item in items]
+        logger.info(
+            "Uploaded %d/%d files (%d bytes, %d packed) to sandbox in %.2fs",
+            sum(result.status == UPLOADED for result in results), len(items),
+            sum(item.size for item in items), len(packed_items), time.perf_counter() - started,
+        )
+        return results
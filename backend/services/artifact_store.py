@@ -0,0 +1,309 @@
+"""
+Content-addressed store for large tool outputs.
+
+Scraped pages, shell output and browser states can be hundreds of kilobytes.
+Stored inline in ``messages`` they are re-read by every
+``get_llm_formatted_messages`` call and re-tokenized by context management,
+and identical outputs (repeat scrapes, unchanged browser states) are stored
+again each time. Outputs above ARTIFACT_OFFLOAD_THRESHOLD_BYTES are instead
+written once under their SHA-256 (local directory or S3-compatible bucket),
+and the message keeps a reference with a truncated preview:
+
+    <artifact sha256="..." bytes="183422">
+    ...first ARTIFACT_PREVIEW_CHARS characters...
+    [181422 more bytes not shown]
+    </artifact>
+
+``run_thread`` swaps references back for the full content (``inline_artifacts``)
+when it builds the model's context, so the model still sees complete outputs;
+resolved artifacts are kept in an in-process LRU bounded by bytes. Only tool
+results are expanded, and only with the digests recorded in their message's
+``metadata.artifacts``: a reference typed into any other message stays text.
+Store failures never lose a tool result: the output is kept inline instead.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Collection, Dict, List, Optional, Tuple
+
+from utils.config import config
+from utils.lazy_imports import lazy_import, lazy_object
+from utils.logger import logger
+
+boto3 = lazy_import("boto3")
+
+ARTIFACT_REFERENCE = re.compile(r'<artifact sha256="([0-9a-f]{64})" bytes="(\d+)">\n.*?\n</artifact>', re.DOTALL)
+
+
+class ArtifactNotFoundError(KeyError):
+    """No artifact is stored under the requested digest."""
+
+
+class LocalArtifactBackend:
+    """Artifacts as files under ``root/<first two hex chars>/<digest>``."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _write(self, digest: str, data: bytes) -> None:
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial artifact
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _read(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self._path(digest), "rb") as artifact_file:
+                return artifact_file.read()
+        except FileNotFoundError:
+            return None
+
+    async def exists(self, digest: str) -> bool:
+        return await asyncio.to_thread(os.path.exists, self._path(digest))
+
+    async def put(self, digest: str, data: bytes) -> None:
+        await asyncio.to_thread(self._write, digest, data)
+
+    async def get(self, digest: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._read, digest)
+
+
+class S3ArtifactBackend:
+    """Artifacts as objects ``<prefix><digest>`` in an S3-compatible bucket (AWS, R2, MinIO)."""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = lazy_object(lambda: boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=config.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
+            region_name=config.AWS_REGION_NAME,
+        ))
+
+    def _key(self, digest: str) -> str:
+        return f"{self.prefix}{digest}"
+
+    def _head(self, digest: str) -> bool:
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=self._key(digest))
+            return True
+        except self._client.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def _read(self, digest: str) -> Optional[bytes]:
+        try:
+            return self._client.get_object(Bucket=self.bucket, Key=self._key(digest))["Body"].read()
+        except self._client.exceptions.NoSuchKey:
+            return None
+
+    async def exists(self, digest: str) -> bool:
+        return await asyncio.to_thread(self._head, digest)
+
+    async def put(self, digest: str, data: bytes) -> None:
+        await asyncio.to_thread(
+            self._client.put_object, Bucket=self.bucket, Key=self._key(digest), Body=data, ContentType="text/plain; charset=utf-8",
+        )
+
+    async def get(self, digest: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._read, digest)
+
+
+@dataclass
+class ArtifactMetrics:
+    offloaded: int = 0
+    deduplicated: int = 0
+    bytes_offloaded: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    errors: int = 0
+
+
+class ArtifactStore:
+    """Offloads large tool outputs to a backend and resolves references back to content."""
+
+    def __init__(self, backend, threshold_bytes: int = 16384, preview_chars: int = 2000, cache_max_bytes: int = 64 * 1024 * 1024):
+        self.backend = backend
+        self.threshold_bytes = threshold_bytes
+        self.preview_chars = preview_chars
+        self.cache_max_bytes = cache_max_bytes
+        self.metrics = ArtifactMetrics()
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._cache_bytes = 0
+        # Digests known to be stored, so repeat outputs skip the existence check
+        self._known: "OrderedDict[str, None]" = OrderedDict()
+
+    def _remember(self, digest: str, data: Optional[bytes] = None) -> None:
+        self._known[digest] = None
+        self._known.move_to_end(digest)
+        while len(self._known) > 10000:
+            self._known.popitem(last=False)
+        if data is None or len(data) > self.cache_max_bytes:
+            return
+        if digest not in self._cache:
+            self._cache[digest] = data
+            self._cache_bytes += len(data)
+        self._cache.move_to_end(digest)
+        while self._cache_bytes > self.cache_max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted)
+
+    async def put(self, data: bytes) -> Tuple[str, bool]:
+        """Store ``data`` under its SHA-256. Returns (digest, whether it was already stored)."""
+        digest = hashlib.sha256(data).hexdigest()
+        duplicate = digest in self._known or await self.backend.exists(digest)
+        if not duplicate:
+            await self.backend.put(digest, data)
+        self._remember(digest, data)
+        return digest, duplicate
+
+    async def get(self, digest: str) -> bytes:
+        """Content of an artifact, from the LRU when hot.
+
+        Raises:
+            ArtifactNotFoundError: If nothing is stored under ``digest``
+        """
+        data = self._cache.get(digest)
+        if data is not None:
+            self._cache.move_to_end(digest)
+            self.metrics.cache_hits += 1
+            return data
+        self.metrics.cache_misses += 1
+        data = await self.backend.get(digest)
+        if data is None:
+            raise ArtifactNotFoundError(digest)
+        self._remember(digest, data)
+        return data
+
+    def reference(self, digest: str, text: str, size: int) -> str:
+        preview = text[:self.preview_chars]
+        omitted = size - len(preview.encode("utf-8"))
+        return f'<artifact sha256="{digest}" bytes="{size}">\n{preview}\n[{omitted} more bytes not shown]\n</artifact>'
+
+    async def offload(self, text: str) -> Tuple[str, Optional[str]]:
+        """Replace a large output by an artifact reference.
+
+        Returns:
+            (text to store in the message, artifact digest or None if the text was kept inline)
+        """
+        if not isinstance(text, str):
+            return text, None
+        data = text.encode("utf-8")
+        if len(data) <= self.threshold_bytes:
+            return text, None
+        try:
+            digest, duplicate = await self.put(data)
+        except Exception as e:
+            self.metrics.errors += 1
+            logger.warning("Could not offload %d byte tool output, keeping it inline: %s", len(data), e)
+            return text, None
+        self.metrics.offloaded += 1
+        self.metrics.bytes_offloaded += len(data)
+        if duplicate:
+            self.metrics.deduplicated += 1
+        logger.debug("Offloaded %d byte tool output to artifact %s (duplicate: %s)", len(data), digest, duplicate)
+        return self.reference(digest, text, len(data)), digest
+
+    async def inline(self, text: str, digests: Collection[str]) -> str:
+        """Replace the references to ``digests`` in ``text`` by the artifacts' full content.
+
+        Other references, and those whose artifact cannot be read, are left as they are
+        (the preview stays usable).
+        """
+        if not isinstance(text, str) or "<artifact " not in text:
+            return text
+        parts: List[str] = []
+        position = 0
+        for match in ARTIFACT_REFERENCE.finditer(text):
+            if match.group(1) not in digests:
+                continue
+            parts.append(text[position:match.start()])
+            try:
+                parts.append((await self.get(match.group(1))).decode("utf-8"))
+            except Exception as e:
+                self.metrics.errors += 1
+                logger.warning("Could not resolve artifact %s: %s", match.group(1), e)
+                parts.append(match.group(0))
+            position = match.end()
+        parts.append(text[position:])
+        return "".join(parts)
+
+
+def find_artifact_references(text: str) -> List[str]:
+    """Digests referenced in ``text``."""
+    if not isinstance(text, str):
+        return []
+    return [match.group(1) for match in ARTIFACT_REFERENCE.finditer(text)]
+
+
+def _create_store() -> Optional[ArtifactStore]:
+    backend_name = (config.ARTIFACT_STORE_BACKEND or "none").lower()
+    if backend_name == "local":
+        backend = LocalArtifactBackend(config.ARTIFACT_STORE_PATH)
+    elif backend_name == "s3":
+        if not config.ARTIFACT_S3_BUCKET:
+            logger.warning("ARTIFACT_STORE_BACKEND is s3 but ARTIFACT_S3_BUCKET is not set; tool outputs stay inline")
+            return None
+        backend = S3ArtifactBackend(config.ARTIFACT_S3_BUCKET, config.ARTIFACT_S3_PREFIX, config.ARTIFACT_S3_ENDPOINT_URL)
+    else:
+        return None
+    return ArtifactStore(
+        backend,
+        threshold_bytes=config.ARTIFACT_OFFLOAD_THRESHOLD_BYTES,
+        preview_chars=config.ARTIFACT_PREVIEW_CHARS,
+        cache_max_bytes=config.ARTIFACT_CACHE_MAX_BYTES,
+    )
+
+
+_store: Optional[ArtifactStore] = None
+_store_created = False
+
+
+def get_artifact_store() -> Optional[ArtifactStore]:
+    """The configured store, or None when offloading is disabled."""
+    global _store, _store_created
+    if not _store_created:
+        _store = _create_store()
+        _store_created = True
+    return _store
+
+
+async def offload_tool_output(text: str) -> Tuple[str, Optional[str]]:
+    """``ArtifactStore.offload`` with the configured store; a no-op when offloading is disabled."""
+    store = get_artifact_store()
+    if store is None:
+        return text, None
+    return await store.offload(text)
+
+
+async def inline_artifacts(text: str, digests: Collection[str]) -> str:
+    """``ArtifactStore.inline`` with the configured store; a no-op when offloading is disabled."""
+    store = get_artifact_store()
+    if store is None or not digests:
+        return text
+    return await store.inline(text, digests)
+
+
+def get_artifact_metrics() -> Dict[str, int]:
+    """Offload and cache counters for this process."""
+    store = get_artifact_store()
+    return dict(vars(store.metrics)) if store else {}
@@ -6,16 +6,42 @@ stripe listen --forward-to localhost:8000/api/billing/webhook
 
 from fastapi import APIRouter, HTTPException, Depends, Request
 from typing import Optional, Dict, Tuple
-import stripe
+import asyncio
+import json
+import time
 from datetime import datetime, timezone
 from utils.logger import logger
 from utils.config import config, EnvMode
 from .supabase import DBConnection
+from services import redis
+from services.usage import get_monthly_usage
 from utils.auth_utils import get_current_user_id_from_jwt
 from pydantic import BaseModel
 from utils.constants import MODEL_ACCESS_TIERS, MODEL_NAME_ALIASES
-# Initialize Stripe
-stripe.api_key = config.STRIPE_SECRET_KEY
+from utils.lazy_imports import lazy_import
+
+def _init_stripe(stripe):
+    stripe.api_key = config.STRIPE_SECRET_KEY
+    if config.STRIPE_API_BASE:
+        # Allows pointing the SDK at a local Stripe stub (e.g. stripe-mock) in tests
+        stripe.api_base = config.STRIPE_API_BASE
+
+# Initialize Stripe (the SDK is imported, and configured, on first use)
+stripe = lazy_import("stripe", on_load=_init_stripe)
+
+# Stripe calls made on the request path are bounded by this timeout (seconds)
+STRIPE_TIMEOUT = 10
+
+# Entitlement cache: tier, allowed models and minutes limit per account.
+# Entries younger than ENTITLEMENT_FRESH_TTL are served as-is; older entries are
+# served while a background refresh runs (stale-while-revalidate) and remain usable
+# as a fallback for up to ENTITLEMENT_STALE_TTL if Stripe is unreachable.
+ENTITLEMENT_CACHE_PREFIX = "billing:entitlements:"
+ENTITLEMENT_FRESH_TTL = 300
+ENTITLEMENT_STALE_TTL = 3600 * 24
+
+# In-flight background refreshes, so one stale read does not fan out into many
+_entitlement_refresh_tasks: Dict[str, asyncio.Task] = {}
 
 # Initialize router
 router = APIRouter(prefix="/billing", tags=["billing"])
@@ -86,118 +112,178 @@ async def create_stripe_customer(client, user_id: str, email: str) -> str:
     
     return customer.id
 
-async def get_user_subscription(user_id: str) -> Optional[Dict]:
-    """Get the current subscription for a user from Stripe."""
-    try:
-        # Get customer ID
-        db = DBConnection()
-        client = await db.client
-        customer_id = await get_stripe_customer_id(client, user_id)
+async def fetch_user_subscription(user_id: str) -> Optional[Dict]:
+    """
+    Get the current subscription for a user from Stripe.
+
+    Unlike get_user_subscription, errors (including Stripe timeouts) are raised
+    so callers can tell "no subscription" apart from "Stripe unavailable".
+    """
+    # Get customer ID
+    db = DBConnection()
+    client = await db.client
+    customer_id = await get_stripe_customer_id(client, user_id)
+    
+    if not customer_id:
+        return None
         
-        if not customer_id:
-            return None
-            
-        # Get all active subscriptions for the customer
-        subscriptions = stripe.Subscription.list(
+    # Get all active subscriptions for the customer
+    subscriptions = await asyncio.wait_for(
+        stripe.Subscription.list_async(
             customer=customer_id,
             status='active'
-        )
-        # print("Found subscriptions:", subscriptions)
+        ),
+        timeout=STRIPE_TIMEOUT
+    )
+    
+    # Check if we have any subscriptions
+    if not subscriptions or not subscriptions.get('data'):
+        return None
         
-        # Check if we have any subscriptions
-        if not subscriptions or not subscriptions.get('data'):
-            return None
-            
-        # Filter subscriptions to only include our product's subscriptions
-        our_subscriptions = []
-        for sub in subscriptions['data']:
-            # Get the first subscription item
-            if sub.get('items') and sub['items'].get('data') and len(sub['items']['data']) > 0:
-                item = sub['items']['data'][0]
-                if item.get('price') and item['price'].get('id') in [
-                    config.STRIPE_FREE_TIER_ID,
-                    config.STRIPE_TIER_2_20_ID,
-                    config.STRIPE_TIER_6_50_ID,
-                    config.STRIPE_TIER_12_100_ID,
-                    config.STRIPE_TIER_25_200_ID,
-                    config.STRIPE_TIER_50_400_ID,
-                    config.STRIPE_TIER_125_800_ID,
-                    config.STRIPE_TIER_200_1000_ID
-                ]:
-                    our_subscriptions.append(sub)
-        
-        if not our_subscriptions:
-            return None
-            
-        # If there are multiple active subscriptions, we need to handle this
-        if len(our_subscriptions) > 1:
-            logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
-            
-            # Get the most recent subscription
-            most_recent = max(our_subscriptions, key=lambda x: x['created'])
-            
-            # Cancel all other subscriptions
-            for sub in our_subscriptions:
-                if sub['id'] != most_recent['id']:
-                    try:
-                        stripe.Subscription.modify(
+    # Filter subscriptions to only include our product's subscriptions
+    our_subscriptions = []
+    for sub in subscriptions['data']:
+        # Get the first subscription item
+        if sub.get('items') and sub['items'].get('data') and len(sub['items']['data']) > 0:
+            item = sub['items']['data'][0]
+            if item.get('price') and item['price'].get('id') in SUBSCRIPTION_TIERS:
+                our_subscriptions.append(sub)
+    
+    if not our_subscriptions:
+        return None
+        
+    # If there are multiple active subscriptions, we need to handle this
+    if len(our_subscriptions) > 1:
+        logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
+        
+        # Get the most recent subscription
+        most_recent = max(our_subscriptions, key=lambda x: x['created'])
+        
+        # Cancel all other subscriptions
+        for sub in our_subscriptions:
+            if sub['id'] != most_recent['id']:
+                try:
+                    await asyncio.wait_for(
+                        stripe.Subscription.modify_async(
                             sub['id'],
                             cancel_at_period_end=True
-                        )
-                        logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
-                    except Exception as e:
-                        logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
-            
-            return most_recent
-            
-        return our_subscriptions[0]
+                        ),
+                        timeout=STRIPE_TIMEOUT
+                    )
+                    logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
+                except Exception as e:
+                    logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
+        
+        return most_recent
         
+    return our_subscriptions[0]
+
+async def get_user_subscription(user_id: str) -> Optional[Dict]:
+    """Get the current subscription for a user from Stripe, or None on error."""
+    try:
+        return await fetch_user_subscription(user_id)
     except Exception as e:
         logger.error(f"Error getting subscription from Stripe: {str(e)}")
         return None
 
-async def calculate_monthly_usage(client, user_id: str) -> float:
-    """Calculate total agent run minutes for the current month for a user."""
-    # Get start of current month in UTC
-    now = datetime.now(timezone.utc)
-    start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
-    
-    # First get all threads for this user
-    threads_result = await client.table('threads') \
-        .select('thread_id') \
-        .eq('account_id', user_id) \
-        .execute()
-    
-    if not threads_result.data:
-        return 0.0
-    
-    thread_ids = [t['thread_id'] for t in threads_result.data]
-    
-    # Then get all agent runs for these threads in current month
-    runs_result = await client.table('agent_runs') \
-        .select('started_at, completed_at') \
-        .in_('thread_id', thread_ids) \
-        .gte('started_at', start_of_month.isoformat()) \
-        .execute()
-    
-    if not runs_result.data:
-        return 0.0
-    
-    # Calculate total minutes
-    total_seconds = 0
-    now_ts = now.timestamp()
+def get_subscription_price_id(subscription: Optional[Dict]) -> str:
+    """Extract the price ID from a Stripe subscription, defaulting to the free tier."""
+    if not subscription:
+        return config.STRIPE_FREE_TIER_ID
+    if subscription.get('items') and subscription['items'].get('data') and len(subscription['items']['data']) > 0:
+        return subscription['items']['data'][0]['price']['id']
+    return subscription.get('price_id', config.STRIPE_FREE_TIER_ID)
+
+def build_entitlements(subscription: Optional[Dict]) -> Dict:
+    """Derive the cached entitlement record (tier, allowed models, minutes limit) from a subscription."""
+    price_id = get_subscription_price_id(subscription)
+    tier_info = SUBSCRIPTION_TIERS.get(price_id)
+    if not tier_info:
+        logger.warning(f"Unknown subscription tier: {price_id}, defaulting to free tier")
+        price_id = config.STRIPE_FREE_TIER_ID
+        tier_info = SUBSCRIPTION_TIERS[price_id]
     
-    for run in runs_result.data:
-        start_time = datetime.fromisoformat(run['started_at'].replace('Z', '+00:00')).timestamp()
-        if run['completed_at']:
-            end_time = datetime.fromisoformat(run['completed_at'].replace('Z', '+00:00')).timestamp()
-        else:
-            # For running jobs, use current time
-            end_time = now_ts
-        
-        total_seconds += (end_time - start_time)
+    return {
+        'price_id': price_id,
+        'plan_name': tier_info['name'],
+        'minutes_limit': tier_info['minutes'],
+        'allowed_models': MODEL_ACCESS_TIERS.get(tier_info['name'], MODEL_ACCESS_TIERS['free']),
+        'cached_at': time.time()
+    }
+
+async def _read_cached_entitlements(user_id: str) -> Optional[Dict]:
+    try:
+        cached = await redis.get(f"{ENTITLEMENT_CACHE_PREFIX}{user_id}")
+        return json.loads(cached) if cached else None
+    except Exception as e:
+        logger.warning(f"Failed to read cached entitlements for {user_id}: {str(e)}")
+        return None
+
+async def refresh_entitlements(user_id: str) -> Dict:
+    """Fetch entitlements from Stripe and store them in the cache. Raises if Stripe is unavailable."""
+    subscription = await fetch_user_subscription(user_id)
+    entitlements = build_entitlements(subscription)
+    try:
+        await redis.set(
+            f"{ENTITLEMENT_CACHE_PREFIX}{user_id}",
+            json.dumps(entitlements),
+            ex=ENTITLEMENT_STALE_TTL
+        )
+    except Exception as e:
+        logger.warning(f"Failed to cache entitlements for {user_id}: {str(e)}")
+    return entitlements
+
+async def invalidate_entitlements(user_id: str) -> None:
+    """Drop the cached entitlements for an account so the next read goes to Stripe."""
+    try:
+        await redis.delete(f"{ENTITLEMENT_CACHE_PREFIX}{user_id}")
+    except Exception as e:
+        logger.warning(f"Failed to invalidate entitlements for {user_id}: {str(e)}")
+
+def _schedule_entitlement_refresh(user_id: str) -> None:
+    """Refresh entitlements in the background unless a refresh is already running."""
+    task = _entitlement_refresh_tasks.get(user_id)
+    if task and not task.done():
+        return
+
+    async def _refresh():
+        try:
+            await refresh_entitlements(user_id)
+        except Exception as e:
+            logger.warning(f"Background entitlement refresh failed for {user_id}, keeping stale entry: {str(e)}")
+        finally:
+            _entitlement_refresh_tasks.pop(user_id, None)
+
+    _entitlement_refresh_tasks[user_id] = asyncio.create_task(_refresh())
+
+async def get_entitlements(user_id: str) -> Dict:
+    """
+    Get the entitlements for an account, served from the Redis cache when possible.
+
+    Fresh entries are returned directly. Stale entries are returned immediately and
+    refreshed in the background. Without any cache entry Stripe is queried inline; if
+    that fails the free tier is assumed (and not cached) so a Stripe outage does not
+    block agent runs.
+    """
+    cached = await _read_cached_entitlements(user_id)
+    if cached:
+        if time.time() - cached.get('cached_at', 0) > ENTITLEMENT_FRESH_TTL:
+            _schedule_entitlement_refresh(user_id)
+        return cached
     
-    return total_seconds / 60  # Convert to minutes
+    try:
+        return await refresh_entitlements(user_id)
+    except Exception as e:
+        logger.error(f"Error fetching entitlements from Stripe for {user_id}, falling back to free tier: {str(e)}")
+        return build_entitlements(None)
+
+async def calculate_monthly_usage(client, user_id: str) -> float:
+    """
+    Calculate total agent run minutes for the current month for a user.
+
+    Reads the usage ledger (finalized runs) plus in-flight runs from Redis; see services.usage.
+    """
+    return await get_monthly_usage(client, user_id)
 
 async def get_allowed_models_for_user(client, user_id: str):
     """
@@ -206,24 +292,8 @@ async def get_allowed_models_for_user(client, user_id: str):
     Returns:
         List of model names allowed for the user's subscription tier.
     """
-
-    subscription = await get_user_subscription(user_id)
-    tier_name = 'free'
-    
-    if subscription:
-        price_id = None
-        if subscription.get('items') and subscription['items'].get('data') and len(subscription['items']['data']) > 0:
-            price_id = subscription['items']['data'][0]['price']['id']
-        else:
-            price_id = subscription.get('price_id', config.STRIPE_FREE_TIER_ID)
-        
-        # Get tier info for this price_id
-        tier_info = SUBSCRIPTION_TIERS.get(price_id)
-        if tier_info:
-            tier_name = tier_info['name']
-    
-    # Return allowed models for this tier
-    return MODEL_ACCESS_TIERS.get(tier_name, MODEL_ACCESS_TIERS['free'])  # Default to free tier if unknown
+    entitlements = await get_entitlements(user_id)
+    return entitlements['allowed_models']
 
 
 async def can_use_model(client, user_id: str, model_name: str):
@@ -257,36 +327,20 @@ async def check_billing_status(client, user_id: str) -> Tuple[bool, str, Optiona
             "minutes_limit": "no limit"
         }
     
-    # Get current subscription
-    subscription = await get_user_subscription(user_id)
-    # print("Current subscription:", subscription)
-    
-    # If no subscription, they can use free tier
-    if not subscription:
-        subscription = {
-            'price_id': config.STRIPE_FREE_TIER_ID,  # Free tier
-            'plan_name': 'free'
-        }
-    
-    # Extract price ID from subscription items
-    price_id = None
-    if subscription.get('items') and subscription['items'].get('data') and len(subscription['items']['data']) > 0:
-        price_id = subscription['items']['data'][0]['price']['id']
-    else:
-        price_id = subscription.get('price_id', config.STRIPE_FREE_TIER_ID)
-    
-    # Get tier info - default to free tier if not found
-    tier_info = SUBSCRIPTION_TIERS.get(price_id)
-    if not tier_info:
-        logger.warning(f"Unknown subscription tier: {price_id}, defaulting to free tier")
-        tier_info = SUBSCRIPTION_TIERS[config.STRIPE_FREE_TIER_ID]
+    # Tier and limits come from the entitlement cache rather than a live Stripe call
+    entitlements = await get_entitlements(user_id)
+    subscription = {
+        'price_id': entitlements['price_id'],
+        'plan_name': entitlements['plan_name'],
+        'minutes_limit': entitlements['minutes_limit']
+    }
     
     # Calculate current month's usage
     current_usage = await calculate_monthly_usage(client, user_id)
     
     # Check if within limits
-    if current_usage >= tier_info['minutes']:
-        return False, f"Monthly limit of {tier_info['minutes']} minutes reached. Please upgrade your plan or wait until next month.", subscription
+    if current_usage >= entitlements['minutes_limit']:
+        return False, f"Monthly limit of {entitlements['minutes_limit']} minutes reached. Please upgrade your plan or wait until next month.", subscription
     
     return True, "OK", subscription
 
@@ -369,6 +423,7 @@ async def create_checkout_session(
                         {'active': True}
                     ).eq('id', customer_id).execute()
                     logger.info(f"Updated customer {customer_id} active status to TRUE after subscription upgrade")
+                    await invalidate_entitlements(current_user_id)
                     
                     latest_invoice = None
                     if updated_subscription.get('latest_invoice'):
@@ -827,11 +882,14 @@ async def stripe_webhook(request: Request):
                 else:
                     # Subscription is not active (e.g., past_due, canceled, etc.)
                     # Check if customer has any other active subscriptions before updating status
-                    has_active = len(stripe.Subscription.list(
-                        customer=customer_id,
-                        status='active',
-                        limit=1
-                    ).get('data', [])) > 0
+                    has_active = len((await asyncio.wait_for(
+                        stripe.Subscription.list_async(
+                            customer=customer_id,
+                            status='active',
+                            limit=1
+                        ),
+                        timeout=STRIPE_TIMEOUT
+                    )).get('data', [])) > 0
                     
                     if not has_active:
                         await client.schema('basejump').from_('billing_customers').update(
@@ -841,11 +899,14 @@ async def stripe_webhook(request: Request):
             
             elif event.type == 'customer.subscription.deleted':
                 # Check if customer has any other active subscriptions
-                has_active = len(stripe.Subscription.list(
-                    customer=customer_id,
-                    status='active',
-                    limit=1
-                ).get('data', [])) > 0
+                has_active = len((await asyncio.wait_for(
+                    stripe.Subscription.list_async(
+                        customer=customer_id,
+                        status='active',
+                        limit=1
+                    ),
+                    timeout=STRIPE_TIMEOUT
+                )).get('data', [])) > 0
                 
                 if not has_active:
                     # If no active subscriptions left, set active to false
@@ -854,6 +915,19 @@ async def stripe_webhook(request: Request):
                     ).eq('id', customer_id).execute()
                     logger.info(f"Webhook: Updated customer {customer_id} active status to FALSE after subscription deletion")
             
+            # Refresh the entitlement cache so tier changes apply to the next agent start
+            customer_result = await client.schema('basejump').from_('billing_customers') \
+                .select('account_id') \
+                .eq('id', customer_id) \
+                .execute()
+            for row in customer_result.data or []:
+                account_id = row['account_id']
+                try:
+                    await refresh_entitlements(account_id)
+                except Exception as e:
+                    logger.warning(f"Webhook: Failed to refresh entitlements for account {account_id}, invalidating: {str(e)}")
+                    await invalidate_entitlements(account_id)
+            
             logger.info(f"Processed {event.type} event for customer {customer_id}")
         
         return {"status": "success"}
@@ -900,22 +974,8 @@ async def get_available_models(
         allowed_models = await get_allowed_models_for_user(client, current_user_id)
         free_tier_models = MODEL_ACCESS_TIERS.get('free', [])
         
-        # Get subscription info for context
-        subscription = await get_user_subscription(current_user_id)
-        
-        # Determine tier name from subscription
-        tier_name = 'free'
-        if subscription:
-            price_id = None
-            if subscription.get('items') and subscription['items'].get('data') and len(subscription['items']['data']) > 0:
-                price_id = subscription['items']['data'][0]['price']['id']
-            else:
-                price_id = subscription.get('price_id', config.STRIPE_FREE_TIER_ID)
-            
-            # Get tier info for this price_id
-            tier_info = SUBSCRIPTION_TIERS.get(price_id)
-            if tier_info:
-                tier_name = tier_info['name']
+        # Tier name comes from the same cached entitlements
+        tier_name = (await get_entitlements(current_user_id))['plan_name']
         
         # Get all unique full model names from MODEL_NAME_ALIASES
         all_models = set()
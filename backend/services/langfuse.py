@@ -1,5 +1,6 @@
 import os
-from langfuse import Langfuse
+
+from utils.lazy_imports import lazy_object
 
 public_key = os.getenv("LANGFUSE_PUBLIC_KEY")
 secret_key = os.getenv("LANGFUSE_SECRET_KEY")
@@ -9,4 +10,11 @@ enabled = False
 if public_key and secret_key:
     enabled = True
 
-langfuse = Langfuse(enabled=enabled)
+
+def _create_client():
+    from langfuse import Langfuse
+    return Langfuse(enabled=enabled)
+
+
+# The langfuse SDK is imported and the client created on first use, not at import
+langfuse = lazy_object(_create_client)
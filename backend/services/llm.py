@@ -5,7 +5,7 @@ This module provides a unified interface for making API calls to different LLM p
 (OpenAI, Anthropic, Groq, etc.) using LiteLLM. It includes support for:
 - Streaming responses
 - Tool calls and function calling
-- Retry logic with exponential backoff
+- Retry logic with backoff, rate-limit admission and provider failover (see services.llm_gateway)
 - Model-specific configurations
 - Comprehensive error handling and logging
 """
@@ -15,18 +15,23 @@ import os
 import json
 import asyncio
 from unittest.mock import patch
-from openai import OpenAIError
-import litellm
-from utils.logger import logger
+from utils.lazy_imports import lazy_import
+from utils.logger import logger, lazy
 from utils.config import config
-
-# litellm.set_verbose=True
-litellm.modify_params=True
-
-# Constants
-MAX_RETRIES = 2
-RATE_LIMIT_DELAY = 30
-RETRY_DELAY = 0.1
+from services.llm_gateway import (
+    gateway,
+    AdmissionTimeout,
+    LLMProviderUnavailable,
+    non_recoverable_errors,
+    retryable_errors,
+)
+from services.llm_cache import LLMCachePolicy, response_cache
+from services.prompt_cache import apply_cache_breakpoints, record_cache_usage, supports_prompt_caching
+
+# litellm (and openai) are only loaded on the first LLM call, see configure_litellm()
+litellm = lazy_import("litellm")
+openai = lazy_import("openai")
+_litellm_configured = False
 
 class LLMError(Exception):
     """Base exception for LLM-related errors."""
@@ -84,12 +89,15 @@ def setup_api_keys() -> None:
     else:
         logger.warning(f"Missing AWS credentials for Bedrock integration - access_key: {bool(aws_access_key)}, secret_key: {bool(aws_secret_key)}, region: {aws_region}")
 
-async def handle_error(error: Exception, attempt: int, max_attempts: int) -> None:
-    """Handle API errors with appropriate delays and logging."""
-    delay = RATE_LIMIT_DELAY if isinstance(error, litellm.exceptions.RateLimitError) else RETRY_DELAY
-    logger.warning(f"Error on attempt {attempt + 1}/{max_attempts}: {str(error)}")
-    logger.debug(f"Waiting {delay} seconds before retry...")
-    await asyncio.sleep(delay)
+def configure_litellm() -> None:
+    """Set up provider API keys and global LiteLLM options on the first LLM call instead of at import."""
+    global _litellm_configured
+    if _litellm_configured:
+        return
+    setup_api_keys()
+    # litellm.set_verbose=True
+    litellm.modify_params = True
+    _litellm_configured = True
 
 def prepare_params(
     messages: List[Dict[str, Any]],
@@ -108,7 +116,7 @@ def prepare_params(
     reasoning_effort: Optional[str] = 'low'
 ) -> Dict[str, Any]:
     """Prepare parameters for the API call."""
-    logger.debug(f"prepare_params: Received model_name: '{model_name}'")
+    logger.debug("prepare_params: Received model_name: '%s'", model_name)
     params = {
         "model": model_name,
         "messages": messages,
@@ -130,7 +138,7 @@ def prepare_params(
         # For Claude 3.7 in Bedrock, do not set max_tokens or max_tokens_to_sample
         # as it causes errors with inference profiles
         if model_name.startswith("bedrock/") and "claude-3-7" in model_name:
-            logger.debug(f"Skipping max_tokens for Claude 3.7 model: {model_name}")
+            logger.debug("Skipping max_tokens for Claude 3.7 model: %s", model_name)
             # Do not add any max_tokens parameter for Claude 3.7
         else:
             param_name = "max_completion_tokens" if 'o1' in model_name else "max_tokens"
@@ -142,7 +150,7 @@ def prepare_params(
             "tools": tools,
             "tool_choice": tool_choice
         })
-        logger.debug(f"Added {len(tools)} tools to API parameters")
+        logger.debug("Added %d tools to API parameters", len(tools))
 
     # # Add Claude-specific headers
     if "claude" in model_name.lower() or "anthropic" in model_name.lower():
@@ -210,74 +218,15 @@ def prepare_params(
             params["model_id"] = "arn:aws:bedrock:us-west-2:935064898258:inference-profile/us.anthropic.claude-3-7-sonnet-20250219-v1:0"
             logger.debug(f"Auto-set model_id for Claude 3.7 Sonnet: {params['model_id']}")
 
-    # Apply Anthropic prompt caching (minimal implementation)
+    # Apply Anthropic prompt caching (see services.prompt_cache)
     # Check model name *after* potential modifications (like adding bedrock/ prefix)
     effective_model_name = params.get("model", model_name) # Use model from params if set, else original
-    if "claude" in effective_model_name.lower() or "anthropic" in effective_model_name.lower():
-        messages = params["messages"] # Direct reference, modification affects params
-
-        # Ensure messages is a list
-        if not isinstance(messages, list):
-            return params # Return early if messages format is unexpected
-
-        # 1. Process the first message if it's a system prompt with string content
-        if messages and messages[0].get("role") == "system":
-            content = messages[0].get("content")
-            if isinstance(content, str):
-                # Wrap the string content in the required list structure
-                messages[0]["content"] = [
-                    {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
-                ]
-            elif isinstance(content, list):
-                 # If content is already a list, check if the first text block needs cache_control
-                 for item in content:
-                     if isinstance(item, dict) and item.get("type") == "text":
-                         if "cache_control" not in item:
-                             item["cache_control"] = {"type": "ephemeral"}
-                             break # Apply to the first text block only for system prompt
-
-        # 2. Find and process relevant user and assistant messages
-        last_user_idx = -1
-        second_last_user_idx = -1
-        last_assistant_idx = -1
-
-        for i in range(len(messages) - 1, -1, -1):
-            role = messages[i].get("role")
-            if role == "user":
-                if last_user_idx == -1:
-                    last_user_idx = i
-                elif second_last_user_idx == -1:
-                    second_last_user_idx = i
-            elif role == "assistant":
-                if last_assistant_idx == -1:
-                    last_assistant_idx = i
-
-            # Stop searching if we've found all needed messages
-            if last_user_idx != -1 and second_last_user_idx != -1 and last_assistant_idx != -1:
-                 break
-
-        # Helper function to apply cache control
-        def apply_cache_control(message_idx: int, message_role: str):
-            if message_idx == -1:
-                return
-
-            message = messages[message_idx]
-            content = message.get("content")
-
-            if isinstance(content, str):
-                message["content"] = [
-                    {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
-                ]
-            elif isinstance(content, list):
-                for item in content:
-                    if isinstance(item, dict) and item.get("type") == "text":
-                        if "cache_control" not in item:
-                           item["cache_control"] = {"type": "ephemeral"}
-
-        # Apply cache control to the identified messages
-        apply_cache_control(last_user_idx, "last user")
-        apply_cache_control(second_last_user_idx, "second last user")
-        apply_cache_control(last_assistant_idx, "last assistant")
+    if supports_prompt_caching(effective_model_name) and isinstance(params["messages"], list):
+        # Breakpoints are added to copies, so the caller's messages stay byte-stable across calls
+        params["messages"] = apply_cache_breakpoints(params["messages"])
+        if stream:
+            # Usage (including cache read/write tokens) arrives in a final chunk
+            params["stream_options"] = {"include_usage": True}
 
     # Add reasoning_effort for Anthropic models if enabled
     use_thinking = enable_thinking if enable_thinking is not None else False
@@ -289,14 +238,13 @@ def prepare_params(
         params["temperature"] = 1.0 # Required by Anthropic when reasoning_effort is used
         logger.info(f"Anthropic thinking enabled with reasoning_effort='{effort_level}'")
 
-    log_params_summary = {
+    logger.debug("prepare_params: Returning parameters: %s", lazy(lambda: {
         "model": params.get("model"),
         "api_base": params.get("api_base"),
         "api_key_present": bool(params.get("api_key")),
         "stream": params.get("stream"),
         "tools_present": bool(params.get("tools"))
-    }
-    logger.debug(f"prepare_params: Returning parameters: {log_params_summary}")
+    }))
     return params
 
 async def make_llm_api_call(
@@ -313,7 +261,8 @@ async def make_llm_api_call(
     top_p: Optional[float] = None,
     model_id: Optional[str] = None,
     enable_thinking: Optional[bool] = False,
-    reasoning_effort: Optional[str] = 'low'
+    reasoning_effort: Optional[str] = 'low',
+    cache: Optional[LLMCachePolicy] = None
 ) -> Union[Dict[str, Any], AsyncGenerator]:
     """
     Make an API call to a language model using LiteLLM.
@@ -333,89 +282,74 @@ async def make_llm_api_call(
         model_id: Optional ARN for Bedrock inference profiles
         enable_thinking: Whether to enable thinking
         reasoning_effort: Level of reasoning effort
+        cache: Opt-in response cache policy; only applied to non-streaming calls
 
     Returns:
         Union[Dict[str, Any], AsyncGenerator]: API response or stream
 
     Raises:
-        LLMRetryError: If API call fails after retries
+        LLMRetryError: If API call fails after retries on every candidate model
         LLMError: For other API-related errors
     """
     # debug <timestamp>.json messages
-    logger.info(f"Making LLM API call to model: {model_name} (Thinking: {enable_thinking}, Effort: {reasoning_effort})")
-    logger.info(f"📡 API Call: Using model {model_name}")
-    params = prepare_params(
-        messages=messages,
-        model_name=model_name,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        response_format=response_format,
-        tools=tools,
-        tool_choice=tool_choice,
-        api_key=api_key,
-        api_base=api_base,
-        stream=stream,
-        top_p=top_p,
-        model_id=model_id,
-        enable_thinking=enable_thinking,
-        reasoning_effort=reasoning_effort
-    )
-    last_error = None
-    for attempt in range(MAX_RETRIES):
-        try:
-            logger.debug(f"Attempt {attempt + 1}/{MAX_RETRIES}")
-            logger.info(f"make_llm_api_call: Attempting litellm.acompletion with model: '{params['model']}', api_base: '{params.get('api_base')}', api_key_present: {bool(params.get('api_key'))}, stream: {params['stream']}")
-            # logger.debug(f"API request parameters: {json.dumps(params, indent=2)}")
-
-            response = await litellm.acompletion(**params)
-            logger.info(f"make_llm_api_call: litellm.acompletion call successful for model '{params['model']}' on attempt {attempt + 1}")
-            # logger.debug(f"Successfully received API response from {model_name}") # Reemplazado por el de arriba
-            logger.debug(f"Response: {response}")
-            return response
-
-        except litellm.exceptions.APIConnectionError as e:
-            last_error = e
-            logger.error(f"make_llm_api_call: LiteLLM APIConnectionError on attempt {attempt + 1}/{MAX_RETRIES} for model '{params['model']}' with api_base '{params.get('api_base')}'. Error: {e}", exc_info=True)
-            await handle_error(e, attempt, MAX_RETRIES)
+    configure_litellm()
+    logger.info("Making LLM API call to model: %s (Thinking: %s, Effort: %s)", model_name, enable_thinking, reasoning_effort)
+    def build_params(candidate_model: str) -> Dict[str, Any]:
+        # Caller-supplied credentials and endpoints only apply to the requested model;
+        # fallback models use the credentials configured for their own provider.
+        is_primary = candidate_model == model_name
+        return prepare_params(
+            messages=messages,
+            model_name=candidate_model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_format=response_format,
+            tools=tools,
+            tool_choice=tool_choice,
+            api_key=api_key if is_primary else None,
+            api_base=api_base if is_primary else None,
+            stream=stream,
+            top_p=top_p,
+            model_id=model_id if is_primary else None,
+            enable_thinking=enable_thinking,
+            reasoning_effort=reasoning_effort
+        )
 
-        except litellm.exceptions.AuthenticationError as e:
-            last_error = e
-            api_key_env_var_name = params['model'].split('/')[0].upper() + '_API_KEY' if '/' in params['model'] else "LITELLM_API_KEY" # Heurística para el nombre de la variable de entorno
-            logger.error(f"make_llm_api_call: LiteLLM AuthenticationError on attempt {attempt + 1}/{MAX_RETRIES} for model '{params['model']}'. API key in params: {bool(params.get('api_key'))}, API key in env ({api_key_env_var_name}): {bool(os.environ.get(api_key_env_var_name))}. Error: {e}", exc_info=True)
-            await handle_error(e, attempt, MAX_RETRIES)
-
-        except litellm.exceptions.RateLimitError as e:
-            last_error = e
-            logger.warning(f"make_llm_api_call: LiteLLM RateLimitError on attempt {attempt + 1}/{MAX_RETRIES} for model '{params['model']}'. Error: {e}", exc_info=True)
-            await handle_error(e, attempt, MAX_RETRIES)
-        
-        except litellm.exceptions.APIError as e: 
-            last_error = e
-            logger.error(f"make_llm_api_call: LiteLLM APIError on attempt {attempt + 1}/{MAX_RETRIES} for model '{params['model']}'. Error: {e}", exc_info=True)
-            await handle_error(e, attempt, MAX_RETRIES)
-
-        except OpenAIError as e: 
-            last_error = e
-            logger.error(f"make_llm_api_call: OpenAIError (possibly from litellm) on attempt {attempt + 1}/{MAX_RETRIES} for model '{params['model']}'. Error: {e}", exc_info=True)
-            await handle_error(e, attempt, MAX_RETRIES)
-        
-        except json.JSONDecodeError as e: 
-            last_error = e
-            logger.error(f"make_llm_api_call: JSONDecodeError on attempt {attempt + 1}/{MAX_RETRIES} for model '{params['model']}'. Error: {e}", exc_info=True)
-            await handle_error(e, attempt, MAX_RETRIES)
+    use_cache = cache is not None and not stream and config.LLM_CACHE_ENABLED
+    if use_cache:
+        # Key on the caller's inputs, before prepare_params adds provider-specific fields
+        cache_params = {
+            "temperature": temperature, "max_tokens": max_tokens, "response_format": response_format,
+            "tools": tools, "tool_choice": tool_choice if tools else None, "top_p": top_p,
+            "enable_thinking": enable_thinking or None, "reasoning_effort": reasoning_effort if enable_thinking else None,
+        }
+        cached_response, prompt_embedding = await response_cache.lookup(cache, model_name, messages, cache_params)
+        if cached_response is not None:
+            logger.info(f"make_llm_api_call: served '{cache.namespace}' response for model '{model_name}' from cache")
+            return cached_response
 
-        except Exception as e:
-            logger.error(f"Unexpected error during API call for model '{params['model']}': {str(e)}", exc_info=True)
-            raise LLMError(f"API call failed for model '{params['model']}': {str(e)}")
+    try:
+        response = await gateway.call(build_params, model_name)
+        logger.info("make_llm_api_call: call successful for model '%s'", getattr(response, 'model', None) or model_name)
+        if not stream:
+            record_cache_usage(getattr(response, 'model', None) or model_name, getattr(response, 'usage', None))
+        if use_cache:
+            await response_cache.store(cache, model_name, messages, cache_params, response, prompt_embedding)
+        return response
+
+    except non_recoverable_errors() as e:
+        logger.error(f"make_llm_api_call: Non-recoverable error for model '{model_name}': {e}", exc_info=True)
+        raise LLMError(f"API call failed for model '{model_name}': {str(e)}")
+
+    except (AdmissionTimeout, LLMProviderUnavailable, openai.OpenAIError, *retryable_errors()) as e:
+        error_msg = f"Failed to make API call to model '{model_name}' after retries and fallbacks. Last error: {str(e)}"
+        logger.error(error_msg, exc_info=True)
+        raise LLMRetryError(error_msg)
 
-    error_msg = f"Failed to make API call to model '{params['model']}' after {MAX_RETRIES} attempts"
-    if last_error:
-        error_msg += f". Last error: {str(last_error)}"
-    logger.error(error_msg, exc_info=True)
-    raise LLMRetryError(error_msg)
+    except Exception as e:
+        logger.error(f"Unexpected error during API call for model '{model_name}': {str(e)}", exc_info=True)
+        raise LLMError(f"API call failed for model '{model_name}': {str(e)}")
 
-# Initialize API keys on module import
-setup_api_keys()
 
 # Test code for OpenRouter integration
 async def test_openrouter():
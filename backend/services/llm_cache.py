@@ -0,0 +1,232 @@
+"""
+Response cache for non-streaming LLM calls.
+
+Call sites opt in by passing an ``LLMCachePolicy`` to ``make_llm_api_call``.
+Responses are stored in Redis under a canonical hash of the request (model,
+messages, tools and sampling parameters). Policies can additionally enable a
+semantic tier: the prompt is embedded and a cached response is reused when a
+previous prompt for the same model and parameters is similar enough.
+
+Cache failures never fail the LLM call; they are logged and treated as misses.
+"""
+
+import hashlib
+import json
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services import redis
+from utils.config import config
+from utils.lazy_imports import lazy_import
+from utils.logger import logger
+
+litellm = lazy_import("litellm")
+
+CACHE_KEY_PREFIX = "llm_cache:"
+# Maximum prompts kept per semantic index (oldest are evicted first)
+SEMANTIC_MAX_ENTRIES = 256
+
+
+@dataclass(frozen=True)
+class LLMCachePolicy:
+    """Per-call-site cache settings.
+
+    Attributes:
+        namespace: Name of the call site, used to partition keys and metrics.
+        ttl: Seconds a cached response stays valid.
+        semantic: Whether to also look up near-duplicate prompts by embedding similarity.
+        similarity_threshold: Minimum cosine similarity for a semantic hit.
+        validator: Optional check a response must pass before it is cached.
+    """
+    namespace: str
+    ttl: int = 3600
+    semantic: bool = False
+    similarity_threshold: float = 0.97
+    validator: Optional[Callable[[Any], bool]] = None
+
+
+@dataclass
+class CacheMetrics:
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    errors: int = 0
+    tokens_saved: int = 0
+
+
+_metrics: Dict[str, CacheMetrics] = {}
+
+
+def get_cache_metrics() -> Dict[str, Dict[str, int]]:
+    """Hit/miss counters and tokens saved per namespace for this process."""
+    return {namespace: dict(vars(metrics)) for namespace, metrics in _metrics.items()}
+
+
+def _metrics_for(namespace: str) -> CacheMetrics:
+    return _metrics.setdefault(namespace, CacheMetrics())
+
+
+def _hash(data: Any) -> str:
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(model_name: str, messages: List[Dict[str, Any]], **params) -> str:
+    """Canonical hash of a request. ``None`` parameters are ignored so defaults do not change the key."""
+    request = {"model": model_name, "messages": messages}
+    request.update({name: value for name, value in params.items() if value is not None})
+    return _hash(request)
+
+
+def _semantic_bucket(model_name: str, **params) -> str:
+    """Hash of everything but the messages: semantic hits only match otherwise identical requests."""
+    return _hash({"model": model_name, **{name: value for name, value in params.items() if value is not None}})
+
+
+def get_prompt_text(messages: List[Dict[str, Any]]) -> str:
+    """Flatten message contents into the text that is embedded for semantic lookups."""
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(item.get("text", "") for item in content if isinstance(item, dict))
+        parts.append(f"{message.get('role')}: {content}")
+    return "\n".join(parts)
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def _dot(a: List[float], b: List[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+async def embed_text(text: str) -> Optional[List[float]]:
+    """Embed text for the semantic tier. Returns None if no embedding model is configured."""
+    if not config.LLM_CACHE_EMBEDDING_MODEL:
+        return None
+    response = await litellm.aembedding(model=config.LLM_CACHE_EMBEDDING_MODEL, input=[text])
+    return _normalize(response.data[0]["embedding"])
+
+
+def _serialize_response(response: Any) -> str:
+    if isinstance(response, dict):
+        return json.dumps(response, default=str)
+    return json.dumps(response.model_dump(warnings=False), default=str)
+
+
+def _deserialize_response(data: str) -> "litellm.ModelResponse":
+    return litellm.ModelResponse(**json.loads(data))
+
+
+def _total_tokens(response: Any) -> int:
+    usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+    if usage is None:
+        return 0
+    total = usage.get("total_tokens") if isinstance(usage, dict) else getattr(usage, "total_tokens", 0)
+    return total or 0
+
+
+class LLMResponseCache:
+    """Redis-backed exact and semantic cache for LLM responses."""
+
+    def __init__(self, embed_fn: Callable[[str], Any] = embed_text):
+        self.embed_fn = embed_fn
+
+    def _response_key(self, policy: LLMCachePolicy, key: str) -> str:
+        return f"{CACHE_KEY_PREFIX}{policy.namespace}:{key}"
+
+    def _index_key(self, policy: LLMCachePolicy, bucket: str) -> str:
+        return f"{CACHE_KEY_PREFIX}{policy.namespace}:semantic:{bucket}"
+
+    async def _semantic_lookup(self, policy: LLMCachePolicy, bucket: str, embedding: List[float]) -> Optional[Tuple[str, float]]:
+        index_key = self._index_key(policy, bucket)
+        entries = await redis.hgetall(index_key)
+        best: Optional[Tuple[str, float]] = None
+        for key, raw in entries.items():
+            similarity = _dot(embedding, json.loads(raw)["embedding"])
+            if similarity >= policy.similarity_threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+    async def lookup(self, policy: LLMCachePolicy, model_name: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> Tuple[Optional[Any], Optional[List[float]]]:
+        """
+        Find a cached response for a request.
+
+        Returns:
+            (response or None, prompt embedding if one was computed so ``store`` can reuse it)
+        """
+        metrics = _metrics_for(policy.namespace)
+        embedding = None
+        try:
+            key = make_cache_key(model_name, messages, **params)
+            cached = await redis.get(self._response_key(policy, key))
+            if cached is not None:
+                response = _deserialize_response(cached)
+                metrics.exact_hits += 1
+                metrics.tokens_saved += _total_tokens(response)
+                logger.debug(f"LLM cache exact hit for '{policy.namespace}'")
+                return response, None
+
+            if policy.semantic:
+                embedding = await self.embed_fn(get_prompt_text(messages))
+                if embedding is not None:
+                    bucket = _semantic_bucket(model_name, **params)
+                    match = await self._semantic_lookup(policy, bucket, embedding)
+                    if match:
+                        cached = await redis.get(self._response_key(policy, match[0]))
+                        if cached is not None:
+                            response = _deserialize_response(cached)
+                            metrics.semantic_hits += 1
+                            metrics.tokens_saved += _total_tokens(response)
+                            logger.debug(f"LLM cache semantic hit for '{policy.namespace}' (similarity {match[1]:.3f})")
+                            return response, embedding
+                        # The response expired; drop its stale index entry
+                        await redis.hdel(self._index_key(policy, bucket), match[0])
+        except Exception as e:
+            metrics.errors += 1
+            logger.warning(f"LLM cache lookup failed for '{policy.namespace}': {str(e)}")
+
+        metrics.misses += 1
+        return None, embedding
+
+    async def store(self, policy: LLMCachePolicy, model_name: str, messages: List[Dict[str, Any]], params: Dict[str, Any],
+                    response: Any, embedding: Optional[List[float]] = None) -> None:
+        """Cache a response if it passes the policy's validator."""
+        metrics = _metrics_for(policy.namespace)
+        try:
+            if policy.validator and not policy.validator(response):
+                logger.debug(f"LLM cache: response for '{policy.namespace}' rejected by validator, not caching")
+                return
+
+            key = make_cache_key(model_name, messages, **params)
+            await redis.set(self._response_key(policy, key), _serialize_response(response), ex=policy.ttl)
+            metrics.stores += 1
+
+            if policy.semantic:
+                if embedding is None:
+                    embedding = await self.embed_fn(get_prompt_text(messages))
+                if embedding is None:
+                    return
+                index_key = self._index_key(policy, _semantic_bucket(model_name, **params))
+                await redis.hset(index_key, key, json.dumps({"embedding": embedding, "stored_at": time.time()}))
+                await redis.expire(index_key, policy.ttl)
+                await self._trim_index(index_key)
+        except Exception as e:
+            metrics.errors += 1
+            logger.warning(f"LLM cache store failed for '{policy.namespace}': {str(e)}")
+
+    async def _trim_index(self, index_key: str) -> None:
+        entries = await redis.hgetall(index_key)
+        if len(entries) <= SEMANTIC_MAX_ENTRIES:
+            return
+        by_age = sorted(entries.items(), key=lambda item: json.loads(item[1]).get("stored_at", 0))
+        await redis.hdel(index_key, *[key for key, _ in by_age[:len(entries) - SEMANTIC_MAX_ENTRIES]])
+
+
+response_cache = LLMResponseCache()
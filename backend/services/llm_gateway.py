@@ -0,0 +1,440 @@
+"""
+LLM gateway: admission control, retries and provider failover for LiteLLM calls.
+
+``services.llm.make_llm_api_call`` delegates the actual request to the gateway.
+For each call the gateway builds an ordered list of candidate models (the
+requested model followed by its configured fallbacks on other providers, e.g.
+Anthropic -> Bedrock -> OpenRouter) and for each candidate:
+
+- waits for per-provider token-bucket admission (requests/min and tokens/min),
+- skips the provider while its circuit breaker is open,
+- retries transient errors with exponential backoff and full jitter, honouring
+  ``Retry-After`` on rate limits,
+- fails over to the next candidate once retries are exhausted.
+
+Non-streaming calls can additionally be hedged (opt-in, ``LLM_HEDGE_DELAY_MS``):
+if the primary request has not returned after ``hedge_delay`` seconds, a second
+request is started on the next candidate and whichever succeeds first wins. The
+primary and hedged chains share the set of models already tried, so no model
+is called twice. Hedging doubles the cost of slow calls, so it is off by default.
+"""
+
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Type
+
+from utils.config import config
+from utils.constants import MODEL_FALLBACKS
+from utils.lazy_imports import lazy_import
+from utils.logger import logger
+
+litellm = lazy_import("litellm")
+openai = lazy_import("openai")
+
+# Retry policy per candidate model
+MAX_RETRIES_PER_MODEL = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+# Never wait longer than this for a single Retry-After; fail over instead
+MAX_RETRY_AFTER = 60.0
+
+# Circuit breaker: open after this many consecutive failures, probe again after the reset timeout
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30.0
+
+# Longest a call may wait for rate-limit admission before failing over
+MAX_ADMISSION_WAIT = 30.0
+
+# Seconds before a hedged (duplicate) non-streaming request is started; None disables hedging
+HEDGE_DELAY: Optional[float] = config.LLM_HEDGE_DELAY_MS / 1000.0 if config.LLM_HEDGE_DELAY_MS > 0 else None
+
+# Default per-provider limits. Override with LLM_PROVIDER_LIMITS, a JSON object such as
+# {"anthropic": {"requests_per_minute": 2000, "tokens_per_minute": 400000}}
+DEFAULT_PROVIDER_LIMITS: Dict[str, Dict[str, float]] = {
+    "anthropic": {"requests_per_minute": 4000, "tokens_per_minute": 2_000_000},
+    "bedrock": {"requests_per_minute": 500, "tokens_per_minute": 1_000_000},
+    "openrouter": {"requests_per_minute": 2000, "tokens_per_minute": 4_000_000},
+    "openai": {"requests_per_minute": 5000, "tokens_per_minute": 2_000_000},
+}
+FALLBACK_PROVIDER_LIMITS = {"requests_per_minute": 1000, "tokens_per_minute": 1_000_000}
+
+
+@lru_cache(maxsize=None)
+def retryable_errors() -> Tuple[Type[BaseException], ...]:
+    """Errors worth retrying on the same model (resolved on first use so litellm loads lazily)."""
+    return (
+        litellm.exceptions.RateLimitError,
+        litellm.exceptions.APIConnectionError,
+        litellm.exceptions.Timeout,
+        litellm.exceptions.ServiceUnavailableError,
+        litellm.exceptions.InternalServerError,
+        json.JSONDecodeError,
+    )
+
+
+@lru_cache(maxsize=None)
+def non_recoverable_errors() -> Tuple[Type[BaseException], ...]:
+    """Errors that no other provider can fix either (bad prompt, context too long, ...)."""
+    return (
+        litellm.exceptions.BadRequestError,
+        litellm.exceptions.ContextWindowExceededError,
+        litellm.exceptions.ContentPolicyViolationError,
+    )
+
+
+class AdmissionTimeout(Exception):
+    """Raised when a provider's rate limit would delay a call for too long."""
+    pass
+
+
+class LLMProviderUnavailable(Exception):
+    """Raised when no provider can currently accept a call."""
+    pass
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def try_acquire(self, amount: float) -> float:
+        """Take ``amount`` tokens if available. Returns 0 on success, else the seconds to wait."""
+        # A request larger than the bucket is admitted once the bucket is full
+        amount = min(amount, self.capacity)
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate_per_second
+
+    async def acquire(self, amount: float, max_wait: float = MAX_ADMISSION_WAIT) -> float:
+        """Wait until ``amount`` tokens are available. Returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(amount)
+            if wait <= 0:
+                return waited
+            if waited + wait > max_wait:
+                raise AdmissionTimeout(f"Rate limit admission would take {waited + wait:.1f}s")
+            await asyncio.sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._clock = clock
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            # Let one probe through
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = self._clock()
+
+    def release(self) -> None:
+        """End a call that produced no outcome, letting the next call probe if it was the probe."""
+        if self.state == self.HALF_OPEN:
+            # _opened_at is left as is, so the reset timeout has already elapsed
+            self.state = self.OPEN
+
+
+@dataclass
+class ProviderState:
+    """Admission and health state of one provider."""
+    name: str
+    requests: TokenBucket
+    tokens: TokenBucket
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+
+
+def get_provider(model_name: str) -> str:
+    """Return the provider a LiteLLM model name is routed to."""
+    if "/" in model_name:
+        return model_name.split("/", 1)[0].lower()
+    if "claude" in model_name.lower():
+        return "anthropic"
+    return "openai"
+
+
+def is_provider_configured(provider: str) -> bool:
+    """Whether credentials for a provider are available (fallbacks to unconfigured providers are skipped)."""
+    if provider == "anthropic":
+        return bool(config.ANTHROPIC_API_KEY)
+    if provider == "bedrock":
+        return bool(config.AWS_ACCESS_KEY_ID and config.AWS_SECRET_ACCESS_KEY and config.AWS_REGION_NAME)
+    if provider == "openrouter":
+        return bool(config.OPENROUTER_API_KEY)
+    if provider == "openai":
+        return bool(config.OPENAI_API_KEY)
+    return True
+
+
+def estimate_tokens(params: Dict[str, Any]) -> int:
+    """Cheap token estimate for admission control (~4 characters per token)."""
+    try:
+        size = len(json.dumps(params.get("messages", []), default=str))
+    except (TypeError, ValueError):
+        size = 0
+    return size // 4 + (params.get("max_tokens") or 0)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Extract the Retry-After delay (seconds) from a provider error, if present."""
+    headers = None
+    response = getattr(error, "response", None)
+    if response is not None:
+        headers = getattr(response, "headers", None)
+    if not headers:
+        headers = getattr(error, "litellm_response_headers", None)
+    if not headers:
+        return None
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms is not None:
+            return float(retry_after_ms) / 1000.0
+        retry_after = headers.get("retry-after")
+        if retry_after is not None:
+            return float(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def compute_backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Exponential backoff with full jitter; a Retry-After hint is used as the floor."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+    if retry_after is not None:
+        # Small jitter on top so many waiters do not retry in lockstep
+        delay = retry_after + random.uniform(0, min(1.0, retry_after * 0.1))
+    return delay
+
+
+def _load_provider_limits() -> Dict[str, Dict[str, float]]:
+    limits = {name: dict(values) for name, values in DEFAULT_PROVIDER_LIMITS.items()}
+    if config.LLM_PROVIDER_LIMITS:
+        try:
+            for name, values in json.loads(config.LLM_PROVIDER_LIMITS).items():
+                limits.setdefault(name, dict(FALLBACK_PROVIDER_LIMITS)).update(values)
+        except (TypeError, ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring invalid LLM_PROVIDER_LIMITS: {e}")
+    return limits
+
+
+class LLMGateway:
+    """Routes LiteLLM completion calls through admission control, retries and failover."""
+
+    def __init__(
+        self,
+        completion_fn: Optional[Callable[..., Awaitable[Any]]] = None,
+        provider_limits: Optional[Dict[str, Dict[str, float]]] = None,
+        fallback_models: Optional[Dict[str, List[str]]] = None,
+        max_retries: int = MAX_RETRIES_PER_MODEL,
+        hedge_delay: Optional[float] = HEDGE_DELAY,
+        max_admission_wait: float = MAX_ADMISSION_WAIT,
+        provider_filter: Callable[[str], bool] = is_provider_configured,
+    ):
+        self._completion_fn = completion_fn
+        self.provider_limits = provider_limits if provider_limits is not None else _load_provider_limits()
+        self.fallback_models = fallback_models if fallback_models is not None else MODEL_FALLBACKS
+        self.max_retries = max_retries
+        self.hedge_delay = hedge_delay
+        self.max_admission_wait = max_admission_wait
+        self.provider_filter = provider_filter
+        self._providers: Dict[str, ProviderState] = {}
+
+    async def _complete(self, **params) -> Any:
+        completion_fn = self._completion_fn or litellm.acompletion
+        return await completion_fn(**params)
+
+    def provider_state(self, provider: str) -> ProviderState:
+        state = self._providers.get(provider)
+        if state is None:
+            limits = self.provider_limits.get(provider, FALLBACK_PROVIDER_LIMITS)
+            state = ProviderState(
+                name=provider,
+                requests=TokenBucket(limits["requests_per_minute"]),
+                tokens=TokenBucket(limits["tokens_per_minute"]),
+            )
+            self._providers[provider] = state
+        return state
+
+    def candidate_models(self, model_name: str) -> List[str]:
+        """The requested model followed by its fallbacks on configured providers."""
+        candidates = [model_name]
+        for fallback in self.fallback_models.get(model_name, []):
+            if fallback not in candidates and self.provider_filter(get_provider(fallback)):
+                candidates.append(fallback)
+        return candidates
+
+    async def _call_model(self, params: Dict[str, Any]) -> Any:
+        """Call one model with admission control and retries. Raises the last error on failure.
+
+        The breaker sees one outcome per call, however many attempts it took. A call that
+        ends without a verdict (admission timeout, cancellation) gives a half-open probe back.
+        """
+        model = params["model"]
+        state = self.provider_state(get_provider(model))
+        if not state.breaker.allow_request():
+            raise LLMProviderUnavailable(f"Circuit open for provider '{state.name}'")
+
+        estimated_tokens = estimate_tokens(params)
+        last_error: Optional[Exception] = None
+        healthy: Optional[bool] = None
+        try:
+            for attempt in range(self.max_retries):
+                if attempt and state.breaker.state == CircuitBreaker.OPEN:
+                    # Other calls tripped the breaker meanwhile; fail over instead of retrying
+                    break
+
+                waited = await state.requests.acquire(1, self.max_admission_wait)
+                waited += await state.tokens.acquire(estimated_tokens, self.max_admission_wait - waited)
+                if waited:
+                    logger.debug(f"LLM gateway: waited {waited:.2f}s for '{state.name}' admission")
+
+                try:
+                    response = await self._complete(**params)
+                    healthy = True
+                    return response
+                except non_recoverable_errors():
+                    # The provider answered; the request itself is at fault
+                    healthy = True
+                    raise
+                except retryable_errors() as e:
+                    last_error = e
+                    retry_after = get_retry_after(e) if isinstance(e, litellm.exceptions.RateLimitError) else None
+                    if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+                        logger.warning(f"LLM gateway: '{model}' asked to retry after {retry_after:.0f}s, failing over instead")
+                        healthy = False
+                        raise
+                    if attempt + 1 >= self.max_retries:
+                        break
+                    delay = compute_backoff(attempt, retry_after)
+                    logger.warning(f"LLM gateway: {type(e).__name__} on '{model}' (attempt {attempt + 1}/{self.max_retries}), retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                except (litellm.exceptions.AuthenticationError, litellm.exceptions.APIError, openai.OpenAIError):
+                    # Not worth retrying on the same provider, but another provider may work
+                    healthy = False
+                    raise
+
+            healthy = False
+            raise last_error or LLMProviderUnavailable(f"No attempts made on '{model}'")
+        finally:
+            if healthy is True:
+                state.breaker.record_success()
+            elif healthy is False:
+                state.breaker.record_failure()
+            else:
+                state.breaker.release()
+
+    async def _call_candidates(self, candidates: List[Dict[str, Any]], claimed: Optional[Set[str]] = None) -> Any:
+        """Try each candidate in order until one succeeds.
+
+        Models in ``claimed`` are skipped and each model tried is added to it, so chains
+        sharing the set never call the same model.
+        """
+        last_error: Optional[Exception] = None
+        for params in candidates:
+            if claimed is not None:
+                if params["model"] in claimed:
+                    continue
+                claimed.add(params["model"])
+            try:
+                return await self._call_model(params)
+            except non_recoverable_errors():
+                raise
+            except (AdmissionTimeout, LLMProviderUnavailable, openai.OpenAIError, *retryable_errors()) as e:
+                last_error = e
+                logger.warning(f"LLM gateway: model '{params['model']}' failed ({type(e).__name__}: {e}), trying next candidate")
+        raise last_error or LLMProviderUnavailable("No LLM candidates available")
+
+    async def _call_hedged(self, candidates: List[Dict[str, Any]]) -> Any:
+        """Run the candidate chain, starting a hedge on the next untried candidate if it is slow."""
+        claimed: Set[str] = set()
+        primary = asyncio.create_task(self._call_candidates(candidates, claimed))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay)
+        untried = [params for params in candidates if params["model"] not in claimed]
+        if done or not untried:
+            return await primary
+
+        logger.info(f"LLM gateway: '{candidates[0]['model']}' slower than {self.hedge_delay}s, hedging on '{untried[0]['model']}'")
+        hedge = asyncio.create_task(self._call_candidates(untried, claimed))
+        pending = {primary, hedge}
+        last_error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, build_params: Callable[[str], Dict[str, Any]], model_name: str) -> Any:
+        """
+        Make a completion call for ``model_name``, failing over to its fallbacks.
+
+        Args:
+            build_params: Returns the LiteLLM parameters for a given model name, so
+                provider-specific preparation is applied to each candidate.
+            model_name: The requested model.
+        """
+        candidates = [build_params(model) for model in self.candidate_models(model_name)]
+        if self.hedge_delay is not None and len(candidates) > 1 and not candidates[0].get("stream"):
+            return await self._call_hedged(candidates)
+        return await self._call_candidates(candidates)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Current admission and breaker state per provider."""
+        return {
+            name: {
+                "breaker": state.breaker.state,
+                "consecutive_failures": state.breaker.failures,
+                "request_tokens": round(state.requests.tokens, 2),
+                "token_budget": round(state.tokens.tokens, 2),
+            }
+            for name, state in self._providers.items()
+        }
+
+
+gateway = LLMGateway()
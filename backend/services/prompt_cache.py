@@ -0,0 +1,219 @@
+"""
+Provider prompt caching (Anthropic and Bedrock Claude models).
+
+Providers cache the prompt prefix ending at each ``cache_control`` breakpoint
+and only reuse it when the next request starts with byte-identical content.
+This module keeps that prefix stable and plans breakpoints:
+
+- Tool schemas are serialized canonically (sorted keys, sorted by name) so the
+  same tools always produce the same bytes; ToolOrchestrator memoizes the result.
+- Breakpoints go on the system prompt (covering tools + system), on the last
+  message of the latest complete block of MESSAGE_BREAKPOINT_STRIDE messages
+  (thread history is append-only, so these boundaries do not move between
+  auto-continue calls), and on the most recent message, never exceeding the
+  provider's limit of MAX_CACHE_BREAKPOINTS.
+
+Cache-read vs cache-write tokens are reported per call from the usage payload.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from utils.logger import logger
+
+# Anthropic and Bedrock reject requests with more than four cache_control blocks
+MAX_CACHE_BREAKPOINTS = 4
+# History is split into blocks of this many messages; a complete block's last message is a stable breakpoint
+MESSAGE_BREAKPOINT_STRIDE = 12
+
+EPHEMERAL_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def supports_prompt_caching(model_name: str) -> bool:
+    """Whether the model accepts cache_control breakpoints."""
+    name = (model_name or "").lower()
+    return "claude" in name or "anthropic" in name
+
+
+def canonicalize(value: Any) -> Any:
+    """Copy of a JSON-like value with dict keys in sorted order, so it always serializes to the same bytes."""
+    if isinstance(value, dict):
+        return {key: canonicalize(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(item) for item in value]
+    return value
+
+
+def _tool_name(tool: Dict[str, Any]) -> str:
+    function = tool.get("function")
+    if isinstance(function, dict) and function.get("name"):
+        return function["name"]
+    return str(tool.get("name", ""))
+
+
+def canonical_tools(tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Tool schemas in a canonical order and key order, independent of registration or plugin load order."""
+    return [canonicalize(tool) for tool in sorted(tools, key=_tool_name)]
+
+
+def _text_block_index(content: Any) -> Optional[int]:
+    """Index of the last non-empty text block of a list content, or -1 for non-empty string content."""
+    if isinstance(content, str):
+        return -1 if content else None
+    if isinstance(content, list):
+        for i in range(len(content) - 1, -1, -1):
+            block = content[i]
+            if isinstance(block, dict) and block.get("type") == "text" and block.get("text"):
+                return i
+    return None
+
+
+def _can_hold_breakpoint(message: Dict[str, Any]) -> bool:
+    return (
+        isinstance(message, dict)
+        and message.get("role") in ("system", "user", "assistant")
+        and _text_block_index(message.get("content")) is not None
+    )
+
+
+def plan_cache_breakpoints(
+    messages: List[Dict[str, Any]],
+    max_breakpoints: int = MAX_CACHE_BREAKPOINTS,
+    stride: int = MESSAGE_BREAKPOINT_STRIDE
+) -> List[int]:
+    """Choose the message indices that get a cache breakpoint, oldest first.
+
+    Args:
+        messages: The messages of the request
+        max_breakpoints: Provider limit on cache_control blocks
+        stride: Size of the message blocks whose boundaries are stable breakpoints
+
+    Returns:
+        Sorted indices of at most max_breakpoints messages
+    """
+    eligible = [i for i, message in enumerate(messages) if _can_hold_breakpoint(message)]
+    if not eligible or max_breakpoints <= 0:
+        return []
+
+    plan = []
+    first_history = 0
+    if messages[0].get("role") == "system":
+        first_history = 1
+        if eligible[0] == 0:
+            plan.append(0)
+
+    history = [i for i in eligible if i >= first_history]
+    if not history or len(plan) >= max_breakpoints:
+        return plan
+
+    # The most recent message: the prefix written here is what the next call reads
+    latest = history[-1]
+
+    # Last eligible message of each complete block, newest first. A block is complete once the
+    # thread has grown past it, so its boundary stays put as messages are appended.
+    complete_blocks = (len(messages) - first_history) // stride
+    milestones = []
+    for block in range(complete_blocks - 1, -1, -1):
+        start = first_history + block * stride
+        in_block = [i for i in history if start <= i < start + stride and i != latest]
+        if in_block:
+            milestones.append(in_block[-1])
+        if len(plan) + len(milestones) + 1 >= max_breakpoints:
+            break
+
+    return sorted(plan + milestones + [latest])
+
+
+def _with_breakpoint(message: Dict[str, Any]) -> Dict[str, Any]:
+    content = message["content"]
+    marked = dict(message)
+    if isinstance(content, str):
+        marked["content"] = [{"type": "text", "text": content, "cache_control": EPHEMERAL_CACHE_CONTROL}]
+    else:
+        index = _text_block_index(content)
+        blocks = [_without_breakpoint(block) for block in content]
+        blocks[index] = {**blocks[index], "cache_control": EPHEMERAL_CACHE_CONTROL}
+        marked["content"] = blocks
+    return marked
+
+
+def _without_breakpoint(block: Any) -> Any:
+    if isinstance(block, dict) and "cache_control" in block:
+        return {key: value for key, value in block.items() if key != "cache_control"}
+    return block
+
+
+def _has_breakpoint(message: Any) -> bool:
+    content = message.get("content") if isinstance(message, dict) else None
+    return isinstance(content, list) and any(isinstance(block, dict) and "cache_control" in block for block in content)
+
+
+def apply_cache_breakpoints(messages: List[Dict[str, Any]], max_breakpoints: int = MAX_CACHE_BREAKPOINTS) -> List[Dict[str, Any]]:
+    """Return a copy of the messages with cache breakpoints at the planned positions.
+
+    The input messages are not modified; breakpoints already present elsewhere are removed
+    so the request never exceeds the provider limit.
+    """
+    plan = set(plan_cache_breakpoints(messages, max_breakpoints))
+    result = []
+    for i, message in enumerate(messages):
+        if i in plan:
+            result.append(_with_breakpoint(message))
+        elif _has_breakpoint(message):
+            result.append({**message, "content": [_without_breakpoint(block) for block in message["content"]]})
+        else:
+            result.append(message)
+    return result
+
+
+@dataclass
+class PromptCacheStats:
+    calls: int = 0
+    prompt_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+
+
+_stats: Dict[str, PromptCacheStats] = {}
+
+
+def get_prompt_cache_metrics() -> Dict[str, Dict[str, int]]:
+    """Prompt and cache-read/write token totals per model for this process."""
+    return {model: dict(vars(stats)) for model, stats in _stats.items()}
+
+
+def _token_field(source: Any, name: str) -> int:
+    value = getattr(source, name, None) if not isinstance(source, dict) else source.get(name)
+    return value if isinstance(value, int) else 0
+
+
+def get_cache_usage(usage: Any) -> Optional[Dict[str, int]]:
+    """Prompt, cache-read and cache-write token counts from a LiteLLM usage payload (None if there is none)."""
+    prompt_tokens = getattr(usage, "prompt_tokens", None) if not isinstance(usage, dict) else usage.get("prompt_tokens")
+    if not isinstance(prompt_tokens, int):
+        return None
+
+    details = getattr(usage, "prompt_tokens_details", None) if not isinstance(usage, dict) else usage.get("prompt_tokens_details")
+    # Anthropic reports cache_read/cache_creation_input_tokens; OpenAI-style payloads use prompt_tokens_details
+    cache_read = _token_field(usage, "cache_read_input_tokens") or _token_field(details, "cached_tokens")
+    cache_write = _token_field(usage, "cache_creation_input_tokens") or _token_field(details, "cache_write_tokens")
+    return {"prompt_tokens": prompt_tokens, "cache_read_tokens": cache_read, "cache_write_tokens": cache_write}
+
+
+def record_cache_usage(model_name: str, usage: Any) -> Optional[Dict[str, int]]:
+    """Log and accumulate the prompt cache usage of one call."""
+    cache_usage = get_cache_usage(usage)
+    if cache_usage is None:
+        return None
+
+    stats = _stats.setdefault(model_name, PromptCacheStats())
+    stats.calls += 1
+    stats.prompt_tokens += cache_usage["prompt_tokens"]
+    stats.cache_read_tokens += cache_usage["cache_read_tokens"]
+    stats.cache_write_tokens += cache_usage["cache_write_tokens"]
+
+    logger.info(
+        f"Prompt cache for {model_name}: {cache_usage['cache_read_tokens']} read, "
+        f"{cache_usage['cache_write_tokens']} written of {cache_usage['prompt_tokens']} prompt tokens"
+    )
+    return cache_usage
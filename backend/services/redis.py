@@ -3,7 +3,8 @@ import os
 from dotenv import load_dotenv
 import asyncio
 from utils.logger import logger
-from typing import List, Any
+from utils.tracing import traced
+from typing import List, Any, Dict
 
 # Redis client
 client = None
@@ -88,12 +89,14 @@ async def get_client():
 
 
 # Basic Redis operations
+@traced("redis", "set")
 async def set(key: str, value: str, ex: int = None):
     """Set a Redis key."""
     redis_client = await get_client()
     return await redis_client.set(key, value, ex=ex)
 
 
+@traced("redis", "get")
 async def get(key: str, default: str = None):
     """Get a Redis key."""
     redis_client = await get_client()
@@ -101,12 +104,14 @@ async def get(key: str, default: str = None):
     return result if result is not None else default
 
 
+@traced("redis", "delete")
 async def delete(key: str):
     """Delete a Redis key."""
     redis_client = await get_client()
     return await redis_client.delete(key)
 
 
+@traced("redis", "publish")
 async def publish(channel: str, message: str):
     """Publish a message to a Redis channel."""
     redis_client = await get_client()
@@ -120,31 +125,58 @@ async def create_pubsub():
 
 
 # List operations
+@traced("redis", "rpush")
 async def rpush(key: str, *values: Any):
     """Append one or more values to a list."""
     redis_client = await get_client()
     return await redis_client.rpush(key, *values)
 
 
+@traced("redis", "lrange")
 async def lrange(key: str, start: int, end: int) -> List[str]:
     """Get a range of elements from a list."""
     redis_client = await get_client()
     return await redis_client.lrange(key, start, end)
 
 
+@traced("redis", "llen")
 async def llen(key: str) -> int:
     """Get the length of a list."""
     redis_client = await get_client()
     return await redis_client.llen(key)
 
 
+# Hash operations
+@traced("redis", "hset")
+async def hset(key: str, field: str, value: str):
+    """Set a field in a hash."""
+    redis_client = await get_client()
+    return await redis_client.hset(key, field, value)
+
+
+@traced("redis", "hdel")
+async def hdel(key: str, *fields: str):
+    """Delete one or more fields from a hash."""
+    redis_client = await get_client()
+    return await redis_client.hdel(key, *fields)
+
+
+@traced("redis", "hgetall")
+async def hgetall(key: str) -> Dict[str, str]:
+    """Get all fields and values of a hash."""
+    redis_client = await get_client()
+    return await redis_client.hgetall(key)
+
+
 # Key management
+@traced("redis", "expire")
 async def expire(key: str, time: int):
     """Set a key's time to live in seconds."""
     redis_client = await get_client()
     return await redis_client.expire(key, time)
 
 
+@traced("redis", "keys")
 async def keys(pattern: str) -> List[str]:
     """Get keys matching a pattern."""
     redis_client = await get_client()
@@ -1,76 +1,391 @@
+"""
+Audio transcription for voice input and uploaded recordings.
+
+Uploads are streamed to disk in chunks instead of being read into memory.
+Long audio is split into segments of about TRANSCRIPTION_SEGMENT_SECONDS,
+cutting inside silences found by ffmpeg's ``silencedetect`` so words are not
+split. The segments are transcribed concurrently, at most
+TRANSCRIPTION_CONCURRENCY at a time, through an async backend. The texts are
+then stitched back together in order. With ``?stream=true`` the endpoint
+answers with SSE frames carrying each segment's text as soon as it and all
+earlier segments are done.
+
+Backends implement ``TranscriptionBackend``. The endpoint resolves the
+backend and segmenter through FastAPI dependencies, so tests can override
+them with local stubs. Without ffmpeg, audio is sent as a single segment, up
+to the backend's per-request limit.
+"""
+
+import asyncio
 import os
-import openai
+import re
+import shutil
 import tempfile
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Protocol, Tuple
+
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from utils.config import config
+from utils.lazy_imports import lazy_import
 from utils.logger import logger
 from utils.auth_utils import get_current_user_id_from_jwt
+from utils.sse import encode_frame
+
+openai = lazy_import("openai")
 
 router = APIRouter(tags=["transcription"])
 
+# OpenAI supports these formats
+ALLOWED_TYPES = [
+    'audio/mp3', 'audio/mpeg', 'audio/mp4', 'audio/m4a',
+    'audio/wav', 'audio/webm', 'audio/mpga'
+]
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Per-request file size limit of the OpenAI transcription API
+OPENAI_MAX_FILE_BYTES = 25 * 1024 * 1024
+
+_SILENCE_START = re.compile(r"silence_start: (-?[\d.]+)")
+_SILENCE_END = re.compile(r"silence_end: (-?[\d.]+)")
+_PROGRESS_TIME = re.compile(r"time=(\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+
 class TranscriptionResponse(BaseModel):
     text: str
 
+
+class TranscriptionError(Exception):
+    """Audio could not be prepared or transcribed."""
+
+
+@dataclass
+class AudioSegment:
+    """A span of the source audio; ``path`` is set once the span is extracted to its own file."""
+
+    index: int
+    start: float
+    end: Optional[float]
+    path: Optional[str] = None
+
+
+class TranscriptionBackend(Protocol):
+    # Largest audio file a single ``transcribe`` call accepts
+    max_file_bytes: int
+
+    async def transcribe(self, path: str) -> str:
+        """Text of the audio file at ``path``."""
+
+
+class AudioSegmenter(Protocol):
+    async def plan(self, path: str) -> List[AudioSegment]:
+        """Spans to transcribe, in order."""
+
+    async def extract(self, source: str, segment: AudioSegment, directory: str) -> str:
+        """Write the segment to its own file under ``directory`` and return its path."""
+
+
+class OpenAITranscriptionBackend:
+    """OpenAI transcription through one shared ``AsyncOpenAI`` client (and its connection pool)."""
+
+    max_file_bytes = OPENAI_MAX_FILE_BYTES
+
+    def __init__(self, model: str, api_key: Optional[str] = None):
+        self.model = model
+        self.client = openai.AsyncOpenAI(api_key=api_key)
+
+    async def transcribe(self, path: str) -> str:
+        content = await asyncio.to_thread(_read, path)
+        return await self.client.audio.transcriptions.create(
+            model=self.model,
+            file=(os.path.basename(path), content),
+            response_format="text",
+        )
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def choose_cut_points(
+    silences: List[Tuple[float, float]], duration: float, target: float, maximum: float
+) -> List[float]:
+    """Times to cut ``duration`` seconds of audio into segments of about ``target`` seconds.
+
+    Each cut is the silence midpoint closest to ``target`` seconds after the previous cut, at
+    least half a target in and at most ``maximum`` seconds in; without a silence there the
+    audio is cut at ``target``. The last segment is never shorter than half a target.
+    """
+    midpoints = sorted((start + end) / 2 for start, end in silences)
+    cuts: List[float] = []
+    start = 0.0
+    while duration - start > target * 1.5:
+        earliest = start + target / 2
+        latest = min(start + maximum, duration - target / 2)
+        candidates = [point for point in midpoints if earliest <= point <= latest]
+        ideal = start + target
+        cut = min(candidates, key=lambda point: abs(point - ideal)) if candidates else ideal
+        cuts.append(cut)
+        start = cut
+    return cuts
+
+
+def parse_silences(ffmpeg_output: str) -> List[Tuple[float, float]]:
+    """(start, end) pairs from ``silencedetect`` log lines; a trailing unterminated silence is dropped."""
+    silences = []
+    start = None
+    for line in ffmpeg_output.splitlines():
+        match = _SILENCE_START.search(line)
+        if match:
+            start = max(float(match.group(1)), 0.0)
+            continue
+        match = _SILENCE_END.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    return silences
+
+
+def parse_decoded_duration(ffmpeg_output: str) -> Optional[float]:
+    """Seconds decoded according to the last ``time=`` progress line, or None if there is none."""
+    matches = _PROGRESS_TIME.findall(ffmpeg_output)
+    if not matches:
+        return None
+    hours, minutes, seconds = matches[-1]
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+async def _run(*args: str) -> Tuple[int, str, str]:
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        raise
+    return process.returncode, stdout.decode("utf-8", "replace"), stderr.decode("utf-8", "replace")
+
+
+class FFmpegSegmenter:
+    """Splits audio on silence with ffmpeg and re-encodes segments as small mono MP3s."""
+
+    def __init__(self, target_seconds: float, max_seconds: float, noise_db: int = -35, min_silence_seconds: float = 0.4):
+        self.target_seconds = target_seconds
+        self.max_seconds = max(max_seconds, target_seconds)
+        self.noise_db = noise_db
+        self.min_silence_seconds = min_silence_seconds
+
+    @staticmethod
+    def available() -> bool:
+        return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+    async def duration(self, path: str) -> Optional[float]:
+        """Duration from the container header; None when the header has none (e.g. MediaRecorder WebM)."""
+        code, stdout, stderr = await _run(
+            "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", path
+        )
+        if code != 0:
+            raise TranscriptionError(f"Could not read audio duration: {stderr.strip()[-500:]}")
+        try:
+            return float(stdout.strip())
+        except ValueError:
+            return None
+
+    async def plan(self, path: str) -> List[AudioSegment]:
+        single = [AudioSegment(index=0, start=0.0, end=None, path=path)]
+        duration = await self.duration(path)
+        if duration is not None and duration <= self.target_seconds * 1.5:
+            return single
+        # Without a duration, the silence pass doubles as the decode that measures it
+        _, _, stderr = await _run(
+            "ffmpeg", "-hide_banner", *(["-nostats"] if duration is not None else []), "-i", path, "-vn",
+            "-af", f"silencedetect=noise={self.noise_db}dB:d={self.min_silence_seconds}", "-f", "null", "-",
+        )
+        if duration is None:
+            duration = parse_decoded_duration(stderr)
+            if duration is None:
+                logger.warning(f"Could not determine the duration of {path}; transcribing it as one segment")
+                return single
+            if duration <= self.target_seconds * 1.5:
+                return single
+        cuts = choose_cut_points(parse_silences(stderr), duration, self.target_seconds, self.max_seconds)
+        bounds = [0.0] + cuts + [None]
+        return [AudioSegment(index=i, start=bounds[i], end=bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+    async def extract(self, source: str, segment: AudioSegment, directory: str) -> str:
+        output = os.path.join(directory, f"segment-{segment.index:04d}.mp3")
+        args = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-ss", f"{segment.start:.3f}", "-i", source]
+        if segment.end is not None:
+            args += ["-t", f"{segment.end - segment.start:.3f}"]
+        args += ["-vn", "-ac", "1", "-ar", "16000", "-c:a", "libmp3lame", "-b:a", "64k", output]
+        code, _, stderr = await _run(*args)
+        if code != 0:
+            raise TranscriptionError(f"Could not extract audio segment {segment.index}: {stderr.strip()[-500:]}")
+        return output
+
+
+class SingleSegmenter:
+    """Transcribes the whole file in one request (used when ffmpeg is not installed)."""
+
+    async def plan(self, path: str) -> List[AudioSegment]:
+        return [AudioSegment(index=0, start=0.0, end=None, path=path)]
+
+    async def extract(self, source: str, segment: AudioSegment, directory: str) -> str:
+        return source
+
+
+class TranscriptionPipeline:
+    """Plans segments, then extracts and transcribes them concurrently and stitches the texts in order."""
+
+    def __init__(self, backend: TranscriptionBackend, segmenter: AudioSegmenter, concurrency: int = 4):
+        self.backend = backend
+        self.segmenter = segmenter
+        self.concurrency = max(1, concurrency)
+
+    async def transcribe(
+        self,
+        path: str,
+        work_dir: str,
+        on_partial: Optional[Callable[[int, int, str], Awaitable[None]]] = None,
+    ) -> str:
+        """Full text of the audio at ``path``.
+
+        ``on_partial(index, total, text)`` is awaited for each segment in order, as soon as the
+        segment and every segment before it are transcribed.
+        """
+        segments = await self.segmenter.plan(path)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        texts: List[Optional[str]] = [None] * len(segments)
+        emitted = 0
+        emit_lock = asyncio.Lock()
+
+        async def run_segment(segment: AudioSegment) -> None:
+            nonlocal emitted
+            async with semaphore:
+                # Short audio is sent as uploaded unless it is too large for the backend
+                if segment.path is None or os.path.getsize(segment.path) > self.backend.max_file_bytes:
+                    segment.path = await self.segmenter.extract(path, segment, work_dir)
+                if os.path.getsize(segment.path) > self.backend.max_file_bytes:
+                    raise TranscriptionError(
+                        f"Audio segment exceeds the {self.backend.max_file_bytes // (1024 * 1024)}MB transcription limit"
+                    )
+                text = (await self.backend.transcribe(segment.path)).strip()
+                if segment.path != path:
+                    os.unlink(segment.path)
+            texts[segment.index] = text
+            async with emit_lock:
+                while emitted < len(texts) and texts[emitted] is not None:
+                    if on_partial:
+                        await on_partial(emitted, len(texts), texts[emitted])
+                    emitted += 1
+
+        tasks = [asyncio.create_task(run_segment(segment)) for segment in segments]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return " ".join(text for text in texts if text)
+
+
+async def save_upload(upload: UploadFile, directory: str, max_bytes: int) -> str:
+    """Stream an upload to a file under ``directory`` in chunks, enforcing ``max_bytes``."""
+    extension = upload.filename.rsplit('.', 1)[-1] if upload.filename and '.' in upload.filename else 'webm'
+    path = os.path.join(directory, f"upload.{re.sub(r'[^A-Za-z0-9]', '', extension) or 'webm'}")
+    size = 0
+    with open(path, "wb") as f:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File size exceeds {max_bytes // (1024 * 1024)}MB limit")
+            await asyncio.to_thread(f.write, chunk)
+    return path
+
+
+_backend: Optional[TranscriptionBackend] = None
+
+
+def get_transcription_backend() -> TranscriptionBackend:
+    """The process-wide backend, created on first use."""
+    global _backend
+    if _backend is None:
+        _backend = OpenAITranscriptionBackend(config.TRANSCRIPTION_MODEL, api_key=config.OPENAI_API_KEY)
+    return _backend
+
+
+def get_audio_segmenter() -> AudioSegmenter:
+    if FFmpegSegmenter.available():
+        return FFmpegSegmenter(config.TRANSCRIPTION_SEGMENT_SECONDS, config.TRANSCRIPTION_MAX_SEGMENT_SECONDS)
+    return SingleSegmenter()
+
+
 @router.post("/transcription", response_model=TranscriptionResponse)
 async def transcribe_audio(
     audio_file: UploadFile = File(...),
-    user_id: str = Depends(get_current_user_id_from_jwt)
+    stream: bool = Query(False, description="Stream partial text as server-sent events"),
+    user_id: str = Depends(get_current_user_id_from_jwt),
+    backend: TranscriptionBackend = Depends(get_transcription_backend),
+    segmenter: AudioSegmenter = Depends(get_audio_segmenter),
 ):
-    """Transcribe audio file to text using OpenAI Whisper."""
+    """Transcribe an audio file to text, optionally streaming partial text."""
+    logger.info(f"Received audio file: {audio_file.filename}, content_type: {audio_file.content_type}")
+
+    if audio_file.content_type not in ALLOWED_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type: {audio_file.content_type}. Supported types: {', '.join(ALLOWED_TYPES)}"
+        )
+
+    max_bytes = config.TRANSCRIPTION_MAX_UPLOAD_BYTES
+    if isinstance(segmenter, SingleSegmenter):
+        max_bytes = min(max_bytes, backend.max_file_bytes)
+    work_dir = tempfile.mkdtemp(prefix="transcription-")
     try:
-        # Validate file type - OpenAI supports these formats
-        allowed_types = [
-            'audio/mp3', 'audio/mpeg', 'audio/mp4', 'audio/m4a', 
-            'audio/wav', 'audio/webm', 'audio/mpga'
-        ]
-        
-        logger.info(f"Received audio file: {audio_file.filename}, content_type: {audio_file.content_type}")
-        
-        if audio_file.content_type not in allowed_types:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Unsupported file type: {audio_file.content_type}. Supported types: {', '.join(allowed_types)}"
-            )
-        
-        # Check file size (25MB limit)
-        content = await audio_file.read()
-        if len(content) > 25 * 1024 * 1024:  # 25MB
-            raise HTTPException(status_code=400, detail="File size exceeds 25MB limit")
-        
-        # Reset file pointer
-        await audio_file.seek(0)
-        
-        # Initialize OpenAI client
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        # Create a temporary file with the correct extension
-        file_extension = audio_file.filename.split('.')[-1] if audio_file.filename and '.' in audio_file.filename else 'webm'
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_extension}') as temp_file:
-            temp_file.write(content)
-            temp_file_path = temp_file.name
-        
+        path = await save_upload(audio_file, work_dir, max_bytes)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    pipeline = TranscriptionPipeline(backend, segmenter, concurrency=config.TRANSCRIPTION_CONCURRENCY)
+
+    if not stream:
         try:
-            # Transcribe audio using the temporary file
-            # OpenAI Whisper API has built-in limits: 25MB file size and handles duration limits internally
-            with open(temp_file_path, 'rb') as f:
-                transcription = client.audio.transcriptions.create(
-                    model="gpt-4o-mini-transcribe",
-                    file=f,
-                    response_format="text"
-                )
-            
+            text = await pipeline.transcribe(path, work_dir)
             logger.info(f"Successfully transcribed audio for user {user_id}")
-            return TranscriptionResponse(text=transcription)
-            
+            return TranscriptionResponse(text=text)
+        except Exception as e:
+            logger.error(f"Error transcribing audio for user {user_id}: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
         finally:
-            # Clean up temporary file
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    async def stream_generator():
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def on_partial(index: int, total: int, text: str) -> None:
+            await queue.put({"type": "partial", "index": index, "total": total, "text": text})
+
+        async def run() -> None:
             try:
-                os.unlink(temp_file_path)
+                text = await pipeline.transcribe(path, work_dir, on_partial=on_partial)
+                logger.info(f"Successfully transcribed audio for user {user_id}")
+                await queue.put({"type": "status", "status": "completed", "text": text})
             except Exception as e:
-                logger.warning(f"Failed to delete temporary file {temp_file_path}: {e}")
-        
-    except Exception as e:
-        logger.error(f"Error transcribing audio for user {user_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}") 
\ No newline at end of file
+                logger.error(f"Error transcribing audio for user {user_id}: {str(e)}")
+                await queue.put({"type": "status", "status": "failed", "message": f"Transcription failed: {str(e)}"})
+
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                response = await queue.get()
+                yield encode_frame(response)
+                if response["type"] == "status":
+                    break
+        finally:
+            task.cancel()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return StreamingResponse(stream_generator(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"
+    })
@@ -0,0 +1,136 @@
+"""
+Usage ledger for agent run time.
+
+Billing limits are enforced on agent run minutes per calendar month. Instead of
+summing every run of the month on each check, finalized runs are added to a
+per-account, per-month counter (``account_usage_monthly``) when their status is
+updated, and runs that are still in progress are tracked in a Redis hash per
+account. Reading the current month's usage is then one row plus one hash.
+
+``reconcile_account_usage`` recomputes a counter from ``agent_runs`` and is used by
+``utils/scripts/reconcile_usage_ledger.py`` to repair drift.
+"""
+
+from datetime import datetime, timezone
+from typing import Optional, Dict
+
+from services import redis
+from utils.logger import logger
+
+# Redis hash per account: agent_run_id -> start timestamp (epoch seconds)
+INFLIGHT_KEY_PREFIX = "usage:inflight:"
+
+
+def get_month_start(now: Optional[datetime] = None) -> datetime:
+    """Return the start of the (UTC) month containing ``now``."""
+    now = now or datetime.now(timezone.utc)
+    return datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+
+
+async def register_inflight_run(account_id: str, agent_run_id: str, started_at: Optional[datetime] = None) -> None:
+    """Track a running agent run so its elapsed time counts towards current usage."""
+    started_ts = (started_at or datetime.now(timezone.utc)).timestamp()
+    key = f"{INFLIGHT_KEY_PREFIX}{account_id}"
+    try:
+        await redis.hset(key, agent_run_id, str(started_ts))
+        await redis.expire(key, redis.REDIS_KEY_TTL)
+    except Exception as e:
+        logger.warning(f"Failed to register in-flight usage for run {agent_run_id}: {str(e)}")
+
+
+async def clear_inflight_run(account_id: str, agent_run_id: str) -> None:
+    """Stop tracking an agent run as in-flight."""
+    try:
+        await redis.hdel(f"{INFLIGHT_KEY_PREFIX}{account_id}", agent_run_id)
+    except Exception as e:
+        logger.warning(f"Failed to clear in-flight usage for run {agent_run_id}: {str(e)}")
+
+
+async def get_inflight_runs(account_id: str) -> Dict[str, float]:
+    """Return the in-flight runs of an account as {agent_run_id: start timestamp}."""
+    try:
+        entries = await redis.hgetall(f"{INFLIGHT_KEY_PREFIX}{account_id}")
+    except Exception as e:
+        logger.warning(f"Failed to read in-flight usage for account {account_id}: {str(e)}")
+        return {}
+    runs = {}
+    for run_id, started_ts in (entries or {}).items():
+        try:
+            runs[run_id] = float(started_ts)
+        except (TypeError, ValueError):
+            continue
+    return runs
+
+
+async def record_run_usage(client, agent_run_id: str) -> Optional[float]:
+    """
+    Add a finalized run to its account's monthly counter.
+
+    Must be called after ``completed_at`` has been set on the run. Safe to call more
+    than once; a run is only counted the first time.
+
+    Returns:
+        The number of seconds added, or None if the run was already recorded.
+    """
+    result = await client.rpc('record_agent_run_usage', {'p_agent_run_id': agent_run_id}).execute()
+    if not result.data:
+        return None
+    row = result.data[0]
+    await clear_inflight_run(row['account_id'], agent_run_id)
+    return row['seconds']
+
+
+async def get_monthly_usage(client, account_id: str) -> float:
+    """
+    Get the account's agent run minutes for the current month.
+
+    Sums the ledger counter of finalized runs with the elapsed time of in-flight
+    runs started this month.
+    """
+    now = datetime.now(timezone.utc)
+    month_start = get_month_start(now)
+
+    result = await client.table('account_usage_monthly') \
+        .select('seconds') \
+        .eq('account_id', account_id) \
+        .eq('month', month_start.date().isoformat()) \
+        .execute()
+    total_seconds = float(result.data[0]['seconds']) if result.data else 0.0
+
+    now_ts = now.timestamp()
+    month_start_ts = month_start.timestamp()
+    for started_ts in (await get_inflight_runs(account_id)).values():
+        if started_ts >= month_start_ts:
+            total_seconds += max(now_ts - started_ts, 0)
+
+    return total_seconds / 60  # Convert to minutes
+
+
+async def reconcile_account_usage(client, account_id: str, month_start: Optional[datetime] = None) -> float:
+    """
+    Recompute an account's monthly counter from agent_runs and prune stale in-flight entries.
+
+    Returns:
+        The reconciled number of seconds for the month.
+    """
+    month_start = month_start or get_month_start()
+    result = await client.rpc('reconcile_account_usage', {
+        'p_account_id': account_id,
+        'p_month': month_start.date().isoformat()
+    }).execute()
+    seconds = float(result.data or 0)
+
+    inflight = await get_inflight_runs(account_id)
+    if inflight:
+        running = await client.table('agent_runs') \
+            .select('id') \
+            .in_('id', list(inflight.keys())) \
+            .eq('status', 'running') \
+            .execute()
+        running_ids = {row['id'] for row in running.data or []}
+        for run_id in inflight:
+            if run_id not in running_ids:
+                logger.info(f"Pruning stale in-flight usage entry {run_id} for account {account_id}")
+                await clear_inflight_run(account_id, run_id)
+
+    return seconds
@@ -0,0 +1,121 @@
+-- Usage ledger: per-account, per-month running totals of agent run time.
+-- Finalized runs are added once (tracked via agent_runs.usage_recorded_at), so
+-- billing checks read a single row instead of scanning every run of the month.
+
+CREATE TABLE account_usage_monthly (
+    account_id UUID NOT NULL REFERENCES basejump.accounts(id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    run_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc'::text, NOW()) NOT NULL,
+    PRIMARY KEY (account_id, month)
+);
+
+ALTER TABLE agent_runs
+ADD COLUMN usage_recorded_at TIMESTAMP WITH TIME ZONE;
+
+CREATE INDEX idx_agent_runs_started_at ON agent_runs(started_at);
+
+CREATE TRIGGER update_account_usage_monthly_updated_at
+    BEFORE UPDATE ON account_usage_monthly
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+ALTER TABLE account_usage_monthly ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY account_usage_monthly_select_policy ON account_usage_monthly
+    FOR SELECT
+    USING (basejump.has_role_on_account(account_id) = true);
+
+GRANT SELECT ON TABLE account_usage_monthly TO authenticated;
+GRANT ALL PRIVILEGES ON TABLE account_usage_monthly TO service_role;
+
+-- Add a finalized run to its account's monthly counter. Idempotent: a run is
+-- only counted the first time it is seen with a completed_at timestamp.
+-- Returns the account and the number of seconds added (no row if nothing was added).
+CREATE OR REPLACE FUNCTION record_agent_run_usage(p_agent_run_id UUID)
+RETURNS TABLE (account_id UUID, seconds DOUBLE PRECISION)
+SECURITY DEFINER
+SET search_path = public
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_account_id UUID;
+    v_started_at TIMESTAMP WITH TIME ZONE;
+    v_completed_at TIMESTAMP WITH TIME ZONE;
+    v_seconds DOUBLE PRECISION;
+BEGIN
+    UPDATE agent_runs ar
+    SET usage_recorded_at = TIMEZONE('utc'::text, NOW())
+    FROM threads t
+    WHERE ar.id = p_agent_run_id
+      AND ar.thread_id = t.thread_id
+      AND ar.completed_at IS NOT NULL
+      AND ar.usage_recorded_at IS NULL
+    RETURNING t.account_id, ar.started_at, ar.completed_at
+    INTO v_account_id, v_started_at, v_completed_at;
+
+    IF v_account_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    v_seconds := GREATEST(EXTRACT(EPOCH FROM (v_completed_at - v_started_at)), 0);
+
+    INSERT INTO account_usage_monthly (account_id, month, seconds, run_count)
+    VALUES (v_account_id, DATE_TRUNC('month', v_started_at AT TIME ZONE 'utc')::date, v_seconds, 1)
+    ON CONFLICT (account_id, month) DO UPDATE
+    SET seconds = account_usage_monthly.seconds + EXCLUDED.seconds,
+        run_count = account_usage_monthly.run_count + 1;
+
+    account_id := v_account_id;
+    seconds := v_seconds;
+    RETURN NEXT;
+END;
+$$;
+
+-- Recompute one account's counter for a month from agent_runs, marking every
+-- finalized run as recorded. Used by the reconciliation job to repair drift.
+CREATE OR REPLACE FUNCTION reconcile_account_usage(p_account_id UUID, p_month DATE)
+RETURNS DOUBLE PRECISION
+SECURITY DEFINER
+SET search_path = public
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_month_start TIMESTAMP WITH TIME ZONE := p_month::timestamp AT TIME ZONE 'utc';
+    v_month_end TIMESTAMP WITH TIME ZONE := (p_month + INTERVAL '1 month')::timestamp AT TIME ZONE 'utc';
+    v_seconds DOUBLE PRECISION;
+    v_run_count INTEGER;
+BEGIN
+    UPDATE agent_runs ar
+    SET usage_recorded_at = TIMEZONE('utc'::text, NOW())
+    FROM threads t
+    WHERE ar.thread_id = t.thread_id
+      AND t.account_id = p_account_id
+      AND ar.started_at >= v_month_start
+      AND ar.started_at < v_month_end
+      AND ar.completed_at IS NOT NULL
+      AND ar.usage_recorded_at IS NULL;
+
+    SELECT COALESCE(SUM(GREATEST(EXTRACT(EPOCH FROM (ar.completed_at - ar.started_at)), 0)), 0), COUNT(*)
+    INTO v_seconds, v_run_count
+    FROM agent_runs ar
+    JOIN threads t ON t.thread_id = ar.thread_id
+    WHERE t.account_id = p_account_id
+      AND ar.started_at >= v_month_start
+      AND ar.started_at < v_month_end
+      AND ar.completed_at IS NOT NULL;
+
+    INSERT INTO account_usage_monthly (account_id, month, seconds, run_count)
+    VALUES (p_account_id, p_month, v_seconds, v_run_count)
+    ON CONFLICT (account_id, month) DO UPDATE
+    SET seconds = EXCLUDED.seconds,
+        run_count = EXCLUDED.run_count;
+
+    RETURN v_seconds;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION record_agent_run_usage TO service_role;
+GRANT EXECUTE ON FUNCTION reconcile_account_usage TO service_role;
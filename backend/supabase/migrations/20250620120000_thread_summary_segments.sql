@@ -0,0 +1,149 @@
+-- Rolling thread summaries: the context manager summarizes older messages in the
+-- background and stores one cumulative summary per pass, bounded by the range of
+-- messages it folded in. get_llm_formatted_messages splices the latest segment in
+-- place of the messages it covers, so turns never wait on summarization.
+
+CREATE TABLE thread_summary_segments (
+    segment_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    thread_id UUID NOT NULL REFERENCES threads(thread_id) ON DELETE CASCADE,
+    -- Coverage boundary the pass started from (previous segment or summary), NULL for the first pass
+    covers_after TIMESTAMP WITH TIME ZONE,
+    start_message_id UUID NOT NULL,
+    end_message_id UUID NOT NULL,
+    start_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    end_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    message_count INTEGER NOT NULL,
+    content JSONB NOT NULL,
+    token_count INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc'::text, NOW()) NOT NULL
+);
+
+CREATE INDEX idx_thread_summary_segments_thread_end ON thread_summary_segments(thread_id, end_created_at DESC);
+
+-- Two workers summarizing from the same boundary race on this index; the loser's segment is discarded
+CREATE UNIQUE INDEX idx_thread_summary_segments_boundary
+    ON thread_summary_segments(thread_id, COALESCE(covers_after, '-infinity'::timestamptz));
+
+ALTER TABLE thread_summary_segments ENABLE ROW LEVEL SECURITY;
+
+GRANT ALL PRIVILEGES ON TABLE thread_summary_segments TO service_role;
+
+CREATE OR REPLACE FUNCTION get_llm_formatted_messages(p_thread_id UUID)
+RETURNS JSONB
+SECURITY DEFINER
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+    messages_array JSONB := '[]'::JSONB;
+    has_access BOOLEAN;
+    current_role TEXT;
+    latest_summary_id UUID;
+    latest_summary_time TIMESTAMP WITH TIME ZONE;
+    segment_content JSONB;
+    segment_end_time TIMESTAMP WITH TIME ZONE;
+    is_project_public BOOLEAN;
+BEGIN
+    -- Get current role
+    SELECT current_user INTO current_role;
+
+    -- Check if associated project is public
+    SELECT p.is_public INTO is_project_public
+    FROM threads t
+    LEFT JOIN projects p ON t.project_id = p.project_id
+    WHERE t.thread_id = p_thread_id;
+
+    -- Skip access check for service_role or public projects
+    IF current_role = 'authenticated' AND NOT is_project_public THEN
+        -- Check if thread exists and user has access
+        SELECT EXISTS (
+            SELECT 1 FROM threads t
+            LEFT JOIN projects p ON t.project_id = p.project_id
+            WHERE t.thread_id = p_thread_id
+            AND (
+                basejump.has_role_on_account(t.account_id) = true OR
+                basejump.has_role_on_account(p.account_id) = true
+            )
+        ) INTO has_access;
+
+        IF NOT has_access THEN
+            RAISE EXCEPTION 'Thread not found or access denied';
+        END IF;
+    END IF;
+
+    -- Find the latest summary message if it exists
+    SELECT message_id, created_at
+    INTO latest_summary_id, latest_summary_time
+    FROM messages
+    WHERE thread_id = p_thread_id
+    AND type = 'summary'
+    AND is_llm_message = TRUE
+    ORDER BY created_at DESC
+    LIMIT 1;
+
+    -- A rolling summary segment that ends after the latest summary supersedes it
+    SELECT content, end_created_at
+    INTO segment_content, segment_end_time
+    FROM thread_summary_segments
+    WHERE thread_id = p_thread_id
+    AND (latest_summary_time IS NULL OR end_created_at > latest_summary_time)
+    ORDER BY end_created_at DESC
+    LIMIT 1;
+
+    IF segment_end_time IS NOT NULL THEN
+        WITH parsed_messages AS (
+            SELECT
+                CASE
+                    WHEN jsonb_typeof(content) = 'string' THEN content::text::jsonb
+                    ELSE content
+                END AS parsed_content,
+                created_at
+            FROM messages
+            WHERE thread_id = p_thread_id
+            AND is_llm_message = TRUE
+            AND type <> 'summary'
+            AND created_at > segment_end_time
+        )
+        SELECT JSONB_BUILD_ARRAY(segment_content) || COALESCE(JSONB_AGG(parsed_content ORDER BY created_at), '[]'::JSONB)
+        INTO messages_array
+        FROM parsed_messages;
+
+        RETURN messages_array;
+    END IF;
+
+    -- Parse content if it's stored as a string and return proper JSON objects
+    WITH parsed_messages AS (
+        SELECT
+            message_id,
+            CASE
+                WHEN jsonb_typeof(content) = 'string' THEN content::text::jsonb
+                ELSE content
+            END AS parsed_content,
+            created_at,
+            type
+        FROM messages
+        WHERE thread_id = p_thread_id
+        AND is_llm_message = TRUE
+        AND (
+            -- Include the latest summary and all messages after it,
+            -- or all messages if no summary exists
+            latest_summary_id IS NULL
+            OR message_id = latest_summary_id
+            OR created_at > latest_summary_time
+        )
+        ORDER BY created_at
+    )
+    SELECT JSONB_AGG(parsed_content)
+    INTO messages_array
+    FROM parsed_messages;
+
+    -- Handle the case when no messages are found
+    IF messages_array IS NULL THEN
+        RETURN '[]'::JSONB;
+    END IF;
+
+    RETURN messages_array;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION get_llm_formatted_messages TO authenticated, anon, service_role;
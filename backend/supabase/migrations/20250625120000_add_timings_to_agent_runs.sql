@@ -0,0 +1,3 @@
+-- Per-run phase timing summary (planning, LLM, tools, sandbox, DB, Redis), written by the worker
+ALTER TABLE agent_runs
+ADD COLUMN timings JSONB;
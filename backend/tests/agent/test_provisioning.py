@@ -0,0 +1,241 @@
+import asyncio
+import io
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from fastapi import UploadFile
+
+from agent import provisioning
+from agent.provisioning import PROVISIONING_RUNS_KEY, ProjectProvisioner, fail_interrupted_runs, stage_uploads
+from utils.sse import decode_frame
+
+
+class FakeFs:
+    def __init__(self):
+        self.files = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def upload_file(self, path, content):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        if path.endswith("broken.txt"):
+            raise IOError("upload rejected")
+        self.files[path] = content
+
+    def list_files(self, directory):
+        return [SimpleNamespace(name=os.path.basename(path)) for path in self.files if os.path.dirname(path) == directory]
+
+
+class FakeSandbox:
+    id = "sandbox-1"
+
+    def __init__(self):
+        self.fs = FakeFs()
+
+    def get_preview_link(self, port):
+        return SimpleNamespace(url=f"https://{port}.preview", token="preview-token")
+
+
+def make_client():
+    client = MagicMock()
+    table = client.table.return_value
+    for method in ("update", "insert", "select", "eq"):
+        getattr(table, method).return_value = table
+    table.execute = AsyncMock(return_value=SimpleNamespace(data=[{"id": "row", "status": "running"}]))
+    return client
+
+
+class FakePubSub:
+    def __init__(self):
+        self.messages = asyncio.Queue()
+        self.channels = []
+
+    async def subscribe(self, *channels):
+        self.channels.extend(channels)
+
+    async def get_message(self, ignore_subscribe_messages=True, timeout=0.5):
+        try:
+            return await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def unsubscribe(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """In-memory stand-in for the Redis keys and hashes the provisioner uses."""
+    values, hashes = {}, {}
+
+    async def hset(key, field, value):
+        hashes.setdefault(key, {})[field] = value
+
+    async def hdel(key, *fields):
+        for field in fields:
+            hashes.get(key, {}).pop(field, None)
+
+    async def set_value(key, value, ex=None):
+        values[key] = value
+
+    async def delete(key):
+        values.pop(key, None)
+
+    monkeypatch.setattr(provisioning.redis, "hset", hset)
+    monkeypatch.setattr(provisioning.redis, "hdel", hdel)
+    monkeypatch.setattr(provisioning.redis, "hgetall", AsyncMock(side_effect=lambda key: dict(hashes.get(key, {}))))
+    monkeypatch.setattr(provisioning.redis, "set", set_value)
+    monkeypatch.setattr(provisioning.redis, "get", AsyncMock(side_effect=lambda key: values.get(key)))
+    monkeypatch.setattr(provisioning.redis, "delete", delete)
+    pubsub = FakePubSub()
+    monkeypatch.setattr(provisioning.redis, "create_pubsub", AsyncMock(return_value=pubsub))
+    return SimpleNamespace(values=values, hashes=hashes, pubsub=pubsub)
+
+
+@pytest.fixture
+def events(monkeypatch, store):
+    published = []
+
+    async def rpush(key, value):
+        published.append(decode_frame(value))
+
+    monkeypatch.setattr(provisioning.redis, "rpush", rpush)
+    monkeypatch.setattr(provisioning.redis, "publish", AsyncMock())
+    return published
+
+
+@pytest.mark.asyncio
+async def test_provisioning_uploads_concurrently_and_starts_agent(tmp_path, events):
+    files = [UploadFile(io.BytesIO(f"content {i}".encode()), filename=f"dir/file{i}.txt") for i in range(4)]
+    files.append(UploadFile(io.BytesIO(b"x"), filename="broken.txt"))
+    staging_dir, staged = await stage_uploads(files, str(tmp_path))
+    assert [upload.filename for upload in staged][:2] == ["dir_file0.txt", "dir_file1.txt"]
+
+    sandbox = FakeSandbox()
+    client = make_client()
+    started = []
+    provisioner = ProjectProvisioner(
+        client, agent_run_id="run-1", project_id="project-1", thread_id="thread-1", prompt="Summarize these",
+        start_agent=started.append, staged_uploads=staged, staging_dir=staging_dir,
+        create_sandbox=lambda password, project_id: sandbox, upload_concurrency=3,
+    )
+
+    assert await provisioner.run() is True
+    transitions = [event for event in events if "file" not in event]
+    assert [event["stage"] for event in transitions] == ["creating_sandbox", "uploading_files", "starting_agent", "ready"]
+    assert transitions[2]["uploaded"] == 4 and transitions[2]["failed"] == 1
+    file_events = {event["file"]["path"]: event["file"]["status"] for event in events if "file" in event}
+    assert file_events["/workspace/broken.txt"] == "failed"
+    assert file_events["/workspace/dir_file3.txt"] == "uploaded"
+    assert sandbox.fs.files["/workspace/dir_file2.txt"] == b"content 2"
+    assert 1 < sandbox.fs.max_in_flight <= 3
+    assert not os.path.exists(staging_dir)
+
+    sandbox_update = client.table.return_value.update.call_args_list[0].args[0]["sandbox"]
+    assert sandbox_update["id"] == "sandbox-1" and sandbox_update["token"] == "preview-token"
+    message = json.loads(client.table.return_value.insert.call_args.args[0]["content"])["content"]
+    assert message == started[0]
+    assert "[Uploaded File: /workspace/dir_file0.txt]" in message
+    assert "- broken.txt" in message
+
+
+@pytest.mark.asyncio
+async def test_sandbox_failure_fails_the_run(events, monkeypatch):
+    record_run_usage = AsyncMock(return_value=0)
+    monkeypatch.setattr(provisioning, "record_run_usage", record_run_usage)
+
+    def create_sandbox(password, project_id):
+        raise RuntimeError("no capacity")
+
+    client = make_client()
+    start_agent = MagicMock()
+    provisioner = ProjectProvisioner(
+        client, agent_run_id="run-1", project_id="project-1", thread_id="thread-1", prompt="hi",
+        start_agent=start_agent, create_sandbox=create_sandbox,
+    )
+
+    assert await provisioner.run() is False
+    assert events[-1]["status"] == "failed" and events[-1]["stage"] == "creating_sandbox"
+    assert "no capacity" in events[-1]["message"]
+    run_update = client.table.return_value.update.call_args.args[0]
+    assert run_update["status"] == "failed" and run_update["completed_at"]
+    record_run_usage.assert_awaited_once_with(client, "run-1")
+    start_agent.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_stop_signal_abandons_provisioning(events, store, monkeypatch):
+    monkeypatch.setattr(provisioning, "record_run_usage", AsyncMock())
+    creating = threading.Event()
+
+    def create_sandbox(password, project_id):
+        creating.set()
+        time.sleep(0.3)
+        return FakeSandbox()
+
+    client = make_client()
+    start_agent = MagicMock()
+    provisioner = ProjectProvisioner(
+        client, agent_run_id="run-1", project_id="project-1", thread_id="thread-1", prompt="hi",
+        start_agent=start_agent, create_sandbox=create_sandbox,
+    )
+    task = asyncio.create_task(provisioner.run())
+    await asyncio.to_thread(creating.wait)
+    assert store.hashes[PROVISIONING_RUNS_KEY] == {"run-1": "project-1"}
+    assert store.pubsub.channels == ["agent_run:run-1:control"]
+    await store.pubsub.messages.put({"type": "message", "data": b"STOP"})
+
+    assert await asyncio.wait_for(task, timeout=1) is False
+    assert provisioner.stage == provisioning.STOPPED
+    start_agent.assert_not_called()
+    # The sandbox finished creating after the STOP and is recorded on the project rather than orphaned
+    client.table.return_value.update.assert_called_once()
+    assert client.table.return_value.update.call_args.args[0]["sandbox"]["id"] == "sandbox-1"
+    assert not any(event.get("stage") == provisioning.UPLOADING_FILES for event in events)
+    assert store.hashes[PROVISIONING_RUNS_KEY] == {} and not store.values
+
+
+@pytest.mark.asyncio
+async def test_agent_is_not_started_for_a_run_stopped_before_subscribing(events):
+    client = make_client()
+    client.table.return_value.execute = AsyncMock(return_value=SimpleNamespace(data=[{"id": "row", "status": "stopped"}]))
+    start_agent = MagicMock()
+    provisioner = ProjectProvisioner(
+        client, agent_run_id="run-1", project_id="project-1", thread_id="thread-1", prompt="hi",
+        start_agent=start_agent, create_sandbox=lambda password, project_id: FakeSandbox(),
+    )
+
+    assert await provisioner.run() is False
+    start_agent.assert_not_called()
+    assert provisioner.stage == provisioning.STOPPED
+
+
+@pytest.mark.asyncio
+async def test_sweep_fails_runs_whose_provisioning_was_interrupted(events, store, monkeypatch):
+    record_run_usage = AsyncMock()
+    monkeypatch.setattr(provisioning, "record_run_usage", record_run_usage)
+    store.hashes[PROVISIONING_RUNS_KEY] = {"run-lost": "project-1", "run-alive": "project-2"}
+    store.values["agent_run:run-alive:provisioning"] = "creating_sandbox"
+    client = make_client()
+
+    assert await fail_interrupted_runs(client) == ["run-lost"]
+    run_update = client.table.return_value.update.call_args.args[0]
+    assert run_update["status"] == "failed" and "interrupted" in run_update["error"]
+    client.table.return_value.eq.assert_any_call("status", "running")
+    record_run_usage.assert_awaited_once_with(client, "run-lost")
+    assert events[-1]["status"] == "failed"
+    assert store.hashes[PROVISIONING_RUNS_KEY] == {"run-alive": "project-2"}
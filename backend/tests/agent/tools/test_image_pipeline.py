@@ -0,0 +1,79 @@
+import os
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw
+
+from agent.tools.image_pipeline import ImageBudget, ImagePipeline, estimate_tokens, prepare_image, sniff_mime_type
+
+
+def encode(image, format, **params):
+    buffer = BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+def screenshot(width=2880, height=1800):
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(0, height, 40):
+        draw.rectangle((40, y + 8, width // 2, y + 24), fill=(30, 30, 30))
+    return image
+
+
+def photo(width=4000, height=3000):
+    return Image.frombytes("RGB", (width // 8, height // 8), os.urandom(width // 8 * height // 8 * 3)).resize((width, height))
+
+
+def test_budget_limits_dimensions_and_tokens():
+    budget = ImageBudget(max_width=1920, max_height=1080, max_tokens=1600)
+    width, height = budget.fit(4000, 3000)
+    assert height <= 1080 and estimate_tokens(width, height) <= 1600 and abs(width / height - 4 / 3) < 0.01
+    assert budget.fit(800, 600) == (800, 600)
+
+
+def test_screenshots_stay_png_and_photos_become_jpeg_within_budget():
+    budget = ImageBudget(max_bytes=300 * 1024)
+
+    shot = prepare_image(encode(screenshot(), "PNG"), budget)
+    assert shot.mime_type == "image/png" and shot.tokens <= budget.max_tokens
+    assert (shot.original_width, shot.original_height) == (2880, 1800)
+
+    picture = prepare_image(encode(photo(), "JPEG", quality=95), budget)
+    assert picture.mime_type == "image/jpeg" and len(picture.data) <= budget.max_bytes
+    assert Image.open(BytesIO(picture.data)).size == (picture.width, picture.height) == budget.fit(4000, 3000)
+
+    noisy = prepare_image(encode(photo(2000, 1500), "PNG"), ImageBudget(max_bytes=40 * 1024))
+    assert noisy.mime_type == "image/jpeg" and len(noisy.data) <= 40 * 1024
+
+
+def test_transparency_is_kept_and_small_images_pass_through():
+    logo = Image.new("RGBA", (3000, 1000), (0, 0, 0, 0))
+    ImageDraw.Draw(logo).ellipse((100, 100, 900, 900), fill=(200, 20, 20, 255))
+    prepared = prepare_image(encode(logo, "PNG"), ImageBudget())
+    assert prepared.mime_type == "image/png" and Image.open(BytesIO(prepared.data)).mode == "RGBA"
+
+    small = encode(photo(800, 600), "JPEG")
+    assert prepare_image(small, ImageBudget()).data == small
+
+
+def test_mime_type_is_sniffed_from_content():
+    image = Image.new("RGB", (8, 8), "white")
+    for format, mime_type in (("PNG", "image/png"), ("JPEG", "image/jpeg"), ("GIF", "image/gif"), ("WEBP", "image/webp")):
+        assert sniff_mime_type(encode(image, format)) == mime_type
+    assert sniff_mime_type(b"<svg></svg>") is None
+
+@pytest.mark.asyncio
+async def test_pipeline_caches_by_content_and_budget():
+    pipeline = ImagePipeline(workers=1)
+    data = encode(screenshot(), "PNG")
+    try:
+        first, cached = await pipeline.prepare(data, ImageBudget())
+        assert not cached
+        again, cached = await pipeline.prepare(data, ImageBudget())
+        assert cached and again is first
+        smaller, cached = await pipeline.prepare(data, ImageBudget(max_tokens=400))
+        assert not cached and smaller.tokens <= 400
+        assert pipeline.cached("unknown", ImageBudget()) is None
+    finally:
+        pipeline.shutdown()
@@ -0,0 +1,32 @@
+from unittest.mock import AsyncMock
+
+import pytest
+
+from agent.tools.sb_browser_tool import SandboxBrowserTool
+
+
+@pytest.fixture
+def tool():
+    tool = SandboxBrowserTool.__new__(SandboxBrowserTool)
+    tool._execute_browser_action = AsyncMock(return_value={"message": "ok"})
+    return tool
+
+
+@pytest.mark.asyncio
+async def test_run_actions_sends_one_batch_request(tool):
+    actions = '[{"action": "input_text", "params": {"index": 3, "text": "it\'s me"}}, {"action": "send_keys", "params": {"keys": "Enter"}, "expect": {"load_state": "load"}, "note": "dropped"}]'
+
+    await tool.browser_run_actions(actions)
+
+    tool._execute_browser_action.assert_awaited_once_with("batch", {"steps": [
+        {"action": "input_text", "params": {"index": 3, "text": "it's me"}},
+        {"action": "send_keys", "params": {"keys": "Enter"}, "expect": {"load_state": "load"}},
+    ]})
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("actions", ["not json", [], [{"params": {}}]])
+async def test_run_actions_rejects_malformed_steps(tool, actions):
+    with pytest.raises(ValueError):
+        await tool.browser_run_actions(actions)
+    tool._execute_browser_action.assert_not_awaited()
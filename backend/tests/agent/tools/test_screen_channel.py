@@ -0,0 +1,100 @@
+import base64
+import io
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image, ImageDraw
+
+from agent.tools import computer_use_tool
+from agent.tools.computer_use_tool import ComputerUseTool
+from agent.tools.screen_channel import ScreenshotChannel, downscale
+
+
+def png(draw=None, size=(640, 480)):
+    image = Image.new("RGB", size, "white")
+    if draw:
+        draw(ImageDraw.Draw(image))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def frames(*pngs):
+    queue = list(pngs)
+
+    async def fetch():
+        return queue.pop(0)
+    return fetch
+
+
+@pytest.mark.asyncio
+async def test_frames_are_diffed_in_tiles_and_buffered():
+    cursor = lambda d: d.rectangle((100, 100, 110, 110), fill="black")
+    channel = ScreenshotChannel(frames(png(), png(), png(cursor), png(size=(320, 240))), tile_size=64, history=3)
+
+    first = await channel.capture()
+    assert first.changed and first.dirty_tiles == first.total_tiles == 80
+
+    unchanged = await channel.capture()
+    assert not unchanged.changed and unchanged.dirty_box is None
+
+    moved = await channel.capture()
+    assert moved.dirty_tiles == 1 and moved.dirty_box == (64, 64, 128, 128)
+
+    resized = await channel.capture()
+    assert resized.dirty_tiles == resized.total_tiles == 20
+    assert [frame.seq for frame in channel.frames] == [2, 3, 4]
+    assert channel.stats()["frames"] == 3
+
+
+@pytest.mark.asyncio
+async def test_render_for_model_crops_and_downscales():
+    channel = ScreenshotChannel(frames(png(size=(2560, 1440))), model_max_width=1280)
+    frame = await channel.capture()
+
+    full = Image.open(io.BytesIO(await channel.render_for_model(frame)))
+    assert full.size == (1280, 720)
+    # Regions keep the full frame's scale
+    region = Image.open(io.BytesIO(await channel.render_for_model(frame, (0, 0, 640, 320))))
+    assert region.size == (320, 160) and channel.scale_for(frame) == 2.0
+    assert downscale(Image.new("RGB", (1000, 500)), 1280).size == (1000, 500)
+
+
+@pytest.mark.asyncio
+async def test_tool_returns_only_changed_regions():
+    tool = ComputerUseTool.__new__(ComputerUseTool)
+    pointer = lambda d: d.rectangle((10, 10, 20, 20), fill="red")
+    tool.screen = ScreenshotChannel(frames(png(), png(), png(pointer)), model_max_width=None)
+
+    first = await tool.get_screenshot_base64(changes_only=True)
+    assert first["region"] is None and Image.open(io.BytesIO(base64.b64decode(first["base64"]))).size == (640, 480)
+    assert (await tool.get_screenshot_base64(changes_only=True))["unchanged"] is True
+    partial = await tool.get_screenshot_base64(changes_only=True)
+    assert partial["region"] == (0, 0, 64, 64)
+    assert Image.open(io.BytesIO(base64.b64decode(partial["base64"]))).size == (64, 64)
+
+
+@pytest.mark.asyncio
+async def test_mouse_coordinates_are_mapped_from_the_downscaled_screenshot(monkeypatch):
+    monkeypatch.setattr(computer_use_tool, "ToolResult", lambda **fields: SimpleNamespace(**fields))
+    tool = ComputerUseTool.__new__(ComputerUseTool)
+    tool.mouse_x = tool.mouse_y = 0
+    tool.screen = ScreenshotChannel(frames(png(size=(2560, 1440))), model_max_width=1280)
+    requests = []
+
+    async def api_request(method, endpoint, data=None):
+        requests.append((endpoint, data))
+        return {"success": True}
+
+    tool._api_request = api_request
+    shot = await tool.get_screenshot_base64()
+    assert (shot["width"], shot["height"], shot["scale"]) == (1280, 720, 2.0)
+    assert shot["dirty_box"] == (0, 0, 1280, 720)
+
+    result = await tool.click(x=100, y=50)
+    assert requests[-1] == ("/automation/mouse/click", {"x": 200, "y": 100, "clicks": 1, "button": "left"})
+    assert "(100, 50)" in result.output
+    await tool.mouse_down()
+    assert requests[-1][1]["x"] == 200
+    await tool.drag_to(x=300, y=200)
+    assert (requests[-1][1]["x"], requests[-1][1]["y"]) == (600, 400)
@@ -0,0 +1,53 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from agent.tools import web_search_tool
+from agent.tools.web_search_tool import SandboxWebSearchTool
+from sandbox.browser_client import BrowserRoute, BrowserRouteCache, BrowserServiceError
+
+
+def make_tool(monkeypatch, browser_result=None, browser_error=None):
+    tool = SandboxWebSearchTool.__new__(SandboxWebSearchTool)
+    tool.workspace_path = "/workspace"
+    tool.thread_id = "thread-1"
+    tool._sandbox = MagicMock()
+    tool._browser_route = BrowserRouteCache(BrowserRoute("https://8003-sb.proxy"))
+    tool._firecrawl_scrape = AsyncMock(return_value={"data": {"markdown": "from firecrawl", "metadata": {"title": "FC"}}})
+    client = SimpleNamespace(request=AsyncMock(side_effect=browser_error, return_value=browser_result))
+    monkeypatch.setattr(web_search_tool, "get_browser_client", lambda: client)
+    return tool, client
+
+
+@pytest.mark.asyncio
+async def test_scrape_uses_page_loaded_in_browser(monkeypatch):
+    tool, client = make_tool(monkeypatch, {
+        "success": True, "found": True, "source": "page", "url": "https://example.com/docs",
+        "title": "Docs", "markdown": "# Docs", "dom_hash": "abc",
+    })
+
+    result = await tool._scrape_single_url("https://example.com/docs")
+
+    assert result["success"] and result["title"] == "Docs" and result["content_length"] == len("# Docs")
+    client.request.assert_awaited_once_with(
+        tool._browser_route.route, "page_content", {"url": "https://example.com/docs"}, headers={"X-Browser-Session": "thread-1"}
+    )
+    tool._firecrawl_scrape.assert_not_awaited()
+    saved = json.loads(tool.sandbox.fs.upload_file.call_args.args[1])
+    assert saved["text"] == "# Docs" and saved["metadata"]["source"] == "browser"
+
+
+@pytest.mark.asyncio
+async def test_scrape_falls_back_to_firecrawl(monkeypatch):
+    tool, _ = make_tool(monkeypatch, {"success": True, "found": False, "url": "https://example.com/"})
+    assert (await tool._scrape_single_url("https://example.com/"))["title"] == "FC"
+
+    tool, _ = make_tool(monkeypatch, browser_error=BrowserServiceError("connection refused", request_sent=False))
+    assert (await tool._scrape_single_url("https://example.com/"))["title"] == "FC"
+    assert tool._browser_route.route is None and tool._browser_route.retry_at > 0
+    client = web_search_tool.get_browser_client()
+    client.request.reset_mock()
+    assert (await tool._scrape_single_url("https://example.com/"))["title"] == "FC"
+    client.request.assert_not_awaited()
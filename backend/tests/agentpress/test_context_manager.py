@@ -0,0 +1,228 @@
+import asyncio
+import re
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from agentpress import context_manager
+from agentpress.context_manager import ContextManager, count_text_tokens
+
+
+class FakeQuery:
+    """Just enough of the PostgREST query builder for the context manager."""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filters = []
+        self.order_by = None
+        self.desc = False
+        self.limit_count = None
+        self.row_to_insert = None
+
+    def select(self, *columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row[column] > value)
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by, self.desc = column, desc
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def insert(self, row):
+        self.row_to_insert = row
+        return self
+
+    async def execute(self):
+        rows = self.db.tables.setdefault(self.table, [])
+        if self.row_to_insert is not None:
+            if any(r['thread_id'] == self.row_to_insert['thread_id'] and r['covers_after'] == self.row_to_insert['covers_after']
+                   for r in rows):
+                raise Exception("duplicate key value violates unique constraint")
+            rows.append(dict(self.row_to_insert))
+            return MagicMock(data=[self.row_to_insert])
+        result = [row for row in rows if all(f(row) for f in self.filters)]
+        if self.order_by:
+            result.sort(key=lambda row: row[self.order_by], reverse=self.desc)
+        if self.limit_count is not None:
+            result = result[:self.limit_count]
+        return MagicMock(data=result)
+
+
+class FakeDB:
+    def __init__(self):
+        self.tables = {}
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    @property
+    async def client(self):
+        return self
+
+
+class MockLLM:
+    """Summarizer stand-in that records each prompt and answers with a short tagged summary."""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def __call__(self, model_name, messages, **kwargs):
+        prompt = messages[0]["content"]
+        self.prompts.append(prompt)
+        kind = "merged" if "consecutive summaries" in prompt else "chunk"
+        message_ids = sorted(set(re.findall(r"message (\d+)", prompt)), key=int)
+        content = f"{kind} summary of messages {','.join(message_ids)}"
+        response = MagicMock()
+        response.choices = [MagicMock(message=MagicMock(content=content))]
+        return response
+
+
+def make_rows(count, words=300, start=None):
+    start = start or datetime(2025, 6, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(count):
+        role = "user" if i % 2 == 0 else "assistant"
+        rows.append({
+            "message_id": f"m{i}",
+            "thread_id": "thread-1",
+            "type": role,
+            "is_llm_message": True,
+            "content": {"role": role, "content": f"message {i} " + "lorem " * words},
+            "created_at": (start + timedelta(seconds=i)).isoformat(),
+        })
+    return rows
+
+
+@pytest.fixture
+def mock_llm():
+    llm = MockLLM()
+    with patch.object(context_manager, "make_llm_api_call", new=llm), \
+         patch.object(context_manager.litellm, "completion_cost", return_value=0.0):
+        yield llm
+
+
+@pytest.fixture
+def manager():
+    manager = ContextManager()
+    manager.db = FakeDB()
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_create_summary_map_reduces_in_bounded_chunks(manager, mock_llm):
+    messages = [row["content"] for row in make_rows(60)]
+
+    with patch.object(context_manager, "SUMMARY_CHUNK_TOKENS", 4000):
+        summary = await manager.create_summary("thread-1", messages, "test-model")
+
+    map_prompts = [p for p in mock_llm.prompts if "consecutive summaries" not in p]
+    reduce_prompts = [p for p in mock_llm.prompts if "consecutive summaries" in p]
+    assert len(map_prompts) > 1
+    assert len(reduce_prompts) == 1
+    # Each map call only sees its own chunk, rendered as a transcript rather than a Python repr
+    assert all(count_text_tokens(p) < 4000 + 1000 for p in map_prompts)
+    assert "{'role'" not in map_prompts[0] and "[user] message 0" in map_prompts[0]
+    # Every message is covered by exactly one chunk
+    covered = [re.findall(r"\[(?:user|assistant)\] message (\d+) ", p) for p in map_prompts]
+    assert sorted(int(i) for ids in covered for i in ids) == list(range(60))
+
+    assert summary["role"] == "user"
+    assert "merged summary" in summary["content"]
+
+
+@pytest.mark.asyncio
+async def test_short_history_is_summarized_in_one_call(manager, mock_llm):
+    summary = await manager.create_summary("thread-1", [row["content"] for row in make_rows(4, words=10)], "test-model")
+    assert len(mock_llm.prompts) == 1
+    assert "chunk summary of messages 0,1,2,3" in summary["content"]
+
+
+@pytest.mark.asyncio
+async def test_rolling_summary_stores_segment_and_keeps_recent_tail(manager, mock_llm):
+    rows = make_rows(40)
+    # A tool result right at the split point stays with its tool call
+    rows[30]["type"] = "tool"
+    rows[30]["content"] = {"role": "tool", "content": "message 30 result"}
+    manager.db.tables["messages"] = rows
+
+    with patch.object(context_manager, "KEEP_RECENT_TOKENS", 3000):
+        split = ContextManager.select_rolling_range(rows, keep_recent_tokens=3000)
+        segment = await manager.update_rolling_summary("thread-1", "test-model")
+
+    assert rows[split]["type"] != "tool"
+    assert segment["covers_after"] is None
+    assert segment["start_message_id"] == "m0"
+    assert segment["end_message_id"] == rows[split - 1]["message_id"]
+    assert segment["message_count"] == split
+    assert manager.db.tables["thread_summary_segments"] == [segment]
+
+    # Token count now only includes the messages after the segment
+    remaining = await manager.get_messages_for_summarization("thread-1")
+    assert len(remaining) == len(rows) - split
+
+
+@pytest.mark.asyncio
+async def test_next_pass_folds_in_previous_summary(manager, mock_llm):
+    rows = make_rows(30)
+    manager.db.tables["messages"] = [{
+        "message_id": "s0", "thread_id": "thread-1", "type": "summary", "is_llm_message": True,
+        "content": {"role": "user", "content": "EARLIER SUMMARY"},
+        "created_at": datetime(2025, 5, 31, tzinfo=timezone.utc).isoformat(),
+    }] + rows
+
+    segment = await manager.update_rolling_summary("thread-1", "test-model")
+    assert segment is None  # everything fits in the verbatim tail
+
+    with patch.object(context_manager, "KEEP_RECENT_TOKENS", 2000):
+        first = await manager.update_rolling_summary("thread-1", "test-model")
+    assert first["covers_after"] == manager.db.tables["messages"][0]["created_at"]
+    assert any("EARLIER SUMMARY" in p and "consecutive summaries" in p for p in mock_llm.prompts)
+
+    manager.db.tables["messages"] += make_rows(10, start=datetime(2025, 6, 2, tzinfo=timezone.utc))
+    for row in manager.db.tables["messages"][-10:]:
+        row["message_id"] = "n" + row["message_id"]
+    mock_llm.prompts.clear()
+    with patch.object(context_manager, "KEEP_RECENT_TOKENS", 2000):
+        second = await manager.update_rolling_summary("thread-1", "test-model")
+    assert second["covers_after"] == first["end_created_at"]
+    assert second["start_created_at"] > first["end_created_at"]
+    assert any(first["content"]["content"] in p for p in mock_llm.prompts)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_pass_from_same_boundary_is_discarded(manager, mock_llm):
+    manager.db.tables["messages"] = make_rows(30)
+    other = ContextManager()
+    other.db = manager.db
+
+    with patch.object(context_manager, "KEEP_RECENT_TOKENS", 2000):
+        results = await asyncio.gather(
+            manager.update_rolling_summary("thread-1", "test-model"),
+            other.update_rolling_summary("thread-1", "test-model"),
+        )
+    assert sum(result is not None for result in results) == 1
+    assert len(manager.db.tables["thread_summary_segments"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_schedule_rolling_summary_runs_once_per_thread(manager, mock_llm):
+    manager.db.tables["messages"] = make_rows(30)
+    with patch.object(context_manager, "KEEP_RECENT_TOKENS", 2000):
+        assert manager.schedule_rolling_summary("thread-1", "test-model")
+        assert not manager.schedule_rolling_summary("thread-1", "test-model")
+        await context_manager._rolling_summary_tasks["thread-1"]
+    await asyncio.sleep(0)
+    assert "thread-1" not in context_manager._rolling_summary_tasks
+    assert len(manager.db.tables["thread_summary_segments"]) == 1
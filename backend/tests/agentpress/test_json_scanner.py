@@ -0,0 +1,139 @@
+import json
+import random
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from agentpress.plan_executor import PlanExecutor
+from agentpress.response_processor import ProcessorConfig, ResponseProcessor
+from agentpress.tool import ToolResult
+from agentpress.tool_orchestrator import ToolOrchestrator
+from agentpress.utils.json_scanner import IncrementalJSONScanner, MAX_PARTIAL_VALUE_CHARS
+
+
+def feed_in_chunks(scanner, text, sizes):
+    i = 0
+    while i < len(text):
+        size = next(sizes)
+        scanner.feed(text[i:i + size])
+        i += size
+    return scanner
+
+
+def test_completes_only_when_root_closes():
+    scanner = IncrementalJSONScanner()
+    assert not scanner.feed('{"a": "}", "b": [1, {')
+    assert not scanner.feed('"c": "\\"]}"}]')
+    assert scanner.feed('}')
+    assert scanner.value() == {"a": "}", "b": [1, {"c": '"]}'}]}
+
+
+def test_random_chunking_matches_json_loads():
+    obj = {"file_path": "src/a \"b\".py", "n": -12.5e3, "ok": True, "none": None,
+           "nested": {"x": [1, "}", {"y": "\\"}]}, "body": "line\\n\"quoted\"\n" * 200}
+    text = json.dumps(obj)
+    rng = random.Random(7)
+    for _ in range(50):
+        scanner = feed_in_chunks(IncrementalJSONScanner(), text, iter(lambda: rng.randint(1, 17), None))
+        assert scanner.complete
+        assert scanner.value() == obj
+
+
+def test_partial_values_are_available_before_completion():
+    scanner = IncrementalJSONScanner()
+    scanner.feed('{"file_path": "src/main.py", "mode": 4')
+    assert scanner.partial_values == {"file_path": "src/main.py"}
+    scanner.feed('20, "file_contents": "a very long bo')
+    assert scanner.pop_new_values() == {"file_path": "src/main.py", "mode": 420}
+    assert not scanner.complete
+    scanner.feed('dy", "nested": {"k": "v"}}')
+    assert scanner.complete
+    # Nested containers are not extracted early; the parsed value has them
+    assert "nested" not in scanner.partial_values
+    assert scanner.value()["nested"] == {"k": "v"}
+
+
+def test_large_values_are_not_buffered_twice():
+    scanner = IncrementalJSONScanner()
+    scanner.feed('{"file_contents": "')
+    for _ in range(10):
+        scanner.feed("x" * MAX_PARTIAL_VALUE_CHARS)
+    scanner.feed('", "file_path": "a.txt"}')
+    assert scanner.partial_values == {"file_path": "a.txt"}
+    assert len(scanner.value()["file_contents"]) == 10 * MAX_PARTIAL_VALUE_CHARS
+
+
+def test_skip_prefix_and_trailing_text():
+    scanner = IncrementalJSONScanner(skip_prefix=True)
+    assert not scanner.feed("Here is the plan: ")
+    assert scanner.feed('{"plan": [1, 2]} and some trailing text')
+    assert scanner.value() == {"plan": [1, 2]}
+
+
+def test_non_json_start_is_an_error():
+    scanner = IncrementalJSONScanner()
+    assert not scanner.feed("not json {}")
+    assert scanner.error
+
+
+def make_tool_call_chunk(index, arguments, tool_call_id=None, name=None, content=None, finish_reason=None):
+    function = MagicMock()
+    function.name = name
+    function.arguments = arguments
+    tool_call = MagicMock()
+    tool_call.index = index
+    tool_call.id = tool_call_id
+    tool_call.type = "function"
+    tool_call.function = function
+    tool_call.model_dump.return_value = {"index": index, "id": tool_call_id, "function": {"name": name, "arguments": arguments}}
+
+    delta = MagicMock()
+    delta.content = content
+    delta.reasoning_content = None
+    delta.tool_calls = [tool_call] if arguments is not None else None
+    choice = MagicMock()
+    choice.delta = delta
+    choice.finish_reason = finish_reason
+    chunk = MagicMock()
+    chunk.choices = [choice]
+    return chunk
+
+
+@pytest.mark.asyncio
+async def test_streamed_native_tool_call_is_staged_and_executed_once():
+    async def add_message(thread_id, type, content, is_llm_message, metadata=None, message_id=None):
+        return {"message_id": f"msg_{type}", "thread_id": thread_id, "type": type, "content": json.dumps(content),
+                "is_llm_message": is_llm_message, "metadata": json.dumps(metadata or {}), "created_at": "now", "updated_at": "now"}
+
+    tool_orchestrator = MagicMock(spec=ToolOrchestrator)
+    tool_orchestrator.execute_tool = AsyncMock(return_value=ToolResult(
+        tool_id="MockFilesTool", execution_id="exec_1", status="completed", result={"ok": True}, start_time=0, end_time=1
+    ))
+    processor = ResponseProcessor(
+        tool_orchestrator=tool_orchestrator,
+        add_message_callback=AsyncMock(side_effect=add_message),
+        plan_executor=MagicMock(spec=PlanExecutor),
+        trace=None
+    )
+
+    async def stream():
+        yield make_tool_call_chunk(0, None, content="Creating the file. ")
+        yield make_tool_call_chunk(0, '{"file_path": "src/ma', tool_call_id="call_1", name="MockFilesTool__create_file")
+        yield make_tool_call_chunk(0, 'in.py", "file_contents": "print(')
+        yield make_tool_call_chunk(0, '\'a\')"}')
+        yield make_tool_call_chunk(0, '', finish_reason="tool_calls")
+
+    config = ProcessorConfig(native_tool_calling=True, xml_tool_calling=False, execute_tools=True, execute_on_stream=True)
+    results = [r async for r in processor.process_streaming_response(stream(), "thread_1", [], "test_model", config)]
+
+    staged = [json.loads(r["content"]) for r in results
+              if r["type"] == "status" and json.loads(r["content"]).get("status_type") == "tool_call_staged"]
+    assert len(staged) == 1
+    assert staged[0]["arguments"] == {"file_path": "src/main.py"}
+    assert staged[0]["function_name"] == "MockFilesTool__create_file"
+
+    tool_orchestrator.execute_tool.assert_called_once_with(
+        tool_id="MockFilesTool",
+        method_name="create_file",
+        params={"file_path": "src/main.py", "file_contents": "print('a')"}
+    )
@@ -0,0 +1,89 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from agentpress import thread_manager
+from agentpress.response_processor import ProcessorConfig
+from agentpress.thread_manager import ThreadManager
+from services import artifact_store
+from services.artifact_store import ArtifactStore, LocalArtifactBackend
+
+
+class FakeDB:
+    def __init__(self, client):
+        self._client = client
+
+    @property
+    def client(self):
+        async def get():
+            return self._client
+        return get()
+
+
+def make_manager(rows, tool_rows=()):
+    client = MagicMock()
+    client.rpc.return_value.execute = AsyncMock(return_value=SimpleNamespace(data=rows))
+    select = client.table.return_value.select.return_value
+    select.eq.return_value.eq.return_value.execute = AsyncMock(return_value=SimpleNamespace(data=list(tool_rows)))
+    manager = ThreadManager.__new__(ThreadManager)
+    manager.db = FakeDB(client)
+    manager.tool_orchestrator = MagicMock()
+    manager.context_manager = SimpleNamespace(token_threshold=10**9, rolling_summary_watermark=10**9)
+
+    async def responses(**kwargs):
+        yield {"type": "finish", "finish_reason": "stop"}
+
+    manager.response_processor = SimpleNamespace(process_non_streaming_response=MagicMock(side_effect=responses))
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_run_thread_sends_offloaded_tool_output_in_full(tmp_path, monkeypatch):
+    store = ArtifactStore(LocalArtifactBackend(str(tmp_path)), threshold_bytes=16 * 1024, preview_chars=2000)
+    monkeypatch.setattr(artifact_store, "_store", store)
+    monkeypatch.setattr(artifact_store, "_store_created", True)
+
+    output = "".join(f"row {i}: scraped content\n" for i in range(2000))
+    reference, digest = await artifact_store.offload_tool_output(output)
+    assert digest and len(reference) < len(output)
+
+    tool_message = {"role": "tool", "tool_call_id": "call-1", "name": "scrape_webpage", "content": reference}
+    rows = [json.dumps({"role": "user", "content": "Scrape the page"}), json.dumps(tool_message)]
+    manager = make_manager(rows, [{"content": tool_message, "metadata": {"artifacts": [digest]}}])
+    llm_call = AsyncMock(return_value=SimpleNamespace())
+    monkeypatch.setattr(thread_manager, "make_llm_api_call", llm_call)
+
+    response = await manager.run_thread(
+        "thread-1", {"role": "system", "content": "You are helpful"}, stream=False,
+        processor_config=ProcessorConfig(xml_tool_calling=False, native_tool_calling=True),
+        native_max_auto_continues=0,
+    )
+    assert [chunk async for chunk in response] == [{"type": "finish", "finish_reason": "stop"}]
+
+    sent = llm_call.call_args.args[0]
+    assert sent[-1]["role"] == "tool" and sent[-1]["content"] == output
+
+
+@pytest.mark.asyncio
+async def test_only_tool_results_expand_their_own_artifacts(tmp_path, monkeypatch):
+    store = ArtifactStore(LocalArtifactBackend(str(tmp_path)), threshold_bytes=100, preview_chars=20)
+    monkeypatch.setattr(artifact_store, "_store", store)
+    monkeypatch.setattr(artifact_store, "_store_created", True)
+    secret, _ = await artifact_store.offload_tool_output("another thread's output " * 20)
+    scraped, scraped_digest = await artifact_store.offload_tool_output("scraped content " * 20)
+
+    # A user quoting a reference, and a tool result smuggling in a digest its metadata does not record
+    tool_text = f"{scraped}\n{secret}"
+    rows = [
+        {"role": "user", "content": f"Show me {secret}"},
+        {"role": "assistant", "content": tool_text},
+    ]
+    manager = make_manager(rows, [
+        {"content": json.dumps({"role": "assistant", "content": tool_text}), "metadata": {"artifacts": [scraped_digest]}},
+    ])
+
+    user, tool = await manager.get_llm_messages("thread-1", expand_artifacts=True)
+    assert user["content"] == f"Show me {secret}"
+    assert tool["content"] == f"{'scraped content ' * 20}\n{secret}"
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from agentpress.tool_scheduler import ToolClassLimit, ToolScheduler, get_tool_scheduler, sandbox_of, tool_class_of
+
+
+def make_scheduler(max_concurrency=8):
+    return ToolScheduler(max_concurrency, {
+        "interactive": ToolClassLimit(priority=0),
+        "browser": ToolClassLimit(limit=1, per_sandbox=True),
+        "scrape": ToolClassLimit(limit=2),
+    })
+
+
+async def hold(scheduler, log, label, release, **slot_kwargs):
+    async with scheduler.slot(**slot_kwargs):
+        log.append(label)
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_class_limits_are_global_or_per_sandbox():
+    scheduler = make_scheduler()
+    release = asyncio.Event()
+    log = []
+    tasks = [asyncio.create_task(hold(scheduler, log, f"scrape-{i}", release, tool_class="scrape", run_id=f"run-{i}")) for i in range(4)]
+    tasks += [asyncio.create_task(hold(scheduler, log, f"browser-{sandbox}-{i}", release, tool_class="browser", sandbox_id=sandbox))
+              for sandbox in ("a", "b") for i in range(2)]
+    await asyncio.sleep(0)
+
+    assert scheduler.stats() == {"active": 4, "running": {"scrape": 2, "browser": 2}, "queued": {"scrape": 2, "browser": 2}}
+    assert sorted(log) == ["browser-a-0", "browser-b-0", "scrape-0", "scrape-1"]
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert len(log) == 8
+    assert scheduler.stats() == {"active": 0, "running": {}, "queued": {}}
+
+
+@pytest.mark.asyncio
+async def test_interactive_tools_and_other_runs_are_not_starved():
+    scheduler = make_scheduler(max_concurrency=1)
+    gate = asyncio.Event()
+    order = []
+
+    async def call(label, **slot_kwargs):
+        async with scheduler.slot(**slot_kwargs):
+            order.append(label)
+            await gate.wait()
+
+    # Run A occupies the only slot and queues a burst; run B and an interactive call arrive later
+    first = asyncio.create_task(call("a-0", run_id="a"))
+    await asyncio.sleep(0)
+    burst = [asyncio.create_task(call(f"a-{i}", run_id="a")) for i in range(1, 4)]
+    await asyncio.sleep(0)
+    other_run = asyncio.create_task(call("b-0", run_id="b"))
+    await asyncio.sleep(0)
+    ask = asyncio.create_task(call("ask", tool_class="interactive", run_id="a"))
+    await asyncio.sleep(0)
+
+    gate.set()
+    await asyncio.gather(first, *burst, other_run, ask)
+    assert order[:3] == ["a-0", "ask", "b-0"]
+    assert order[3:] == ["a-1", "a-2", "a-3"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiters_release_their_place():
+    scheduler = make_scheduler(max_concurrency=1)
+    release = asyncio.Event()
+    log = []
+    running = asyncio.create_task(hold(scheduler, log, "running", release))
+    await asyncio.sleep(0)
+    queued = asyncio.create_task(hold(scheduler, log, "cancelled", release))
+    await asyncio.sleep(0)
+
+    queued.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+    release.set()
+    await running
+
+    assert log == ["running"]
+    assert scheduler.stats() == {"active": 0, "running": {}, "queued": {}}
+
+
+@pytest.mark.asyncio
+async def test_tool_metadata_and_shared_scheduler():
+    class BrowserTool:
+        SCHEDULER_CLASS = "browser"
+        project_id = "project-1"
+
+    assert (tool_class_of(BrowserTool()), sandbox_of(BrowserTool())) == ("browser", "project-1")
+    assert (tool_class_of(object()), sandbox_of(None)) == ("default", None)
+    assert get_tool_scheduler() is get_tool_scheduler()
@@ -0,0 +1,110 @@
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+pytest.importorskip("playwright")
+pytest.importorskip("pytesseract")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "sandbox", "docker"))
+
+import browser_api  # noqa: E402
+from browser_api import BatchAction, BrowserAutomation, PageContentAction  # noqa: E402
+from browser_pool import DEFAULT_SESSION, BrowserSession  # noqa: E402
+
+
+class FakePage:
+    url = "https://example.com/login"
+
+    async def wait_for_url(self, predicate, timeout):
+        if not predicate(self.url):
+            raise TimeoutError(f"url is {self.url}")
+
+
+@pytest.fixture
+def automation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    service = BrowserAutomation()
+    service.pool.sessions[DEFAULT_SESSION] = BrowserSession(DEFAULT_SESSION, context=None, pages=[FakePage()])
+    states = []
+
+    async def state(action_name):
+        states.append((action_name, browser_api._batch_in_progress.get()))
+        return None, "final-shot", "[1]<button>Go</button>", {"element_count": 1}
+
+    monkeypatch.setattr(service, "get_updated_browser_state", state)
+    return service, states
+
+
+@pytest.mark.asyncio
+async def test_batch_runs_steps_and_collects_state_once(automation):
+    service, states = automation
+    calls = []
+
+    async def input_text(action):
+        calls.append((action.index, action.text))
+        return browser_api.BrowserActionResult(success=True, message="typed")
+
+    service.batch_actions["input_text"] = (input_text, browser_api.InputTextAction)
+    result = await service.batch(BatchAction(steps=[
+        {"action": "input_text", "params": {"index": 1, "text": "jane"}},
+        {"action": "input_text", "params": {"index": 2, "text": "secret"}, "expect": {"url_contains": "/login"}},
+    ]))
+
+    assert result.success and result.completed_steps == 2 and result.failed_step is None
+    assert calls == [(1, "jane"), (2, "secret")]
+    assert result.screenshot_base64 == "final-shot"
+    assert len(states) == 1 and states[0][1] is False
+
+
+@pytest.mark.asyncio
+async def test_batch_stops_at_first_failed_expectation(automation):
+    service, states = automation
+    send_keys = AsyncMock(return_value=browser_api.BrowserActionResult(success=True, message="sent"))
+    service.batch_actions["send_keys"] = (send_keys, browser_api.SendKeysAction)
+
+    result = await service.batch(BatchAction(steps=[
+        {"action": "send_keys", "params": {"keys": "Enter"}, "expect": {"url_contains": "/dashboard", "timeout_ms": 10}},
+        {"action": "send_keys", "params": {"keys": "Tab"}},
+    ], include_screenshot=False))
+
+    assert not result.success and result.failed_step == 0 and result.completed_steps == 0
+    assert "Expectation not met" in result.error
+    assert send_keys.await_count == 1
+    assert result.screenshot_base64 is None and len(states) == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_rejects_unknown_actions(automation):
+    service, _ = automation
+    result = await service.batch(BatchAction(steps=[{"action": "save_pdf"}]))
+    assert result.failed_step == 0 and "Unsupported batch action" in result.steps[0].error
+
+
+@pytest.mark.asyncio
+async def test_batch_validates_params_of_body_field_endpoints(automation):
+    service, _ = automation
+    result = await service.batch(BatchAction(steps=[
+        {"action": "wait", "params": {"seconds": 0}},
+        {"action": "select_dropdown_option", "params": {"index": 3}},
+    ], include_screenshot=False))
+
+    assert result.steps[0].success and result.steps[0].message == "Waited for 0 seconds"
+    assert result.failed_step == 1 and "option_text" in result.steps[1].error
+
+
+@pytest.mark.asyncio
+async def test_page_content_only_sees_the_callers_session(automation):
+    service, _ = automation
+    service.pool.sessions["thread-a"] = BrowserSession("thread-a", context=None, pages=[FakePage()])
+    service.extractor.extract = AsyncMock(return_value=(SimpleNamespace(
+        url=FakePage.url, title="Login", markdown="# Login", dom_hash="abc", age_seconds=0,
+    ), False))
+    action = PageContentAction(url=FakePage.url)
+
+    assert (await service.page_content(action, "thread-a"))["found"]
+    service.extractor.extract.assert_awaited_once()
+    assert service.extractor.extract.await_args.args[1] == "thread-a"
+    assert not (await service.page_content(action, "thread-b"))["found"]
+    assert "thread-b" not in service.pool.sessions
@@ -0,0 +1,108 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+
+from agent.tools import sb_browser_tool
+from sandbox import browser_client
+from agent.tools.sb_browser_tool import BrowserToolError, SandboxBrowserTool
+from sandbox.browser_client import (
+    BrowserRoute, BrowserRouteCache, BrowserServiceClient, BrowserServiceError, action_timeout, resolve_browser_route,
+)
+
+
+def test_routes_for_daytona_and_local_sandboxes():
+    daytona = SimpleNamespace(get_preview_link=lambda port: SimpleNamespace(url=f"https://{port}-sb.proxy/", token="tok"))
+    assert resolve_browser_route(daytona) == BrowserRoute("https://8003-sb.proxy", {"X-Daytona-Preview-Token": "tok"})
+
+    container = MagicMock(ports={"8003/tcp": [{"HostIp": "0.0.0.0", "HostPort": "41234"}]})
+    assert resolve_browser_route({"id": "local", "container": container}).base_url == "http://127.0.0.1:41234"
+    assert resolve_browser_route({"id": "local", "container": MagicMock(ports={})}) is None
+    assert action_timeout("wait", {"seconds": 5}) == 35 and action_timeout("batch") == 180
+
+
+@pytest.mark.asyncio
+async def test_client_sends_json_with_route_headers():
+    seen, sessions = [], []
+
+    def handler(request):
+        seen.append((request.url.path, request.headers.get("x-daytona-preview-token"), json.loads(request.content)))
+        sessions.append(request.headers.get("x-browser-session"))
+        if request.url.path.endswith("/missing"):
+            return httpx.Response(404, text="Not Found")
+        if request.url.path.endswith("/down"):
+            return httpx.Response(503)
+        if request.url.path.endswith("/gateway"):
+            return httpx.Response(504)
+        return httpx.Response(200, json={"success": True, "screenshot_base64": "x" * 5000})
+
+    client = BrowserServiceClient(4, max_response_bytes=10_000, transport=httpx.MockTransport(handler))
+    route = BrowserRoute("https://8003-sb.proxy", {"X-Daytona-Preview-Token": "tok"})
+
+    result = await client.request(route, "click_element", {"index": 2})
+    assert result["success"] and seen[0] == ("/api/automation/click_element", "tok", {"index": 2})
+    await client.request(route, "click_element", {"index": 2}, headers={"X-Browser-Session": "thread-1"})
+    assert sessions[:2] == [None, "thread-1"] and seen[1][1] == "tok"
+    with pytest.raises(BrowserServiceError) as missing:
+        await client.request(route, "missing")
+    assert missing.value.request_sent
+    with pytest.raises(BrowserServiceError) as down:
+        await client.request(route, "down")
+    assert not down.value.request_sent
+    with pytest.raises(BrowserServiceError) as gateway:
+        await client.request(route, "gateway")
+    assert gateway.value.request_sent
+    small = BrowserServiceClient(4, max_response_bytes=100, transport=httpx.MockTransport(handler))
+    with pytest.raises(BrowserServiceError, match="exceeds"):
+        await small.request(route, "click_element", {"index": 2})
+
+
+def make_tool(monkeypatch, direct_error=None):
+    tool = SandboxBrowserTool.__new__(SandboxBrowserTool)
+    tool.project_id = "project-1"
+    tool.thread_id = "thread-1"
+    tool._sandbox = MagicMock()
+    tool._browser_route = BrowserRouteCache(BrowserRoute("https://8003-sb.proxy"))
+    tool._browser_request_via_exec = AsyncMock(return_value={"success": True, "via": "exec"})
+    client = SimpleNamespace(request=AsyncMock(side_effect=direct_error, return_value={"success": True, "via": "http"}))
+    monkeypatch.setattr(sb_browser_tool, "get_browser_client", lambda: client)
+    return tool
+
+
+@pytest.mark.asyncio
+async def test_tool_prefers_direct_route(monkeypatch):
+    tool = make_tool(monkeypatch)
+    assert (await tool._browser_request("click_element", {"index": 1}, "POST"))["via"] == "http"
+    tool._browser_request_via_exec.assert_not_awaited()
+    assert sb_browser_tool.get_browser_client().request.await_args.kwargs["headers"] == {"X-Browser-Session": "thread-1"}
+
+
+@pytest.mark.asyncio
+async def test_tool_falls_back_to_exec_only_when_request_was_not_sent(monkeypatch):
+    tool = make_tool(monkeypatch, BrowserServiceError("connection refused", request_sent=False))
+    assert (await tool._browser_request("click_element", {"index": 1}, "POST"))["via"] == "exec"
+    assert tool._browser_route.route is None and tool._browser_route.retry_at > 0
+
+    tool = make_tool(monkeypatch, BrowserServiceError("read timeout", request_sent=True))
+    with pytest.raises(BrowserToolError):
+        await tool._browser_request("click_element", {"index": 1}, "POST")
+    tool._browser_request_via_exec.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_tool_looks_up_failed_route_again_later(monkeypatch):
+    tool = make_tool(monkeypatch, BrowserServiceError("connection refused", request_sent=False))
+    resolve = MagicMock(return_value=BrowserRoute("https://8003-sb.proxy"))
+    monkeypatch.setattr(browser_client, "resolve_browser_route", resolve)
+    monkeypatch.setattr(browser_client.config, "BROWSER_API_DIRECT", True)
+    await tool._browser_request("click_element", {"index": 1}, "POST")
+
+    sb_browser_tool.get_browser_client().request.side_effect = None
+    assert (await tool._browser_request("click_element", {"index": 1}, "POST"))["via"] == "exec"
+    resolve.assert_not_called()
+
+    tool._browser_route.retry_at = 0.0
+    assert (await tool._browser_request("click_element", {"index": 1}, "POST"))["via"] == "http"
+    resolve.assert_called_once_with(tool._sandbox)
@@ -0,0 +1,154 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "sandbox", "docker"))
+
+from browser_pool import BrowserContextPool, RequestBlockingPolicy  # noqa: E402
+
+
+class FakePage:
+    def __init__(self, heap=0):
+        self.url = "about:blank"
+        self.main_frame = object()
+        self.heap = heap
+        self.closed = False
+        self.listeners = {}
+
+    def on(self, event, callback):
+        self.listeners[event] = callback
+
+    async def goto(self, url, **kwargs):
+        self.url = url
+        self.navigate()
+
+    def navigate(self):
+        self.listeners["framenavigated"](self.main_frame)
+
+    async def evaluate(self, script):
+        return self.heap
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self, storage_state=None):
+        self.pages = []
+        self.closed = False
+        self.routes = []
+        self.state = storage_state or {"cookies": [], "origins": []}
+
+    async def new_page(self):
+        page = FakePage()
+        self.pages.append(page)
+        return page
+
+    async def route(self, pattern, handler):
+        self.routes.append(pattern)
+
+    async def storage_state(self):
+        return self.state
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.contexts = []
+
+    async def new_context(self, storage_state=None, **kwargs):
+        context = FakeContext(storage_state)
+        self.contexts.append(context)
+        return context
+
+
+def make_pool(**kwargs):
+    pool = BrowserContextPool(**kwargs)
+    pool.browser = FakeBrowser()
+    return pool
+
+
+@pytest.mark.asyncio
+async def test_blocking_policy_aborts_fonts_media_and_ads():
+    policy = RequestBlockingPolicy()
+    assert policy.should_block("font", "https://example.com/a.woff2")
+    assert policy.should_block("script", "https://securepubads.g.doubleclick.net/tag.js")
+    assert not policy.should_block("document", "https://example.com/")
+    assert not RequestBlockingPolicy(resource_types=[""], block_ads=False).active
+
+    route = SimpleNamespace(
+        request=SimpleNamespace(resource_type="media", url="https://example.com/v.mp4"),
+        abort=AsyncMock(), continue_=AsyncMock(),
+    )
+    await policy.handle(route)
+    route.abort.assert_awaited_once()
+    route.continue_.assert_not_awaited()
+    assert policy.blocked == 1
+
+
+@pytest.mark.asyncio
+async def test_sessions_get_isolated_contexts_and_make_room():
+    pool = make_pool(max_contexts=2)
+    first = await pool.acquire("thread-a")
+    assert await pool.acquire("thread-a") is first
+    second = await pool.acquire("thread-b")
+    assert first.context is not second.context and len(first.pages) == 1
+    assert first.context.routes == ["**/*"]
+
+    first.last_used -= 100
+    second.active = 1
+    await pool.acquire("thread-c")
+    assert set(pool.sessions) == {"thread-b", "thread-c"} and first.context.closed
+
+
+@pytest.mark.asyncio
+async def test_recycles_after_navigation_limit_on_current_url():
+    pool = make_pool(max_navigations=3)
+    session = await pool.acquire("thread-a")
+    page = session.pages[0]
+    await page.goto("https://example.com/report")
+    page.navigate()
+    page.navigate()
+    assert session.navigations == 3
+
+    session.active = 1
+    await pool.acquire("thread-a")
+    assert session.recycles == 0
+    session.active = 0
+    old_context = session.context
+    old_context.state = {"cookies": [{"name": "sid", "value": "1", "domain": "example.com"}], "origins": []}
+    await pool.acquire("thread-a")
+    assert old_context.closed and session.context is not old_context
+    assert session.recycles == 1 and session.navigations == 0
+    assert session.pages[0].url == "https://example.com/report"
+    assert session.context.state == old_context.state
+
+
+@pytest.mark.asyncio
+async def test_reap_closes_idle_tabs_sessions_and_recycles_heavy_contexts():
+    pool = make_pool(idle_tab_seconds=60, idle_context_seconds=600, max_heap_mb=100)
+    session = await pool.acquire("thread-a")
+    current = session.pages[0]
+    stale = await pool.new_page(session)
+    session.current_page_index = 0
+    session.page_last_used[id(stale)] = time.monotonic() - 120
+    session.page_last_used[id(current)] = time.monotonic() - 120
+    idle = await pool.acquire("thread-b")
+    idle.last_used -= 1000
+
+    await pool.reap()
+    assert stale.closed and not current.closed and session.pages == [current] and session.current_page_index == 0
+    assert "thread-b" not in pool.sessions and idle.context.closed
+
+    current.heap = 150 * 1024 * 1024
+    metrics = await pool.metrics()
+    assert metrics["contexts"] == 1 and metrics["closed_tabs"] == 1 and metrics["closed_sessions"] == 1
+    assert metrics["sessions"]["thread-a"]["js_heap_mb"] == 150.0
+    await pool.reap()
+    assert session.recycles == 1 and session.pages[0] is not current
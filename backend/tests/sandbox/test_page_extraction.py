@@ -0,0 +1,84 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "sandbox", "docker"))
+
+from page_extraction import ByteLRU, PageExtractor, normalize_url  # noqa: E402
+
+
+class FakePage:
+    """Stands in for the page script: blocks are (fingerprint, markdown) pairs."""
+
+    def __init__(self, url, blocks):
+        self.url = url
+        self.blocks = blocks
+        self.calls = []
+
+    async def evaluate(self, script, args):
+        self.calls.append(sorted(args["known"]))
+        known = set(args["known"])
+        return {
+            "url": self.url,
+            "title": "Docs",
+            "blocks": [{"hash": h} if h in known else {"hash": h, "markdown": md} for h, md in self.blocks],
+        }
+
+
+@pytest.mark.asyncio
+async def test_extraction_is_cached_per_dom_and_reconverts_only_changed_blocks():
+    extractor = PageExtractor()
+    page = FakePage("https://example.com/docs#install", [("a1", "# Install"), ("b1", "Run it.")])
+
+    first, cached = await extractor.extract(page, "thread-a")
+    assert not cached and first.markdown == "# Install\n\nRun it." and first.url == "https://example.com/docs"
+    assert (await extractor.extract(page, "thread-a"))[1] is True
+    assert page.calls[1] == ["a1", "b1"]
+
+    page.blocks[1] = ("b2", "Run it twice.")
+    changed, cached = await extractor.extract(page, "thread-a")
+    assert not cached and changed.markdown == "# Install\n\nRun it twice." and changed.dom_hash != first.dom_hash
+    assert extractor.converted_blocks == 3 and extractor.reused_blocks == 1
+    assert extractor.latest("https://example.com/docs/", "thread-a") is changed
+
+
+@pytest.mark.asyncio
+async def test_evicted_blocks_fall_back_to_full_conversion():
+    extractor = PageExtractor()
+    page = FakePage("https://example.com/", [("a1", "Intro"), ("b1", "Body")])
+    await extractor.extract(page, "thread-a")
+    page.blocks.append(("c1", "More"))
+    original_get = extractor.blocks.get
+    extractor.blocks.get = lambda key: None if key == ("thread-a", "b1") else original_get(key)
+
+    extracted, _ = await extractor.extract(page, "thread-a")
+    assert extracted.markdown == "Intro\n\nBody\n\nMore"
+    assert page.calls[-1] == []
+
+
+@pytest.mark.asyncio
+async def test_extractions_are_scoped_to_their_session():
+    extractor = PageExtractor()
+    page = FakePage("https://example.com/account", [("a1", "Balance: 42")])
+    extracted, _ = await extractor.extract(page, "thread-a")
+
+    assert extractor.latest("https://example.com/account", "thread-a") is extracted
+    assert extractor.latest("https://example.com/account", "thread-b") is None
+    other_page = FakePage(page.url, page.blocks)
+    other, cached = await extractor.extract(other_page, "thread-b")
+    assert not cached and other is not extracted
+    # Blocks converted for one session are not offered to another
+    assert other_page.calls == [[]] and ("thread-b", "a1") in extractor.blocks
+
+
+def test_byte_lru_bounds_total_size():
+    cache = ByteLRU(10, len)
+    cache.put("a", "12345")
+    cache.put("b", "12345")
+    cache.get("a")
+    cache.put("c", "123")
+    assert "a" in cache and "b" not in cache and cache.size == 8
+    cache.put("huge", "x" * 11)
+    assert "huge" not in cache
+    assert normalize_url("https://example.com/a/#top") == "https://example.com/a"
@@ -0,0 +1,106 @@
+import importlib.util
+import os
+
+import httpx
+import pytest
+
+SERVER_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "sandbox", "docker", "server.py")
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    root = tmp_path / "workspace"
+    (root / "docs").mkdir(parents=True)
+    (root / "index.html").write_text("<html>" + "home " * 500 + "</html>")
+    (root / "docs" / "index.html").write_text("<html>docs</html>")
+    (root / "video.mp4").write_bytes(bytes(range(256)) * 40)
+    (tmp_path / "secret.txt").write_text("outside")
+    monkeypatch.setenv("PREVIEW_WORKSPACE_DIR", str(root))
+    monkeypatch.delenv("PREVIEW_SERVER_DEV", raising=False)
+    spec = importlib.util.spec_from_file_location("preview_server", SERVER_PATH)
+    server = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(server)
+    app = server.PreviewFiles(str(root), compressed_dir=str(tmp_path / "compressed"))
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test"), server
+
+
+@pytest.mark.asyncio
+async def test_validators_and_compression(site):
+    client, server = site
+    async with client:
+        response = await client.get("/", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert int(response.headers["content-length"]) < 2500
+        assert response.text.startswith("<html>home")
+        assert response.headers["cache-control"] == "no-cache"
+
+        etag = response.headers["etag"]
+        assert etag.endswith('-gz"')
+        revalidated = await client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert revalidated.status_code == 304 and revalidated.content == b""
+
+        # The identity body is a different representation with its own strong ETag
+        identity = await client.get("/", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+        assert identity.status_code == 200 and "content-encoding" not in identity.headers
+        assert identity.headers["etag"] == etag.replace("-gz", "")
+
+        docs = await client.get("/docs/", headers={"Accept-Encoding": "identity"})
+        assert docs.text == "<html>docs</html>" and "content-encoding" not in docs.headers
+
+
+@pytest.mark.asyncio
+async def test_ranges(site):
+    client, _ = site
+    async with client:
+        partial = await client.get("/video.mp4", headers={"Range": "bytes=256-511"})
+        assert partial.status_code == 206
+        assert partial.headers["content-range"] == "bytes 256-511/10240"
+        assert partial.content == bytes(range(256))
+
+        suffix = await client.get("/video.mp4", headers={"Range": "bytes=-10"})
+        assert suffix.content == bytes(range(246, 256))
+
+        stale = await client.get("/video.mp4", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+        assert stale.status_code == 200 and len(stale.content) == 10240
+
+        unsatisfiable = await client.get("/video.mp4", headers={"Range": "bytes=20000-"})
+        assert unsatisfiable.status_code == 416
+        assert unsatisfiable.headers["content-range"] == "bytes */10240"
+
+
+@pytest.mark.asyncio
+async def test_directory_without_trailing_slash_redirects(site):
+    client, _ = site
+    async with client:
+        response = await client.get("/docs?tab=api")
+        assert response.status_code == 307
+        assert response.headers["location"] == "/docs/?tab=api"
+        assert (await client.get("/docs/")).text == "<html>docs</html>"
+        assert (await client.get("/")).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_missing_files_and_traversal_are_404(site):
+    client, _ = site
+    async with client:
+        assert (await client.get("/missing.js")).status_code == 404
+        assert (await client.get("/../secret.txt")).status_code == 404
+        assert (await client.get("/%2e%2e/secret.txt")).status_code == 404
+        assert (await client.post("/")).status_code == 405
+
+
+@pytest.mark.asyncio
+async def test_compressed_bodies_of_old_versions_are_dropped(site, tmp_path):
+    client, _ = site
+    page = tmp_path / "workspace" / "index.html"
+    compressed = tmp_path / "compressed"
+    async with client:
+        await client.get("/", headers={"Accept-Encoding": "gzip"})
+        assert len(os.listdir(compressed)) == 1
+        page.write_text("<html>" + "changed " * 500 + "</html>")
+        os.utime(page, ns=(1, 1))
+        response = await client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.text.startswith("<html>changed")
+    [name] = os.listdir(compressed)
+    assert name.split("-")[1] == "1"
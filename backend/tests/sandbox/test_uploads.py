@@ -0,0 +1,103 @@
+import io
+import json
+import tarfile
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+from sandbox import api as sandbox_api
+from sandbox.uploads import SandboxUploader, UploadItem, item_from_file, spool_chunks
+
+
+class FakeSandbox:
+    def __init__(self, exit_code=0):
+        self.files = {}
+        self.commands = []
+        self.exit_code = exit_code
+        self.fs = SimpleNamespace(upload_file=self.upload_file)
+        self.process = SimpleNamespace(exec=self.exec)
+
+    def upload_file(self, path, content):
+        self.files[path] = content
+
+    def exec(self, command, timeout=None):
+        self.commands.append(command)
+        if self.exit_code == 0:
+            # Extract the uploaded archive like the sandbox's tar would
+            archive_path = next(path for path in self.files if path.endswith(".tar"))
+            with tarfile.open(fileobj=io.BytesIO(self.files.pop(archive_path))) as tar:
+                for member in tar.getmembers():
+                    self.files["/" + member.name] = tar.extractfile(member).read()
+        return SimpleNamespace(exit_code=self.exit_code, result="tar: error")
+
+
+def make_items(count, size=10):
+    return [item_from_file(io.BytesIO(bytes([65 + i]) * size), f"/workspace/data/file{i}.csv") for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_small_files_are_packed_into_one_tar():
+    sandbox = FakeSandbox()
+    progress = []
+    items = make_items(5) + [item_from_file(io.BytesIO(b"z" * 100), "/workspace/big.bin")]
+
+    results = await SandboxUploader(sandbox, pack_min_files=3, pack_max_file_bytes=50).upload(items, on_progress=progress.append)
+
+    assert [result.status for result in results] == ["uploaded"] * 6
+    assert [result.packed for result in results] == [True] * 5 + [False]
+    assert len(sandbox.commands) == 1 and "tar -xf" in sandbox.commands[0]
+    assert sandbox.files["/workspace/data/file3.csv"] == b"D" * 10
+    assert sandbox.files["/workspace/big.bin"] == b"z" * 100
+    assert sorted(p.path for p in progress) == sorted(item.target_path for item in items)
+
+
+@pytest.mark.asyncio
+async def test_failed_extraction_falls_back_to_individual_uploads():
+    sandbox = FakeSandbox(exit_code=2)
+    results = await SandboxUploader(sandbox, pack_min_files=3).upload(make_items(4))
+
+    assert [(result.status, result.packed) for result in results] == [("uploaded", False)] * 4
+    assert sandbox.files["/workspace/data/file0.csv"] == b"A" * 10
+
+
+@pytest.mark.asyncio
+async def test_spool_chunks_rolls_over_to_disk():
+    async def chunks():
+        for _ in range(4):
+            yield b"x" * 300
+
+    spool = await spool_chunks(chunks(), max_memory=1000)
+    assert spool._rolled
+    item = item_from_file(spool, "/workspace/large.bin")
+    assert item.size == 1200
+    assert isinstance(item, UploadItem)
+
+    with pytest.raises(HTTPException) as too_large:
+        await spool_chunks(chunks(), max_memory=1000, max_bytes=1000)
+    assert too_large.value.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_batch_endpoint_streams_per_file_progress(monkeypatch):
+    sandbox = FakeSandbox()
+    monkeypatch.setattr(sandbox_api, "db", SimpleNamespace(client=AsyncMock()()))
+    monkeypatch.setattr(sandbox_api, "verify_sandbox_access", AsyncMock())
+    monkeypatch.setattr(sandbox_api, "get_sandbox_by_id_safely", AsyncMock(return_value=sandbox))
+    app = FastAPI()
+    app.include_router(sandbox_api.router)
+    app.dependency_overrides[sandbox_api.get_optional_user_id] = lambda: "user-1"
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(
+            "/sandboxes/sb-1/files/batch",
+            files=[("files", (f"f{i}.txt", f"content {i}".encode())) for i in range(3)],
+            data={"directory": "/workspace/in", "pack": "false", "stream_progress": "true"},
+        )
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["type"] for line in lines] == ["progress"] * 3 + ["summary"]
+    assert lines[-1]["uploaded"] == 3
+    assert sandbox.files["/workspace/in/f1.txt"] == b"content 1"
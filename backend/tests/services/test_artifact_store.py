@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from services.artifact_store import (
+    ArtifactNotFoundError,
+    ArtifactStore,
+    LocalArtifactBackend,
+    find_artifact_references,
+)
+
+
+class FailingBackend:
+    async def exists(self, digest):
+        return False
+
+    async def put(self, digest, data):
+        raise OSError("disk full")
+
+    async def get(self, digest):
+        return None
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(LocalArtifactBackend(str(tmp_path)), threshold_bytes=100, preview_chars=20, cache_max_bytes=1000)
+
+
+@pytest.mark.asyncio
+async def test_small_outputs_stay_inline(store):
+    text, digest = await store.offload("short output")
+    assert (text, digest) == ("short output", None)
+    assert store.metrics.offloaded == 0
+
+
+@pytest.mark.asyncio
+async def test_large_outputs_are_offloaded_and_deduplicated(store, tmp_path):
+    output = "line of scraped markdown\n" * 40
+
+    first, digest = await store.offload(output)
+    second, same_digest = await store.offload(output)
+
+    assert digest == same_digest
+    assert first == second
+    assert len(first) < len(output)
+    assert first.startswith(f'<artifact sha256="{digest}" bytes="{len(output)}">\n{output[:20]}')
+    assert find_artifact_references(f"<tool_result> {first} </tool_result>") == [digest]
+    assert os.listdir(tmp_path / digest[:2]) == [digest]
+    assert (store.metrics.offloaded, store.metrics.deduplicated) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_inline_resolves_references_from_backend_and_cache(tmp_path, store):
+    output = "x" * 150 + "é"
+    reference, digest = await store.offload(output)
+    message = f"<tool_result> <scrape> {reference} </scrape> </tool_result>"
+
+    # A fresh store (another process) reads the artifact from the backend, then from its LRU
+    reader = ArtifactStore(LocalArtifactBackend(str(tmp_path)), threshold_bytes=100)
+    assert await reader.inline(message, {digest}) == f"<tool_result> <scrape> {output} </scrape> </tool_result>"
+    assert await reader.inline(message, {digest}) == f"<tool_result> <scrape> {output} </scrape> </tool_result>"
+    assert (reader.metrics.cache_misses, reader.metrics.cache_hits) == (1, 1)
+    # References to digests the caller did not allow stay as they are
+    assert await reader.inline(message, {"0" * 64}) == message
+
+    with pytest.raises(ArtifactNotFoundError):
+        await reader.get("0" * 64)
+
+
+@pytest.mark.asyncio
+async def test_cache_is_bounded_by_bytes(store):
+    digests = [(await store.offload(str(i) * 400))[1] for i in range(4)]
+    assert store._cache_bytes <= store.cache_max_bytes
+    assert list(store._cache) == digests[-2:]
+
+
+@pytest.mark.asyncio
+async def test_backend_failure_keeps_output_inline():
+    store = ArtifactStore(FailingBackend(), threshold_bytes=10)
+    text, digest = await store.offload("a fairly long tool output")
+    assert (text, digest) == ("a fairly long tool output", None)
+    assert store.metrics.errors == 1
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+import stripe
+
+from services import billing
+from utils.config import config
+
+
+class StripeStubHandler(BaseHTTPRequestHandler):
+    """Minimal local stand-in for the Stripe subscriptions API."""
+
+    price_id = None
+    requests = 0
+    fail = False
+
+    def do_GET(self):
+        type(self).requests += 1
+        if type(self).fail:
+            self.send_response(500)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps({"error": {"message": "stub outage"}}).encode())
+            return
+        data = []
+        if type(self).price_id:
+            data.append({
+                "id": "sub_123",
+                "object": "subscription",
+                "created": 1,
+                "items": {"object": "list", "data": [{"id": "si_1", "price": {"id": type(self).price_id}}]},
+            })
+        body = json.dumps({"object": "list", "data": data, "has_more": False, "url": "/v1/subscriptions"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key, default=None):
+        return self.store.get(key, default)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    async def delete(self, key):
+        self.store.pop(key, None)
+
+
+@pytest.fixture
+def stripe_stub():
+    server = HTTPServer(("127.0.0.1", 0), StripeStubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StripeStubHandler.price_id = config.STRIPE_TIER_2_20_ID
+    StripeStubHandler.requests = 0
+    StripeStubHandler.fail = False
+    with patch.object(stripe, "api_base", f"http://127.0.0.1:{server.server_port}"), \
+         patch.object(stripe, "api_key", "sk_test_stub"), \
+         patch.object(stripe, "max_network_retries", 0):
+        yield StripeStubHandler
+    server.shutdown()
+
+
+class FakeDBConnection:
+    @property
+    async def client(self):
+        return MagicMock()
+
+
+@pytest.fixture
+def fake_redis():
+    fake = FakeRedis()
+    with patch.object(billing, "redis", fake), \
+         patch.object(billing, "DBConnection", FakeDBConnection), \
+         patch.object(billing, "get_stripe_customer_id", AsyncMock(return_value="cus_123")):
+        yield fake
+
+
+@pytest.mark.asyncio
+async def test_entitlements_are_cached(stripe_stub, fake_redis):
+    entitlements = await billing.get_entitlements("acct-1")
+    assert entitlements["plan_name"] == "tier_2_20"
+    assert entitlements["minutes_limit"] == 120
+    assert stripe_stub.requests == 1
+
+    # Second read is served from Redis without hitting Stripe
+    assert (await billing.get_entitlements("acct-1"))["plan_name"] == "tier_2_20"
+    assert stripe_stub.requests == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_and_revalidated(stripe_stub, fake_redis):
+    await billing.get_entitlements("acct-1")
+    key = f"{billing.ENTITLEMENT_CACHE_PREFIX}acct-1"
+    stale = json.loads(fake_redis.store[key])
+    stale["cached_at"] = time.time() - billing.ENTITLEMENT_FRESH_TTL - 1
+    fake_redis.store[key] = json.dumps(stale)
+
+    stripe_stub.price_id = config.STRIPE_TIER_6_50_ID
+    entitlements = await billing.get_entitlements("acct-1")
+    # The stale value is returned immediately...
+    assert entitlements["plan_name"] == "tier_2_20"
+    # ...and replaced by the background refresh
+    await asyncio.gather(*billing._entitlement_refresh_tasks.values())
+    assert json.loads(fake_redis.store[key])["plan_name"] == "tier_6_50"
+
+
+@pytest.mark.asyncio
+async def test_stripe_outage_falls_back(stripe_stub, fake_redis):
+    stripe_stub.fail = True
+    entitlements = await billing.get_entitlements("acct-1")
+    assert entitlements["plan_name"] == "free"
+    # The fallback must not be cached
+    assert fake_redis.store == {}
+
+
+@pytest.mark.asyncio
+async def test_invalidate_forces_refetch(stripe_stub, fake_redis):
+    await billing.get_entitlements("acct-1")
+    await billing.invalidate_entitlements("acct-1")
+    stripe_stub.price_id = None
+    assert (await billing.get_entitlements("acct-1"))["plan_name"] == "free"
+    assert stripe_stub.requests == 2
+
+
+@pytest.mark.asyncio
+async def test_check_billing_status_uses_entitlements(fake_redis):
+    entitlements = billing.build_entitlements(None)
+    with patch.object(billing.config, "ENV_MODE", billing.EnvMode.PRODUCTION), \
+         patch.object(billing, "get_entitlements", AsyncMock(return_value=entitlements)), \
+         patch.object(billing, "calculate_monthly_usage", AsyncMock(return_value=entitlements["minutes_limit"] + 1)):
+        can_run, message, subscription = await billing.check_billing_status(MagicMock(), "acct-1")
+    assert can_run is False
+    assert subscription["plan_name"] == "free"
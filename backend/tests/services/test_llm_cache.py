@@ -0,0 +1,142 @@
+import json
+from unittest.mock import patch
+
+import litellm
+import pytest
+
+from services import llm, llm_cache
+from services.llm_cache import LLMCachePolicy, LLMResponseCache, make_cache_key
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.hashes = {}
+
+    async def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    async def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    async def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def expire(self, key, ttl):
+        pass
+
+
+def make_response(content="cached answer", total_tokens=42):
+    return litellm.ModelResponse(
+        id="resp-1",
+        model="mock-model",
+        choices=[{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        usage={"prompt_tokens": total_tokens - 2, "completion_tokens": 2, "total_tokens": total_tokens},
+    )
+
+
+def messages(text):
+    return [{"role": "system", "content": "You plan tasks."}, {"role": "user", "content": text}]
+
+
+@pytest.fixture
+def fake_redis():
+    fake = FakeRedis()
+    llm_cache._metrics.clear()
+    with patch.object(llm_cache, "redis", fake):
+        yield fake
+
+
+def test_cache_key_is_canonical():
+    key = make_cache_key("model", messages("a"), temperature=0.1, tools=None)
+    assert key == make_cache_key("model", messages("a"), temperature=0.1)
+    assert key != make_cache_key("model", messages("a"), temperature=0.2)
+    assert key != make_cache_key("other-model", messages("a"), temperature=0.1)
+
+
+@pytest.mark.asyncio
+async def test_exact_hit_and_metrics(fake_redis):
+    cache = LLMResponseCache()
+    policy = LLMCachePolicy(namespace="test")
+    params = {"temperature": 0}
+
+    assert (await cache.lookup(policy, "model", messages("plan"), params))[0] is None
+    await cache.store(policy, "model", messages("plan"), params, make_response())
+
+    response, _ = await cache.lookup(policy, "model", messages("plan"), params)
+    assert response.choices[0].message.content == "cached answer"
+    assert response["choices"][0]["message"]["content"] == "cached answer"
+
+    metrics = llm_cache.get_cache_metrics()["test"]
+    assert metrics["exact_hits"] == 1
+    assert metrics["misses"] == 1
+    assert metrics["tokens_saved"] == 42
+
+
+@pytest.mark.asyncio
+async def test_validator_rejects_response(fake_redis):
+    cache = LLMResponseCache()
+    policy = LLMCachePolicy(namespace="test", validator=lambda response: False)
+    await cache.store(policy, "model", messages("plan"), {}, make_response())
+    assert fake_redis.values == {}
+
+
+@pytest.mark.asyncio
+async def test_semantic_hit_for_similar_prompt(fake_redis):
+    vectors = {"book a hotel": [1.0, 0.0], "book a hotel please": [0.99, 0.05], "write a poem": [0.0, 1.0]}
+
+    async def embed(text):
+        return llm_cache._normalize(vectors[text.rsplit("user: ", 1)[1]])
+
+    cache = LLMResponseCache(embed_fn=embed)
+    policy = LLMCachePolicy(namespace="planner", semantic=True, similarity_threshold=0.95)
+
+    await cache.store(policy, "model", messages("book a hotel"), {}, make_response("hotel plan"))
+
+    response, _ = await cache.lookup(policy, "model", messages("book a hotel please"), {})
+    assert response.choices[0].message.content == "hotel plan"
+    assert (await cache.lookup(policy, "model", messages("write a poem"), {}))[0] is None
+    # Near-duplicates only match requests with the same model and parameters
+    assert (await cache.lookup(policy, "model", messages("book a hotel please"), {"temperature": 1}))[0] is None
+    assert llm_cache.get_cache_metrics()["planner"]["semantic_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_errors_are_treated_as_misses():
+    class BrokenRedis(FakeRedis):
+        async def get(self, key, default=None):
+            raise ConnectionError("redis down")
+
+    with patch.object(llm_cache, "redis", BrokenRedis()):
+        response, _ = await LLMResponseCache().lookup(LLMCachePolicy(namespace="broken"), "model", messages("x"), {})
+    assert response is None
+
+
+@pytest.mark.asyncio
+async def test_make_llm_api_call_uses_cache_for_opted_in_calls(fake_redis):
+    calls = []
+
+    class FakeGateway:
+        async def call(self, build_params, model_name):
+            calls.append(build_params(model_name))
+            return make_response("fresh")
+
+    policy = LLMCachePolicy(namespace="naming")
+    with patch.object(llm, "gateway", FakeGateway()):
+        first = await llm.make_llm_api_call(messages("name it"), "anthropic/claude-3-7-sonnet-latest", cache=policy)
+        second = await llm.make_llm_api_call(messages("name it"), "anthropic/claude-3-7-sonnet-latest", cache=policy)
+        await llm.make_llm_api_call(messages("name it"), "anthropic/claude-3-7-sonnet-latest")
+        await llm.make_llm_api_call(messages("name it"), "anthropic/claude-3-7-sonnet-latest", stream=True, cache=policy)
+
+    assert first.choices[0].message.content == second.choices[0].message.content == "fresh"
+    # Cached once; the uncached and streaming calls always go to the provider
+    assert len(calls) == 3
+    stored = json.loads(next(iter(fake_redis.values.values())))
+    assert stored["choices"][0]["message"]["content"] == "fresh"
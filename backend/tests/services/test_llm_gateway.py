@@ -0,0 +1,257 @@
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import litellm
+import pytest
+
+from services import llm, llm_gateway
+from services.llm_gateway import CircuitBreaker, LLMGateway, TokenBucket, get_retry_after
+
+LIMITS = {"primary": {"requests_per_minute": 6000, "tokens_per_minute": 10_000_000},
+          "secondary": {"requests_per_minute": 6000, "tokens_per_minute": 10_000_000}}
+FALLBACKS = {"primary/model": ["secondary/model"]}
+
+
+def rate_limit_error(retry_after="2"):
+    request = httpx.Request("POST", "http://mock/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return litellm.exceptions.RateLimitError("rate limited", llm_provider="openai", model="model", response=response)
+
+
+def build_params(model):
+    return {"model": model, "messages": [{"role": "user", "content": "hi"}]}
+
+
+def make_gateway(completion_fn, **kwargs):
+    kwargs.setdefault("hedge_delay", None)
+    kwargs.setdefault("fallback_models", FALLBACKS)
+    return LLMGateway(completion_fn=completion_fn, provider_limits=LIMITS, provider_filter=lambda _: True, **kwargs)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def sleeps():
+    recorded = []
+
+    async def fake_sleep(delay):
+        recorded.append(delay)
+
+    with patch.object(llm_gateway.asyncio, "sleep", fake_sleep):
+        yield recorded
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_minute=60, clock=clock)
+    assert bucket.try_acquire(60) == 0
+    assert bucket.try_acquire(1) == pytest.approx(1.0)
+    clock.now = 2.0
+    assert bucket.try_acquire(2) == 0
+    # Requests larger than the bucket are admitted once it is full
+    clock.now = 100.0
+    assert bucket.try_acquire(500) == 0
+
+
+def test_circuit_breaker_opens_and_probes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    clock.now = 10.0
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one probe while half-open; a failed probe re-opens the breaker
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 20.0
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retry_after_is_parsed_from_headers():
+    assert get_retry_after(rate_limit_error("3")) == 3.0
+    assert get_retry_after(ValueError("no headers")) is None
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_retry_honours_retry_after(sleeps):
+    calls = []
+
+    async def completion(**params):
+        calls.append(params["model"])
+        if len(calls) == 1:
+            raise rate_limit_error("2")
+        return "ok"
+
+    gateway = make_gateway(completion)
+    assert await gateway.call(build_params, "primary/model") == "ok"
+    assert calls == ["primary/model", "primary/model"]
+    assert 2.0 <= sleeps[0] <= 2.2
+
+
+@pytest.mark.asyncio
+async def test_fails_over_after_retries_exhausted(sleeps):
+    calls = []
+
+    async def completion(**params):
+        calls.append(params["model"])
+        if params["model"] == "primary/model":
+            raise rate_limit_error("1")
+        return "from-secondary"
+
+    gateway = make_gateway(completion, max_retries=2)
+    assert await gateway.call(build_params, "primary/model") == "from-secondary"
+    assert calls == ["primary/model", "primary/model", "secondary/model"]
+
+
+@pytest.mark.asyncio
+async def test_long_retry_after_fails_over_immediately(sleeps):
+    async def completion(**params):
+        if params["model"] == "primary/model":
+            raise rate_limit_error("600")
+        return "from-secondary"
+
+    gateway = make_gateway(completion)
+    assert await gateway.call(build_params, "primary/model") == "from-secondary"
+    assert sleeps == []
+
+
+@pytest.mark.asyncio
+async def test_bad_request_is_not_retried_or_failed_over(sleeps):
+    calls = []
+
+    async def completion(**params):
+        calls.append(params["model"])
+        raise litellm.exceptions.BadRequestError("bad prompt", model="model", llm_provider="openai")
+
+    gateway = make_gateway(completion)
+    with pytest.raises(litellm.exceptions.BadRequestError):
+        await gateway.call(build_params, "primary/model")
+    assert calls == ["primary/model"]
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_skips_provider(sleeps):
+    calls = []
+
+    async def completion(**params):
+        calls.append(params["model"])
+        return params["model"]
+
+    gateway = make_gateway(completion)
+    breaker = gateway.provider_state("primary").breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    assert await gateway.call(build_params, "primary/model") == "secondary/model"
+    assert calls == ["secondary/model"]
+
+
+@pytest.mark.asyncio
+async def test_breaker_counts_one_failure_per_call(sleeps):
+    async def completion(**params):
+        raise rate_limit_error("1")
+
+    gateway = make_gateway(completion, max_retries=3)
+    with pytest.raises(litellm.exceptions.RateLimitError):
+        await gateway._call_model(build_params("primary/model"))
+    assert gateway.provider_state("primary").breaker.failures == 1
+
+
+@pytest.mark.asyncio
+async def test_half_open_probe_without_outcome_is_released():
+    clock = FakeClock()
+    started = asyncio.Event()
+
+    async def completion(**params):
+        started.set()
+        await asyncio.sleep(5)
+
+    gateway = make_gateway(completion)
+    breaker = gateway.provider_state("primary").breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+
+    # Probe cancelled, e.g. a losing hedge
+    probe = asyncio.create_task(gateway._call_model(build_params("primary/model")))
+    await started.wait()
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Probe that never got admitted
+    gateway.provider_state("primary").requests.tokens = 0
+    gateway.max_admission_wait = 0
+    with pytest.raises(llm_gateway.AdmissionTimeout):
+        await gateway._call_model(build_params("primary/model"))
+    assert breaker.allow_request() and breaker.state == CircuitBreaker.HALF_OPEN
+
+
+@pytest.mark.asyncio
+async def test_slow_non_streaming_call_is_hedged():
+    async def completion(**params):
+        if params["model"] == "primary/model":
+            await asyncio.sleep(5)
+            return "from-primary"
+        return "from-secondary"
+
+    gateway = make_gateway(completion, hedge_delay=0.05)
+    assert await asyncio.wait_for(gateway.call(build_params, "primary/model"), timeout=1) == "from-secondary"
+
+
+@pytest.mark.asyncio
+async def test_hedge_and_primary_chain_never_call_the_same_model():
+    calls = []
+
+    async def completion(**params):
+        calls.append(params["model"])
+        if params["model"] == "primary/model":
+            await asyncio.sleep(0.1)
+            raise litellm.exceptions.ServiceUnavailableError("down", llm_provider="openai", model="model")
+        if params["model"] == "secondary/model":
+            await asyncio.sleep(0.3)
+        return params["model"]
+
+    gateway = make_gateway(completion, hedge_delay=0.05, max_retries=1,
+                           fallback_models={"primary/model": ["secondary/model", "tertiary/model"]})
+    assert await asyncio.wait_for(gateway.call(build_params, "primary/model"), timeout=1) == "tertiary/model"
+    assert sorted(calls) == ["primary/model", "secondary/model", "tertiary/model"]
+
+
+@pytest.mark.asyncio
+async def test_streaming_call_is_not_hedged():
+    calls = []
+
+    async def completion(**params):
+        calls.append(params["model"])
+        await asyncio.sleep(0.1)
+        return "stream"
+
+    gateway = make_gateway(completion, hedge_delay=0.01)
+    assert await gateway.call(lambda model: {**build_params(model), "stream": True}, "primary/model") == "stream"
+    assert calls == ["primary/model"]
+
+
+@pytest.mark.asyncio
+async def test_make_llm_api_call_raises_retry_error_when_all_candidates_fail(sleeps):
+    async def completion(**params):
+        raise rate_limit_error("1")
+
+    with patch.object(llm, "gateway", make_gateway(completion, max_retries=1)):
+        with pytest.raises(llm.LLMRetryError):
+            await llm.make_llm_api_call([{"role": "user", "content": "hi"}], "primary/model")
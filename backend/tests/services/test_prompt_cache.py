@@ -0,0 +1,100 @@
+import copy
+import json
+from unittest.mock import MagicMock
+
+from litellm import Usage
+
+from services.llm import prepare_params
+from services.prompt_cache import (
+    MAX_CACHE_BREAKPOINTS,
+    apply_cache_breakpoints,
+    canonical_tools,
+    get_cache_usage,
+    plan_cache_breakpoints,
+)
+
+
+def make_thread(count):
+    messages = [{"role": "system", "content": "You are a helpful agent."}]
+    for i in range(count):
+        if i % 3 == 2:
+            messages.append({"role": "tool", "tool_call_id": f"call_{i}", "content": f"result {i}"})
+        elif i % 3 == 1:
+            messages.append({"role": "assistant", "content": f"step {i}",
+                             "tool_calls": [{"id": f"call_{i + 1}", "type": "function", "function": {"name": "t", "arguments": "{}"}}]})
+        else:
+            messages.append({"role": "user", "content": [{"type": "text", "text": f"question {i}"}, {"type": "text", "text": "more"}]})
+    return messages
+
+
+def count_breakpoints(messages):
+    return sum(1 for message in messages if isinstance(message.get("content"), list)
+               for block in message["content"] if "cache_control" in block)
+
+
+def test_breakpoints_stay_under_limit_and_cover_system_and_latest():
+    messages = make_thread(50)
+    plan = plan_cache_breakpoints(messages)
+    assert len(plan) == MAX_CACHE_BREAKPOINTS
+    assert plan[0] == 0
+    assert plan[-1] == max(i for i, m in enumerate(messages) if m["role"] != "tool")
+    assert all(messages[i]["role"] != "tool" for i in plan)
+
+    marked = apply_cache_breakpoints(messages)
+    assert count_breakpoints(marked) == MAX_CACHE_BREAKPOINTS
+
+
+def test_breakpoints_are_stable_as_the_thread_grows():
+    # Each auto-continue appends an assistant message and a tool result; consecutive calls
+    # must share a breakpoint (besides the system prompt) so the history prefix is read from cache
+    for count in range(13, 90, 2):
+        before = set(plan_cache_breakpoints(make_thread(count))) - {0}
+        after = set(plan_cache_breakpoints(make_thread(count + 2))) - {0}
+        assert before & after, count
+
+
+def test_apply_does_not_mutate_and_replaces_stale_breakpoints():
+    messages = make_thread(30)
+    messages[1]["content"] = [{"type": "text", "text": "old", "cache_control": {"type": "ephemeral"}}]
+    original = copy.deepcopy(messages)
+
+    marked = apply_cache_breakpoints(messages)
+    assert messages == original
+    assert count_breakpoints(marked) <= MAX_CACHE_BREAKPOINTS
+    # String content is wrapped; list content gets the breakpoint on its last text block
+    assert marked[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    last_user = max(i for i, m in enumerate(marked) if m["role"] == "user")
+    if last_user in plan_cache_breakpoints(messages):
+        assert "cache_control" in marked[last_user]["content"][-1]
+        assert "cache_control" not in marked[last_user]["content"][0]
+
+
+def test_canonical_tools_are_byte_stable():
+    a = {"type": "function", "function": {"name": "b_tool", "parameters": {"type": "object", "properties": {"x": {"type": "string"}}}}}
+    b = {"function": {"parameters": {"properties": {"y": {"type": "integer"}}, "type": "object"}, "name": "a_tool"}, "type": "function"}
+    b_reordered = json.loads(json.dumps(b))
+    b_reordered["function"] = dict(reversed(list(b_reordered["function"].items())))
+    assert json.dumps(canonical_tools([a, b])) == json.dumps(canonical_tools([b_reordered, a]))
+    assert [t["function"]["name"] for t in canonical_tools([a, b])] == ["a_tool", "b_tool"]
+
+
+def test_cache_usage_is_read_from_usage_payloads():
+    anthropic_usage = Usage(prompt_tokens=1200, completion_tokens=10, total_tokens=1210,
+                            cache_read_input_tokens=1000, cache_creation_input_tokens=150)
+    assert get_cache_usage(anthropic_usage) == {"prompt_tokens": 1200, "cache_read_tokens": 1000, "cache_write_tokens": 150}
+    openai_usage = {"prompt_tokens": 500, "prompt_tokens_details": {"cached_tokens": 256}}
+    assert get_cache_usage(openai_usage) == {"prompt_tokens": 500, "cache_read_tokens": 256, "cache_write_tokens": 0}
+    assert get_cache_usage(None) is None
+    assert get_cache_usage(MagicMock()) is None
+
+
+def test_prepare_params_plans_breakpoints_only_for_caching_models():
+    messages = make_thread(40)
+    params = prepare_params(messages=messages, model_name="anthropic/claude-3-7-sonnet-latest", stream=True)
+    assert count_breakpoints(params["messages"]) == MAX_CACHE_BREAKPOINTS
+    assert params["stream_options"] == {"include_usage": True}
+    assert count_breakpoints(messages) == 0
+
+    params = prepare_params(messages=messages, model_name="openai/gpt-4o", stream=True)
+    assert count_breakpoints(params["messages"]) == 0
+    assert "stream_options" not in params
@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from services import transcription
+from services.transcription import (
+    AudioSegment, FFmpegSegmenter, TranscriptionPipeline, choose_cut_points, parse_silences,
+)
+
+
+class StubBackend:
+    max_file_bytes = 1024
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def transcribe(self, path):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        with open(path) as f:
+            content = f.read()
+        await asyncio.sleep(self.delays.get(content, 0.01))
+        self.in_flight -= 1
+        return f" {content.upper()} "
+
+
+class StubSegmenter:
+    """Treats each line of the uploaded file as one segment."""
+
+    async def plan(self, path):
+        with open(path) as f:
+            lines = f.read().splitlines()
+        return [AudioSegment(index=i, start=float(i), end=float(i + 1)) for i in range(len(lines))]
+
+    async def extract(self, source, segment, directory):
+        with open(source) as f:
+            line = f.read().splitlines()[segment.index]
+        output = f"{directory}/segment-{segment.index}.txt"
+        with open(output, "w") as f:
+            f.write(line)
+        return output
+
+
+def test_cut_points_prefer_silences_near_the_target():
+    silences = parse_silences(
+        "[silencedetect] silence_start: 95.0\n[silencedetect] silence_end: 97.0 | silence_duration: 2\n"
+        "[silencedetect] silence_start: 230.5\n[silencedetect] silence_end: 231.5 | silence_duration: 1\n"
+        "[silencedetect] silence_start: 590.0\n"
+    )
+    assert silences == [(95.0, 97.0), (230.5, 231.5)]
+    # Cuts at silences, then at the target where there are none; the tail is not split off
+    assert choose_cut_points(silences, 500.0, target=120, maximum=300) == [96.0, 231.0, 351.0]
+    assert choose_cut_points([], 170.0, target=120, maximum=300) == []
+
+
+@pytest.mark.asyncio
+async def test_audio_without_header_duration_is_measured_or_sent_whole(monkeypatch):
+    calls = []
+
+    def fake_run(decoded):
+        async def run(*args):
+            calls.append(args[0])
+            if args[0] == "ffprobe":
+                return 0, "N/A\n", ""
+            return 0, "", decoded
+        return run
+
+    segmenter = FFmpegSegmenter(target_seconds=120, max_seconds=300)
+    monkeypatch.setattr(transcription, "_run", fake_run(""))
+    assert await segmenter.plan("voice.webm") == [AudioSegment(index=0, start=0.0, end=None, path="voice.webm")]
+
+    decoded = (
+        "[silencedetect] silence_start: 95.0\n[silencedetect] silence_end: 97.0 | silence_duration: 2\n"
+        "size=N/A time=00:03:20.00 bitrate=N/A speed= 410x\r"
+        "size=N/A time=00:08:20.00 bitrate=N/A speed= 420x\n"
+    )
+    monkeypatch.setattr(transcription, "_run", fake_run(decoded))
+    segments = await segmenter.plan("long.webm")
+    assert [segment.start for segment in segments] == [0.0, 96.0, 216.0, 336.0]
+    assert calls == ["ffprobe", "ffmpeg", "ffprobe", "ffmpeg"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_transcribes_concurrently_and_emits_in_order(tmp_path):
+    source = tmp_path / "upload.webm"
+    source.write_text("one\ntwo\nthree\nfour\nfive")
+    backend = StubBackend(delays={"one": 0.1})
+    partials = []
+
+    async def on_partial(index, total, text):
+        partials.append((index, total, text))
+
+    text = await TranscriptionPipeline(backend, StubSegmenter(), concurrency=3).transcribe(
+        str(source), str(tmp_path), on_partial=on_partial
+    )
+
+    assert text == "ONE TWO THREE FOUR FIVE"
+    assert [index for index, _, _ in partials] == [0, 1, 2, 3, 4]
+    assert partials[0] == (0, 5, "ONE")
+    assert backend.max_in_flight == 3
+    assert not list(tmp_path.glob("segment-*"))
+
+
+@pytest.mark.asyncio
+async def test_endpoint_streams_partials_over_sse():
+    app = FastAPI()
+    app.include_router(transcription.router)
+    app.dependency_overrides[transcription.get_current_user_id_from_jwt] = lambda: "user-1"
+    app.dependency_overrides[transcription.get_transcription_backend] = StubBackend
+    app.dependency_overrides[transcription.get_audio_segmenter] = StubSegmenter
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        files = {"audio_file": ("note.webm", b"hello\nworld", "audio/webm")}
+        streamed = await client.post("/transcription?stream=true", files=files)
+        plain = await client.post("/transcription", files=files)
+        too_large = await client.post(
+            "/transcription", files={"audio_file": ("big.wav", b"x" * 2048, "audio/wav")}
+        )
+
+    frames = [json.loads(line[len("data: "):]) for line in streamed.text.split("\n\n") if line]
+    assert [frame["type"] for frame in frames] == ["partial", "partial", "status"]
+    assert frames[1]["text"] == "WORLD"
+    assert frames[-1] == {"type": "status", "status": "completed", "text": "HELLO WORLD"}
+    assert plain.json() == {"text": "HELLO WORLD"}
+    assert too_large.status_code == 500 and "transcription limit" in too_large.json()["detail"]
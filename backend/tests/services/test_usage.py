@@ -0,0 +1,84 @@
+import time
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from services import usage
+
+
+class FakeRedis:
+    REDIS_KEY_TTL = 3600
+
+    def __init__(self):
+        self.hashes = {}
+
+    async def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    async def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def expire(self, key, ttl):
+        pass
+
+
+def make_client(ledger_seconds=None, rpc_data=None):
+    """Supabase client mock whose table(...) chain and rpc(...) return canned data."""
+    client = MagicMock()
+    table_query = MagicMock()
+    table_query.select.return_value = table_query
+    table_query.eq.return_value = table_query
+    table_query.execute = AsyncMock(return_value=MagicMock(
+        data=[{'seconds': ledger_seconds}] if ledger_seconds is not None else []
+    ))
+    client.table.return_value = table_query
+    client.rpc.return_value.execute = AsyncMock(return_value=MagicMock(data=rpc_data))
+    return client
+
+
+@pytest.fixture
+def fake_redis():
+    fake = FakeRedis()
+    with patch.object(usage, "redis", fake):
+        yield fake
+
+
+@pytest.mark.asyncio
+async def test_monthly_usage_reads_ledger_row(fake_redis):
+    client = make_client(ledger_seconds=600)
+    assert await usage.get_monthly_usage(client, "acct-1") == pytest.approx(10.0)
+    client.table.assert_called_once_with('account_usage_monthly')
+
+
+@pytest.mark.asyncio
+async def test_monthly_usage_includes_inflight_runs(fake_redis):
+    await usage.register_inflight_run("acct-1", "run-1", datetime.fromtimestamp(time.time() - 120, tz=timezone.utc))
+    # Runs started before this month do not count towards it
+    await fake_redis.hset(f"{usage.INFLIGHT_KEY_PREFIX}acct-1", "run-old", "0")
+
+    minutes = await usage.get_monthly_usage(make_client(ledger_seconds=60), "acct-1")
+    assert minutes == pytest.approx(3.0, abs=0.05)
+
+
+@pytest.mark.asyncio
+async def test_record_run_usage_clears_inflight(fake_redis):
+    await usage.register_inflight_run("acct-1", "run-1")
+    client = make_client(rpc_data=[{'account_id': 'acct-1', 'seconds': 42.0}])
+
+    assert await usage.record_run_usage(client, "run-1") == 42.0
+    client.rpc.assert_called_once_with('record_agent_run_usage', {'p_agent_run_id': 'run-1'})
+    assert await usage.get_inflight_runs("acct-1") == {}
+
+
+@pytest.mark.asyncio
+async def test_record_run_usage_is_noop_when_already_recorded(fake_redis):
+    await usage.register_inflight_run("acct-1", "run-1")
+    client = make_client(rpc_data=[])
+
+    assert await usage.record_run_usage(client, "run-1") is None
+    assert "run-1" in await usage.get_inflight_runs("acct-1")
@@ -0,0 +1,118 @@
+import time
+import pytest
+import jwt
+from unittest.mock import MagicMock, patch
+from fastapi import HTTPException
+
+from utils import auth_utils
+from utils.auth_utils import TokenVerifier
+
+SECRET = "test-secret-that-is-long-enough-for-hs256"
+
+
+def make_token(sub="user-123", exp_in=3600, secret=SECRET, aud="authenticated", **extra):
+    payload = {"sub": sub, "exp": int(time.time()) + exp_in, "aud": aud, **extra}
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+def make_request(token=None):
+    request = MagicMock()
+    request.headers = {"Authorization": f"Bearer {token}"} if token else {}
+    return request
+
+
+@pytest.fixture
+def verifier():
+    v = TokenVerifier(jwt_secret=SECRET, audience="authenticated", max_size=2)
+    with patch.object(auth_utils, "token_verifier", v):
+        yield v
+
+
+@pytest.mark.asyncio
+async def test_valid_token_is_verified_and_cached(verifier):
+    token = make_token()
+    payload = await verifier.verify(token)
+    assert payload["sub"] == "user-123"
+
+    # Second call must be served from the cache without decoding again
+    with patch.object(auth_utils.jwt, "decode", side_effect=AssertionError("decoded twice")):
+        assert (await verifier.verify(token))["sub"] == "user-123"
+
+
+@pytest.mark.asyncio
+async def test_forged_signature_is_rejected(verifier):
+    token = make_token(secret="another-secret-that-is-long-enough")
+    with pytest.raises(jwt.PyJWTError):
+        await verifier.verify(token)
+
+
+@pytest.mark.asyncio
+async def test_expired_token_is_rejected(verifier):
+    with pytest.raises(jwt.ExpiredSignatureError):
+        await verifier.verify(make_token(exp_in=-10))
+
+
+@pytest.mark.asyncio
+async def test_cached_token_expires(verifier):
+    token = make_token(exp_in=1)
+    await verifier.verify(token)
+    with patch.object(auth_utils.time, "time", return_value=time.time() + 5):
+        assert verifier._get_cached(verifier._token_key(token)) is None
+
+
+@pytest.mark.asyncio
+async def test_cache_is_bounded(verifier):
+    tokens = [make_token(sub=f"user-{i}") for i in range(3)]
+    for token in tokens:
+        await verifier.verify(token)
+    assert len(verifier._cache) == 2
+    assert verifier._token_key(tokens[0]) not in verifier._cache
+
+
+@pytest.mark.asyncio
+async def test_hs256_without_secret_is_rejected():
+    v = TokenVerifier(jwt_secret=None, audience="authenticated")
+    with pytest.raises(jwt.PyJWTError):
+        await v.verify(make_token())
+
+
+@pytest.mark.asyncio
+async def test_current_user_dependency(verifier):
+    assert await auth_utils.get_current_user_id_from_jwt(make_request(make_token())) == "user-123"
+
+    with pytest.raises(HTTPException) as exc_info:
+        await auth_utils.get_current_user_id_from_jwt(make_request(make_token(secret="wrong-secret-that-is-long-enough")))
+    assert exc_info.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_stream_auth_prefers_query_token(verifier):
+    query_token = make_token(sub="from-query")
+    header_token = make_token(sub="from-header")
+    assert await auth_utils.get_user_id_from_stream_auth(make_request(header_token), query_token) == "from-query"
+    assert await auth_utils.get_user_id_from_stream_auth(make_request(header_token), "garbage") == "from-header"
+
+    with pytest.raises(HTTPException):
+        await auth_utils.get_user_id_from_stream_auth(make_request(), "garbage")
+
+
+@pytest.mark.asyncio
+async def test_optional_user_id(verifier):
+    assert await auth_utils.get_optional_user_id(make_request()) is None
+    assert await auth_utils.get_optional_user_id(make_request("not-a-jwt")) is None
+    assert await auth_utils.get_optional_user_id(make_request(make_token())) == "user-123"
+
+
+@pytest.mark.asyncio
+async def test_metrics_token_is_required_and_disables_metrics_when_unset():
+    with patch.object(auth_utils.config, "METRICS_TOKEN", None):
+        with pytest.raises(HTTPException) as disabled:
+            await auth_utils.verify_metrics_token(make_request("anything"))
+        assert disabled.value.status_code == 404
+
+    with patch.object(auth_utils.config, "METRICS_TOKEN", "scrape-secret"):
+        await auth_utils.verify_metrics_token(make_request("scrape-secret"))
+        for token in (None, "wrong"):
+            with pytest.raises(HTTPException) as denied:
+                await auth_utils.verify_metrics_token(make_request(token))
+            assert denied.value.status_code == 401
@@ -0,0 +1,81 @@
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from utils.lazy_imports import lazy_import, lazy_object
+
+
+@pytest.fixture
+def heavy_module(tmp_path, monkeypatch):
+    """A module that records when its body runs."""
+    (tmp_path / "fake_heavy_sdk.py").write_text(
+        "import builtins\n"
+        "builtins.fake_heavy_sdk_loads = getattr(builtins, 'fake_heavy_sdk_loads', 0) + 1\n"
+        "def call():\n"
+        "    return 'real'\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import builtins
+    builtins.fake_heavy_sdk_loads = 0
+    yield lambda: builtins.fake_heavy_sdk_loads
+    sys.modules.pop("fake_heavy_sdk", None)
+
+
+def test_lazy_import_defers_execution_until_first_use(heavy_module):
+    module = lazy_import("fake_heavy_sdk")
+    assert heavy_module() == 0
+    assert lazy_import("fake_heavy_sdk") is module
+
+    assert module.call() == "real"
+    assert heavy_module() == 1
+    # A regular import now returns the same, already executed module
+    import fake_heavy_sdk
+    assert fake_heavy_sdk is module and heavy_module() == 1
+
+
+def test_lazy_module_can_be_patched(heavy_module):
+    module = lazy_import("fake_heavy_sdk")
+    with patch.object(module, "call", return_value="mocked"):
+        assert module.call() == "mocked"
+    assert module.call() == "real"
+
+
+def test_on_load_configures_the_module_when_it_executes(heavy_module):
+    configured = []
+    module = lazy_import("fake_heavy_sdk", on_load=lambda m: configured.append(m.__name__))
+    assert configured == []
+    assert module.call() == "real"
+    assert configured == ["fake_heavy_sdk"] and heavy_module() == 1
+    module.call()
+    assert configured == ["fake_heavy_sdk"]
+
+
+def test_lazy_import_of_missing_module_fails_at_import():
+    with pytest.raises(ModuleNotFoundError):
+        lazy_import("definitely_not_installed_sdk")
+
+
+def test_lazy_object_is_built_once_on_first_public_access():
+    built = []
+
+    class Client:
+        region = "us"
+
+        def ping(self):
+            return "pong"
+
+    def factory():
+        built.append(1)
+        return Client()
+
+    client = lazy_object(factory)
+    # Introspection by mock.patch/inspect must not build the client
+    assert not hasattr(client, "__code__")
+    assert not hasattr(client, "_is_coroutine")
+    assert built == [] and not client.is_resolved
+
+    assert client.ping() == "pong"
+    client.region = "eu"
+    assert client.region == "eu"
+    assert built == [1]
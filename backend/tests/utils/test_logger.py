@@ -0,0 +1,116 @@
+import logging
+import queue
+import threading
+from logging.handlers import QueueListener
+
+import pytest
+
+from utils import logger as logger_module
+from utils.logger import (
+    AsyncLogHandler,
+    ModuleLevelFilter,
+    SamplingFilter,
+    get_log_levels,
+    lazy,
+    sampled,
+    set_module_level,
+)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.seen = threading.Event()
+
+    def emit(self, record):
+        self.records.append(record)
+        self.seen.set()
+
+
+@pytest.fixture
+def isolated_logger():
+    """A logger wired like setup_logger's: filters on a queue handler, a listener thread doing the output."""
+    log_queue = queue.Queue(-1)
+    queue_handler = AsyncLogHandler(log_queue)
+    queue_handler.addFilter(ModuleLevelFilter())
+    queue_handler.addFilter(SamplingFilter())
+    output = ListHandler()
+    listener = QueueListener(log_queue, output)
+    listener.start()
+
+    test_logger = logging.getLogger("test_logger_isolated")
+    test_logger.propagate = False
+    test_logger.setLevel(logging.DEBUG)
+    test_logger.addHandler(queue_handler)
+    try:
+        yield test_logger, output, listener
+    finally:
+        test_logger.removeHandler(queue_handler)
+        if listener._thread is not None:
+            listener.stop()
+
+
+@pytest.fixture
+def restore_levels():
+    saved_default = logger_module._default_level
+    saved_modules = dict(logger_module._module_levels)
+    yield
+    logger_module._default_level = saved_default
+    logger_module._module_levels.clear()
+    logger_module._module_levels.update(saved_modules)
+    logger_module._apply_levels()
+
+
+def test_lazy_arguments_are_not_computed_for_disabled_levels(isolated_logger):
+    test_logger, output, listener = isolated_logger
+    calls = []
+    test_logger.setLevel(logging.INFO)
+
+    test_logger.debug("state: %s", lazy(lambda: calls.append("debug") or "x"))
+    test_logger.info("state: %s", lazy(lambda: calls.append("info") or "y"))
+    listener.stop()
+
+    assert calls == ["info"]
+    assert [record.getMessage() for record in output.records] == ["state: y"]
+
+
+def test_records_are_written_by_the_listener_thread(isolated_logger):
+    test_logger, output, _ = isolated_logger
+    payload = {"key": "before"}
+
+    test_logger.warning("payload %s", payload)
+    payload["key"] = "after"  # the message is merged on the caller, so later mutation does not leak
+
+    assert output.seen.wait(2)
+    record = output.records[0]
+    assert record.getMessage() == "payload {'key': 'before'}"
+    assert record.args is None
+
+
+def test_module_level_overrides_default(isolated_logger, restore_levels):
+    test_logger, output, listener = isolated_logger
+    logger_module.set_log_level("INFO")
+    # Records from this file resolve to the module "tests.utils.test_logger"
+    set_module_level("tests.utils", "DEBUG")
+    test_logger.debug("visible")
+    set_module_level("tests.utils.test_logger", "ERROR")
+    test_logger.warning("hidden")
+    set_module_level("tests.utils.test_logger", None)
+    set_module_level("tests.utils", None)
+    test_logger.debug("hidden too")
+    listener.stop()
+
+    assert [record.getMessage() for record in output.records] == ["visible"]
+    assert get_log_levels() == {"default": "INFO", "modules": {}}
+
+
+def test_sampled_records_emit_one_in_n_per_call_site(isolated_logger, restore_levels):
+    test_logger, output, listener = isolated_logger
+    logger_module.set_log_level("DEBUG")
+    for i in range(25):
+        test_logger.debug("chunk %d", i, extra=sampled(10))
+    test_logger.debug("unsampled")
+    listener.stop()
+
+    assert [record.getMessage() for record in output.records] == ["chunk 0", "chunk 10", "chunk 20", "unsampled"]
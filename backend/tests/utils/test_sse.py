@@ -0,0 +1,46 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from agentpress.utils.json_helpers import to_json_string
+from utils.sse import as_frame, decode_frame, encode_frame, get_terminal_status
+
+
+def test_frame_round_trip():
+    response = {"type": "assistant", "content": to_json_string({"role": "assistant", "content": "héllo \"x\""}),
+                "created_at": datetime(2025, 6, 1, tzinfo=timezone.utc)}
+    frame = encode_frame(response)
+    assert frame.startswith("data: ") and frame.endswith("\n\n")
+    decoded = decode_frame(frame)
+    assert json.loads(decoded["content"])["content"] == "héllo \"x\""
+    assert decoded["created_at"].startswith("2025-06-01")
+
+
+def test_legacy_entries_are_wrapped_without_parsing():
+    legacy_entry = json.dumps({"type": "assistant", "content": "hi"})
+    assert as_frame(legacy_entry) == f"data: {legacy_entry}\n\n"
+    frame = encode_frame({"type": "assistant"})
+    assert as_frame(frame) is frame
+    assert decode_frame(legacy_entry) == {"type": "assistant", "content": "hi"}
+
+
+@pytest.mark.parametrize("entry, expected", [
+    (encode_frame({"type": "status", "status": "completed", "message": "done"}), "completed"),
+    (as_frame(json.dumps({"type": "status", "status": "failed"})), "failed"),
+    (encode_frame({"type": "status", "status": "running"}), None),
+    (encode_frame({"type": "assistant", "content": "status completed"}), None),
+    (encode_frame({"type": "status", "status": "completed", "message": "x" * 2000}), None),
+])
+def test_terminal_status_detection(entry, expected):
+    assert get_terminal_status(entry) == expected
+
+
+@pytest.mark.parametrize("value", ["plain text chunk", "", "  ", "123 apples", '{"a": 1}', "[1, 2]", "true", "null", "-", '"quoted"'])
+def test_to_json_string_fast_path_is_equivalent(value):
+    try:
+        json.loads(value)
+        expected = value
+    except json.JSONDecodeError:
+        expected = json.dumps(value)
+    assert to_json_string(value) == expected
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from utils.startup import StartupTracker
+
+
+@pytest.mark.asyncio
+async def test_readiness_follows_deferred_steps():
+    tracker = StartupTracker()
+    release = asyncio.Event()
+
+    async def load_plugins():
+        await release.wait()
+
+    async def load_tasks():
+        raise RuntimeError("storage unavailable")
+
+    tracker.defer("tool_plugins", load_plugins())
+    tracker.defer("tasks", load_tasks())
+    await asyncio.sleep(0)
+
+    assert not tracker.is_ready()
+    assert tracker.status()["tool_plugins"]["state"] == "pending"
+    assert not await tracker.wait_for("tool_plugins", timeout=0.01)
+
+    release.set()
+    assert await tracker.wait_for("tool_plugins")
+    assert not await tracker.wait_for("tasks")
+    status = tracker.status()
+    assert status["tool_plugins"]["state"] == "ready"
+    assert status["tool_plugins"]["duration_ms"] is not None
+    assert status["tasks"] == {"state": "failed", "duration_ms": status["tasks"]["duration_ms"], "error": "storage unavailable"}
+    assert not tracker.is_ready()
+
+
+@pytest.mark.asyncio
+async def test_unknown_steps_do_not_block_and_shutdown_cancels_pending():
+    tracker = StartupTracker()
+    assert await tracker.wait_for("never_deferred")
+    assert tracker.is_ready()
+
+    task = tracker.defer("slow", asyncio.sleep(60))
+    await tracker.shutdown()
+    assert task.cancelled()
+    assert tracker.status()["slow"]["state"] == "failed"
+    assert not await tracker.wait_for("slow")
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from utils import tracing
+from utils.tracing import finish_run, record_phase, span, start_run, traced
+
+
+def histogram_count(phase, name=""):
+    return REGISTRY.get_sample_value("agent_phase_duration_seconds_count", {"phase": phase, "name": name}) or 0
+
+
+@traced("test_phase", "decorated")
+async def traced_sleep(seconds):
+    await asyncio.sleep(seconds)
+    return "done"
+
+
+@pytest.mark.asyncio
+async def test_spans_feed_histogram_and_run_summary():
+    before = histogram_count("test_phase", "decorated")
+
+    async def run():
+        start_run("run-1")
+        assert await traced_sleep(0.01) == "done"
+        # Tasks created during the run inherit its trace
+        await asyncio.gather(traced_sleep(0), asyncio.create_task(traced_sleep(0)))
+        with pytest.raises(ValueError):
+            with span("tool", "sb_shell_tool"):
+                raise ValueError("failed tools are timed too")
+        record_phase("llm_ttft", 0.25, "gpt-4o")
+        return finish_run()
+
+    summary = await asyncio.create_task(run())
+
+    assert histogram_count("test_phase", "decorated") == before + 3
+    phases = summary["phases"]
+    assert phases["test_phase"]["count"] == 3
+    assert phases["test_phase"]["max_ms"] >= 10
+    assert phases["tool"]["by_name"]["sb_shell_tool"]["count"] == 1
+    assert phases["llm_ttft"]["total_ms"] == 250.0
+    assert summary["wall_ms"] >= phases["test_phase"]["max_ms"]
+
+
+@pytest.mark.asyncio
+async def test_spans_outside_a_run_only_update_histogram():
+    assert tracing.current_run() is None
+    before = histogram_count("redis", "publish")
+    with span("redis", "publish"):
+        pass
+    assert histogram_count("redis", "publish") == before + 1
+    assert finish_run() is None
+
+
+def test_sync_functions_can_be_traced():
+    @traced("sync_phase")
+    def add(a, b):
+        return a + b
+
+    before = histogram_count("sync_phase")
+    assert add(1, 2) == 3
+    assert add.__name__ == "add"
+    assert histogram_count("sync_phase") == before + 1
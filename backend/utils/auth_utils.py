@@ -1,8 +1,149 @@
 import sentry
+import asyncio
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
 from fastapi import HTTPException, Request
-from typing import Optional
+from typing import Optional, Dict, Any, Tuple
 import jwt
 from jwt.exceptions import PyJWTError
+from utils.logger import logger
+from utils.config import config
+
+# Algorithms accepted for Supabase access tokens. HS256 is verified against the
+# project JWT secret, the asymmetric ones against the project's JWKS.
+SYMMETRIC_ALGORITHMS = ["HS256"]
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256"]
+
+
+class TokenVerifier:
+    """
+    Verifies Supabase JWTs and remembers the ones that already passed.
+
+    Signatures are checked against the locally configured JWT secret (HS256) or
+    the project's JWKS, which is fetched once and cached by ``PyJWKClient``.
+    Verified payloads are kept in an LRU keyed by the SHA-256 of the token until
+    the token's ``exp``, so repeat requests with the same token (e.g. SSE
+    reconnects) cost a dictionary lookup instead of a signature check.
+    """
+
+    def __init__(
+        self,
+        jwt_secret: Optional[str] = None,
+        jwks_url: Optional[str] = None,
+        audience: Optional[str] = None,
+        max_size: int = 10000,
+        leeway: int = 0,
+    ):
+        self.jwt_secret = jwt_secret
+        self.jwks_url = jwks_url
+        self.audience = audience
+        self.max_size = max_size
+        self.leeway = leeway
+        self._jwks_client: Optional[jwt.PyJWKClient] = None
+        # token hash -> (payload, exp)
+        self._cache: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def _get_cached(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        payload, exp = entry
+        if time.time() >= exp + self.leeway:
+            # Expired since it was verified; force a full verification (which will fail)
+            self._cache.pop(key, None)
+            return None
+        self._cache.move_to_end(key)
+        return payload
+
+    def _store(self, key: str, payload: Dict[str, Any]) -> None:
+        exp = payload.get("exp")
+        if exp is None:
+            # Never cache tokens without an expiry; they are verified every time
+            return
+        self._cache[key] = (payload, float(exp))
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _get_jwks_client(self) -> jwt.PyJWKClient:
+        if self._jwks_client is None:
+            if not self.jwks_url:
+                raise PyJWTError("No JWKS URL configured for asymmetric token verification")
+            self._jwks_client = jwt.PyJWKClient(self.jwks_url, cache_keys=True, lifespan=3600)
+        return self._jwks_client
+
+    async def _resolve_key(self, token: str) -> Tuple[Any, list]:
+        """Return the verification key and allowed algorithms for a token."""
+        header = jwt.get_unverified_header(token)
+        alg = header.get("alg")
+        if alg in SYMMETRIC_ALGORITHMS:
+            if not self.jwt_secret:
+                logger.error("Received HS256 token but SUPABASE_JWT_SECRET is not configured; rejecting")
+                raise PyJWTError("JWT secret not configured")
+            return self.jwt_secret, SYMMETRIC_ALGORITHMS
+        if alg in ASYMMETRIC_ALGORITHMS:
+            jwks_client = self._get_jwks_client()
+            # The JWKS lookup may hit the network on a cold cache; keep it off the event loop
+            signing_key = await asyncio.to_thread(jwks_client.get_signing_key_from_jwt, token)
+            return signing_key.key, ASYMMETRIC_ALGORITHMS
+        raise PyJWTError(f"Unsupported token algorithm: {alg}")
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Verify a token and return its claims.
+
+        Raises:
+            PyJWTError: If the token is malformed, expired or its signature is invalid
+        """
+        key = self._token_key(token)
+        payload = self._get_cached(key)
+        if payload is not None:
+            return payload
+
+        verification_key, algorithms = await self._resolve_key(token)
+        payload = jwt.decode(
+            token,
+            verification_key,
+            algorithms=algorithms,
+            audience=self.audience,
+            leeway=self.leeway,
+            options={"require": ["exp", "sub"], "verify_aud": bool(self.audience)},
+        )
+        self._store(key, payload)
+        return payload
+
+    def clear(self) -> None:
+        """Drop all cached verifications."""
+        self._cache.clear()
+
+
+token_verifier = TokenVerifier(
+    jwt_secret=config.SUPABASE_JWT_SECRET,
+    jwks_url=f"{config.SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if config.SUPABASE_URL else None,
+    audience=config.SUPABASE_JWT_AUDIENCE,
+    max_size=config.JWT_CACHE_MAX_SIZE,
+)
+
+
+def _get_bearer_token(request: Request) -> Optional[str]:
+    """Return the bearer token from the Authorization header, if any."""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+    return auth_header.split(' ')[1]
+
+
+async def _verify_user_id(token: str) -> Optional[str]:
+    """Verify a token and return the Supabase user ID from its 'sub' claim."""
+    payload = await token_verifier.verify(token)
+    return payload.get('sub')
+
 
 # This function extracts the user ID from Supabase JWT
 async def get_current_user_id_from_jwt(request: Request) -> str:
@@ -21,24 +162,18 @@ async def get_current_user_id_from_jwt(request: Request) -> str:
     Raises:
         HTTPException: If no valid token is found or if the token is invalid
     """
-    auth_header = request.headers.get('Authorization')
+    token = _get_bearer_token(request)
     
-    if not auth_header or not auth_header.startswith('Bearer '):
+    if not token:
         raise HTTPException(
             status_code=401,
             detail="No valid authentication credentials found",
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    token = auth_header.split(' ')[1]
-    
     try:
-        # For Supabase JWT, we just need to decode and extract the user ID
-        # The actual validation is handled by Supabase's RLS
-        payload = jwt.decode(token, options={"verify_signature": False})
-        
         # Supabase stores the user ID in the 'sub' claim
-        user_id = payload.get('sub')
+        user_id = await _verify_user_id(token)
         
         if not user_id:
             raise HTTPException(
@@ -115,29 +250,17 @@ async def get_user_id_from_stream_auth(
     Raises:
         HTTPException: If no valid token is found or if the token is invalid
     """
-    # Try to get user_id from token in query param (for EventSource which can't set headers)
-    if token:
-        try:
-            # For Supabase JWT, we just need to decode and extract the user ID
-            payload = jwt.decode(token, options={"verify_signature": False})
-            user_id = payload.get('sub')
-            sentry.sentry.set_user({ "id": user_id })
-            if user_id:
-                return user_id
-        except Exception:
-            pass
-    
-    # If no valid token in query param, try to get it from the Authorization header
-    auth_header = request.headers.get('Authorization')
-    if auth_header and auth_header.startswith('Bearer '):
+    # Try the token in query param first (for EventSource which can't set headers),
+    # then the Authorization header
+    for candidate in (token, _get_bearer_token(request)):
+        if not candidate:
+            continue
         try:
-            # Extract token from header
-            header_token = auth_header.split(' ')[1]
-            payload = jwt.decode(header_token, options={"verify_signature": False})
-            user_id = payload.get('sub')
+            user_id = await _verify_user_id(candidate)
             if user_id:
+                sentry.sentry.set_user({ "id": user_id })
                 return user_id
-        except Exception:
+        except PyJWTError:
             pass
     
     # If we still don't have a user_id, return authentication error
@@ -147,6 +270,19 @@ async def get_user_id_from_stream_auth(
         headers={"WWW-Authenticate": "Bearer"}
     )
 
+async def verify_metrics_token(request: Request) -> None:
+    """Allow only requests with the configured ``METRICS_TOKEN`` as their bearer token."""
+    if not config.METRICS_TOKEN:
+        # Metrics are not served unless a scraper token is configured
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = _get_bearer_token(request)
+    if not token or not hmac.compare_digest(token.encode(), config.METRICS_TOKEN.encode()):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
 async def verify_thread_access(client, thread_id: str, user_id: str):
     """
     Verify that a user has access to a specific thread based on account membership.
@@ -200,20 +336,13 @@ async def get_optional_user_id(request: Request) -> Optional[str]:
     Returns:
         Optional[str]: The user ID extracted from the JWT, or None if no valid token
     """
-    auth_header = request.headers.get('Authorization')
+    token = _get_bearer_token(request)
     
-    if not auth_header or not auth_header.startswith('Bearer '):
+    if not token:
         return None
     
-    token = auth_header.split(' ')[1]
-    
     try:
-        # For Supabase JWT, we just need to decode and extract the user ID
-        payload = jwt.decode(token, options={"verify_signature": False})
-        
         # Supabase stores the user ID in the 'sub' claim
-        user_id = payload.get('sub')
-        
-        return user_id
+        return await _verify_user_id(token)
     except PyJWTError:
         return None
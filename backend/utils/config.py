@@ -127,11 +127,26 @@ class Configuration:
     
     # Model configuration
     MODEL_TO_USE: Optional[str] = "anthropic/claude-3-7-sonnet-latest"
+    # JSON object of per-provider limits for the LLM gateway, e.g.
+    # {"anthropic": {"requests_per_minute": 2000, "tokens_per_minute": 400000}}
+    LLM_PROVIDER_LIMITS: Optional[str] = None
+    # Start a duplicate request on the next fallback model when a non-streaming call is
+    # slower than this (milliseconds); 0 disables hedging
+    LLM_HEDGE_DELAY_MS: int = 0
+    # Bearer token Prometheus must send to scrape /metrics; the endpoint is disabled when unset
+    METRICS_TOKEN: Optional[str] = None
+    # Response cache for call sites that opt in (see services/llm_cache.py)
+    LLM_CACHE_ENABLED: bool = True
+    # Embedding model for the semantic cache tier; semantic lookups are skipped when unset
+    LLM_CACHE_EMBEDDING_MODEL: Optional[str] = None
     
     # Supabase configuration
     SUPABASE_URL: str
     SUPABASE_ANON_KEY: str
     SUPABASE_SERVICE_ROLE_KEY: str
+    SUPABASE_JWT_SECRET: Optional[str] = None
+    SUPABASE_JWT_AUDIENCE: Optional[str] = "authenticated"
+    JWT_CACHE_MAX_SIZE: int = 10000
     
     # Redis configuration
     REDIS_HOST: str
@@ -156,6 +171,7 @@ class Configuration:
     STRIPE_WEBHOOK_SECRET: Optional[str] = None
     STRIPE_DEFAULT_PLAN_ID: Optional[str] = None
     STRIPE_DEFAULT_TRIAL_DAYS: int = 14
+    STRIPE_API_BASE: Optional[str] = None
     
     # Stripe Product IDs
     STRIPE_PRODUCT_ID_PROD: str = 'prod_SCl7AQ2C8kK1CD'
@@ -174,6 +190,79 @@ class Configuration:
     RABBITMQ_HOST: str = "rabbitmq"
     RABBITMQ_PORT: int = 5672
 
+    # Logging (see utils/logger.py); LOG_LEVEL defaults to INFO in production and DEBUG elsewhere
+    LOG_LEVEL: Optional[str] = None
+    # Per-module overrides, e.g. "agentpress.response_processor=DEBUG,services.llm=WARNING"
+    LOG_MODULE_LEVELS: Optional[str] = None
+    # Sampled high-frequency events (per-chunk debug logs) emit one record in this many
+    LOG_SAMPLE_EVERY: int = 100
+
+    # Cold start budget for importing the API module (benchmarks/startup_benchmark.py fails above it)
+    STARTUP_IMPORT_BUDGET_MS: int = 1500
+
+    # Tool-result artifact store (see services/artifact_store.py): "local", "s3" or "none"
+    ARTIFACT_STORE_BACKEND: str = "local"
+    ARTIFACT_STORE_PATH: str = "artifacts"
+    ARTIFACT_S3_BUCKET: Optional[str] = None
+    ARTIFACT_S3_PREFIX: str = "artifacts/"
+    ARTIFACT_S3_ENDPOINT_URL: Optional[str] = None
+    # Tool outputs larger than this are offloaded; messages keep a preview of ARTIFACT_PREVIEW_CHARS
+    ARTIFACT_OFFLOAD_THRESHOLD_BYTES: int = 16384
+    ARTIFACT_PREVIEW_CHARS: int = 2000
+    # In-process LRU of resolved artifacts
+    ARTIFACT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Worker-wide tool scheduler (see agentpress/tool_scheduler.py)
+    TOOL_MAX_CONCURRENCY: int = 32
+    # Browser tools share one browser per sandbox, so they run one at a time per sandbox
+    TOOL_BROWSER_CONCURRENCY_PER_SANDBOX: int = 1
+    # Scrape/search tools call rate-limited external APIs; limit is across all runs in the worker
+    TOOL_SCRAPE_CONCURRENCY: int = 4
+
+    # Background project provisioning for /agent/initiate (see agent/provisioning.py)
+    # Where attached files wait for the sandbox; defaults to the system temp directory
+    PROVISIONING_STAGING_DIR: Optional[str] = None
+
+    # File uploads into sandboxes (see sandbox/uploads.py)
+    SANDBOX_UPLOAD_CONCURRENCY: int = 4
+    # Streamed request bodies stay in memory up to this size, then spill to a temp file
+    SANDBOX_UPLOAD_SPOOL_MAX_MEMORY: int = 1024 * 1024
+    # Largest streamed request body accepted; bigger uploads are rejected with 413
+    SANDBOX_UPLOAD_MAX_BYTES: int = 500 * 1024 * 1024
+    # Batches with at least this many files of up to PACK_MAX_FILE_BYTES are sent as one tar (0 disables)
+    SANDBOX_UPLOAD_PACK_MIN_FILES: int = 8
+    SANDBOX_UPLOAD_PACK_MAX_FILE_BYTES: int = 256 * 1024
+
+    # Audio transcription (see services/transcription.py)
+    TRANSCRIPTION_MODEL: str = "gpt-4o-mini-transcribe"
+    TRANSCRIPTION_MAX_UPLOAD_BYTES: int = 500 * 1024 * 1024
+    # Long audio is cut at silences into segments of about this length, never longer than the max
+    TRANSCRIPTION_SEGMENT_SECONDS: int = 120
+    TRANSCRIPTION_MAX_SEGMENT_SECONDS: int = 300
+    # Segments of one upload transcribed at the same time
+    TRANSCRIPTION_CONCURRENCY: int = 4
+
+    # Computer-use screenshots (see agent/tools/screen_channel.py): frames kept in memory per tool
+    COMPUTER_USE_SCREENSHOT_HISTORY: int = 8
+    # Screenshots sent to the model are downscaled to at most this width (0 keeps full size)
+    COMPUTER_USE_SCREENSHOT_MAX_WIDTH: int = 1280
+
+    # Browser service calls from tools (see sandbox/browser_client.py)
+    # Call the service over the sandbox preview link instead of curl through sandbox exec
+    BROWSER_API_DIRECT: bool = True
+    BROWSER_API_MAX_CONNECTIONS: int = 50
+    BROWSER_API_MAX_RESPONSE_BYTES: int = 64 * 1024 * 1024
+
+    # see_image preprocessing (see agent/tools/image_pipeline.py)
+    # Budget per image: estimated tokens (width * height / 750) and encoded bytes
+    VISION_IMAGE_MAX_TOKENS: int = 1600
+    VISION_IMAGE_MAX_BYTES: int = 1024 * 1024
+    # Worker processes decoding and resizing images (0 processes them in a thread)
+    VISION_IMAGE_WORKERS: int = 2
+    VISION_IMAGE_CACHE_BYTES: int = 64 * 1024 * 1024
+    # Images at least this large are downscaled inside the sandbox before download (0 disables)
+    VISION_SANDBOX_RESIZE_MIN_BYTES: int = 2 * 1024 * 1024
+
     @property
     def STRIPE_PRODUCT_ID(self) -> str:
         if self.ENV_MODE == EnvMode.STAGING:
@@ -142,4 +142,24 @@ MODEL_NAME_ALIASES = {
     
     # "qwen/qwen3-235b-a22b": "openrouter/qwen/qwen3-235b-a22b",
     # "xai/grok-3-mini-fast-beta": "xai/grok-3-mini-fast-beta",  # Commented out in constants.py
-}
\ No newline at end of file
+}
+# Ordered fallbacks used by the LLM gateway when a model's provider is rate limited
+# or failing. Fallbacks on providers without configured credentials are skipped.
+MODEL_FALLBACKS = {
+    "anthropic/claude-3-7-sonnet-latest": [
+        "bedrock/anthropic.claude-3-7-sonnet-20250219-v1:0",
+        "openrouter/anthropic/claude-3.7-sonnet",
+    ],
+    "anthropic/claude-sonnet-4-20250514": [
+        "bedrock/us.anthropic.claude-sonnet-4-20250514-v1:0",
+        "openrouter/anthropic/claude-sonnet-4",
+    ],
+    "anthropic/claude-3-5-sonnet-latest": [
+        "bedrock/anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "openrouter/anthropic/claude-3.5-sonnet",
+    ],
+    "anthropic/claude-3-5-haiku-latest": [
+        "bedrock/anthropic.claude-3-5-haiku-20241022-v1:0",
+        "openrouter/anthropic/claude-3.5-haiku",
+    ],
+}
@@ -0,0 +1,131 @@
+"""
+Deferred imports and construction for heavy dependencies.
+
+Importing the API pulls in the whole agent stack; SDKs such as litellm, openai,
+langfuse, stripe and daytona account for most of the cold start time even
+though many replicas (and most requests) never touch some of them. These
+helpers keep such dependencies out of import time:
+
+- lazy_import("litellm") returns a module that is only executed on first
+  attribute access (importlib's LazyLoader), so ``litellm.acompletion`` keeps
+  working unchanged, including with ``unittest.mock.patch``. Module-level SDK
+  configuration goes in its ``on_load`` callback.
+- lazy_object(factory) returns a proxy for a module-level client that is built
+  on first use instead of at import time.
+
+Names only used in annotations should be imported under ``TYPE_CHECKING``.
+"""
+
+import importlib
+import importlib.abc
+import importlib.util
+import sys
+import threading
+from types import ModuleType
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _OnLoadLoader(importlib.abc.Loader):
+    """Wraps a module's loader to run a callback right after the module body executes."""
+
+    def __init__(self, loader: importlib.abc.Loader, on_load: Callable[[ModuleType], None]):
+        self._loader = loader
+        self._on_load = on_load
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module: ModuleType) -> None:
+        self._loader.exec_module(module)
+        self._on_load(module)
+
+    def __getattr__(self, name: str) -> Any:
+        # Resource readers, get_data, ... of the original loader
+        return getattr(self._loader, name)
+
+
+def lazy_import(name: str, on_load: Optional[Callable[[ModuleType], None]] = None) -> ModuleType:
+    """Return module ``name``, deferring its execution until an attribute is first accessed.
+
+    Args:
+        name: Absolute module name, e.g. "litellm" or "daytona_api_client.models.workspace_state"
+        on_load: Optional callback run once the module has executed (e.g. to set an SDK's API key);
+            called immediately if the module is already loaded
+
+    Returns:
+        The module (already loaded if something imported it before)
+
+    Raises:
+        ModuleNotFoundError: If the module is not installed
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        if on_load is not None:
+            if type(module).__name__ == "_LazyModule":
+                raise RuntimeError(f"'{name}' is already imported lazily; register on_load on the first lazy_import")
+            on_load(module)
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+
+    if on_load is not None:
+        spec.loader = _OnLoadLoader(spec.loader, on_load)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    if "." in name:
+        parent, _, child = name.rpartition(".")
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+class LazyObject(Generic[T]):
+    """Proxy that builds the wrapped object on first attribute access (thread-safe)."""
+
+    __slots__ = ("_factory", "_instance", "_lock")
+
+    def __init__(self, factory: Callable[[], T]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def resolve(self) -> T:
+        """Build the object if needed and return it."""
+        instance = object.__getattribute__(self, "_instance")
+        if instance is None:
+            with object.__getattribute__(self, "_lock"):
+                instance = object.__getattribute__(self, "_instance")
+                if instance is None:
+                    instance = object.__getattribute__(self, "_factory")()
+                    object.__setattr__(self, "_instance", instance)
+        return instance
+
+    @property
+    def is_resolved(self) -> bool:
+        return object.__getattribute__(self, "_instance") is not None
+
+    def __getattr__(self, name: str) -> Any:
+        # Introspection (mock.patch, inspect, asyncio.iscoroutinefunction) probes private and dunder
+        # attributes; that must not build the object, so only public attributes are forwarded
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self.resolve(), name, value)
+
+    def __repr__(self) -> str:
+        if self.is_resolved:
+            return repr(self.resolve())
+        return f"<lazy {getattr(object.__getattribute__(self, '_factory'), '__qualname__', 'object')}>"
+
+
+def lazy_object(factory: Callable[[], T]) -> LazyObject[T]:
+    """Defer building a module-level client: ``client = lazy_object(lambda: Client(...))``."""
+    return LazyObject(factory)
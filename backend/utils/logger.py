@@ -6,17 +6,29 @@ This module provides a unified logging interface with:
 - Log levels for different environments
 - Correlation IDs for request tracing
 - Contextual information for debugging
+- Non-blocking output: records are handed to a background writer thread
+  (QueueHandler/QueueListener), so formatting and file/console I/O never run
+  on the event loop
+- Runtime per-module levels and sampling of high-frequency events
+
+Hot paths should log with %-style arguments (or lazy(...) for expensive values)
+so nothing is formatted when the level is disabled:
+
+    logger.debug("Extracted XML chunk: %s", chunk, extra=sampled())
 """
 
+import atexit
 import logging
 import json
+import queue
 import sys
 import os
 from datetime import datetime, timezone
 from contextvars import ContextVar
 from functools import wraps
 import traceback
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from typing import Any, Callable, Dict, List, Optional, Union
 
 from .config import config, EnvMode
 
@@ -69,6 +81,181 @@ class JSONFormatter(logging.Formatter):
             
         return json.dumps(log_data)
 
+class LazyArg:
+    """Log argument that is only computed if the record is actually emitted."""
+
+    __slots__ = ("fn",)
+
+    def __init__(self, fn: Callable[[], Any]):
+        self.fn = fn
+
+    def __str__(self) -> str:
+        return str(self.fn())
+
+    def __repr__(self) -> str:
+        return repr(self.fn())
+
+
+def lazy(fn: Callable[[], Any]) -> LazyArg:
+    """Defer an expensive log argument: logger.debug("state: %s", lazy(lambda: dump(state)))."""
+    return LazyArg(fn)
+
+
+def sampled(every: Optional[int] = None) -> Dict[str, int]:
+    """``extra`` for high-frequency events: only one in ``every`` records per call site is emitted."""
+    return {"sample_every": every or config.LOG_SAMPLE_EVERY}
+
+
+def _parse_level(level: Union[int, str]) -> int:
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).strip().upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return value
+
+
+_default_level = _parse_level(config.LOG_LEVEL) if config.LOG_LEVEL else (
+    logging.INFO if config.ENV_MODE == EnvMode.PRODUCTION else logging.DEBUG
+)
+# Dotted module prefix (e.g. "agentpress.response_processor") -> level
+_module_levels: Dict[str, int] = {}
+# Record pathname -> effective level, invalidated when levels change
+_resolved_levels: Dict[str, int] = {}
+_configured_loggers: Dict[str, logging.Logger] = {}
+_BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _module_name(pathname: str) -> str:
+    relative = os.path.relpath(pathname, _BACKEND_ROOT)
+    if relative.startswith('..'):
+        return os.path.splitext(os.path.basename(pathname))[0]
+    return os.path.splitext(relative)[0].replace(os.sep, '.')
+
+
+def _effective_level(pathname: str) -> int:
+    level = _resolved_levels.get(pathname)
+    if level is None:
+        level = _default_level
+        if _module_levels:
+            parts = _module_name(pathname).split('.')
+            for i in range(len(parts), 0, -1):
+                prefix = '.'.join(parts[:i])
+                if prefix in _module_levels:
+                    level = _module_levels[prefix]
+                    break
+        _resolved_levels[pathname] = level
+    return level
+
+
+def _apply_levels() -> None:
+    _resolved_levels.clear()
+    # Loggers must let through the most verbose configured level; the module filter does the rest
+    threshold = min([_default_level, *_module_levels.values()])
+    for configured in _configured_loggers.values():
+        configured.setLevel(threshold)
+
+
+def set_log_level(level: Union[int, str]) -> None:
+    """Change the default level of all application loggers at runtime."""
+    global _default_level
+    _default_level = _parse_level(level)
+    _apply_levels()
+
+
+def set_module_level(module: str, level: Optional[Union[int, str]]) -> None:
+    """Override the level of one module (and its submodules) at runtime, or clear it with None.
+
+    Args:
+        module: Dotted module path relative to the backend, e.g. "agentpress.response_processor"
+        level: Level name or number, or None to fall back to the default level
+    """
+    if level is None:
+        _module_levels.pop(module, None)
+    else:
+        _module_levels[module] = _parse_level(level)
+    _apply_levels()
+
+
+def get_log_levels() -> Dict[str, Any]:
+    """Current default and per-module levels."""
+    return {
+        "default": logging.getLevelName(_default_level),
+        "modules": {module: logging.getLevelName(level) for module, level in _module_levels.items()},
+    }
+
+
+class ModuleLevelFilter(logging.Filter):
+    """Drops records below the level configured for the module that logged them."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= _effective_level(record.pathname)
+
+
+class SamplingFilter(logging.Filter):
+    """Emits one in ``sample_every`` records per call site for records logged with extra=sampled()."""
+
+    def __init__(self):
+        super().__init__()
+        self._counts: Dict[tuple, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = getattr(record, 'sample_every', None)
+        if not every or every <= 1:
+            return True
+        key = (record.pathname, record.lineno)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        return count % every == 0
+
+
+class AsyncLogHandler(QueueHandler):
+    """Queues records for the background writer thread.
+
+    The message is merged on the calling thread (arguments may be mutated after
+    the call returns); formatting, serialization and I/O happen on the writer.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_listeners: List[QueueListener] = []
+
+
+def _start_listener(queue_handler: AsyncLogHandler, handlers: List[logging.Handler]) -> None:
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+
+
+def _stop_listeners() -> None:
+    """Flush queued records (called at exit)."""
+    for listener in _listeners:
+        if listener._thread is not None:
+            listener.stop()
+
+
+def _restart_listeners_after_fork() -> None:
+    # Only the forking thread survives a fork: give each listener a fresh queue and writer thread
+    for listener in _listeners:
+        fresh_queue = queue.Queue(-1)
+        for configured in _configured_loggers.values():
+            for handler in configured.handlers:
+                if isinstance(handler, AsyncLogHandler) and handler.queue is listener.queue:
+                    handler.queue = fresh_queue
+        listener.queue = fresh_queue
+        listener._thread = None
+        listener.start()
+
+
+atexit.register(_stop_listeners)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listeners_after_fork)
+
+
 def setup_logger(name: str = 'BACKEND') -> logging.Logger:
     """
     Set up a centralized logger with console, app-specific rotating file,
@@ -80,8 +267,20 @@ def setup_logger(name: str = 'BACKEND') -> logging.Logger:
     Returns:
         logging.Logger: Configured logger instance.
     """
+    if name in _configured_loggers:
+        return _configured_loggers[name]
+
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)  # Set lowest level for logger, handlers control their own levels
+    # Handlers control their own levels; the logger level and module filter drop disabled records before any work
+    _configured_loggers[name] = logger
+    _apply_levels()
+
+    # All output goes through one queue; handlers below run on the background writer thread
+    queue_handler = AsyncLogHandler(queue.Queue(-1))
+    queue_handler.addFilter(ModuleLevelFilter())
+    queue_handler.addFilter(SamplingFilter())
+    logger.addHandler(queue_handler)
+    handlers: List[logging.Handler] = []
     
     # --- App-specific Rotating File Handler ---
     app_specific_log_dir_path = "/app/runtime_logs/" # Explicit absolute path
@@ -107,7 +306,7 @@ def setup_logger(name: str = 'BACKEND') -> logging.Logger:
             '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(funcName)s - %(message)s'
         )
         rotating_file_handler.setFormatter(file_formatter)
-        logger.addHandler(rotating_file_handler)
+        handlers.append(rotating_file_handler)
         # This print is useful for seeing if setup was attempted. Keep it.
         print(f"Attempted to add app-specific rotating file handler for: {app_log_file}")
         app_log_file_setup_success = True # Mark as success
@@ -211,7 +410,7 @@ def setup_logger(name: str = 'BACKEND') -> logging.Logger:
             '%(asctime)s [%(levelname)s] [%(name)s] %(message)s (%(filename)s:%(lineno)d - %(funcName)s)'
         )
         temp_log_handler.setFormatter(temp_log_formatter)
-        logger.addHandler(temp_log_handler)
+        handlers.append(temp_log_handler)
         print(f"Added TEMP_LOG file handler for {name} at: {current_temp_log_file_path}")
     except Exception as e:
         print(f"Error setting up TEMP_LOG handler for {name}: {e}", file=sys.stderr)
@@ -226,12 +425,14 @@ def setup_logger(name: str = 'BACKEND') -> logging.Logger:
         
         console_formatter = JSONFormatter()
         console_handler.setFormatter(console_formatter)
-        logger.addHandler(console_handler)
+        handlers.append(console_handler)
         # Avoid logging with the logger instance itself during setup if it's not fully configured
         print(f"Added console handler with level: {logging.getLevelName(console_handler.level)}")
     except Exception as e:
         print(f"Error setting up console handler: {e}", file=sys.stderr)
     
+    _start_listener(queue_handler, handlers)
+
     # # Example test logging (can be uncommented for quick verification)
     # logger.debug("Logger setup complete - DEBUG test")
     # logger.info("Logger setup complete - INFO test")
@@ -240,4 +441,19 @@ def setup_logger(name: str = 'BACKEND') -> logging.Logger:
     return logger
 
 # Create default logger instance
-logger = setup_logger() 
\ No newline at end of file
+logger = setup_logger()
+
+
+def _load_module_levels(spec: str) -> None:
+    for entry in spec.split(','):
+        if '=' not in entry:
+            continue
+        module, level = entry.split('=', 1)
+        try:
+            set_module_level(module.strip(), level)
+        except ValueError as e:
+            logger.warning(f"Ignoring LOG_MODULE_LEVELS entry '{entry}': {e}")
+
+
+if config.LOG_MODULE_LEVELS:
+    _load_module_levels(config.LOG_MODULE_LEVELS) 
\ No newline at end of file
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Script to reconcile the agent run usage ledger with the agent_runs table.
+
+Usage:
+    python reconcile_usage_ledger.py [--account-id ACCOUNT_ID] [--month YYYY-MM]
+
+This script:
+1. Finds all accounts with agent runs started in the given month (default: current month)
+2. Recomputes each account's account_usage_monthly row from agent_runs
+3. Removes in-flight usage entries in Redis for runs that are no longer running
+
+Run it periodically (e.g. hourly) to repair drift caused by crashed workers or
+failed ledger updates.
+
+Make sure your environment variables are properly set:
+- SUPABASE_URL
+- SUPABASE_SERVICE_ROLE_KEY
+- REDIS_HOST, REDIS_PORT, REDIS_PASSWORD
+"""
+
+import argparse
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Optional, Set
+from dotenv import load_dotenv
+
+# Load script-specific environment variables
+load_dotenv(".env")
+
+from services.supabase import DBConnection
+from services.usage import get_month_start, reconcile_account_usage
+from services import redis
+from utils.logger import logger
+
+# Number of agent_runs rows fetched per page when discovering accounts
+PAGE_SIZE = 1000
+# Number of accounts reconciled concurrently
+CONCURRENCY_LIMIT = 10
+
+
+async def get_accounts_with_runs(client, month_start: datetime) -> Set[str]:
+    """Return the IDs of all accounts with at least one agent run started in the month."""
+    account_ids: Set[str] = set()
+    offset = 0
+    while True:
+        result = await client.table('agent_runs') \
+            .select('threads(account_id)') \
+            .gte('started_at', month_start.isoformat()) \
+            .range(offset, offset + PAGE_SIZE - 1) \
+            .execute()
+        rows = result.data or []
+        for row in rows:
+            thread = row.get('threads') or {}
+            if thread.get('account_id'):
+                account_ids.add(thread['account_id'])
+        if len(rows) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+    return account_ids
+
+
+async def reconcile(account_ids: Optional[List[str]], month_start: datetime) -> int:
+    """Reconcile the ledger for the given accounts (or all active ones). Returns the number of failures."""
+    db = DBConnection()
+    client = await db.client
+    await redis.initialize_async()
+
+    if not account_ids:
+        account_ids = sorted(await get_accounts_with_runs(client, month_start))
+    logger.info(f"Reconciling usage for {len(account_ids)} accounts for month {month_start.date().isoformat()}")
+
+    semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
+    failures = 0
+
+    async def _reconcile_one(account_id: str):
+        nonlocal failures
+        async with semaphore:
+            try:
+                seconds = await reconcile_account_usage(client, account_id, month_start)
+                logger.info(f"Account {account_id}: {seconds / 60:.2f} minutes")
+            except Exception as e:
+                failures += 1
+                logger.error(f"Failed to reconcile usage for account {account_id}: {str(e)}", exc_info=True)
+
+    await asyncio.gather(*(_reconcile_one(account_id) for account_id in account_ids))
+    return failures
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Reconcile the agent run usage ledger with agent_runs')
+    parser.add_argument('--account-id', action='append', dest='account_ids', help='Only reconcile this account (can be repeated)')
+    parser.add_argument('--month', help='Month to reconcile as YYYY-MM (default: current month)')
+    args = parser.parse_args()
+
+    if args.month:
+        month_start = datetime.strptime(args.month, '%Y-%m').replace(tzinfo=timezone.utc)
+    else:
+        month_start = get_month_start()
+
+    try:
+        failures = await reconcile(args.account_ids, month_start)
+        logger.info(f"Usage reconciliation finished with {failures} failures")
+    finally:
+        await redis.close()
+        await DBConnection.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+"""
+Server-sent event frames for streamed agent output.
+
+Producers serialize each response exactly once into a complete SSE frame
+(``data: <json>\\n\\n``) and push that frame to the run's Redis list. Stream
+viewers forward stored frames untouched instead of parsing and re-encoding
+every response for every viewer.
+"""
+
+from typing import Any, Dict, Optional
+
+import orjson
+
+FRAME_PREFIX = "data: "
+FRAME_SUFFIX = "\n\n"
+
+# Statuses that end a run's stream
+TERMINAL_STATUSES = ("completed", "failed", "stopped")
+# Terminal status frames are small; larger frames are never parsed for status detection
+_MAX_STATUS_FRAME_SIZE = 1024
+_STATUS_MARKER = '"type":"status"'
+
+
+def dumps(value: Any) -> str:
+    """Serialize a value to compact JSON."""
+    return orjson.dumps(value, default=str).decode("utf-8")
+
+
+def encode_frame(response: Dict[str, Any]) -> str:
+    """Serialize a response into a complete SSE frame."""
+    return f"{FRAME_PREFIX}{dumps(response)}{FRAME_SUFFIX}"
+
+
+def as_frame(entry: str) -> str:
+    """Return a stored response list entry as an SSE frame.
+
+    Entries written before frames were stored are bare JSON and are wrapped without parsing.
+    """
+    if entry.startswith(FRAME_PREFIX):
+        return entry
+    return f"{FRAME_PREFIX}{entry}{FRAME_SUFFIX}"
+
+
+def decode_frame(entry: str) -> Any:
+    """Parse a stored frame (or bare JSON entry) back into a response."""
+    if entry.startswith(FRAME_PREFIX):
+        entry = entry[len(FRAME_PREFIX):]
+    return orjson.loads(entry)
+
+
+def get_terminal_status(frame: str) -> Optional[str]:
+    """Return the status if the frame is a terminal status message, without parsing other frames."""
+    if len(frame) > _MAX_STATUS_FRAME_SIZE or _STATUS_MARKER not in frame.replace('": "', '":"'):
+        return None
+    try:
+        response = decode_frame(frame)
+    except orjson.JSONDecodeError:
+        return None
+    if isinstance(response, dict) and response.get("type") == "status" and response.get("status") in TERMINAL_STATUSES:
+        return response["status"]
+    return None
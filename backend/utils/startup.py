@@ -0,0 +1,105 @@
+"""
+Deferred startup work and readiness tracking.
+
+The API starts serving as soon as its connections are set up; slower
+initialization (tool plugin discovery, loading tasks from storage) runs in the
+background as named steps. ``/api/health`` (liveness) answers immediately,
+while ``/api/health/ready`` (readiness) only reports ready once every step has
+finished, so load balancers route traffic to a replica only when it can serve
+everything. Request handlers that depend on a step can wait for it.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Dict, Optional
+
+from utils.logger import logger
+
+# How long a request waits for a deferred step before giving up (seconds)
+STARTUP_WAIT_TIMEOUT = 30.0
+
+
+@dataclass
+class StartupStep:
+    name: str
+    task: asyncio.Task
+    started_at: float
+    duration: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        if not self.task.done():
+            return "pending"
+        return "failed" if self.error or self.task.cancelled() else "ready"
+
+
+class StartupTracker:
+    """Runs deferred initialization steps and reports whether the process is ready."""
+
+    def __init__(self):
+        self._steps: Dict[str, StartupStep] = {}
+
+    def defer(self, name: str, work: Awaitable[Any]) -> asyncio.Task:
+        """Run ``work`` in the background as the startup step ``name``."""
+        started_at = time.monotonic()
+
+        async def run():
+            step = self._steps[name]
+            try:
+                return await work
+            except Exception as e:
+                step.error = str(e) or type(e).__name__
+                logger.error(f"Startup step '{name}' failed: {e}", exc_info=True)
+            finally:
+                step.duration = time.monotonic() - started_at
+                if not step.error:
+                    logger.info(f"Startup step '{name}' finished in {step.duration * 1000:.0f} ms")
+
+        task = asyncio.create_task(run())
+        # If the step is cancelled before it starts, close the coroutine so it is not reported as never awaited
+        task.add_done_callback(lambda _: getattr(work, "close", lambda: None)())
+        self._steps[name] = StartupStep(name=name, task=task, started_at=started_at)
+        return task
+
+    async def wait_for(self, name: str, timeout: Optional[float] = STARTUP_WAIT_TIMEOUT) -> bool:
+        """Wait until step ``name`` has finished. True if it succeeded (or was never deferred)."""
+        step = self._steps.get(name)
+        if step is None:
+            return True
+        if not step.task.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(step.task), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Timed out after {timeout}s waiting for startup step '{name}'")
+                return False
+            except asyncio.CancelledError:
+                if not step.task.cancelled():
+                    raise
+        return step.state == "ready"
+
+    def is_ready(self) -> bool:
+        return all(step.state == "ready" for step in self._steps.values())
+
+    def status(self) -> Dict[str, Any]:
+        """Per-step state and duration, for the readiness endpoint."""
+        return {
+            name: {
+                "state": step.state,
+                "duration_ms": round(step.duration * 1000) if step.duration is not None else None,
+                **({"error": step.error} if step.error else {}),
+            }
+            for name, step in self._steps.items()
+        }
+
+    async def shutdown(self) -> None:
+        """Cancel steps that are still running."""
+        pending = [step.task for step in self._steps.values() if not step.task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+startup = StartupTracker()
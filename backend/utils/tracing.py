@@ -0,0 +1,142 @@
+"""
+Per-run performance tracing.
+
+Phases of an agent run (planning, LLM request / first token / stream, tool
+execution, sandbox exec, DB writes, Redis publishing) are timed with spans:
+
+    with span("tool", tool_id):
+        ...
+
+    @traced("redis")
+    async def publish(...): ...
+
+Every span is observed in the ``agent_phase_duration_seconds`` Prometheus
+histogram (served on ``/metrics``). When a run trace is active in the current
+context (``start_run`` in the worker), spans are also added to that run's
+summary, which is stored with the ``agent_runs`` row when the run finishes.
+The trace lives in a ContextVar, so tasks created during the run inherit it.
+
+Time to first token is ``llm_request`` (until the provider returns the
+stream) plus ``llm_ttft`` (until the first chunk arrives).
+"""
+
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from prometheus_client import Histogram
+
+PHASE_DURATION = Histogram(
+    "agent_phase_duration_seconds",
+    "Time spent per phase of an agent run",
+    ["phase", "name"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+
+
+@dataclass
+class PhaseStats:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+@dataclass
+class RunTrace:
+    """Timing summary of one agent run, keyed by (phase, name)."""
+    run_id: str
+    started_at: float = field(default_factory=time.monotonic)
+    phases: Dict[Tuple[str, str], PhaseStats] = field(default_factory=dict)
+
+    def add(self, phase: str, name: str, seconds: float) -> None:
+        self.phases.setdefault((phase, name), PhaseStats()).add(seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        """JSON-serializable summary: per-phase totals, plus a breakdown by name where spans have one."""
+        phases: Dict[str, Dict[str, Any]] = {}
+        for (phase, name), stats in sorted(self.phases.items()):
+            entry = phases.setdefault(phase, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += stats.count
+            entry["total_ms"] += stats.total * 1000
+            entry["max_ms"] = max(entry["max_ms"], stats.max * 1000)
+            if name:
+                entry.setdefault("by_name", {})[name] = {
+                    "count": stats.count,
+                    "total_ms": round(stats.total * 1000, 1),
+                    "max_ms": round(stats.max * 1000, 1),
+                }
+        for entry in phases.values():
+            entry["total_ms"] = round(entry["total_ms"], 1)
+            entry["max_ms"] = round(entry["max_ms"], 1)
+        return {
+            "wall_ms": round((time.monotonic() - self.started_at) * 1000, 1),
+            "phases": phases,
+        }
+
+
+_current_run: ContextVar[Optional[RunTrace]] = ContextVar("current_run_trace", default=None)
+
+
+def start_run(run_id: str) -> RunTrace:
+    """Start collecting a timing summary for ``run_id`` in the current context."""
+    run = RunTrace(run_id=run_id)
+    _current_run.set(run)
+    return run
+
+
+def finish_run() -> Optional[Dict[str, Any]]:
+    """Stop the current run trace and return its summary (None if no run was being traced)."""
+    run = _current_run.get()
+    if run is None:
+        return None
+    _current_run.set(None)
+    return run.summary()
+
+
+def current_run() -> Optional[RunTrace]:
+    return _current_run.get()
+
+
+def record_phase(phase: str, seconds: float, name: str = "") -> None:
+    """Record a duration measured by the caller (e.g. time to first token)."""
+    PHASE_DURATION.labels(phase=phase, name=name).observe(seconds)
+    run = _current_run.get()
+    if run is not None:
+        run.add(phase, name, seconds)
+
+
+@contextmanager
+def span(phase: str, name: str = "") -> Iterator[None]:
+    """Time the enclosed block as ``phase`` (``name`` distinguishes e.g. tool ids). Errors are timed too."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started, name)
+
+
+def traced(phase: str, name: str = "") -> Callable[[Callable], Callable]:
+    """Decorator form of ``span`` for sync and async functions."""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(phase, name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(phase, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator